@@ -0,0 +1,152 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+A semantic cache for generated answers. Each call to the
+retrieval_augmented_generation processor costs a DeepSeek generation that
+takes seconds. This cache sits in front of it, and stores each answer with
+the embedding of its question and the ids of the documents that were
+retrieved as its context.
+
+A lookup hits when an earlier question had exactly the same context (same
+generation model, index, and document ids), and its embedding has a cosine
+similarity of at least similarity_threshold with the new question's embedding.
+So an exact or near-duplicate question is served from the cache, but a
+similar question that retrieves different documents goes to the LLM.
+
+Entries expire after ttl_seconds, and the cache evicts the least recently
+used entry when it holds max_entries. load_data.py calls invalidate_documents
+for the documents it rewrites, so an answer never outlives its context.
+
+The cache persists to a JSON file, so that run_rag.py and load_data.py can
+share it between runs.
+'''
+
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def document_key(index_name, doc_id):
+  return f'{index_name}/{doc_id}'
+
+
+def context_key(generation_model_id, index_name, doc_ids):
+  '''
+  Identifies the context of an answer. The order of the document ids doesn't
+  matter, since the same documents make the same prompt context.
+  '''
+  return '|'.join([generation_model_id] +
+                  sorted(document_key(index_name, doc_id) for doc_id in doc_ids))
+
+
+class SemanticAnswerCache:
+
+  def __init__(self, path,
+               similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+               ttl_seconds=DEFAULT_TTL_SECONDS,
+               max_entries=DEFAULT_MAX_ENTRIES):
+    self.path = path
+    self.similarity_threshold = similarity_threshold
+    self.ttl_seconds = ttl_seconds
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    # entry id -> entry, in least-recently-used order, and context key ->
+    # entry ids.
+    self._entries = OrderedDict()
+    self._by_context = {}
+    self._next_id = 0
+    if os.path.exists(path):
+      with open(path, encoding='utf-8') as f:
+        for entry in json.load(f)['entries']:
+          self._add(entry)
+
+  def _add(self, entry):
+    entry_id = self._next_id
+    self._next_id += 1
+    entry['vector'] = np.asarray(entry['vector'], dtype=np.float32)
+    self._entries[entry_id] = entry
+    self._by_context.setdefault(entry['context'], set()).add(entry_id)
+
+  def _remove(self, entry_id):
+    entry = self._entries.pop(entry_id)
+    ids = self._by_context[entry['context']]
+    ids.discard(entry_id)
+    if not ids:
+      del self._by_context[entry['context']]
+
+  def lookup(self, generation_model_id, index_name, question_vector, doc_ids):
+    '''
+    Returns the cached answer for the question and context, or None.
+    '''
+    context = context_key(generation_model_id, index_name, doc_ids)
+    now = time.time()
+    with self._lock:
+      best_id, best_similarity = None, self.similarity_threshold
+      for entry_id in list(self._by_context.get(context, ())):
+        entry = self._entries[entry_id]
+        if now - entry['created'] > self.ttl_seconds:
+          self._remove(entry_id)
+          continue
+        similarity = _cosine(question_vector, entry['vector'])
+        if similarity >= best_similarity:
+          best_id, best_similarity = entry_id, similarity
+      if best_id is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._entries.move_to_end(best_id)
+      return self._entries[best_id]['answer']
+
+  def store(self, generation_model_id, index_name, question_vector, doc_ids, answer):
+    with self._lock:
+      self._add({"context": context_key(generation_model_id, index_name, doc_ids),
+                 "documents": [document_key(index_name, doc_id) for doc_id in doc_ids],
+                 "vector": question_vector,
+                 "answer": answer,
+                 "created": time.time()})
+      while len(self._entries) > self.max_entries:
+        self._remove(next(iter(self._entries)))
+
+  def invalidate_documents(self, index_name, doc_ids):
+    '''
+    Removes every answer whose context includes one of doc_ids. Returns the
+    number of answers removed.
+    '''
+    stale = {document_key(index_name, doc_id) for doc_id in doc_ids}
+    with self._lock:
+      entry_ids = [entry_id for entry_id, entry in self._entries.items()
+                   if stale.intersection(entry['documents'])]
+      for entry_id in entry_ids:
+        self._remove(entry_id)
+    return len(entry_ids)
+
+  def save(self):
+    with self._lock:
+      entries = [dict(entry, vector=entry['vector'].tolist())
+                 for entry in self._entries.values()]
+    with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+      json.dump({"entries": entries}, f)
+    os.replace(self.path + '.tmp', self.path)
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {"entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+def _cosine(a, b):
+  denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+  return float(np.dot(a, b)) / denominator if denominator else 0.0
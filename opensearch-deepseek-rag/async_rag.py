@@ -0,0 +1,305 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Runs many RAG questions concurrently. Where run_rag.py sends one question
+through a synchronous client, this script reads a stream of questions, one per
+line, from the file in RAG_QUESTIONS_FILE (or from standard input), and sends
+them through the deepseek_rag_pipeline search pipeline with the async
+OpenSearch client.
+
+At most RAG_CONCURRENCY queries are in flight at a time, and all of them share
+one pool of connections. Each answer prints as a JSON line as soon as its query
+finishes, so the output order can differ from the input order. When the input
+ends, the script prints p50/p95/p99 latency and queries per second to
+standard error.
+
+Set RAG_RETRIEVAL to hybrid to retrieve with a match query alongside the
+neural query, as in run_rag.py.
+
+Set RAG_CONTEXT_TOKENS to fit each question's passages into that many tokens
+(see context_budget.py), as in run_rag.py. Each answer's JSON line then
+includes the tokens saved, and the summary the total.
+
+Set RAG_BATCH_MODEL_ID to a model on the batch connector (see
+generation_batch.py) to generate the answers of concurrent questions together,
+up to RAG_BATCH_SIZE prompts in one SageMaker invocation. Each question
+retrieves on its own, and waits at most RAG_BATCH_WAIT_MS for others to join
+its batch. The summary then includes the number of batches and their mean
+size.
+
+Set RAG_QUERY_EMBEDDING to client to embed the questions here, and retrieve
+with a knn query with the vector, rather than a neural query, for which
+OpenSearch calls the embedding model once per question (see
+query_embedding.py). The questions in flight are embedded together, up to
+RAG_EMBED_BATCH_SIZE in one call, and, with EMBEDDING_CACHE_DIR, a question
+that was asked before isn't embedded again. The summary then includes the
+embedding calls, their mean size, and the cache's hit rate.
+
+Set RAG_METADATA_FILTER to true to filter each question's kNN query to the
+metro areas and years it names (see metadata_filters.py). The script reads
+the metro areas in the index once, at the start.
+
+Set RAG_FACTS_ROUTER to true to answer numeric questions from the facts
+index that load_data.py builds, without retrieval or the LLM (see facts.py).
+Each answer then includes the path it took, and the summary the number of
+questions on each path, their share, and their median latency.
+
+Set RAG_GENERATION_MODEL_IDS to the models on a pool of SageMaker endpoints
+(see create_deepseek_model.py), separated by commas, to generate each answer
+through whichever endpoint is expected to answer first (see
+generation_pool.py). A request that runs past RAG_HEDGE_PERCENTILE of the
+latencies so far is sent to a second endpoint too, and an endpoint that keeps
+failing, or takes longer than RAG_ENDPOINT_TIMEOUT seconds, is ejected for a
+while. The summary then includes the hedges, and each endpoint's requests,
+errors, and ejections.
+
+Run load_data.py first, to create the knowledge base.
+'''
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import context_budget
+import embedding_cache
+import facts
+import generation_batch
+import generation_pool
+import metadata_filters
+import opensearch_client
+import perf_stats
+import query_embedding
+import rag_query
+
+
+opensearch_service_api_endpoint = os.environ['OPENSEARCH_SERVICE_DOMAIN_ENDPOINT']
+opensearch_user_name = os.environ['OPENSEARCH_SERVICE_ADMIN_USER']
+opensearch_user_password = os.environ['OPENSEARCH_SERVICE_ADMIN_PASSWORD']
+embedding_model_id = os.environ['EMBEDDING_MODEL_ID']
+generation_model_id = os.environ['DEEPSEEK_MODEL_ID']
+# Note: if you changed the index name in load_data.py, be sure to change it here.
+# After a rebuild (REBUILD_INDEX in load_data.py), this is an alias for the
+# current version of the index, so it stays the same.
+index_name = "population_data"
+questions_file = os.environ.get('RAG_QUESTIONS_FILE')
+concurrency = int(os.environ.get('RAG_CONCURRENCY', 8))
+request_timeout = int(os.environ.get('RAG_TIMEOUT', 300))
+retrieval_mode = os.environ.get('RAG_RETRIEVAL', 'neural')
+hybrid_weights = [float(w) for w in os.environ.get('RAG_HYBRID_WEIGHTS', ','.join(map(str, rag_query.DEFAULT_HYBRID_WEIGHTS))).split(',')]
+context_tokens = int(os.environ.get('RAG_CONTEXT_TOKENS', 0))
+batch_model_id = os.environ.get('RAG_BATCH_MODEL_ID')
+batch_size = int(os.environ.get('RAG_BATCH_SIZE', generation_batch.DEFAULT_MAX_BATCH_SIZE))
+batch_wait_ms = float(os.environ.get('RAG_BATCH_WAIT_MS', generation_batch.DEFAULT_MAX_WAIT_MS))
+# neural, or client. With client, CLIENT_EMBEDDER must be the model that
+# embedded the index: "model" (EMBEDDING_MODEL_ID) or "hashing".
+query_embedding_mode = os.environ.get('RAG_QUERY_EMBEDDING', 'neural')
+client_embedder = os.environ.get('CLIENT_EMBEDDER', 'model')
+embed_batch_size = int(os.environ.get('RAG_EMBED_BATCH_SIZE', query_embedding.DEFAULT_MAX_BATCH_SIZE))
+embed_wait_ms = float(os.environ.get('RAG_EMBED_WAIT_MS', query_embedding.DEFAULT_MAX_WAIT_MS))
+embedding_cache_dir = os.environ.get('EMBEDDING_CACHE_DIR')
+metadata_filter = os.environ.get('RAG_METADATA_FILTER', 'false').lower() in ('1', 'true', 'yes')
+facts_router = os.environ.get('RAG_FACTS_ROUTER', 'false').lower() in ('1', 'true', 'yes')
+facts_index = os.environ.get('FACTS_INDEX', facts.DEFAULT_INDEX)
+generation_model_ids = [model_id for model_id in os.environ.get('RAG_GENERATION_MODEL_IDS', '').split(',') if model_id]
+# The percentile of the latencies after which a request is hedged, or 0 not to
+# hedge. RAG_HEDGE_MS is the delay before the pool has seen enough requests.
+hedge_percentile = float(os.environ.get('RAG_HEDGE_PERCENTILE', generation_pool.DEFAULT_HEDGE_PERCENTILE))
+hedge_ms = float(os.environ.get('RAG_HEDGE_MS', 0))
+endpoint_timeout = int(os.environ.get('RAG_ENDPOINT_TIMEOUT', generation_pool.DEFAULT_REQUEST_TIMEOUT))
+search_pipeline_id = rag_query.SEARCH_PIPELINE_ID
+retrieval_pipeline_id = None
+if retrieval_mode == 'hybrid':
+  search_pipeline_id = rag_query.HYBRID_RAG_PIPELINE_ID
+  retrieval_pipeline_id = rag_query.HYBRID_PIPELINE_ID
+
+
+async def read_questions(loop):
+  '''
+  Yields questions one at a time. Reading happens in a worker thread, so a
+  slow producer on standard input doesn't block queries that are in flight.
+  '''
+  source = open(questions_file, encoding='utf-8') if questions_file else sys.stdin
+  try:
+    while True:
+      line = await loop.run_in_executor(None, source.readline)
+      if not line:
+        return
+      line = line.strip()
+      if line:
+        yield line
+  finally:
+    if questions_file:
+      source.close()
+
+
+async def ask_with_prompt(client, question, query, batcher=None, pool=None):
+  '''
+  Retrieves the passages, fits them into the context budget (with
+  RAG_CONTEXT_TOKENS), and generates the answer from the prompt: through the
+  batcher or the pool, when there is one, or else the model's _predict API.
+  Returns the answer, the search response, and the compaction report, or
+  None.
+  '''
+  resp = await client.search(body={"query": query["query"],
+                                   "size": query["size"],
+                                   "_source": rag_query.SOURCE_FIELDS},
+                             index=index_name,
+                             search_pipeline=retrieval_pipeline_id)
+  contexts = rag_query.hit_texts(resp, query["ext"]["generative_qa_parameters"]["context_size"])
+  compaction = None
+  if context_tokens:
+    contexts, compaction = context_budget.assemble_context(question, contexts, context_tokens)
+  prompt = rag_query.build_prompt(question, contexts)
+  if batcher:
+    return await batcher.generate(prompt), resp, compaction
+  if pool:
+    return await pool.generate(prompt), resp, compaction
+  prediction = await client.transport.perform_request(
+    'POST', rag_query.predict_path(generation_model_id),
+    body=rag_query.predict_request(prompt),
+    params={"request_timeout": request_timeout})
+  return rag_query.answer_from_prediction(prediction), resp, compaction
+
+
+async def ask_llm(client, question, batcher=None, query_embedder=None, question_parser=None,
+                  pool=None):
+  '''
+  Retrieves the context for question and generates the answer. Returns the
+  answer, the search response, and the compaction report, or None.
+  '''
+  # The embedding is part of the query's latency, as it is for the neural
+  # query, where OpenSearch computes it.
+  retrieval_filter = question_parser.filter(question) if question_parser else None
+  if query_embedder:
+    retrieval_clause = rag_query.knn_clause(await query_embedder.embed(question), k=5,
+                                            filter=retrieval_filter)
+  else:
+    retrieval_clause = rag_query.neural_clause(question, embedding_model_id, k=5,
+                                               filter=retrieval_filter)
+  if retrieval_mode == 'hybrid':
+    retrieval_clause = rag_query.hybrid_clause(question, retrieval_clause, filter=retrieval_filter)
+  query = rag_query.build_rag_query(question,
+                                    retrieval_clause,
+                                    size=2,
+                                    context_size=5)
+  if context_tokens or batcher or pool:
+    return await ask_with_prompt(client, question, query, batcher, pool)
+  resp = await client.search(body=query,
+                             index=index_name,
+                             search_pipeline=search_pipeline_id,
+                             request_timeout=request_timeout)
+  return rag_query.answer_from_response(resp), resp, None
+
+
+async def ask(client, question, semaphore, latencies, errors, tokens_saved, batcher=None,
+              query_embedder=None, question_parser=None, fact_router=None, pool=None):
+  try:
+    start = time.perf_counter()
+    answer, resp, compaction = None, {}, None
+    try:
+      if fact_router:
+        answer = await fact_router.route_async(client, question)
+      route = facts.ROUTE_LLM if answer is None else facts.ROUTE_FACTS
+      if route == facts.ROUTE_LLM:
+        answer, resp, compaction = await ask_llm(client, question, batcher, query_embedder,
+                                                 question_parser, pool)
+    except Exception as e:
+      errors.append(question)
+      print(json.dumps({"question": question, "error": str(e)}), flush=True)
+      return
+    latency = time.perf_counter() - start
+    latencies.append(latency)
+    if fact_router:
+      fact_router.record(route, latency)
+    result = {"question": question,
+              "answer": answer,
+              "route": route,
+              "hits": rag_query.hit_ids(resp),
+              "sources": rag_query.hit_parent_ids(resp),
+              "latency_ms": round(latency * 1000, 1)}
+    if compaction:
+      result["context"] = compaction
+      tokens_saved.append(compaction["tokens_saved"])
+    print(json.dumps(result), flush=True)
+  finally:
+    semaphore.release()
+
+
+async def main():
+  # The pool holds one connection per concurrent query, so that queries reuse
+  # connections (and their TLS sessions) instead of opening new ones. A hedged
+  # query has two generation requests in flight.
+  client = opensearch_client.create_async_client(opensearch_service_api_endpoint,
+                                                 (opensearch_user_name, opensearch_user_password),
+                                                 pool_size=concurrency * 2 if generation_model_ids else concurrency)
+  try:
+    hybrid = hybrid_weights if retrieval_mode == 'hybrid' else None
+    await client.search_pipeline.put(id=search_pipeline_id,
+                                     body=rag_query.search_pipeline_definition(generation_model_id,
+                                                                               hybrid_weights=hybrid))
+    if retrieval_pipeline_id:
+      await client.search_pipeline.put(id=retrieval_pipeline_id,
+                                       body=rag_query.hybrid_pipeline_definition(hybrid_weights))
+    # At most RAG_CONCURRENCY questions are in flight, so that's also the
+    # largest batch that can form.
+    batcher = None
+    if batch_model_id:
+      batcher = generation_batch.GenerationBatcher(
+        generation_batch.model_generator(client, batch_model_id, request_timeout),
+        max_batch_size=batch_size, max_wait_ms=batch_wait_ms)
+    query_embedder = None
+    if query_embedding_mode == 'client':
+      cache = embedding_cache.EmbeddingCache(embedding_cache_dir) if embedding_cache_dir else None
+      query_embedder = query_embedding.create_query_embedder(
+        client_embedder, client, embedding_model_id, cache=cache,
+        max_batch_size=min(embed_batch_size, concurrency), max_wait_ms=embed_wait_ms)
+    fact_router = None
+    if facts_router:
+      resp = await client.search(index=facts_index, body=metadata_filters.metros_query())
+      fact_router = facts.FactRouter(metadata_filters.metros_from_response(resp), index_name=facts_index)
+    pool = None
+    if generation_model_ids:
+      pool = generation_pool.GenerationPool(
+        generation_pool.model_generators(client, generation_model_ids, endpoint_timeout),
+        hedge_percentile=hedge_percentile, hedge_after_ms=hedge_ms)
+    question_parser = None
+    if metadata_filter:
+      resp = await client.search(index=index_name, body=metadata_filters.metros_query())
+      question_parser = metadata_filters.QuestionParser(metadata_filters.metros_from_response(resp))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors, tokens_saved, tasks = [], [], [], set()
+    start = time.perf_counter()
+    async for question in read_questions(asyncio.get_running_loop()):
+      # Wait for a free slot before starting the next query. This bounds both
+      # the queries in flight and the questions read ahead of them.
+      await semaphore.acquire()
+      task = asyncio.create_task(ask(client, question, semaphore, latencies, errors, tokens_saved,
+                                       batcher, query_embedder, question_parser, fact_router,
+                                       pool))
+      tasks.add(task)
+      task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+  finally:
+    await client.close()
+  summary = perf_stats.summarize_latencies(latencies, elapsed, errors=len(errors))
+  if context_tokens:
+    summary["context_tokens_saved"] = sum(tokens_saved)
+  if batcher:
+    summary["generation_batches"] = batcher.stats()
+  if query_embedder:
+    if query_embedder.cache is not None:
+      query_embedder.cache.save()
+    summary["query_embedding"] = query_embedder.stats()
+  if fact_router:
+    summary["routes"] = fact_router.stats()
+  if pool:
+    summary["generation_pool"] = pool.stats()
+  summary["client"] = opensearch_client.metrics.snapshot()
+  print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == '__main__':
+  asyncio.run(main())
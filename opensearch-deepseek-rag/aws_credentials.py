@@ -0,0 +1,215 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Caches the temporary credentials of an assumed IAM role, and signs requests
+with them.
+
+create_connector.py assumes a role, and signs its call to OpenSearch with the
+role's credentials. Calling STS for every signed request costs a round trip,
+and building a new AWS4Auth for each derives a new signing key (four
+HMAC-SHA256 rounds). For a tool that makes many signed calls, both add up.
+
+- AssumedRoleCredentials calls STS once, and hands out the same credentials
+  until they're about to expire. A background timer refreshes them ahead of
+  that, so callers don't wait for STS. Optionally, the credentials are kept in
+  a file (readable only by you), so that the next run of a script can use
+  them too.
+- SigV4Auth signs requests with the current credentials. It derives a
+  signing key only when the credentials (or the date) change, and reuses it
+  for every request in between.
+- LocalSTS stands in for the STS client offline. It issues fake credentials
+  after a configurable latency, and counts its calls, so you can measure the
+  overhead of the STS and signing layer (see the signing suite in
+  benchmark.py).
+'''
+
+import datetime
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import boto3
+import requests
+from requests_aws4auth import AWS4Auth
+
+
+DEFAULT_DURATION_SECONDS = 3600
+# Refresh when the credentials have less than this left. The background
+# refresh starts a little earlier still.
+DEFAULT_REFRESH_MARGIN_SECONDS = 300
+
+
+def _utcnow():
+  return datetime.datetime.now(datetime.timezone.utc)
+
+
+class LocalSTS:
+  '''
+  A local stand-in for boto3.client('sts'). assume_role sleeps for latency_ms,
+  and returns fake credentials shaped like the real response.
+  '''
+
+  def __init__(self, latency_ms=0.0):
+    self.latency_ms = latency_ms
+    self.calls = 0
+    self._lock = threading.Lock()
+
+  def assume_role(self, RoleArn, RoleSessionName, DurationSeconds=DEFAULT_DURATION_SECONDS):
+    if self.latency_ms > 0:
+      time.sleep(self.latency_ms / 1000.0)
+    with self._lock:
+      self.calls += 1
+    return {
+      "Credentials": {
+        "AccessKeyId": 'ASIA' + uuid.uuid4().hex[:16].upper(),
+        "SecretAccessKey": uuid.uuid4().hex + uuid.uuid4().hex[:8],
+        "SessionToken": uuid.uuid4().hex * 4,
+        "Expiration": _utcnow() + datetime.timedelta(seconds=DurationSeconds),
+      },
+      "AssumedRoleUser": {"Arn": f'{RoleArn}/{RoleSessionName}'},
+    }
+
+
+class AssumedRoleCredentials:
+  '''
+  The credentials of role_arn, assumed through sts_client (by default,
+  boto3's STS client), and cached until refresh_margin_seconds before they
+  expire. get() returns a dict with access_key, secret_key, token, and
+  expiration.
+  '''
+
+  def __init__(self, role_arn, session_name, sts_client=None,
+               duration_seconds=DEFAULT_DURATION_SECONDS,
+               refresh_margin_seconds=DEFAULT_REFRESH_MARGIN_SECONDS,
+               cache_path=None, background_refresh=True):
+    self.role_arn = role_arn
+    self.session_name = session_name
+    self.sts_client = sts_client
+    self.duration_seconds = duration_seconds
+    self.refresh_margin_seconds = refresh_margin_seconds
+    self.cache_path = cache_path
+    self.background_refresh = background_refresh
+    self.sts_calls = 0
+    self.refresh_failures = 0
+    self._credentials = None
+    self._lock = threading.Lock()
+    self._timer = None
+    if cache_path:
+      self._credentials = self._load()
+      if self._credentials:
+        self._schedule_refresh()
+
+  def _remaining_seconds(self, credentials):
+    return (credentials["expiration"] - _utcnow()).total_seconds()
+
+  def get(self):
+    with self._lock:
+      if (self._credentials is None or
+          self._remaining_seconds(self._credentials) < self.refresh_margin_seconds):
+        self._refresh()
+      return self._credentials
+
+  def _refresh(self):
+    # Callers hold the lock.
+    if self.sts_client is None:
+      self.sts_client = boto3.client('sts')
+    response = self.sts_client.assume_role(RoleArn=self.role_arn,
+                                           RoleSessionName=self.session_name,
+                                           DurationSeconds=self.duration_seconds)
+    self.sts_calls += 1
+    credentials = response['Credentials']
+    self._credentials = {"access_key": credentials['AccessKeyId'],
+                         "secret_key": credentials['SecretAccessKey'],
+                         "token": credentials['SessionToken'],
+                         "expiration": credentials['Expiration']}
+    if self.cache_path:
+      self._save(self._credentials)
+    self._schedule_refresh()
+
+  def _schedule_refresh(self):
+    '''
+    Starts a timer that refreshes the credentials before get() would have to.
+    The jitter keeps many processes that started together from calling STS
+    together.
+    '''
+    if not self.background_refresh:
+      return
+    if self._timer is not None:
+      self._timer.cancel()
+    remaining = self._remaining_seconds(self._credentials)
+    lead = self.refresh_margin_seconds * (1.5 + random.random() * 0.5)
+    delay = max(remaining - lead, remaining / 2)
+    self._timer = threading.Timer(delay, self._refresh_in_background)
+    self._timer.daemon = True
+    self._timer.start()
+
+  def _refresh_in_background(self):
+    try:
+      with self._lock:
+        self._refresh()
+    except Exception:
+      # The current credentials are still valid. get() refreshes in the
+      # foreground if they get too close to expiring.
+      self.refresh_failures += 1
+
+  def close(self):
+    if self._timer is not None:
+      self._timer.cancel()
+
+  def _load(self):
+    try:
+      with open(self.cache_path, encoding='utf-8') as f:
+        cached = json.load(f)
+    except (OSError, ValueError):
+      return None
+    if cached.get("role_arn") != self.role_arn:
+      return None
+    credentials = dict(cached["credentials"],
+                       expiration=datetime.datetime.fromisoformat(cached["credentials"]["expiration"]))
+    if self._remaining_seconds(credentials) < self.refresh_margin_seconds:
+      return None
+    return credentials
+
+  def _save(self, credentials):
+    # The file holds secrets, so only the owner can read it.
+    fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+      json.dump({"role_arn": self.role_arn,
+                 "credentials": dict(credentials, expiration=credentials["expiration"].isoformat())}, f)
+
+
+class SigV4Auth(requests.auth.AuthBase):
+  '''
+  Signs requests for service in region with the provider's current
+  credentials. Use it as the auth of a requests Session (see
+  opensearch_client.create_session).
+  '''
+
+  def __init__(self, provider, region, service='es'):
+    self.provider = provider
+    self.region = region
+    self.service = service
+    self.signing_keys = 0
+    self._auth = None
+    self._lock = threading.Lock()
+
+  def _current_auth(self):
+    credentials = self.provider.get()
+    auth = self._auth
+    if auth is None or auth.access_id != credentials["access_key"]:
+      with self._lock:
+        auth = self._auth
+        if auth is None or auth.access_id != credentials["access_key"]:
+          # A new AWS4Auth derives the signing key once. It derives it again
+          # by itself only when the date changes.
+          auth = AWS4Auth(credentials["access_key"], credentials["secret_key"],
+                          self.region, self.service, session_token=credentials["token"])
+          self._auth = auth
+          self.signing_keys += 1
+    return auth
+
+  def __call__(self, request):
+    return self._current_auth()(request)
@@ -0,0 +1,85 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Benchmarks the hot paths of this example end to end, against the local mock
+in mock_opensearch.py, so you need no domain or SageMaker endpoint. The
+suites live in the benchmarks package, one module per feature, and this
+script runs the ones in BENCH_SUITES:
+
+- ingest and backpressure (benchmarks/ingest.py): the _bulk load, and the
+  adaptive load against a busy write queue.
+- query, retrieval, query_embedding, filter, and router
+  (benchmarks/query.py): the RAG query, and the ways to retrieve for it.
+- predict, stream, batch, and pool (benchmarks/generation.py): the
+  generation round trip, streamed, batched, and through a pool of endpoints.
+- snapshot (benchmarks/snapshot.py): refilling an index from a vector
+  snapshot.
+- signing (benchmarks/signing.py): SigV4-signed connector calls.
+
+Each module describes its suites. Before they run, the script loads
+BENCH_DOCS synthetic documents through embedding_pipeline into an index that
+the query, generation, and snapshot suites search.
+
+The mock's latencies come from the MOCK_* environment variables (see
+MockLatency in mock_opensearch.py). The results are JSON, written to
+BENCH_OUTPUT or to standard output, so you can keep them and compare runs to
+catch regressions.
+'''
+
+import datetime
+import json
+import os
+import sys
+
+import bulk_loader
+import mock_opensearch
+import rag_query
+
+from benchmarks import generation, ingest, query, signing, snapshot
+from benchmarks.common import (doc_count, embedding_model_id, generation_model_id, index_name,
+                               make_client, mapping, synthetic_documents)
+
+
+SUITES = dict(ingest.SUITES, **query.SUITES, **generation.SUITES, **snapshot.SUITES, **signing.SUITES)
+
+suites = os.environ.get('BENCH_SUITES', 'ingest,query,retrieval,query_embedding,filter,router,predict,stream,batch,pool,backpressure,snapshot,signing').split(',')
+output_path = os.environ.get('BENCH_OUTPUT')
+
+
+def main():
+  unknown = [suite for suite in suites if suite not in SUITES]
+  if unknown:
+    raise ValueError(f'Unknown suites {unknown} in BENCH_SUITES. Use some of {sorted(SUITES)}.')
+  latency = mock_opensearch.MockLatency.from_env()
+  server, url = mock_opensearch.start_mock_server(latency)
+  client = make_client(url, 1)
+  client.ingest.put_pipeline(id='embedding_pipeline', body={
+    "processors": [{"text_embedding": {"model_id": embedding_model_id,
+                                       "field_map": {"text": "text_embedding"}}}]})
+  client.search_pipeline.put(id=rag_query.SEARCH_PIPELINE_ID,
+                             body=rag_query.search_pipeline_definition(generation_model_id))
+  client.search_pipeline.put(id=rag_query.HYBRID_PIPELINE_ID,
+                             body=rag_query.hybrid_pipeline_definition())
+  # The query, retrieval, and predict suites search a fixed, preloaded index.
+  client.indices.create(index=index_name, body=mapping)
+  bulk_loader.bulk_load(client, index_name, synthetic_documents(doc_count),
+                        pipeline='embedding_pipeline', log=None)
+
+  report = {"started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "mock_latency_ms": latency.as_dict(),
+            "results": []}
+  for suite in suites:
+    print(f'Running {suite}', file=sys.stderr)
+    report["results"].extend(SUITES[suite](url))
+  server.shutdown()
+
+  if output_path:
+    with open(output_path, 'w', encoding='utf-8') as f:
+      json.dump(report, f, indent=2)
+    print(f'Wrote {output_path}', file=sys.stderr)
+  else:
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,7 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+The suites of benchmark.py, one module per feature. Each module maps its
+suite names to their functions in SUITES. A suite takes the URL of the mock,
+and returns a list of results.
+'''
@@ -0,0 +1,180 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+What the benchmark suites share: the settings that every suite sweeps, the
+synthetic corpus and questions, and the helpers that run calls concurrently
+and report their latency.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import itertools
+import os
+import time
+
+import deepseek_connector
+import generation_stream
+import index_profiles
+import opensearch_client
+import perf_stats
+import rag_query
+
+
+def int_list(name, default):
+  return [int(x) for x in os.environ.get(name, default).split(',') if x]
+
+
+doc_count = int(os.environ.get('BENCH_DOCS', 2000))
+query_count = int(os.environ.get('BENCH_QUERIES', 50))
+concurrency_levels = int_list('BENCH_CONCURRENCY', '1,4,16')
+k_values = int_list('BENCH_K', '5,20')
+size_values = int_list('BENCH_SIZES', '2,5')
+index_name = 'bench_population_data'
+embedding_model_id = 'mock-embedding'
+generation_model_id = 'mock-deepseek'
+question = "What's the population increase of New York City from 2021 to 2023? How is the trending comparing with Miami?"
+
+
+# The default mapping from load_data.py, which the mock needs to build its kNN
+# index.
+mapping = index_profiles.build_mapping()
+
+
+def synthetic_documents(count):
+  '''
+  Generates documents shaped like the population_data knowledge base.
+  '''
+  for i in range(count):
+    population = 500_000 + 7_919 * i
+    yield {"id": str(i),
+           "text": f'Chart and table of population level and growth rate for the Metro {i} metro area '
+                   f'from 1950 to 2023. The current metro area population of Metro {i} in 2023 is '
+                   f'{population:,}, a {i % 300 / 100:.2f}% increase from 2022.'}
+
+
+def make_client(url, pool_size):
+  return opensearch_client.create_client(url, pool_size=pool_size)
+
+
+def run_concurrently(call, count, concurrency):
+  '''
+  Makes count calls with concurrency threads, and returns the latency summary,
+  with the client's connection reuse and retries.
+  '''
+  latencies, errors = [], []
+  opensearch_client.metrics.reset()
+
+  def timed(_):
+    start = time.perf_counter()
+    try:
+      call()
+    except Exception as e:
+      errors.append(str(e))
+      return
+    latencies.append(time.perf_counter() - start)
+
+  start = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    list(executor.map(timed, range(count)))
+  summary = perf_stats.summarize_latencies(latencies, time.perf_counter() - start, errors=len(errors))
+  client_metrics = opensearch_client.metrics.snapshot()
+  summary["connection_reuse"] = client_metrics["connection_reuse"]
+  summary["retries"] = client_metrics["retries"]
+  return summary
+
+
+def cycling_search(client, bodies, **params):
+  '''
+  Returns a call for run_concurrently that searches with each of bodies in
+  turn, with params.
+  '''
+  bodies = itertools.cycle(bodies)
+  return lambda: client.search(body=next(bodies), **params)
+
+
+def run_async_concurrently(url, make_call, count, concurrency, pool_size=None):
+  '''
+  Like run_concurrently, with concurrency tasks sharing one async client.
+  make_call takes the client, and returns the coroutine function to call,
+  with the number of the call. The client's pool holds pool_size
+  connections, or concurrency.
+  '''
+  async def run():
+    client = opensearch_client.create_async_client(url, pool_size=pool_size or concurrency)
+    call = make_call(client)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def timed(i):
+      async with semaphore:
+        start = time.perf_counter()
+        try:
+          await call(i)
+        except Exception as e:
+          errors.append(str(e))
+          return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    try:
+      await asyncio.gather(*(timed(i) for i in range(count)))
+    finally:
+      await client.close()
+    return perf_stats.summarize_latencies(latencies, time.perf_counter() - start, errors=len(errors))
+  return asyncio.run(run())
+
+
+def labeled_questions(count):
+  '''
+  Questions about single synthetic documents, each paired with the id of the
+  document that answers it.
+  '''
+  step = max(doc_count // max(count, 1), 1)
+  return [(f'What is the population of the Metro {i} metro area in 2023?', str(i))
+          for i in range(0, doc_count, step)][:count]
+
+
+def retrieval_query(mode, question, k, size):
+  clause = rag_query.neural_clause(question, embedding_model_id, k=k)
+  if mode == 'hybrid':
+    clause = rag_query.hybrid_clause(question, clause)
+  return {"query": clause, "size": size, "_source": False}
+
+
+def register_model(client, name, action):
+  '''
+  Creates a connector with action, with the parameters of
+  create_connector.py, registers and deploys a model on it, and returns the
+  model's id.
+  '''
+  connector = client.transport.perform_request('POST', '/_plugins/_ml/connectors/_create', body={
+    "name": f'{name} connector', "protocol": "aws_sigv4",
+    "parameters": dict(generation_stream.DEFAULT_PARAMETERS, max_new_tokens=64),
+    "actions": [action]})
+  model_id = client.transport.perform_request(
+    'POST', '/_plugins/_ml/models/_register', params={"deploy": "true"},
+    body={"name": f'{name} model', "function_name": "remote",
+          "connector_id": connector["connector_id"]})["model_id"]
+  while client.transport.perform_request(
+      'GET', f'/_plugins/_ml/models/{model_id}')["model_state"] != 'DEPLOYED':
+    time.sleep(0.05)
+  return model_id
+
+
+def stub_generation_action(stub_url):
+  '''
+  The PREDICT action of a connector to the SageMaker endpoint of the mock at
+  stub_url, as create_connector.py makes it.
+  '''
+  return deepseek_connector.connector_action(f'{stub_url}/endpoints/{generation_model_id}/invocations')
+
+
+# Every call has its own prompt. The mock echoes the prompt ahead of the
+# answer, so a completion that went back to the wrong caller is an error.
+def numbered_prompt(i):
+  return rag_query.build_prompt(f'{question} ({i})', [])
+
+
+def check_completion(i, completion):
+  if not completion.startswith(numbered_prompt(i)):
+    raise ValueError(f'Call {i} got the completion for another prompt')
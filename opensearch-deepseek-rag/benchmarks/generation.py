@@ -0,0 +1,255 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+The generation suites:
+
+- predict: the ML Commons _predict round trip through the connector to the
+  SageMaker endpoint, swept over concurrency.
+- stream: the blocking RAG query, which returns the answer all at once,
+  against retrieval followed by a streamed generation (generation_stream.py),
+  swept over concurrency, through a stub SageMaker endpoint of its own that
+  takes BENCH_STREAM_TOKEN_MS for each token. Reports the time to the first
+  token separately from the total latency, and fails when the streamed first
+  token doesn't come in less than half the streamed total.
+- batch: concurrent _predict calls, one prompt each, against the same prompts
+  grouped into batched invocations through the batch connector
+  (generation_batch.py), swept over concurrency. Set MOCK_GENERATE_SLOTS to
+  limit the invocations the mock's endpoint works on at once, as a real
+  endpoint's GPUs do. Without a limit, one prompt per call scales forever.
+- pool: generation through several stub SageMaker endpoints, each a mock of
+  its own with the generate_ms in BENCH_POOL_ENDPOINTS, BENCH_POOL_SLOTS
+  invocations at a time, and a share (BENCH_POOL_TAIL_RATE) of slow
+  invocations, plus BENCH_POOL_FAILING endpoints that fail every
+  invocation. Each endpoint has its own connector and model. Compares one
+  endpoint, round robin over all of them, and the generation pool
+  (generation_pool.py), without and with hedging, swept over concurrency.
+  Until the pool has latencies, the hedged mode hedges after
+  BENCH_POOL_HEDGE_MS. Reports the latency, the hedges, the failovers, and
+  the ejections, and fails when the hedged mode sent no hedge, or no hedge
+  won.
+'''
+
+import functools
+import itertools
+import os
+import time
+
+import generation_batch
+import generation_pool
+import generation_stream
+import mock_opensearch
+import perf_stats
+import rag_query
+
+from benchmarks.common import (check_completion, concurrency_levels, embedding_model_id,
+                               generation_model_id, index_name, int_list, make_client,
+                               numbered_prompt, query_count, question, register_model,
+                               run_async_concurrently, run_concurrently, stub_generation_action)
+
+
+stream_token_ms = float(os.environ.get('BENCH_STREAM_TOKEN_MS', 20))
+pool_endpoint_ms = int_list('BENCH_POOL_ENDPOINTS', '300,300,900')
+pool_slots = int(os.environ.get('BENCH_POOL_SLOTS', 4))
+pool_tail_rate = float(os.environ.get('BENCH_POOL_TAIL_RATE', 0.02))
+pool_tail_ms = float(os.environ.get('BENCH_POOL_TAIL_MS', 2000))
+pool_failing = int(os.environ.get('BENCH_POOL_FAILING', 1))
+pool_hedge_ms = float(os.environ.get('BENCH_POOL_HEDGE_MS', 1.5 * min(pool_endpoint_ms)))
+STREAM_PIPELINE_ID = 'bench_stream_pipeline'
+
+
+def bench_predict(url):
+  results = []
+  for concurrency in concurrency_levels:
+    client = make_client(url, concurrency)
+    body = {"parameters": {"inputs": question, "max_new_tokens": 64}}
+    metrics = run_concurrently(
+      functools.partial(client.transport.perform_request,
+                        'POST', f'/_plugins/_ml/models/{generation_model_id}/_predict', body=body),
+      query_count, concurrency)
+    results.append({"suite": "predict",
+                    "params": {"concurrency": concurrency},
+                    "metrics": metrics})
+  return results
+
+
+def stream_answer(client, streamer, query, max_new_tokens, first_tokens):
+  '''
+  Retrieves the passages for query, and streams the answer from streamer.
+  Appends the time to the first token to first_tokens.
+  '''
+  start = time.perf_counter()
+  resp = client.search(body={"query": query["query"], "size": query["size"],
+                             "_source": rag_query.SOURCE_FIELDS},
+                       index=index_name)
+  prompt = rag_query.build_prompt(question, rag_query.hit_texts(resp))
+  tokens = generation_stream.TimedStream(streamer.stream(prompt, {"max_new_tokens": max_new_tokens}),
+                                         start=start)
+  for _ in tokens:
+    pass
+  first_tokens.append(tokens.first_token_s)
+
+
+def bench_stream(url):
+  # A stub SageMaker endpoint of its own, which takes stream_token_ms for each
+  # token, so that a streamed answer starts well before it ends, with a model
+  # and a search pipeline on the main mock that generate through it.
+  latency = mock_opensearch.MockLatency.from_env()
+  latency.token_ms = stream_token_ms
+  server, stub_url = mock_opensearch.start_mock_server(latency)
+  results = []
+  max_new_tokens = 64
+  try:
+    client = make_client(url, 1)
+    model_id = register_model(client, 'bench stream', stub_generation_action(stub_url))
+    client.search_pipeline.put(id=STREAM_PIPELINE_ID, body=rag_query.search_pipeline_definition(model_id))
+    for concurrency in concurrency_levels:
+      client = make_client(url, concurrency)
+      query = rag_query.build_rag_query(question,
+                                        rag_query.neural_clause(question, embedding_model_id, k=5))
+      blocking = run_concurrently(
+        functools.partial(client.search, body=query, index=index_name,
+                          search_pipeline=STREAM_PIPELINE_ID, request_timeout=300),
+        query_count, concurrency)
+      # The first token of a blocking answer arrives with the last.
+      blocking["ttft_p50_ms"], blocking["ttft_p95_ms"] = blocking["p50_ms"], blocking["p95_ms"]
+      results.append({"suite": "stream",
+                      "params": {"mode": "blocking", "concurrency": concurrency,
+                                 "token_ms": stream_token_ms},
+                      "metrics": blocking})
+
+      streamer = generation_stream.HttpStreamer(f'{stub_url}/endpoints/{generation_model_id}/invocations')
+      first_tokens = []
+      metrics = run_concurrently(
+        functools.partial(stream_answer, client, streamer, query, max_new_tokens, first_tokens),
+        query_count, concurrency)
+      for p in (50, 95):
+        ttft = perf_stats.percentile(first_tokens, p)
+        metrics[f'ttft_p{p}_ms'] = None if ttft is None else round(ttft * 1000, 2)
+      results.append({"suite": "stream",
+                      "params": {"mode": "streamed", "concurrency": concurrency,
+                                 "token_ms": stream_token_ms},
+                      "metrics": metrics})
+      if metrics["ttft_p50_ms"] is None or metrics["ttft_p50_ms"] >= metrics["p50_ms"] / 2:
+        raise Exception(f'The streamed first token took {metrics["ttft_p50_ms"]} ms, of '
+                        f'{metrics["p50_ms"]} ms in all, at concurrency {concurrency}')
+  finally:
+    server.shutdown()
+  return results
+
+
+def bench_batch(url):
+  # Register a model on the batch connector, pointed at the mock's SageMaker
+  # route.
+  client = make_client(url, 1)
+  batch_model_id = register_model(
+    client, 'bench batch',
+    generation_batch.connector_action(f'{url}/endpoints/{generation_model_id}/invocations'))
+
+  def single(client):
+    async def call(i):
+      resp = await client.transport.perform_request(
+        'POST', rag_query.predict_path(generation_model_id),
+        body={"parameters": {"inputs": numbered_prompt(i), "max_new_tokens": 64}})
+      check_completion(i, rag_query.answer_from_prediction(resp))
+    return call
+
+  def batched(concurrency, batchers, client):
+    batcher = generation_batch.GenerationBatcher(
+      generation_batch.model_generator(client, batch_model_id), max_batch_size=concurrency)
+    batchers.append(batcher)
+    async def call(i):
+      check_completion(i, await batcher.generate(numbered_prompt(i)))
+    return call
+
+  results = []
+  for concurrency in concurrency_levels:
+    metrics = run_async_concurrently(url, single, query_count, concurrency)
+    metrics["invocations"] = query_count
+    results.append({"suite": "batch",
+                    "params": {"mode": "single", "concurrency": concurrency},
+                    "metrics": metrics})
+
+    batchers = []
+    metrics = run_async_concurrently(url, functools.partial(batched, concurrency, batchers),
+                                     query_count, concurrency)
+    stats = batchers[0].stats()
+    metrics.update(invocations=stats["batches"], mean_batch_size=stats["mean_batch_size"])
+    results.append({"suite": "batch",
+                    "params": {"mode": "batched", "concurrency": concurrency},
+                    "metrics": metrics})
+  return results
+
+
+def bench_pool(url):
+  # One stub SageMaker endpoint per BENCH_POOL_ENDPOINTS entry, each a mock of
+  # its own, with its own latency, and a connector and a model on the main
+  # mock, as create_connector.py and create_deepseek_model.py make them for
+  # SAGEMAKER_MODEL_INFERENCE_ENDPOINTS.
+  latencies = [mock_opensearch.MockLatency(generate_ms=ms, generate_slots=pool_slots,
+                                           generate_tail_rate=pool_tail_rate,
+                                           generate_tail_ms=pool_tail_ms)
+               for ms in pool_endpoint_ms]
+  latencies += [mock_opensearch.MockLatency(generate_ms=min(pool_endpoint_ms), generate_error_rate=1.0)
+                for _ in range(pool_failing)]
+  client = make_client(url, 1)
+  servers, model_ids = [], []
+  try:
+    for i, latency in enumerate(latencies):
+      server, stub_url = mock_opensearch.start_mock_server(latency)
+      servers.append(server)
+      model_ids.append(register_model(client, f'bench pool {i + 1}', stub_generation_action(stub_url)))
+
+    def make_call(mode, pools, client):
+      if mode == 'single':
+        generate = generation_pool.model_generator(client, model_ids[0])
+      elif mode == 'round_robin':
+        generators = itertools.cycle([generation_pool.model_generator(client, model_id)
+                                      for model_id in model_ids])
+        async def generate(prompt):
+          return await next(generators)(prompt)
+      else:
+        if mode == 'hedged':
+          pool = generation_pool.GenerationPool(generation_pool.model_generators(client, model_ids),
+                                                hedge_after_ms=pool_hedge_ms)
+        else:
+          pool = generation_pool.GenerationPool(generation_pool.model_generators(client, model_ids),
+                                                hedge_percentile=0)
+        pools.append(pool)
+        generate = pool.generate
+      async def call(i):
+        check_completion(i, await generate(numbered_prompt(i)))
+      return call
+
+    results = []
+    for concurrency in concurrency_levels:
+      for mode in ('single', 'round_robin', 'pool', 'hedged'):
+        pools = []
+        # A hedged call has two requests in flight.
+        metrics = run_async_concurrently(url, functools.partial(make_call, mode, pools),
+                                         query_count, concurrency, pool_size=concurrency * 2)
+        if pools:
+          stats = pools[0].stats()
+          endpoints = stats["endpoints"].values()
+          metrics.update(generations=sum(endpoint["requests"] for endpoint in endpoints),
+                         hedges=stats["hedges"], hedge_wins=stats["hedge_wins"],
+                         failovers=stats["failovers"],
+                         ejections=sum(endpoint["ejections"] for endpoint in endpoints))
+          # The pool tries every endpoint while it warms up. A hedge from the
+          # slowest one, after BENCH_POOL_HEDGE_MS, to a fast one answers
+          # first, so the hedged mode must hedge, and win.
+          if mode == 'hedged' and (not stats["hedges"] or not stats["hedge_wins"]):
+            raise Exception(f'The hedged pool sent {stats["hedges"]} hedges, of which '
+                            f'{stats["hedge_wins"]} won, at concurrency {concurrency}')
+        results.append({"suite": "pool",
+                        "params": {"mode": mode, "concurrency": concurrency,
+                                   "endpoints_ms": pool_endpoint_ms, "failing": pool_failing},
+                        "metrics": metrics})
+    return results
+  finally:
+    for server in servers:
+      server.shutdown()
+
+
+
+SUITES = {"predict": bench_predict, "stream": bench_stream, "batch": bench_batch,
+          "pool": bench_pool}
@@ -0,0 +1,93 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+The ingest suites:
+
+- ingest: the _bulk load through embedding_pipeline (load_data.py), swept over
+  batch size and concurrency.
+- backpressure: the fixed _bulk load (bulk_loader.py) against the adaptive
+  one (ingest_controller.py), against a mock of its own whose write queue
+  takes BENCH_BULK_SLOTS requests at once, and rejects the items of the rest,
+  and BENCH_BULK_REJECT_RATE of the items at random. Reports the documents
+  that reached the index, and the rejections and retries, for each starting
+  concurrency.
+'''
+
+import os
+
+import bulk_loader
+import ingest_controller
+import mock_opensearch
+
+from benchmarks.common import (concurrency_levels, doc_count, index_name, int_list, make_client,
+                               mapping, synthetic_documents)
+
+
+batch_sizes = int_list('BENCH_BATCH_SIZES', '50,200,1000')
+bulk_slots = int(os.environ.get('BENCH_BULK_SLOTS', 2))
+bulk_reject_rate = float(os.environ.get('BENCH_BULK_REJECT_RATE', 0.01))
+
+
+def bench_ingest(url):
+  results = []
+  for batch_size in batch_sizes:
+    for concurrency in concurrency_levels:
+      client = make_client(url, concurrency)
+      target = f'{index_name}_{batch_size}_{concurrency}'
+      client.indices.create(index=target, body=mapping)
+      totals = bulk_loader.bulk_load(client, target, synthetic_documents(doc_count),
+                                     pipeline='embedding_pipeline',
+                                     workers=concurrency,
+                                     max_docs=batch_size,
+                                     log=None)
+      results.append({"suite": "ingest",
+                      "params": {"batch_size": batch_size, "concurrency": concurrency,
+                                 "documents": doc_count},
+                      "metrics": {"seconds": round(totals["seconds"], 3),
+                                  "docs_per_s": round(totals["documents"] / totals["seconds"], 1),
+                                  "batches": totals["batches"],
+                                  "errors": totals["errors"]}})
+  return results
+
+
+def bench_backpressure(url):
+  latency = mock_opensearch.MockLatency.from_env()
+  latency.bulk_slots = bulk_slots
+  latency.bulk_reject_rate = bulk_reject_rate
+  server, busy_url = mock_opensearch.start_mock_server(latency)
+  results = []
+  try:
+    for concurrency in concurrency_levels:
+      client = make_client(busy_url, max(concurrency, ingest_controller.DEFAULT_MAX_WORKERS))
+      for mode in ('fixed', 'adaptive'):
+        target = f'{index_name}_{mode}_{concurrency}'
+        client.indices.create(index=target, body=mapping)
+        if mode == 'fixed':
+          totals = bulk_loader.bulk_load(client, target, synthetic_documents(doc_count),
+                                         workers=concurrency, log=None)
+        else:
+          limits = ingest_controller.AIMDLimits(workers=concurrency,
+                                                max_workers=max(concurrency, ingest_controller.DEFAULT_MAX_WORKERS))
+          totals = ingest_controller.adaptive_bulk_load(client, target, synthetic_documents(doc_count),
+                                                        limits=limits, retry_backoff=0.1, log=None)
+        client.indices.refresh(index=target)
+        indexed = client.count(index=target)["count"]
+        metrics = {"seconds": round(totals["seconds"], 3),
+                   "indexed_docs_per_s": round(indexed / totals["seconds"], 1),
+                   "indexed": indexed,
+                   "lost": doc_count - indexed,
+                   "batches": totals["batches"]}
+        if mode == 'adaptive':
+          metrics.update(rejected=totals["rejected"], retried=totals["retried"],
+                         final_limits=totals["limits"])
+        results.append({"suite": "backpressure",
+                        "params": {"mode": mode, "concurrency": concurrency, "documents": doc_count,
+                                   "bulk_slots": bulk_slots, "bulk_reject_rate": bulk_reject_rate},
+                        "metrics": metrics})
+  finally:
+    server.shutdown()
+  return results
+
+
+
+SUITES = {"ingest": bench_ingest, "backpressure": bench_backpressure}
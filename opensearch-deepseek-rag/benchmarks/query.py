@@ -0,0 +1,240 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+The retrieval suites:
+
+- query: the neural query through the RAG search pipeline (run_rag.py), swept
+  over k, size, and concurrency.
+- retrieval: neural-only against hybrid (match plus neural) retrieval,
+  without generation, swept over k, size, and concurrency. Each question asks
+  about one synthetic document, so the suite also reports the hit rate (the
+  share of questions whose document is in the results) and the mean
+  reciprocal rank.
+- query_embedding: retrieval with the neural query, where OpenSearch embeds
+  each question, against knn queries with vectors that the client embedded
+  (query_embedding.py): in batched _predict calls, and from a warm embedding
+  cache. Swept over concurrency. Also checks that each knn query returns the
+  same hits, with the same scores, as the neural query.
+- filter: the neural query on its own, against the same query filtered to
+  the metro area and the year that each question names (metadata_filters.py),
+  on corpora of BENCH_FILTER_DOCS documents. Reports the latency and the hit
+  rate for each corpus size.
+- router: a mix of questions, two thirds numeric and one third open-ended,
+  all through the RAG search pipeline, against the same mix through the fact
+  router (facts.py), which answers the numeric ones from the facts index.
+  Swept over concurrency. Reports the share of questions on each path, and
+  each path's median latency.
+'''
+
+import functools
+import os
+import tempfile
+import time
+
+import bulk_loader
+import embedders
+import embedding_cache
+import facts
+import metadata_filters
+import query_embedding
+import rag_query
+
+from benchmarks.common import (concurrency_levels, cycling_search, doc_count, embedding_model_id,
+                               index_name, int_list, k_values, labeled_questions, make_client,
+                               mapping, query_count, question, retrieval_query,
+                               run_async_concurrently, run_concurrently, size_values,
+                               synthetic_documents)
+
+
+retrieval_modes = os.environ.get('BENCH_RETRIEVAL', 'neural,hybrid').split(',')
+filter_doc_counts = int_list('BENCH_FILTER_DOCS', '2000,8000')
+
+
+def bench_query(url):
+  results = []
+  for k in k_values:
+    for size in size_values:
+      for concurrency in concurrency_levels:
+        client = make_client(url, concurrency)
+        query = rag_query.build_rag_query(question,
+                                          rag_query.neural_clause(question, embedding_model_id, k=k),
+                                          size=size,
+                                          context_size=size)
+        metrics = run_concurrently(
+          functools.partial(client.search, body=query, index=index_name,
+                            search_pipeline=rag_query.SEARCH_PIPELINE_ID,
+                            request_timeout=300),
+          query_count, concurrency)
+        results.append({"suite": "query",
+                        "params": {"k": k, "size": size, "concurrency": concurrency},
+                        "metrics": metrics})
+  return results
+
+
+def bench_retrieval(url):
+  results = []
+  questions = labeled_questions(query_count)
+  for mode in retrieval_modes:
+    pipeline = rag_query.HYBRID_PIPELINE_ID if mode == 'hybrid' else None
+    for k in k_values:
+      for size in size_values:
+        client = make_client(url, max(concurrency_levels))
+        # Hit quality doesn't depend on concurrency, so measure it once.
+        hits, reciprocal_ranks = 0, 0.0
+        for question_text, expected in questions:
+          resp = client.search(body=retrieval_query(mode, question_text, k, size),
+                               index=index_name, search_pipeline=pipeline)
+          ids = rag_query.hit_ids(resp)
+          if expected in ids:
+            hits += 1
+            reciprocal_ranks += 1 / (ids.index(expected) + 1)
+        quality = {"hit_rate": round(hits / len(questions), 3),
+                   "mrr": round(reciprocal_ranks / len(questions), 3)}
+        for concurrency in concurrency_levels:
+          client = make_client(url, concurrency)
+          bodies = [retrieval_query(mode, q, k, size) for q, _ in questions]
+          metrics = run_concurrently(
+            cycling_search(client, bodies, index=index_name, search_pipeline=pipeline),
+            query_count, concurrency)
+          results.append({"suite": "retrieval",
+                          "params": {"mode": mode, "k": k, "size": size, "concurrency": concurrency},
+                          "metrics": dict(metrics, **quality)})
+  return results
+
+
+def bench_query_embedding(url):
+  questions = [q for q, _ in labeled_questions(query_count)]
+  size = max(size_values)
+
+  def knn_body(vector):
+    return {"query": rag_query.knn_clause(vector, k=max(k_values)), "size": size, "_source": False}
+
+  # The same question, embedded by the client, finds the same hits, with the
+  # same scores, as the neural query.
+  client = make_client(url, 1)
+  identical = 0
+  for q in questions:
+    neural_resp = client.search(body=retrieval_query('neural', q, max(k_values), size), index=index_name)
+    resp = client.transport.perform_request('POST', embedders.predict_path(embedding_model_id),
+                                            body=embedders.predict_request([q]))
+    knn_resp = client.search(body=knn_body(embedders.vectors_from_prediction(resp)[0]), index=index_name)
+    identical += ([(h["_id"], h["_score"]) for h in neural_resp["hits"]["hits"]] ==
+                  [(h["_id"], h["_score"]) for h in knn_resp["hits"]["hits"]])
+
+  def neural(client):
+    async def call(i):
+      await client.search(body=retrieval_query('neural', questions[i % len(questions)],
+                                                max(k_values), size), index=index_name)
+    return call
+
+  def client_side(cache, concurrency, embedders_used, client):
+    embedder = query_embedding.create_query_embedder('model', client, embedding_model_id, cache=cache,
+                                                     max_batch_size=concurrency)
+    embedders_used.append(embedder)
+    async def call(i):
+      vector = await embedder.embed(questions[i % len(questions)])
+      await client.search(body=knn_body(vector), index=index_name)
+    return call
+
+  results = []
+  for concurrency in concurrency_levels:
+    metrics = run_async_concurrently(url, neural, query_count, concurrency)
+    results.append({"suite": "query_embedding",
+                    "params": {"mode": "neural", "concurrency": concurrency},
+                    "metrics": metrics})
+    with tempfile.TemporaryDirectory() as cache_dir:
+      for mode in ('client', 'cached'):
+        cache = embedding_cache.EmbeddingCache(cache_dir) if mode == 'cached' else None
+        used = []
+        make_call = functools.partial(client_side, cache, concurrency, used)
+        if cache is not None:
+          # Fill the cache with every question, and measure the second pass.
+          run_async_concurrently(url, make_call, len(questions), concurrency)
+          used.clear()
+        metrics = run_async_concurrently(url, make_call, query_count, concurrency)
+        stats = used[0].stats()
+        metrics.update(embed_calls=stats["calls"], mean_batch_size=stats["mean_batch_size"],
+                       identical_hits=round(identical / len(questions), 3))
+        results.append({"suite": "query_embedding",
+                        "params": {"mode": mode, "concurrency": concurrency},
+                        "metrics": metrics})
+  return results
+
+
+def bench_filter(url):
+  k, size = max(k_values), max(size_values)
+  client = make_client(url, 1)
+  results = []
+  for count in filter_doc_counts:
+    # Embed on the client with the mock's own model, so that large corpora
+    # load quickly.
+    target = f'{index_name}_filter_{count}'
+    client.indices.create(index=target, body=mapping)
+    documents = metadata_filters.with_metadata(synthetic_documents(count))
+    bulk_loader.bulk_load(client, target, embedders.embed_documents(documents, embedders.HashingEmbedder()),
+                          log=None)
+    client.indices.refresh(index=target)
+    parser = metadata_filters.QuestionParser(metadata_filters.known_metros(client, target))
+    step = max(count // query_count, 1)
+    questions = [(f'What is the population of the Metro {i} metro area in 2023?', str(i))
+                 for i in range(0, count, step)][:query_count]
+    for mode in ('unfiltered', 'filtered'):
+      bodies = [{"query": rag_query.neural_clause(q, embedding_model_id, k=k,
+                                                  filter=parser.filter(q) if mode == 'filtered' else None),
+                 "size": size, "_source": False}
+                for q, _ in questions]
+      hits = sum(1 for body, (_, expected) in zip(bodies, questions)
+                 if expected in rag_query.hit_ids(client.search(body=body, index=target)))
+      metrics = run_concurrently(cycling_search(client, bodies, index=target), query_count, 1)
+      metrics["hit_rate"] = round(hits / len(questions), 3)
+      results.append({"suite": "filter",
+                      "params": {"mode": mode, "documents": count, "k": k, "size": size},
+                      "metrics": metrics})
+    client.indices.delete(index=target)
+  return results
+
+
+def bench_router(url):
+  client = make_client(url, 1)
+  facts_index = f'{index_name}_facts'
+  facts.build_facts_index(client, facts_index, synthetic_documents(doc_count), log=None)
+  metros = metadata_filters.known_metros(client, facts_index)
+  templates = ['What is the population of {} in 2023?',
+               'What was the growth rate of {} in 2023?',
+               'Why is {} growing?']
+  questions = [templates[n % len(templates)].format(f'Metro {doc_id}')
+               for n, (_, doc_id) in enumerate(labeled_questions(query_count))]
+
+  def ask(router, client):
+    async def call(i):
+      question_text = questions[i % len(questions)]
+      start = time.perf_counter()
+      answer = await router.route_async(client, question_text) if router else None
+      if answer is None:
+        query = rag_query.build_rag_query(question_text,
+                                          rag_query.neural_clause(question_text, embedding_model_id, k=5),
+                                          size=2, context_size=2)
+        await client.search(body=query, index=index_name, search_pipeline=rag_query.SEARCH_PIPELINE_ID,
+                             request_timeout=300)
+      if router:
+        router.record(facts.ROUTE_LLM if answer is None else facts.ROUTE_FACTS,
+                      time.perf_counter() - start)
+    return call
+
+  results = []
+  for mode in ('llm', 'routed'):
+    for concurrency in concurrency_levels:
+      router = facts.FactRouter(metros, index_name=facts_index) if mode == 'routed' else None
+      metrics = run_async_concurrently(url, functools.partial(ask, router), query_count, concurrency)
+      if router:
+        metrics["routes"] = router.stats()
+      results.append({"suite": "router",
+                      "params": {"mode": mode, "concurrency": concurrency},
+                      "metrics": metrics})
+  return results
+
+
+
+SUITES = {"query": bench_query, "retrieval": bench_retrieval,
+          "query_embedding": bench_query_embedding, "filter": bench_filter,
+          "router": bench_router}
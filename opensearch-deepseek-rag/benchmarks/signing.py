@@ -0,0 +1,73 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+The signing suite: SigV4-signed connector calls (create_connector.py),
+assuming the role and opening a session for every call, against the cached
+credentials and signing key in aws_credentials.py. STS is
+aws_credentials.LocalSTS, with MOCK_STS_MS of latency per call. The suite
+also times signing alone.
+'''
+
+import time
+
+from requests_aws4auth import AWS4Auth
+import requests
+
+import aws_credentials
+import mock_opensearch
+import opensearch_client
+
+from benchmarks.common import query_count, run_concurrently
+
+
+def bench_signing(url):
+  latency = mock_opensearch.MockLatency.from_env()
+  role_arn = 'arn:aws:iam::123456789012:role/bench_connector_role'
+  body = {"name": "bench connector", "protocol": "aws_sigv4", "actions": []}
+
+  # Naive: what create_connector.py did, once per call.
+  sts = aws_credentials.LocalSTS(latency.sts_ms)
+  def naive_call():
+    credentials = sts.assume_role(RoleArn=role_arn, RoleSessionName='bench')['Credentials']
+    auth = AWS4Auth(credentials['AccessKeyId'], credentials['SecretAccessKey'], 'us-west-2', 'es',
+                    session_token=credentials['SessionToken'])
+    with requests.Session() as session:
+      session.post(f'{url}/_plugins/_ml/connectors/_create', auth=auth, json=body).raise_for_status()
+  naive = run_concurrently(naive_call, query_count, 1)
+  naive.update(sts_calls=sts.calls, signing_keys=query_count)
+
+  # Cached: one provider, one signer, and one session for all the calls.
+  sts = aws_credentials.LocalSTS(latency.sts_ms)
+  provider = aws_credentials.AssumedRoleCredentials(role_arn, 'bench', sts_client=sts)
+  auth = aws_credentials.SigV4Auth(provider, 'us-west-2', 'es')
+  session = opensearch_client.create_session(auth=auth)
+  cached = run_concurrently(
+    lambda: session.post(f'{url}/_plugins/_ml/connectors/_create', json=body).raise_for_status(),
+    query_count, 1)
+  cached.update(sts_calls=sts.calls, signing_keys=auth.signing_keys)
+  provider.close()
+
+  # Signing alone, without the network: a new signing key per request,
+  # against one key for all of them.
+  request = requests.Request('POST', f'{url}/_plugins/_ml/connectors/_create', json=body).prepare()
+  credentials = provider.get()
+  def sign_time(new_key):
+    reused = AWS4Auth(credentials["access_key"], credentials["secret_key"], 'us-west-2', 'es',
+                      session_token=credentials["token"])
+    signs = 1000
+    start = time.perf_counter()
+    for _ in range(signs):
+      auth = (AWS4Auth(credentials["access_key"], credentials["secret_key"], 'us-west-2', 'es',
+                       session_token=credentials["token"]) if new_key else reused)
+      auth(request.copy())
+    return round((time.perf_counter() - start) * 1000 / signs, 4)
+
+  return [{"suite": "signing", "params": {"mode": "naive"}, "metrics": naive},
+          {"suite": "signing", "params": {"mode": "cached"}, "metrics": cached},
+          {"suite": "signing", "params": {"mode": "sign_only"},
+           "metrics": {"new_key_ms_per_request": sign_time(True),
+                       "reused_key_ms_per_request": sign_time(False)}}]
+
+
+
+SUITES = {"signing": bench_signing}
@@ -0,0 +1,67 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+The snapshot suite: refilling an index through embedding_pipeline, against
+exporting the preloaded index to a vector snapshot (vector_snapshot.py) and
+importing it, with no embedding calls. Swept over the number of export
+slices. Also checks that the imported documents have the same vectors as the
+source index, and that the same queries score the same.
+'''
+
+import os
+import tempfile
+
+import bulk_loader
+import vector_snapshot
+
+from benchmarks.common import (doc_count, index_name, int_list, labeled_questions, make_client,
+                               mapping, retrieval_query, synthetic_documents)
+
+
+snapshot_slices = int_list('BENCH_SNAPSHOT_SLICES', '1,4')
+
+
+def bench_snapshot(url):
+  client = make_client(url, max(snapshot_slices + [bulk_loader.DEFAULT_WORKERS]))
+  target = f'{index_name}_reembedded'
+  client.indices.create(index=target, body=mapping)
+  totals = bulk_loader.bulk_load(client, target, synthetic_documents(doc_count),
+                                 pipeline='embedding_pipeline', log=None)
+  results = [{"suite": "snapshot",
+              "params": {"mode": "pipeline", "documents": doc_count},
+              "metrics": {"seconds": round(totals["seconds"], 3),
+                          "docs_per_s": round(totals["documents"] / totals["seconds"], 1)}}]
+  questions = labeled_questions(20)
+  for slices in snapshot_slices:
+    target = f'{index_name}_snapshot_{slices}'
+    client.indices.create(index=target, body=mapping)
+    with tempfile.TemporaryDirectory() as directory:
+      prefix = os.path.join(directory, 'snapshot')
+      exported = vector_snapshot.export_snapshot(client, index_name, prefix, slices=slices, log=None)
+      imported = bulk_loader.bulk_load(client, target, vector_snapshot.read_snapshot(prefix), log=None)
+    client.indices.refresh(index=target)
+    # The imported vectors are the exported ones, so every query scores the
+    # same. Documents with tied scores can come back in another order.
+    def scores(index, question_text):
+      resp = client.search(body=retrieval_query('neural', question_text, 5, 5), index=index)
+      return [hit["_score"] for hit in resp["hits"]["hits"]]
+    def vector(index, doc_id):
+      return client.get(index=index, id=doc_id)["_source"]["text_embedding"]
+    identical_scores = sum(1 for q, _ in questions if scores(index_name, q) == scores(target, q))
+    identical_vectors = sum(1 for _, doc_id in questions
+                            if vector(index_name, doc_id) == vector(target, doc_id))
+    seconds = exported["seconds"] + imported["seconds"]
+    results.append({"suite": "snapshot",
+                    "params": {"mode": "snapshot", "slices": slices, "documents": doc_count},
+                    "metrics": {"seconds": round(seconds, 3),
+                                "docs_per_s": round(imported["documents"] / seconds, 1),
+                                "export_seconds": round(exported["seconds"], 3),
+                                "import_seconds": round(imported["seconds"], 3),
+                                "snapshot_bytes": exported["bytes"],
+                                "identical_vectors": round(identical_vectors / len(questions), 3),
+                                "identical_scores": round(identical_scores / len(questions), 3)}})
+  return results
+
+
+
+SUITES = {"snapshot": bench_snapshot}
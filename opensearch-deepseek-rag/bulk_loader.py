@@ -0,0 +1,215 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Helpers for streaming a large corpus into OpenSearch with the _bulk API. The
+documents are read lazily from JSONL or CSV files, grouped into _bulk bodies
+that are bounded both by document count and by size in bytes, and sent over
+several concurrent workers. Only a handful of batches are held in memory at
+any time, so the corpus can be much larger than the memory on your machine.
+
+load_data.py loads every index through these helpers: the built-in
+population_data set, or the files in LOAD_DATA_FILES, when you set it.
+'''
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import csv
+import itertools
+import json
+import time
+
+import tracing
+
+
+# Defaults for the batch bounds. 5 MB and 500 documents are conservative
+# starting points for Amazon OpenSearch Service. Measure, and then adjust.
+DEFAULT_BATCH_DOCS = 500
+DEFAULT_BATCH_BYTES = 5 * 1024 * 1024
+DEFAULT_WORKERS = 4
+
+
+def read_documents(paths):
+  '''
+  Yields documents one at a time from a list of JSONL or CSV files. Each
+  document is a dict. An "id" or "_id" field, if present, becomes the document
+  id. Files ending in .csv are read with a header row. Everything else is read
+  as JSON lines.
+  '''
+  for path in paths:
+    with open(path, newline='', encoding='utf-8') as f:
+      if path.endswith('.csv'):
+        for row in csv.DictReader(f):
+          yield row
+      else:
+        for line in f:
+          line = line.strip()
+          if line:
+            yield json.loads(line)
+
+
+def document_id(document):
+  '''
+  Returns the id of a document as a string, or None when it has no id.
+  '''
+  doc_id = document.get('_id', document.get('id'))
+  return None if doc_id is None else str(doc_id)
+
+
+def record_ids(documents, ids):
+  '''
+  Passes documents through unchanged, appending the id of each one (when it
+  has one) to the ids list.
+  '''
+  for document in documents:
+    doc_id = document_id(document)
+    if doc_id is not None:
+      ids.append(doc_id)
+    yield document
+
+
+def bulk_entry(document, index_name):
+  '''
+  Returns the index action and source lines of a _bulk body for document.
+  The "_id" field, or else the "id" field, becomes the document id, and
+  neither one stays in the source.
+  '''
+  source = dict(document)
+  doc_id = source.pop('_id', None)
+  other_id = source.pop('id', None)
+  if doc_id is None:
+    doc_id = other_id
+  action = {"index": {"_index": index_name}}
+  if doc_id is not None:
+    action["index"]["_id"] = str(doc_id)
+  return json.dumps(action) + '\n' + json.dumps(source) + '\n'
+
+
+def iter_bulk_batches(documents, index_name,
+                      max_docs=DEFAULT_BATCH_DOCS,
+                      max_bytes=DEFAULT_BATCH_BYTES):
+  '''
+  Groups documents into newline-delimited _bulk bodies. A batch closes when it
+  reaches max_docs documents, or when adding the next document would push it
+  over max_bytes. Yields (body, document_count) tuples.
+  '''
+  lines = []
+  batch_docs = 0
+  batch_bytes = 0
+  for document in documents:
+    entry = bulk_entry(document, index_name)
+    entry_bytes = len(entry.encode('utf-8'))
+    if batch_docs and (batch_docs >= max_docs or batch_bytes + entry_bytes > max_bytes):
+      yield ''.join(lines), batch_docs
+      lines, batch_docs, batch_bytes = [], 0, 0
+    lines.append(entry)
+    batch_docs += 1
+    batch_bytes += entry_bytes
+  if batch_docs:
+    yield ''.join(lines), batch_docs
+
+
+def disable_refresh(client, index_name):
+  '''
+  Turns off periodic refresh for the index (or the index behind an alias),
+  and returns the previous
+  refresh_interval (None when the index uses the default) so that you can
+  restore it with restore_refresh.
+  '''
+  settings = client.indices.get_settings(index=index_name,
+                                         name='index.refresh_interval')
+  # index_name can be an alias, like population_data after a rebuild. The
+  # response is keyed by the index behind it.
+  previous = next(iter(settings.values()), {}).get('settings', {}) \
+                 .get('index', {}).get('refresh_interval')
+  client.indices.put_settings(index=index_name,
+                              body={"index": {"refresh_interval": "-1"}})
+  return previous
+
+
+def restore_refresh(client, index_name, previous):
+  '''
+  Restores the refresh_interval saved by disable_refresh, and refreshes the
+  index once so that everything loaded is searchable.
+  '''
+  client.indices.put_settings(index=index_name,
+                              body={"index": {"refresh_interval": previous}})
+  client.indices.refresh(index=index_name)
+
+
+def bulk_load(client, index_name, documents, pipeline=None,
+              workers=DEFAULT_WORKERS,
+              max_docs=DEFAULT_BATCH_DOCS,
+              max_bytes=DEFAULT_BATCH_BYTES,
+              log=print):
+  '''
+  Sends documents to index_name with the _bulk API, using workers concurrent
+  requests. At most two batches per worker are built ahead of the requests in
+  flight, which keeps memory flat regardless of the size of the corpus.
+  Logs the throughput of each batch as it completes (pass log=None to turn
+  that off), and returns a dict with the totals for the load. Each batch is a
+  span (see tracing.py), under the caller's current span.
+  '''
+  totals = {"batches": 0, "documents": 0, "bytes": 0, "errors": 0}
+  start = time.perf_counter()
+  # The workers' threads don't inherit the current span.
+  parent = tracing.tracer.current()
+
+  def send(batch_number, body, doc_count):
+    body_bytes = len(body.encode('utf-8'))
+    span = tracing.tracer.start_span('bulk.batch', parent=parent, batch=batch_number,
+                                     documents=doc_count, bytes=body_bytes, pipeline=pipeline)
+    batch_start = time.perf_counter()
+    resp = client.bulk(body=body, index=index_name, pipeline=pipeline)
+    elapsed = time.perf_counter() - batch_start
+    errors = sum(1 for item in resp.get('items', [])
+                 if 'error' in next(iter(item.values())))
+    span.set(errors=errors)
+    tracing.end_bulk_span(span, resp)
+    return batch_number, doc_count, body_bytes, errors, elapsed
+
+  def report(future):
+    batch_number, doc_count, body_bytes, errors, elapsed = future.result()
+    totals["batches"] += 1
+    totals["documents"] += doc_count
+    totals["bytes"] += body_bytes
+    totals["errors"] += errors
+    if log:
+      log(f'batch {batch_number}: {doc_count} docs, {body_bytes / 1024:.0f} KB '
+          f'in {elapsed:.2f}s ({doc_count / elapsed:.0f} docs/s), {errors} errors')
+
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    in_flight = set()
+    batches = iter_bulk_batches(documents, index_name, max_docs, max_bytes)
+    for batch_number, (body, doc_count) in enumerate(batches, start=1):
+      if len(in_flight) >= workers * 2:
+        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+          report(future)
+      in_flight.add(executor.submit(send, batch_number, body, doc_count))
+    for future in wait(in_flight).done:
+      report(future)
+
+  totals["seconds"] = time.perf_counter() - start
+  return totals
+
+
+def bulk_delete(client, index_name, ids, max_docs=DEFAULT_BATCH_DOCS):
+  '''
+  Deletes the documents with the given ids from index_name with the _bulk
+  API, max_docs per request. Ids that are already gone don't count as errors.
+  Returns a dict with the number of documents deleted, and of errors.
+  '''
+  totals = {"deleted": 0, "errors": 0}
+  ids = iter(ids)
+  while True:
+    batch = list(itertools.islice(ids, max_docs))
+    if not batch:
+      return totals
+    body = ''.join(json.dumps({"delete": {"_index": index_name, "_id": doc_id}}) + '\n'
+                   for doc_id in batch)
+    resp = client.bulk(body=body, index=index_name)
+    for item in resp.get('items', []):
+      result = item.get('delete', {})
+      if result.get('result') == 'deleted':
+        totals["deleted"] += 1
+      elif 'error' in result:
+        totals["errors"] += 1
@@ -0,0 +1,131 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Splits documents into passages before they're embedded. The all-MiniLM-L6-v2
+embedding model reads at most 256 word pieces and silently drops the rest, so
+a long document's embedding only describes its beginning. Splitting the text
+into overlapping windows that fit the model gives every part of the document
+its own vector, and lets the RAG query send the generation model a few short,
+relevant passages instead of whole documents.
+
+Each passage is indexed as its own document, with the fields in
+CHUNK_PROPERTIES:
+
+- parent_id: the id of the document the passage came from.
+- chunk_index: the position of the passage in that document, from 0.
+- chunk_count: the number of passages in that document.
+
+A passage's id is the parent id and the chunk index, joined by
+CHUNK_ID_SEPARATOR, so loading the same document again overwrites its
+passages. load_data.py chunks documents when you set CHUNK_MAX_TOKENS, and
+rag_query.py reads the parent ids back out of the search results.
+'''
+
+import bisect
+import hashlib
+import re
+
+import bulk_loader
+
+
+# The model was trained on 128 word pieces, and truncates at 256. Windows of
+# 128 tokens stay clear of the limit, since the tokens counted here are words
+# and punctuation, which the model's tokenizer splits further.
+DEFAULT_MAX_TOKENS = 128
+DEFAULT_OVERLAP_TOKENS = 24
+CHUNK_ID_SEPARATOR = '#'
+
+PARENT_ID_FIELD = 'parent_id'
+CHUNK_INDEX_FIELD = 'chunk_index'
+CHUNK_COUNT_FIELD = 'chunk_count'
+
+# The mapping for the chunk fields. index_profiles.build_mapping adds these to
+# the knowledge base's mapping.
+CHUNK_PROPERTIES = {
+  PARENT_ID_FIELD: {"type": "keyword"},
+  CHUNK_INDEX_FIELD: {"type": "integer"},
+  CHUNK_COUNT_FIELD: {"type": "integer"},
+}
+
+_token_pattern = re.compile(r'\w+|[^\w\s]')
+_sentence_break = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def count_tokens(text):
+  '''
+  Counts words and punctuation marks. This is a lower bound on the number of
+  word pieces the embedding model sees, and it needs no tokenizer.
+  '''
+  return len(_token_pattern.findall(text))
+
+
+def chunk_text(text, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+  '''
+  Splits text into windows of at most max_tokens tokens. Consecutive windows
+  share about overlap_tokens tokens, so a sentence that straddles a window
+  boundary is whole in at least one window. Where it can, a window ends and
+  starts on a sentence boundary, rather than in the middle of a sentence.
+  Returns a list of strings. Text that fits in one window comes back as is.
+  '''
+  if overlap_tokens >= max_tokens:
+    raise ValueError('overlap_tokens must be less than max_tokens')
+  spans = [(m.start(), m.end()) for m in _token_pattern.finditer(text)]
+  if len(spans) <= max_tokens:
+    return [text.strip()] if spans else []
+  # The token positions where a new sentence starts.
+  starts = [start for start, _ in spans]
+  boundaries = {bisect.bisect_left(starts, m.end()) for m in _sentence_break.finditer(text)}
+
+  chunks = []
+  start = 0
+  while True:
+    end = min(start + max_tokens, len(spans))
+    if end < len(spans):
+      # Move the end back to a sentence boundary, if there's one in the second
+      # half of the window.
+      for position in range(end, start + max_tokens // 2, -1):
+        if position in boundaries:
+          end = position
+          break
+    chunks.append(text[spans[start][0]:spans[end - 1][1]])
+    if end == len(spans):
+      return chunks
+    next_start = max(end - overlap_tokens, start + 1)
+    # Move the start forward to a sentence boundary inside the overlap, if
+    # there is one.
+    for position in range(next_start, end):
+      if position in boundaries:
+        next_start = position
+        break
+    start = next_start
+
+
+def parent_id(document, text_field='text'):
+  '''
+  The id of a document, or, when it has none, a hash of its text, so that its
+  passages get the same ids every time it's loaded.
+  '''
+  doc_id = bulk_loader.document_id(document)
+  if doc_id is not None:
+    return doc_id
+  return hashlib.sha1(document.get(text_field, '').encode('utf-8')).hexdigest()
+
+
+def chunk_documents(documents, max_tokens=DEFAULT_MAX_TOKENS,
+                    overlap_tokens=DEFAULT_OVERLAP_TOKENS, text_field='text'):
+  '''
+  Replaces each document with its passages, lazily. A passage carries all of
+  its parent's fields, with text_field replaced by the passage's text, and the
+  chunk fields added.
+  '''
+  for document in documents:
+    parent = parent_id(document, text_field)
+    fields = {name: value for name, value in document.items() if name not in ('_id', 'id')}
+    passages = chunk_text(fields.get(text_field, ''), max_tokens, overlap_tokens)
+    for chunk_index, passage in enumerate(passages):
+      yield dict(fields,
+                 _id=f'{parent}{CHUNK_ID_SEPARATOR}{chunk_index}',
+                 **{text_field: passage,
+                    PARENT_ID_FIELD: parent,
+                    CHUNK_INDEX_FIELD: chunk_index,
+                    CHUNK_COUNT_FIELD: len(passages)})
@@ -0,0 +1,137 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Fits the retrieved passages into a token budget before they go into the
+DeepSeek prompt. The retrieval_augmented_generation processor sends the whole
+text field of every hit, and prompt length drives the latency and the cost of
+each SageMaker call. Most of that text doesn't help answer the question: a
+population document has one sentence per year, and passages from the same
+document overlap (see chunking.py).
+
+assemble_context compacts the passages in three steps:
+
+1. It splits each passage into sentences, and drops sentences that an
+   earlier (higher ranked) passage already contains.
+2. It scores each sentence by the question terms it contains, weighted so
+   that rare terms, like a city name or a year, count for more than terms
+   that every sentence shares.
+3. It keeps the highest scoring sentences that fit in the budget, and puts
+   them back in their passage, in their original order, so each passage still
+   reads in sequence. Terms that kept sentences already cover count for less,
+   so the context covers every part of the question.
+
+Tokens are counted with chunking.count_tokens, which counts words and
+punctuation. That's an estimate of the generation model's tokens, and it
+needs no tokenizer.
+
+run_rag.py and async_rag.py use this when you set RAG_CONTEXT_TOKENS.
+'''
+
+import math
+import re
+
+import chunking
+
+
+DEFAULT_MAX_TOKENS = 256
+# Words that carry no meaning for matching a sentence to a question.
+STOP_WORDS = frozenset('''
+  a an and are as at be by does did do for from has have how in is it its of
+  on or that the this to was were what when where which who why will with
+  compare comparing
+'''.split())
+
+_word_pattern = re.compile(r'\w+')
+_sentence_break = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def split_sentences(text):
+  '''
+  Splits text into sentences. The built-in population_data set has literal
+  "\\n" sequences between sentences, so those count as breaks too.
+  '''
+  text = text.replace('\\n', '\n')
+  return [sentence.strip() for sentence in _sentence_break.split(text) if sentence.strip()]
+
+
+def terms(text):
+  return {word for word in _word_pattern.findall(text.lower()) if word not in STOP_WORDS}
+
+
+def _normalize(sentence):
+  return ' '.join(_word_pattern.findall(sentence.lower()))
+
+
+def assemble_context(question, passages, max_tokens=DEFAULT_MAX_TOKENS):
+  '''
+  Compacts passages (a list of strings, in rank order) to at most max_tokens
+  tokens in total. Returns (contexts, report). contexts has one string per
+  passage that kept at least one sentence, in rank order. report counts the
+  tokens before and after, the tokens saved, and the duplicate sentences
+  dropped.
+  '''
+  question_terms = terms(question)
+  # (passage index, position in passage, sentence)
+  sentences = []
+  seen = set()
+  duplicates = 0
+  tokens_before = 0
+  for passage_index, passage in enumerate(passages):
+    tokens_before += chunking.count_tokens(passage)
+    for position, sentence in enumerate(split_sentences(passage)):
+      key = _normalize(sentence)
+      if key in seen:
+        duplicates += 1
+        continue
+      seen.add(key)
+      sentences.append((passage_index, position, sentence))
+
+  # Inverse document frequency over the candidate sentences, so that a term
+  # in every sentence ("population", "metro") adds little, and a term in a
+  # few ("miami", "2021") adds a lot.
+  sentence_terms = [terms(sentence) for _, _, sentence in sentences]
+  frequency = {}
+  for found in sentence_terms:
+    for term in found & question_terms:
+      frequency[term] = frequency.get(term, 0) + 1
+  weights = {term: math.log(1 + len(sentences) / count) for term, count in frequency.items()}
+
+  def score(i):
+    passage_index, position, _ = sentences[i]
+    relevance = sum(weights.get(term, 0.0) for term in sentence_terms[i])
+    # Break ties in favor of higher ranked passages, and earlier sentences.
+    return (relevance, -passage_index, -position)
+
+  # Pick sentences greedily. Each time a kept sentence covers a question term,
+  # the term's weight halves, so that the context covers every part of the
+  # question (both cities in a comparison), rather than repeating one.
+  kept = set()
+  tokens_after = 0
+  remaining = set(range(len(sentences)))
+  while remaining:
+    best = max(remaining, key=score)
+    remaining.discard(best)
+    # Sentences that share no term with the question only fill the budget.
+    # Keep one, when none share a term, so the prompt has some context.
+    if kept and score(best)[0] == 0:
+      break
+    sentence_tokens = chunking.count_tokens(sentences[best][2])
+    if tokens_after + sentence_tokens > max_tokens:
+      continue
+    kept.add(best)
+    tokens_after += sentence_tokens
+    for term in sentence_terms[best]:
+      if term in weights:
+        weights[term] /= 2
+
+  contexts = []
+  for passage_index in range(len(passages)):
+    selected = [sentence for i, (index, _, sentence) in enumerate(sentences)
+                if index == passage_index and i in kept]
+    if selected:
+      contexts.append(' '.join(selected))
+  return contexts, {"passages": len(passages),
+                    "duplicate_sentences": duplicates,
+                    "tokens_before": tokens_before,
+                    "tokens_after": tokens_after,
+                    "tokens_saved": tokens_before - tokens_after}
@@ -1,44 +1,62 @@
 # Copyright opensearch-examples contributors
 # SPDX-License-Identifier: Apache-2.0
 '''
-This module uses the requests library and the AWS4Auth library to send a
-signed request to your OpenSearch Service domain creating a connector to
-your SageMaker endpoint. SageMaker hosts DeepSeek R1 text generation model
-for use in the run_rag.py example.
+This module uses a requests session (see opensearch_client.py) and the
+credential provider in aws_credentials.py to send a signed request to your
+OpenSearch Service domain creating a connector to your SageMaker endpoint.
+SageMaker hosts DeepSeek R1 text generation model for use in the run_rag.py
+example.
+
+Set AWS_CREDENTIALS_CACHE to a file path to keep the assumed role's temporary
+credentials there, so that later runs skip the STS call until they expire.
+
+Set DEEPSEEK_BATCH_CONNECTOR to true to create the batch connector instead,
+which sends a list of prompts to the endpoint in one invocation (see
+generation_batch.py).
+
+Set SAGEMAKER_MODEL_INFERENCE_ENDPOINTS to the URLs of several endpoints,
+separated by commas, to create one connector for each of them, for a pool of
+generation models (see generation_pool.py). The invoke role must be allowed
+to call every endpoint (see create_invoke_role.py).
 '''
 
 
-import boto3
+import aws_credentials
+import copy
+import deepseek_connector
+import generation_batch
 import json
+import opensearch_client
 import os
-import requests 
-from requests_aws4auth import AWS4Auth
 
 opensearch_service_api_endpoint = os.environ['OPENSEARCH_SERVICE_DOMAIN_ENDPOINT']
 region = os.environ['DEEPSEEK_AWS_REGION']
 invoke_role_arn = os.environ['INVOKE_DEEPSEEK_ROLE']
 create_deepseek_connector_role_arn = os.environ['CREATE_DEEPSEEK_CONNECTOR_ROLE']
-sagemaker_endpoint_url = os.environ['SAGEMAKER_MODEL_INFERENCE_ENDPOINT']
+sagemaker_endpoint_urls = [url for url in os.environ.get('SAGEMAKER_MODEL_INFERENCE_ENDPOINTS', '').split(',') if url] \
+  or [os.environ['SAGEMAKER_MODEL_INFERENCE_ENDPOINT']]
+credentials_cache = os.environ.get('AWS_CREDENTIALS_CACHE')
+batch_connector = os.environ.get('DEEPSEEK_BATCH_CONNECTOR', 'false').lower() in ('1', 'true', 'yes')
 
 
-# Create the AWS4Auth object that will sign the create connector API call. 
-credentials = boto3.client('sts').assume_role(
-    RoleArn=create_deepseek_connector_role_arn,
-    RoleSessionName='create_connector_session'
-)['Credentials']
-awsauth = AWS4Auth(credentials['AccessKeyId'], 
-                   credentials['SecretAccessKey'], 
-                   region, 
-                   'es', 
-                   session_token=credentials['SessionToken'])
+# Create the auth object that will sign the create connector API call. The
+# provider assumes the role on first use, and reuses the credentials (and the
+# signing key) until shortly before they expire.
+credentials = aws_credentials.AssumedRoleCredentials(create_deepseek_connector_role_arn,
+                                                     'create_connector_session',
+                                                     cache_path=credentials_cache)
+awsauth = aws_credentials.SigV4Auth(credentials, region, 'es')
 
 
 # Prepare the API call parameters. 
 path = '/_plugins/_ml/connectors/_create'
-url = opensearch_service_api_endpoint + path
+url = opensearch_client.endpoint_url(opensearch_service_api_endpoint) + path
 # See the documentation 
 # https://opensearch.org/docs/latest/ml-commons-plugin/remote-models/blueprints/ for 
 # details on the connector payload, and additional blueprints for other models.
+# The action, with the request body and the post-processing script that
+# translate between ML Commons and the TGI container, is in
+# deepseek_connector.py.
 payload = {
   "name": "DeepSeek R1 model connector v2",
   "description": "Connector for my Sagemaker DeepSeek model",
@@ -55,27 +73,38 @@ payload = {
     "temperature": 0.7,
     "max_new_tokens": 512
   },
-  "actions": [
-    {
-      "action_type": "PREDICT",
-      "method": "POST",
-      "url": sagemaker_endpoint_url,
-      "headers": {
-        "content-type": "application/json"
-      },
-      "request_body": "{ \"inputs\": \"${parameters.inputs}\", \"parameters\": {\"do_sample\": ${parameters.do_sample}, \"top_p\": ${parameters.top_p}, \"temperature\": ${parameters.temperature}, \"max_new_tokens\": ${parameters.max_new_tokens}} }",
-      "post_process_function": "\n      if (params.result == null || params.result.length == 0) {\n        throw new Exception('No response available');\n      }\n      \n      def completion = params.result[0].generated_text;\n      return '{' +\n               '\"name\": \"response\",'+\n               '\"dataAsMap\": {' +\n                  '\"completion\":\"' + escape(completion) + '\"}' +\n             '}';\n    "
-    }
-  ]
+  "actions": [deepseek_connector.connector_action(sagemaker_endpoint_urls[0])]
 }
+# The batch connector takes a list of prompts in inputs, and returns a list of
+# completions. The parameters are the same.
+if batch_connector:
+  payload["name"] = "DeepSeek R1 model batch connector"
+  payload["description"] = "Connector for my Sagemaker DeepSeek model, with batches of prompts"
+  payload["actions"] = [generation_batch.connector_action(sagemaker_endpoint_urls[0])]
 
 # This ignores errors and doesn't check the result. In real use,
 # you should wrap this code with try/except blocks and check the
-# response status code and the response body for errors.
+# response status code and the response body for errors. For a pool, each
+# connector is the same but for its endpoint URL, and its name is numbered.
 headers = {"Content-Type": "application/json"}
-r = requests.post(url, auth=awsauth, json=payload, headers=headers)
-connector_id = json.loads(r.text)['connector_id']
+session = opensearch_client.create_session(auth=awsauth)
+connector_ids = []
+for i, endpoint_url in enumerate(sagemaker_endpoint_urls):
+  endpoint_payload = copy.deepcopy(payload)
+  endpoint_payload["actions"][0]["url"] = endpoint_url
+  if len(sagemaker_endpoint_urls) > 1:
+    endpoint_payload["name"] += f' {i + 1}'
+  r = session.post(url, json=endpoint_payload, headers=headers)
+  connector_ids.append(json.loads(r.text)['connector_id'])
+connector_id = connector_ids[0]
 
 
-print(connector_id)
-print(f'\nPlease execute the following command\nexport DEEPSEEK_CONNECTOR_ID="{connector_id}"\n')
+print(' '.join(connector_ids))
+if len(connector_ids) > 1:
+  print(f'\nRun create_deepseek_model.py with DEEPSEEK_CONNECTOR_IDS set to these connectors, to '
+        f'register a model on each of them\nexport DEEPSEEK_CONNECTOR_IDS="{",".join(connector_ids)}"\n')
+elif batch_connector:
+  print('\nRun create_deepseek_model.py with DEEPSEEK_CONNECTOR_ID set to this connector, and '
+        'export the model id it prints as RAG_BATCH_MODEL_ID, for async_rag.py\n')
+else:
+  print(f'\nPlease execute the following command\nexport DEEPSEEK_CONNECTOR_ID="{connector_id}"\n')
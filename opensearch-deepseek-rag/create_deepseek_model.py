@@ -4,53 +4,88 @@
 This module creates an OpenSearch model 
 (see: https://opensearch.org/docs/latest/ml-commons-plugin/api/model-apis/index/)
 that you use to connect to SageMaker/DeepSeek. It
-uses the requests library with username/password authentication to call OpenSearch's
-REST API directly.
+uses a requests session with username/password authentication to call OpenSearch's
+REST API directly. Both calls share one kept-alive connection (see
+opensearch_client.py).
 
 As a side effect, OpenSearch automatically creates a model group for the model. Model
 groups (see: https://opensearch.org/docs/latest/ml-commons-plugin/api/model-group-apis/index/)
 help you control access to your OpenSearch models.
+
+Deploying is asynchronous, so the script polls the model's state, waiting longer
+after each poll, until it's DEPLOYED. provision.py does this, and the rest of the
+setup, in one run.
+
+Set DEEPSEEK_CONNECTOR_IDS to the connectors that create_connector.py created
+for a pool of endpoints, separated by commas, to register and deploy a model
+on each of them. The script prints their ids as RAG_GENERATION_MODEL_IDS, for
+run_rag.py and async_rag.py (see generation_pool.py).
 '''
 
 
+import opensearch_client
 import os
-import requests
+import time
 
 
 opensearch_service_api_endpoint = os.environ['OPENSEARCH_SERVICE_DOMAIN_ENDPOINT']
 opensearch_user_name = os.environ['OPENSEARCH_SERVICE_ADMIN_USER']
 opensearch_user_password = os.environ['OPENSEARCH_SERVICE_ADMIN_PASSWORD']
 region = os.environ['DEEPSEEK_AWS_REGION']
-connector_id = os.environ['DEEPSEEK_CONNECTOR_ID']
+connector_ids = [connector_id for connector_id in os.environ.get('DEEPSEEK_CONNECTOR_IDS', '').split(',') if connector_id] \
+  or [os.environ['DEEPSEEK_CONNECTOR_ID']]
 create_deepseek_connector_role = os.environ['CREATE_DEEPSEEK_CONNECTOR_ROLE']
 
 
 # Set up user/password auth
 userauth = (opensearch_user_name, opensearch_user_password)
 headers = {"Content-Type": "application/json"}
+session = opensearch_client.create_session(auth=userauth)
+base_url = opensearch_client.endpoint_url(opensearch_service_api_endpoint)
+
+
+def register_and_deploy(connector_id):
+  '''
+  Registers a model on connector_id, deploys it, waits until it's deployed,
+  and returns its id.
+  '''
+  ######################################################################################
+  # Register the model
+  path = '/_plugins/_ml/models/_register'
+  url = base_url + path
+  payload = {
+    "name": "Sagemaker DeepSeek R1 model",
+    "function_name": "remote",
+    "description": "DeepSeek R1 model on Sagemaker",
+    "connector_id": connector_id
+  }
+  r = session.post(url, json=payload, headers=headers)
 
+  model_id = r.json()['model_id']
+  print(f'model_id: {model_id}')
 
-########################################################################################
-# Register the model
-path = '/_plugins/_ml/models/_register'
-url = opensearch_service_api_endpoint + path
-payload = {
-  "name": "Sagemaker DeepSeek R1 model",
-  "function_name": "remote",
-  "description": "DeepSeek R1 model on Sagemaker",
-  "connector_id": connector_id
-}
-r = requests.post(url, auth=userauth, json=payload, headers=headers)
+  ######################################################################################
+  # Deploy the model, and wait until it's deployed
+  path = f'/_plugins/_ml/models/{model_id}/_deploy'
+  url = base_url + path
+  r = session.post(url, headers=headers)
 
-model_id = r.json()['model_id']
-print(f'model_id: {model_id}')
+  url = base_url + f'/_plugins/_ml/models/{model_id}'
+  for attempt in range(20):
+    model_state = session.get(url, headers=headers).json().get('model_state')
+    print(f'model_state: {model_state}')
+    if model_state in ('DEPLOYED', 'DEPLOY_FAILED'):
+      break
+    time.sleep(opensearch_client.backoff_delay(attempt, 1.0))
+  if model_state != 'DEPLOYED':
+    raise Exception(f'Model {model_id} is {model_state}')
+  return model_id
 
 
-########################################################################################
-# Deploy the model
-path = f'/_plugins/_ml/models/model_id/_deploy'
-url = opensearch_service_api_endpoint + path
-r = requests.post(url, auth=userauth, headers=headers)
+model_ids = [register_and_deploy(connector_id) for connector_id in connector_ids]
 
 
-print(f'\nPlease execute the following command\nexport DEEPSEEK_MODEL_ID="{model_id}"\n')
+if len(model_ids) > 1:
+  print(f'\nPlease execute the following command\nexport RAG_GENERATION_MODEL_IDS="{",".join(model_ids)}"\n')
+else:
+  print(f'\nPlease execute the following command\nexport DEEPSEEK_MODEL_ID="{model_ids[0]}"\n')
@@ -4,6 +4,10 @@
 '''
 Creates an AWS IAM role that OpenSearch service assumes to make
 calls to the SageMaker inference endpoint.
+
+For a pool of endpoints (see generation_pool.py), set
+SAGEMAKER_MODEL_INFERENCE_ARNS to their ARNs, separated by commas, and the
+role can invoke every one of them.
 '''
 
 
@@ -12,10 +16,11 @@ import json
 import os
 
 # The script will create a role and policy with the names below. It
-# reads the ARN for the SageMaker endpoint from the environment.
+# reads the ARN for the SageMaker endpoint (or endpoints) from the environment.
 invoke_deepseek_policy_name = 'invoke_deepseek_policy'
 invoke_deepseek_role_name = 'invoke_deepseek_role'
-sagemaker_model_inference_endpoint = os.environ['SAGEMAKER_MODEL_INFERENCE_ARN']
+sagemaker_model_inference_endpoints = [arn for arn in os.environ.get('SAGEMAKER_MODEL_INFERENCE_ARNS', '').split(',') if arn] \
+  or [os.environ['SAGEMAKER_MODEL_INFERENCE_ARN']]
 
 
 # Allows invoke endpoint
@@ -27,9 +32,7 @@ policy = {
       "Action": [
         "sagemaker:InvokeEndpoint"
       ],
-      "Resource": [
-        sagemaker_model_inference_endpoint
-      ]
+      "Resource": sagemaker_model_inference_endpoints
     }
   ]
 }
@@ -0,0 +1,28 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+The PREDICT action of the connector to the SageMaker endpoint that hosts
+DeepSeek R1. create_connector.py and provision.py both create the connector
+with it, so the two always send the same request, and read the same response.
+See generation_batch.py for the batch connector's action.
+'''
+
+
+# The connector's request_body. ML Commons fills in the prompt from the
+# _predict request, and the generation parameters from the connector's.
+REQUEST_BODY = "{ \"inputs\": \"${parameters.inputs}\", \"parameters\": {\"do_sample\": ${parameters.do_sample}, \"top_p\": ${parameters.top_p}, \"temperature\": ${parameters.temperature}, \"max_new_tokens\": ${parameters.max_new_tokens}} }"
+# The connector's post_process_function. It returns the first result's text
+# under completion.
+POST_PROCESS_FUNCTION = "\n      if (params.result == null || params.result.length == 0) {\n        throw new Exception('No response available');\n      }\n      \n      def completion = params.result[0].generated_text;\n      return '{' +\n               '\"name\": \"response\",'+\n               '\"dataAsMap\": {' +\n                  '\"completion\":\"' + escape(completion) + '\"}' +\n             '}';\n    "
+
+
+def connector_action(url):
+  '''
+  The PREDICT action of the connector, for the SageMaker endpoint at url.
+  '''
+  return {"action_type": "PREDICT",
+          "method": "POST",
+          "url": url,
+          "headers": {"content-type": "application/json"},
+          "request_body": REQUEST_BODY,
+          "post_process_function": POST_PROCESS_FUNCTION}
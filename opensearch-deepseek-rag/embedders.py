@@ -0,0 +1,185 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Client-side embedding generation. When you use the embedding_pipeline ingest
+pipeline, OpenSearch calls the embedding model once for each document during
+_bulk, so ingest throughput is bound by the model round trip. The embedders in
+this module compute embeddings for many texts in one call, so that the loader
+can write the text_embedding field directly and skip the ingest pipeline.
+
+Every embedder implements embed(texts), which returns a float32 NumPy array
+with one row per text. The rows must match the 384 dimensions of the
+knn_vector mapping in load_data.py.
+
+- OpenSearchModelEmbedder sends batches of texts to the same model that the
+  ingest pipeline uses, through ML Commons' _predict API.
+- HashingEmbedder is a deterministic, local stand-in that needs no model or
+  network. Its vectors are not semantically meaningful, but they are stable
+  across runs and processes, which makes it useful for offline testing and
+  performance work.
+'''
+
+import hashlib
+import re
+
+import numpy as np
+
+import tracing
+
+
+# The all-MiniLM-L6-v2 model produces 384-dimensional embeddings. This must
+# match the dimension of the text_embedding field in the index mapping.
+EMBEDDING_DIMENSION = 384
+DEFAULT_BATCH_SIZE = 128
+
+_token_pattern = re.compile(r'\w+')
+
+
+class Embedder:
+  '''
+  The embedder interface. Subclasses set model_id, which identifies the
+  vectors they produce, and implement embed.
+  '''
+  model_id = None
+  dimension = EMBEDDING_DIMENSION
+
+  def embed(self, texts):
+    '''
+    Returns a float32 array of shape (len(texts), dimension).
+    '''
+    raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+  '''
+  Embeds text with the hashing trick. Each lower-cased word is hashed to a
+  dimension and a sign, the counts are summed, and the vector is normalized to
+  unit length. The hash is blake2b rather than Python's hash(), so vectors are
+  identical across processes.
+  '''
+  model_id = 'local-hashing-384'
+
+  def __init__(self, dimension=EMBEDDING_DIMENSION):
+    self.dimension = dimension
+    self._buckets = {}
+
+  def _bucket(self, token):
+    bucket = self._buckets.get(token)
+    if bucket is None:
+      digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+      bucket = (digest % self.dimension, 1.0 if (digest >> 63) else -1.0)
+      self._buckets[token] = bucket
+    return bucket
+
+  def embed(self, texts):
+    rows, columns, signs = [], [], []
+    for row, text in enumerate(texts):
+      for token in _token_pattern.findall(text.lower()):
+        column, sign = self._bucket(token)
+        rows.append(row)
+        columns.append(column)
+        signs.append(sign)
+    vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+    np.add.at(vectors, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)),
+              np.array(signs, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class OpenSearchModelEmbedder(Embedder):
+  '''
+  Calls an ML Commons text embedding model with a batch of texts per request,
+  instead of one request per document.
+  '''
+
+  def __init__(self, client, model_id, batch_size=DEFAULT_BATCH_SIZE):
+    self.client = client
+    self.model_id = model_id
+    self.batch_size = batch_size
+
+  def embed(self, texts):
+    vectors = []
+    for start in range(0, len(texts), self.batch_size):
+      batch = texts[start:start + self.batch_size]
+      resp = self.client.transport.perform_request('POST', predict_path(self.model_id),
+                                                   body=predict_request(batch))
+      vectors.extend(vectors_from_prediction(resp, len(batch)))
+    return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+
+
+def predict_path(model_id):
+  return f'/_plugins/_ml/_predict/text_embedding/{model_id}'
+
+
+def predict_request(texts):
+  return {"text_docs": list(texts), "target_response": ["sentence_embedding"]}
+
+
+def vectors_from_prediction(resp, count=None):
+  '''
+  Returns the vectors in a text_embedding _predict response, as lists, in
+  the order of the texts. Raises ValueError when an output has no vector, or
+  when there aren't count vectors, since the vectors would no longer line up
+  with their texts.
+  '''
+  # Local models return one inference result per text. Remote models
+  # return one inference result with an output per text. Flatten both.
+  vectors = []
+  for result in resp['inference_results']:
+    for output in result['output']:
+      if 'data' not in output:
+        raise ValueError(f'The {output.get("name")} output of the _predict response has no data')
+      vectors.append(output['data'])
+  if count is not None and len(vectors) != count:
+    raise ValueError(f'Sent {count} texts to embed, and got {len(vectors)} vectors')
+  return vectors
+
+
+def check_dimension(vectors, dimension=EMBEDDING_DIMENSION):
+  '''
+  Raises ValueError unless vectors has dimension columns. Writing vectors with
+  the wrong dimension into a knn_vector field fails for every document.
+  '''
+  if vectors.ndim != 2 or vectors.shape[1] != dimension:
+    raise ValueError(f'Embedder produced vectors of shape {vectors.shape}, '
+                     f'but the knn_vector mapping expects {dimension} dimensions')
+  return vectors
+
+
+def embed_documents(documents, embedder, batch_size=DEFAULT_BATCH_SIZE,
+                    text_field='text', vector_field='text_embedding'):
+  '''
+  Streams documents through the embedder in batches of batch_size, and yields
+  each document with vector_field set. Like bulk_loader.read_documents, it only
+  holds one batch in memory.
+  '''
+  batch = []
+  for document in documents:
+    batch.append(document)
+    if len(batch) >= batch_size:
+      yield from _embed_batch(batch, embedder, text_field, vector_field)
+      batch = []
+  if batch:
+    yield from _embed_batch(batch, embedder, text_field, vector_field)
+
+
+def _embed_batch(batch, embedder, text_field, vector_field):
+  with tracing.tracer.start_span('embedding.batch', texts=len(batch), model_id=embedder.model_id):
+    vectors = check_dimension(embedder.embed([d[text_field] for d in batch]))
+  for document, vector in zip(batch, vectors):
+    document = dict(document)
+    document[vector_field] = vector.tolist()
+    yield document
+
+
+def create_embedder(name, client=None, model_id=None, batch_size=DEFAULT_BATCH_SIZE):
+  '''
+  Builds an embedder from its name: "model" for OpenSearchModelEmbedder, or
+  "hashing" for HashingEmbedder.
+  '''
+  if name == 'hashing':
+    return HashingEmbedder()
+  if name == 'model':
+    return OpenSearchModelEmbedder(client, model_id, batch_size=batch_size)
+  raise ValueError(f'Unknown embedder {name}. Use "model" or "hashing".')
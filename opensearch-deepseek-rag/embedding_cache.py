@@ -0,0 +1,216 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+A persistent, content-addressed cache for embeddings. Each entry is keyed by
+the embedding model id plus a SHA-256 hash of the normalized text, so a
+document that hasn't changed, or a question that someone asked before, never
+goes back to the model.
+
+The cache lives in a directory with two files:
+
+- vectors.f32 is a memory-mapped float32 array with one row per slot. Only
+  the rows you read or write are paged in, so a large cache costs little
+  memory.
+- index.json maps keys to slots, in least-recently-used order.
+
+The cache holds at most capacity entries. When it's full, it evicts the least
+recently used entries, a batch at a time. A slot that index.json on disk still
+maps to a key is never overwritten: an evicted slot is only reused after the
+index has been rewritten without it. If a load stops before save(), the
+reopened cache loses the entries added since the last save, but every key it
+still has maps to that key's vector.
+'''
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+
+import numpy as np
+
+from embedders import Embedder, EMBEDDING_DIMENSION
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# When the cache is full, it evicts this fraction of its capacity at once, so
+# it rewrites the index once per batch of evictions, not once per put.
+EVICTION_FRACTION = 1 / 64
+
+
+def normalize_text(text):
+  '''
+  Normalizes text for cache keys: Unicode NFC, with runs of whitespace
+  collapsed to one space and leading and trailing whitespace removed. It
+  doesn't change case, because not every embedding model is case-insensitive.
+  '''
+  return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def capacity_for(max_bytes, dimension):
+  return max(1, max_bytes // (dimension * 4))
+
+
+def cache_key(model_id, text):
+  return hashlib.sha256(f'{model_id}\x00{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+  '''
+  An on-disk LRU cache of embedding vectors. Call save() to persist the
+  index after you add entries. It's safe to share one cache between threads,
+  but not between processes that write at the same time.
+  '''
+
+  def __init__(self, directory, dimension=None, max_bytes=None):
+    '''
+    Opens the cache in directory, or creates it with dimension (384 by
+    default) and room for max_bytes (256 MB by default) of vectors. When the
+    cache exists, it keeps its own dimension and capacity, and it's a
+    ValueError to pass a different dimension, or a max_bytes that gives a
+    different capacity.
+    '''
+    self.directory = directory
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._lock = threading.Lock()
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, 'index.json')
+    vectors_path = os.path.join(directory, 'vectors.f32')
+    if os.path.exists(index_path):
+      with open(index_path, encoding='utf-8') as f:
+        index = json.load(f)
+      self.dimension = index['dimension']
+      self.capacity = index['capacity']
+      if dimension is not None and dimension != self.dimension:
+        raise ValueError(f'The embedding cache in {directory} holds {self.dimension}-dimensional '
+                         f'vectors, not {dimension}-dimensional ones')
+      if max_bytes is not None and capacity_for(max_bytes, self.dimension) != self.capacity:
+        raise ValueError(f'The embedding cache in {directory} holds {self.capacity} vectors, and '
+                         f'max_bytes={max_bytes} gives {capacity_for(max_bytes, self.dimension)}. '
+                         'Use the same max_bytes, or another directory')
+      self._entries = OrderedDict((key, slot) for key, slot in index['entries'])
+      mode = 'r+'
+    else:
+      self.dimension = EMBEDDING_DIMENSION if dimension is None else dimension
+      self.capacity = capacity_for(DEFAULT_MAX_BYTES if max_bytes is None else max_bytes, self.dimension)
+      self._entries = OrderedDict()
+      mode = 'w+'
+    self._vectors = np.memmap(vectors_path, dtype=np.float32, mode=mode,
+                              shape=(self.capacity, self.dimension))
+    used = set(self._entries.values())
+    self._free_slots = [slot for slot in range(self.capacity - 1, -1, -1) if slot not in used]
+    # Slots evicted since the last save. index.json may still map them, so
+    # they're only reused after the next save.
+    self._evicted_slots = []
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, model_id, text):
+    '''
+    Returns a copy of the cached vector for text, or None.
+    '''
+    key = cache_key(model_id, text)
+    with self._lock:
+      slot = self._entries.get(key)
+      if slot is None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return np.array(self._vectors[slot])
+
+  def put(self, model_id, text, vector):
+    key = cache_key(model_id, text)
+    with self._lock:
+      slot = self._entries.get(key)
+      if slot is None:
+        if not self._free_slots:
+          self._evict()
+        slot = self._free_slots.pop()
+        self._entries[key] = slot
+      else:
+        self._entries.move_to_end(key)
+      self._vectors[slot] = vector
+
+  def _evict(self):
+    '''
+    Evicts the least recently used entries, and saves the index without
+    them before their slots are reused. Called with the lock held.
+    '''
+    for _ in range(min(len(self._entries), max(1, int(self.capacity * EVICTION_FRACTION)))):
+      _, slot = self._entries.popitem(last=False)
+      self._evicted_slots.append(slot)
+      self.evictions += 1
+    self._save()
+
+  def save(self):
+    '''
+    Flushes the vectors, and atomically rewrites the index.
+    '''
+    with self._lock:
+      self._save()
+
+  def _save(self):
+    # The vectors go to disk before the index that maps them.
+    self._vectors.flush()
+    index = {"dimension": self.dimension,
+             "capacity": self.capacity,
+             "entries": list(self._entries.items())}
+    index_path = os.path.join(self.directory, 'index.json')
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+      json.dump(index, f)
+    os.replace(index_path + '.tmp', index_path)
+    # The index on disk no longer maps the evicted slots.
+    self._free_slots.extend(self._evicted_slots)
+    self._evicted_slots = []
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {"entries": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class CachedEmbedder(Embedder):
+  '''
+  Wraps another embedder. Texts found in the cache are served from it, and
+  only the misses go to the wrapped embedder, each once: texts that
+  normalize to the same cache key share one embedding.
+  '''
+
+  def __init__(self, embedder, cache):
+    if cache.dimension != embedder.dimension:
+      raise ValueError(f'The embedding cache holds {cache.dimension}-dimensional vectors, and '
+                       f'{embedder.model_id} embeds into {embedder.dimension} dimensions')
+    self.embedder = embedder
+    self.cache = cache
+    self.model_id = embedder.model_id
+    self.dimension = embedder.dimension
+
+  def embed(self, texts):
+    vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+    # The first text for each missing normalized text, and its rows.
+    missing = {}
+    for row, text in enumerate(texts):
+      normalized = normalize_text(text)
+      if normalized in missing:
+        missing[normalized][1].append(row)
+        continue
+      vector = self.cache.get(self.model_id, text)
+      if vector is None:
+        missing[normalized] = (text, [row])
+      else:
+        vectors[row] = vector
+    if missing:
+      missing_texts = [text for text, _ in missing.values()]
+      for (text, rows), vector in zip(missing.values(), self.embedder.embed(missing_texts)):
+        self.cache.put(self.model_id, text, vector)
+        vectors[rows] = vector
+    return vectors
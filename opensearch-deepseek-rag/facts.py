@@ -0,0 +1,299 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Answers numeric questions about the population data from a small index of
+facts, without the LLM. A question like "What's the population increase of
+New York City from 2021 to 2023?" is arithmetic over numbers that the
+documents already state, and yet, through the retrieval_augmented_generation
+processor, it pays for a kNN search and a whole DeepSeek generation.
+
+At load time, build_facts_index reads every sentence like "The metro area
+population of Chicago in 2022 was 8,901,000, a 0.27% increase from 2021."
+out of the documents, and indexes it as one fact: the metro area, the year,
+the population, and the growth rate from the year before, in percent (less
+than 0 for a decline). The facts index is small, one document per metro area
+and year. load_data.py rebuilds it when you set LOAD_FACTS, or
+RAG_FACTS_ROUTER, to true.
+
+FactRouter sends each question down one of two paths. It finds the metro
+areas and the years in the question (with metadata_filters.QuestionParser),
+and, from its wording, what it asks for:
+
+- population: the population of one or more metro areas in a year (or the
+  latest year, without one).
+- change: the change in population between the first and the last year it
+  names, like the sample question in run_rag.py.
+- growth_rate: the growth rate in a year, from the year before.
+
+With more than one metro area, the answer also compares them. The router
+looks the facts up with a single filtered search, and formats the answer.
+
+The router is conservative. A question goes to the facts only when every
+word besides the metro areas and the years is one that the questions above
+use: question words, and words for the population, its change, and its rate.
+Any other word, like "moved", "born", or "density", could change what the
+question asks, so the question goes to the LLM, as do questions that ask
+why, or for a prediction, that name no metro area, or whose facts aren't all
+in the index.
+
+run_rag.py and async_rag.py route questions when you set RAG_FACTS_ROUTER to
+true, and report the path each question took.
+'''
+
+from collections import Counter
+import re
+import statistics
+
+import bulk_loader
+import metadata_filters
+
+
+DEFAULT_INDEX = 'population_facts'
+# The facts for a question are at most a few metro areas over a few years,
+# and a metro area has one fact per year.
+MAX_FACTS = 1000
+ROUTE_FACTS = 'facts'
+ROUTE_LLM = 'llm'
+
+FACTS_MAPPING = {
+  "settings": {"index": {"number_of_shards": 1}},
+  "mappings": {
+    "properties": {
+      "metro": {"type": "keyword"},
+      "year": {"type": "integer"},
+      "population": {"type": "long"},
+      "growth_rate": {"type": "float"},
+      "source_id": {"type": "keyword"},
+    }
+  }
+}
+
+_fact_pattern = re.compile(r'population of (?P<metro>.+?) in (?P<year>(?:19|20)\d{2}) (?:is|was) '
+                           r'(?P<population>\d[\d,]*), an? (?P<rate>\d+(?:\.\d+)?)% '
+                           r'(?P<direction>increase|decline|decrease) from')
+# Questions with these words ask for an explanation or a judgment, which the
+# facts can't give.
+_open_ended_pattern = re.compile(r'\b(why|explain|reasons?|causes?|caused|drives?|driving|predict\w*|'
+                                 r'forecast\w*|project\w*|expect\w*|should|recommend\w*|describe|impact)\b')
+_change_pattern = re.compile(r'\b(increase[sd]?|decrease[sd]?|decline[sd]?|grow|grew|grown|growth|'
+                             r'change[sd]?|gain(?:ed)?|lost|los[es]|trend\w*|rise|rose|fell|fall)\b')
+_rate_pattern = re.compile(r'\b(rate|percent\w*|%)')
+_population_pattern = re.compile(r'\b(population|people|residents|inhabitants|how (?:many|big|large))\b')
+# The words a question that the facts answer can have, besides its metro
+# areas and years. A question with any other word goes to the LLM.
+_template_words = frozenset('''
+  what s was is were are be been will the a an of in for and to from between
+  at on by over during how much many did does do has have had its it their
+  which tell me please show give compare compared comparing comparison with
+  vs versus against than year years current latest now total overall metro
+  metropolitan area areas city cities region
+  population people residents inhabitants live lived living big large size
+  increase increases increased decrease decreases decreased decline declines
+  declined grow grew grown growth change changes changed gain gained lost
+  lose loses trend trends trending rise rose fell fall
+  rate percent percentage annual yearly
+'''.split())
+
+
+def extract_facts(document, text_field='text'):
+  '''
+  Returns the facts that document's text states, as dicts with metro, year,
+  population, growth_rate, and source_id.
+  '''
+  facts = []
+  for match in _fact_pattern.finditer(document.get(text_field, '')):
+    rate = float(match.group('rate'))
+    facts.append({"metro": match.group('metro').strip(),
+                  "year": int(match.group('year')),
+                  "population": int(match.group('population').replace(',', '')),
+                  "growth_rate": rate if match.group('direction') == 'increase' else -rate,
+                  "source_id": bulk_loader.document_id(document)})
+  return facts
+
+
+def fact_id(fact):
+  return f'{fact["metro"]}:{fact["year"]}'
+
+
+def build_facts_index(client, index_name, documents, log=print):
+  '''
+  Replaces index_name with the facts in documents. A fact that several
+  documents (or passages) state is indexed once. Returns a dict with the
+  numbers of facts and metro areas.
+  '''
+  facts = {}
+  for document in documents:
+    for fact in extract_facts(document):
+      facts[fact_id(fact)] = fact
+  if client.indices.exists(index=index_name):
+    client.indices.delete(index=index_name)
+  client.indices.create(index=index_name, body=FACTS_MAPPING)
+  bulk_loader.bulk_load(client, index_name,
+                        ({"_id": doc_id, **fact} for doc_id, fact in facts.items()),
+                        log=log)
+  client.indices.refresh(index=index_name)
+  return {"facts": len(facts), "metros": len({fact["metro"] for fact in facts.values()})}
+
+
+def _number(value):
+  return f'{value:,}'
+
+
+def _rate(value):
+  return f'{value:.2f}'.rstrip('0').rstrip('.') + '%'
+
+
+class FactRouter:
+  '''
+  Routes questions to the facts index, or to the LLM. metros are the metro
+  areas in the facts index (see metadata_filters.known_metros). Counts the
+  questions on each path.
+  '''
+
+  def __init__(self, metros, index_name=DEFAULT_INDEX):
+    self.index_name = index_name
+    self.parser = metadata_filters.QuestionParser(metros)
+    self.routes = Counter()
+    self.latencies = {ROUTE_FACTS: [], ROUTE_LLM: []}
+
+  def plan(self, question):
+    '''
+    Returns what the question asks for, as a dict with the kind, the metro
+    areas, and the years, or None when only the LLM can answer it.
+    '''
+    text = question.lower()
+    metros, years, words = self.parser.split(question)
+    if not metros or _open_ended_pattern.search(text):
+      return None
+    if any(word not in _template_words for word in words):
+      return None
+    if _change_pattern.search(text):
+      if len(years) >= 2:
+        kind = 'change'
+      elif _rate_pattern.search(text) or years:
+        kind = 'growth_rate'
+      else:
+        return None
+    elif _population_pattern.search(text) and len(years) <= 1:
+      kind = 'population'
+    else:
+      return None
+    return {"kind": kind, "metros": metros, "years": years}
+
+  def facts_query(self, plan):
+    '''
+    The search body for the facts a plan needs: every year of its metro areas,
+    so that a question without a year can use the latest.
+    '''
+    return {"query": {"bool": {"filter": [{"terms": {"metro": plan["metros"]}}]}},
+            "size": MAX_FACTS}
+
+  def answer(self, plan, resp):
+    '''
+    Formats the answer to plan from the facts in resp, the response to
+    facts_query, or returns None when a fact it needs is missing.
+    '''
+    facts = {}
+    for hit in resp["hits"]["hits"]:
+      fact = hit["_source"]
+      facts.setdefault(fact["metro"], {})[fact["year"]] = fact
+    if any(metro not in facts for metro in plan["metros"]):
+      return None
+    if plan["kind"] == 'change':
+      return self._change(plan, facts)
+    if plan["kind"] == 'growth_rate':
+      return self._growth_rate(plan, facts)
+    return self._population(plan, facts)
+
+  def _year(self, plan, facts):
+    '''
+    The question's year, or the latest year with a fact for every metro area.
+    '''
+    if plan["years"]:
+      return plan["years"][0]
+    common = set.intersection(*(set(facts[metro]) for metro in plan["metros"]))
+    return max(common) if common else None
+
+  def _population(self, plan, facts):
+    year = self._year(plan, facts)
+    if year is None or any(year not in facts[metro] for metro in plan["metros"]):
+      return None
+    populations = {metro: facts[metro][year]["population"] for metro in plan["metros"]}
+    sentences = [f'The population of the {metro} metro area in {year} was {_number(population)}.'
+                 for metro, population in populations.items()]
+    if len(populations) > 1:
+      ranked = sorted(populations, key=populations.get, reverse=True)
+      sentences.append(f'{ranked[0]} was the largest, {_number(populations[ranked[0]] - populations[ranked[1]])} '
+                       f'more than {ranked[1]}.')
+    return ' '.join(sentences)
+
+  def _growth_rate(self, plan, facts):
+    year = self._year(plan, facts)
+    if year is None or any(year not in facts[metro] for metro in plan["metros"]):
+      return None
+    rates = {metro: facts[metro][year]["growth_rate"] for metro in plan["metros"]}
+    sentences = [f'The population of the {metro} metro area {"grew" if rate >= 0 else "declined"} '
+                 f'{_rate(abs(rate))} in {year}, from {year - 1}.'
+                 for metro, rate in rates.items()]
+    if len(rates) > 1:
+      fastest = max(rates, key=rates.get)
+      sentences.append(f'{fastest} grew the fastest.')
+    return ' '.join(sentences)
+
+  def _change(self, plan, facts):
+    first, last = plan["years"][0], plan["years"][-1]
+    changes = {}
+    sentences = []
+    for metro in plan["metros"]:
+      if first not in facts[metro] or last not in facts[metro]:
+        return None
+      before, after = facts[metro][first]["population"], facts[metro][last]["population"]
+      change = after - before
+      changes[metro] = change / before * 100 if before else 0.0
+      sentences.append(f'From {first} to {last}, the population of the {metro} metro area '
+                       f'{"grew" if change >= 0 else "declined"} by {_number(abs(change))} '
+                       f'({_rate(abs(changes[metro]))}), from {_number(before)} to {_number(after)}.')
+    if len(changes) > 1:
+      ranked = sorted(changes, key=changes.get, reverse=True)
+      trend = 'grew the fastest' if changes[ranked[0]] >= 0 else 'declined the least'
+      sentences.append(f'{ranked[0]} {trend}, relative to its size: {_rate(changes[ranked[0]])}, '
+                       f'against {_rate(changes[ranked[1]])} for {ranked[1]}.')
+    return ' '.join(sentences)
+
+  def route(self, client, question):
+    '''
+    Answers question from the facts index, or returns None when it should go
+    to the LLM.
+    '''
+    plan = self.plan(question)
+    if plan is None:
+      return None
+    return self.answer(plan, client.search(index=self.index_name, body=self.facts_query(plan)))
+
+  async def route_async(self, client, question):
+    '''
+    Like route, with the async client.
+    '''
+    plan = self.plan(question)
+    if plan is None:
+      return None
+    return self.answer(plan, await client.search(index=self.index_name, body=self.facts_query(plan)))
+
+  def record(self, route, latency=None):
+    '''
+    Counts a question on route, and, with latency, in seconds, the time it
+    took to answer it.
+    '''
+    self.routes[route] += 1
+    if latency is not None:
+      self.latencies[route].append(latency)
+
+  def stats(self):
+    total = sum(self.routes.values())
+    stats = {"facts": self.routes[ROUTE_FACTS],
+             "llm": self.routes[ROUTE_LLM],
+             "facts_share": round(self.routes[ROUTE_FACTS] / total, 3) if total else None}
+    for route, latencies in self.latencies.items():
+      if latencies:
+        stats[f'{route}_p50_ms'] = round(statistics.median(latencies) * 1000, 1)
+    return stats
@@ -0,0 +1,130 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Groups concurrent RAG questions into one generation request. The connector in
+create_connector.py sends one prompt in each _predict call, so every question
+is its own SageMaker invocation. The SageMaker TGI container also accepts a
+list of prompts in "inputs", and generates them together, in one batch on the
+GPU, and returns one result for each:
+
+  {"inputs": ["prompt 1", "prompt 2"], "parameters": {...}}
+  [{"generated_text": "..."}, {"generated_text": "..."}]
+
+That needs its own connector (create_connector.py, with
+DEEPSEEK_BATCH_CONNECTOR), because the request_body inserts inputs as a JSON
+list, rather than as a quoted string, and the post_process_function returns
+every completion, rather than the first. Register a model for it with
+create_deepseek_model.py, as for the other connector.
+
+GenerationBatcher collects the prompts of concurrent callers for up to
+max_wait_ms, or until it has max_batch_size of them, sends them in one
+request, and hands each caller its own completion. async_rag.py uses it when
+you set RAG_BATCH_MODEL_ID.
+'''
+
+import asyncio
+
+import rag_query
+
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 20
+
+# The connector's request_body. ${parameters.inputs} has no quotes around it,
+# so ML Commons inserts the list of prompts from the _predict request as JSON.
+BATCH_REQUEST_BODY = "{ \"inputs\": ${parameters.inputs}, \"parameters\": {\"do_sample\": ${parameters.do_sample}, \"top_p\": ${parameters.top_p}, \"temperature\": ${parameters.temperature}, \"max_new_tokens\": ${parameters.max_new_tokens}} }"
+# The connector's post_process_function. It returns every result, in order,
+# as a list under completions.
+BATCH_POST_PROCESS_FUNCTION = "\n      if (params.result == null || params.result.length == 0) {\n        throw new Exception('No response available');\n      }\n      \n      def completions = [];\n      for (int i = 0; i < params.result.length; i++) {\n        completions.add('\"' + escape(params.result[i].generated_text) + '\"');\n      }\n      return '{' +\n               '\"name\": \"response\",'+\n               '\"dataAsMap\": {' +\n                  '\"completions\":[' + String.join(',', completions) + ']}' +\n             '}';\n    "
+
+
+def connector_action(url):
+  '''
+  The PREDICT action of the batch connector, for the SageMaker endpoint at url.
+  '''
+  return {"action_type": "PREDICT",
+          "method": "POST",
+          "url": url,
+          "headers": {"content-type": "application/json"},
+          "request_body": BATCH_REQUEST_BODY,
+          "post_process_function": BATCH_POST_PROCESS_FUNCTION}
+
+
+def model_generator(client, model_id, request_timeout=300):
+  '''
+  Returns a coroutine function that generates a list of prompts with one
+  _predict call to model_id, a model on the batch connector, through the
+  async client.
+  '''
+  async def generate_batch(prompts):
+    resp = await client.transport.perform_request('POST', rag_query.predict_path(model_id),
+                                                  body=rag_query.batch_predict_request(prompts),
+                                                  params={"request_timeout": request_timeout})
+    return rag_query.answers_from_batch_prediction(resp)
+  return generate_batch
+
+
+class GenerationBatcher:
+  '''
+  Batches the prompts of concurrent callers. generate_batch is a coroutine
+  function that takes a list of prompts, and returns their completions in the
+  same order, like the one model_generator returns. A batch goes out when it
+  has max_batch_size prompts, or max_wait_ms after its first prompt arrived,
+  whichever comes first. If the request fails, every caller in the batch gets
+  the error.
+  '''
+
+  def __init__(self, generate_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+               max_wait_ms=DEFAULT_MAX_WAIT_MS):
+    self.generate_batch = generate_batch
+    self.max_batch_size = max_batch_size
+    self.max_wait_s = max_wait_ms / 1000.0
+    self.batches = 0
+    self.prompts = 0
+    self._pending = []
+    self._timer = None
+    self._in_flight = set()
+
+  async def generate(self, prompt):
+    '''
+    Returns the completion for prompt, once its batch comes back.
+    '''
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    self._pending.append((prompt, future))
+    if len(self._pending) >= self.max_batch_size:
+      self._flush()
+    elif self._timer is None:
+      self._timer = loop.call_later(self.max_wait_s, self._flush)
+    return await future
+
+  def _flush(self):
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    batch, self._pending = self._pending, []
+    if batch:
+      task = asyncio.ensure_future(self._send(batch))
+      self._in_flight.add(task)
+      task.add_done_callback(self._in_flight.discard)
+
+  async def _send(self, batch):
+    self.batches += 1
+    self.prompts += len(batch)
+    try:
+      completions = await self.generate_batch([prompt for prompt, _ in batch])
+      if len(completions) != len(batch):
+        raise ValueError(f'Sent {len(batch)} prompts, and got {len(completions)} completions')
+    except Exception as e:
+      for _, future in batch:
+        if not future.done():
+          future.set_exception(e)
+      return
+    for (_, future), completion in zip(batch, completions):
+      if not future.done():
+        future.set_result(completion)
+
+  def stats(self):
+    return {"batches": self.batches,
+            "prompts": self.prompts,
+            "mean_batch_size": round(self.prompts / self.batches, 2) if self.batches else None}
@@ -0,0 +1,299 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Spreads generation over several SageMaker endpoints, each behind its own
+connector and model, so that one slow or overloaded endpoint doesn't set the
+latency of every answer. With one connector, every question waits for the
+one endpoint, for as long as the request timeout allows.
+
+create_connector.py creates one connector per endpoint in
+SAGEMAKER_MODEL_INFERENCE_ENDPOINTS, and create_deepseek_model.py registers
+and deploys a model on each of them, and prints their ids as
+RAG_GENERATION_MODEL_IDS. GenerationPool sends each prompt to one of the
+models, through its _predict API:
+
+- Routing: the pool keeps, for each endpoint, the requests it has in flight
+  and a moving average of its latency, and picks the endpoint with the
+  shortest expected wait, the average times the requests in flight plus
+  one. A fast endpoint takes more of the load, and a busy one less, until
+  it catches up.
+- Hedging: when the first request hasn't returned within hedge_percentile
+  of the latencies the pool has seen lately, the pool sends the same prompt
+  to the next best endpoint, takes whichever answer comes first, and
+  cancels the other request. Only the slowest few percent of requests are
+  hedged, so the extra generations are few, and the tail comes down to
+  about the hedge delay plus a typical generation. A request that fails
+  before the hedge goes out is sent to another endpoint the same way.
+- Health: an endpoint that fails max_failures times in a row, including
+  timeouts, is ejected, and gets no requests for eject_s seconds. Then it's
+  tried again: a success restores it, and a failure ejects it again, for
+  twice as long, up to max_eject_s.
+
+Until the pool has min_samples latencies, it hedges after hedge_after_ms, or
+not at all, without it.
+
+run_rag.py and async_rag.py generate through the pool when you set
+RAG_GENERATION_MODEL_IDS.
+'''
+
+import asyncio
+import collections
+import time
+
+import perf_stats
+import rag_query
+
+
+DEFAULT_REQUEST_TIMEOUT = 60
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_WINDOW = 200
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_EJECT_S = 10.0
+DEFAULT_MAX_EJECT_S = 300.0
+# The weight of the latest latency in an endpoint's moving average.
+LATENCY_SMOOTHING = 0.2
+
+
+def model_generator(client, model_id, request_timeout=DEFAULT_REQUEST_TIMEOUT):
+  '''
+  Returns a coroutine function that generates the completion for one prompt
+  with a _predict call to model_id, through the async client. A request that
+  takes longer than request_timeout seconds fails, and counts against the
+  endpoint's health.
+  '''
+  async def generate(prompt):
+    resp = await client.transport.perform_request('POST', rag_query.predict_path(model_id),
+                                                  body=rag_query.predict_request(prompt),
+                                                  params={"request_timeout": request_timeout})
+    return rag_query.answer_from_prediction(resp)
+  return generate
+
+
+def model_generators(client, model_ids, request_timeout=DEFAULT_REQUEST_TIMEOUT):
+  '''
+  The generators for a GenerationPool over model_ids, one model per
+  endpoint, by model id.
+  '''
+  return {model_id: model_generator(client, model_id, request_timeout) for model_id in model_ids}
+
+
+class Endpoint:
+  '''
+  One member of the pool, and what the pool has seen of it.
+  '''
+
+  def __init__(self, name, generate):
+    self.name = name
+    self.generate = generate
+    self.outstanding = 0
+    self.latency_s = None
+    self.requests = 0
+    self.answers = 0
+    self.errors = 0
+    self.hedges = 0
+    self.wins = 0
+    self.failures = 0
+    self.ejections = 0
+    self.eject_s = None
+    self.ejected_until = 0.0
+
+  def observe(self, latency):
+    if self.latency_s is None:
+      self.latency_s = latency
+    else:
+      self.latency_s += LATENCY_SMOOTHING * (latency - self.latency_s)
+
+  def observe_at_least(self, latency):
+    '''
+    Records a request that was cancelled after latency, which is only a lower
+    bound on how long it would have taken. It raises the estimate when it's
+    above it, so an endpoint that always loses the race still looks slow, and
+    otherwise says nothing.
+    '''
+    if self.latency_s is None or latency > self.latency_s:
+      self.observe(latency)
+
+  def proven(self):
+    '''
+    Whether the endpoint has answered before, and its last request didn't
+    fail.
+    '''
+    return self.answers > 0 and not self.failures
+
+  def expected_s(self, default):
+    '''
+    The expected wait for one more request: the latency, or default for an
+    endpoint that hasn't answered yet, for every request in flight, and this
+    one.
+    '''
+    latency = self.latency_s if self.latency_s is not None else default
+    return latency * (self.outstanding + 1)
+
+  def stats(self, now):
+    return {"requests": self.requests,
+            "wins": self.wins,
+            "hedges": self.hedges,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "ejected": now < self.ejected_until,
+            "latency_ms": round(self.latency_s * 1000, 1) if self.latency_s is not None else None}
+
+
+class GenerationPool:
+  '''
+  Generates through whichever of generators, a dict of coroutine functions
+  that each take a prompt and return its completion (like the ones
+  model_generators returns), is expected to answer first. Set
+  hedge_percentile to 0 to turn hedging off. clock is for tests.
+  '''
+
+  def __init__(self, generators, hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+               hedge_after_ms=None, min_samples=DEFAULT_MIN_SAMPLES, window=DEFAULT_WINDOW,
+               max_failures=DEFAULT_MAX_FAILURES, eject_s=DEFAULT_EJECT_S,
+               max_eject_s=DEFAULT_MAX_EJECT_S, clock=time.monotonic):
+    if not generators:
+      raise ValueError('The pool needs at least one generator')
+    self.endpoints = [Endpoint(name, generate) for name, generate in generators.items()]
+    self.hedge_percentile = hedge_percentile
+    self.hedge_after_s = hedge_after_ms / 1000.0 if hedge_after_ms else None
+    self.min_samples = min_samples
+    self.max_failures = max_failures
+    self.eject_s = eject_s
+    self.max_eject_s = max_eject_s
+    self.clock = clock
+    self.latencies = collections.deque(maxlen=window)
+    self.hedges = 0
+    self.hedge_wins = 0
+    self.failovers = 0
+
+  def choose(self, exclude=()):
+    '''
+    The endpoint with the shortest expected wait, out of the ones that
+    aren't ejected or in exclude. When every endpoint is ejected, the first
+    request still goes to the one that comes back soonest, rather than
+    failing, but a second request doesn't go out, and choose returns None.
+    A second request (with exclude) goes to an endpoint that has answered
+    before, and whose last request didn't fail, when there is one, since it's
+    the one that has to answer.
+    '''
+    now = self.clock()
+    candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+    healthy = [endpoint for endpoint in candidates if now >= endpoint.ejected_until]
+    if not healthy:
+      if exclude or not candidates:
+        return None
+      return min(candidates, key=lambda endpoint: endpoint.ejected_until)
+    # An endpoint that hasn't answered yet is expected to be typical, and
+    # among endpoints with the same expected wait, the one with the fewest
+    # requests goes first, so every endpoint gets tried.
+    default = perf_stats.percentile(self.latencies, 50) or 0.0
+    return min(healthy, key=lambda endpoint: (bool(exclude and not endpoint.proven()),
+                                              endpoint.expected_s(default), endpoint.outstanding,
+                                              endpoint.requests))
+
+  def hedge_delay(self):
+    '''
+    The seconds to wait for the first request before hedging, or None not to
+    hedge.
+    '''
+    if not self.hedge_percentile or len(self.endpoints) < 2:
+      return None
+    if len(self.latencies) < self.min_samples:
+      return self.hedge_after_s
+    return perf_stats.percentile(self.latencies, self.hedge_percentile)
+
+  async def generate(self, prompt):
+    '''
+    Returns the first completion for prompt. Raises the last error when
+    every request failed.
+    '''
+    first = self.choose()
+    tasks = {self._send(first, prompt): first}
+    delay = self.hedge_delay()
+    second_sent = hedged = False
+    error = None
+    try:
+      while tasks:
+        done, _ = await asyncio.wait(tasks, timeout=None if second_sent else delay,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+          endpoint = tasks.pop(task)
+          if task.exception() is None:
+            endpoint.wins += 1
+            if hedged and endpoint is not first:
+              self.hedge_wins += 1
+            return task.result()
+          error = task.exception()
+        if second_sent:
+          continue
+        # The first request failed, or is slower than hedge_percentile of
+        # the requests: send the prompt to another endpoint, too.
+        second_sent = True
+        second = self.choose(exclude=[first])
+        if second is None:
+          continue
+        if done:
+          self.failovers += 1
+        else:
+          hedged = True
+          self.hedges += 1
+          second.hedges += 1
+        tasks[self._send(second, prompt)] = second
+      raise error
+    finally:
+      for task in tasks:
+        task.cancel()
+
+  def _send(self, endpoint, prompt):
+    '''
+    Starts a request to endpoint, and counts it in flight right away, so that
+    the next choose, before the request gets to run, sees it.
+    '''
+    endpoint.requests += 1
+    endpoint.outstanding += 1
+    return asyncio.ensure_future(self._call(endpoint, prompt, self.clock()))
+
+  async def _call(self, endpoint, prompt, start):
+    try:
+      completion = await endpoint.generate(prompt)
+    except asyncio.CancelledError:
+      # The other request answered first. This one would have taken at
+      # least this long, which is all the pool learns of it.
+      endpoint.observe_at_least(self.clock() - start)
+      raise
+    except Exception:
+      self._failed(endpoint)
+      raise
+    finally:
+      endpoint.outstanding -= 1
+    latency = self.clock() - start
+    endpoint.observe(latency)
+    self.latencies.append(latency)
+    endpoint.answers += 1
+    endpoint.failures = 0
+    endpoint.eject_s = None
+    return completion
+
+  def _failed(self, endpoint):
+    '''
+    Counts a failure, and ejects the endpoint after max_failures in a row. An
+    endpoint that fails again right after it comes back is ejected for twice
+    as long.
+    '''
+    now = self.clock()
+    endpoint.errors += 1
+    endpoint.failures += 1
+    if endpoint.failures >= self.max_failures and now >= endpoint.ejected_until:
+      endpoint.eject_s = min(endpoint.eject_s * 2, self.max_eject_s) if endpoint.eject_s else self.eject_s
+      endpoint.ejected_until = now + endpoint.eject_s
+      endpoint.ejections += 1
+
+  def stats(self):
+    now = self.clock()
+    delay = self.hedge_delay()
+    return {"hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            "endpoints": {endpoint.name: endpoint.stats(now) for endpoint in self.endpoints}}
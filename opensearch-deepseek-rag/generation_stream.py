@@ -0,0 +1,148 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Streams DeepSeek's answer token by token, instead of waiting for the whole
+generation. The retrieval_augmented_generation processor returns the answer
+only when generation finishes, which, with max_new_tokens at 512, takes many
+seconds. Streaming shows the first tokens after the model's prefill, and the
+rest as they are generated.
+
+The SageMaker TGI container streams when the request sets "stream": true. It
+sends server-sent events, one per token, with lines like:
+
+  data:{"token": {"text": " The", "special": false}, "generated_text": null}
+
+There are two streamers, with the same interface:
+
+- SageMakerStreamer calls the endpoint's InvokeEndpointWithResponseStream API
+  with boto3, with your AWS credentials.
+- HttpStreamer posts to a URL that speaks TGI's protocol directly, like a TGI
+  server, or the mock's SageMaker route (see mock_opensearch.py).
+
+run_rag.py uses these when you set RAG_STREAM.
+'''
+
+import json
+import re
+import time
+
+import opensearch_client
+
+
+# The generation parameters of the connector in create_connector.py.
+DEFAULT_PARAMETERS = {"do_sample": True, "top_p": 0.9, "temperature": 0.7, "max_new_tokens": 512}
+
+
+def stream_request(prompt, parameters=None):
+  return {"inputs": prompt,
+          "parameters": dict(DEFAULT_PARAMETERS, **(parameters or {})),
+          "stream": True}
+
+
+def parse_events(chunks):
+  '''
+  Yields the text of each token in a stream of TGI server-sent events. The
+  chunks are bytes, and an event can span chunks, so lines are reassembled
+  before parsing. Special tokens (like the end of sequence) are dropped.
+  '''
+  buffer = b''
+  for chunk in chunks:
+    buffer += chunk
+    *lines, buffer = buffer.split(b'\n')
+    for line in lines:
+      token = _token_text(line)
+      if token is not None:
+        yield token
+  token = _token_text(buffer)
+  if token is not None:
+    yield token
+
+
+def _token_text(line):
+  line = line.strip()
+  if not line.startswith(b'data:'):
+    return None
+  event = json.loads(line[len(b'data:'):])
+  token = event.get('token') or {}
+  if token.get('special'):
+    return None
+  return token.get('text')
+
+
+class SageMakerStreamer:
+  '''
+  Streams from a SageMaker endpoint. endpoint is the endpoint's name, or its
+  invocations URL (SAGEMAKER_MODEL_INFERENCE_ENDPOINT), from which the name
+  is taken.
+  '''
+
+  def __init__(self, endpoint, region, sagemaker_runtime=None):
+    match = re.search(r'/endpoints/([^/]+)/', endpoint)
+    self.endpoint_name = match.group(1) if match else endpoint
+    if sagemaker_runtime is None:
+      import boto3
+      sagemaker_runtime = boto3.client('sagemaker-runtime', region_name=region)
+    self.runtime = sagemaker_runtime
+
+  def stream(self, prompt, parameters=None):
+    resp = self.runtime.invoke_endpoint_with_response_stream(
+      EndpointName=self.endpoint_name,
+      ContentType='application/json',
+      Body=json.dumps(stream_request(prompt, parameters)))
+    return parse_events(event['PayloadPart']['Bytes']
+                        for event in resp['Body'] if 'PayloadPart' in event)
+
+
+class HttpStreamer:
+  '''
+  Streams from a URL that speaks TGI's streaming protocol, over a pooled
+  session (see opensearch_client.py).
+  '''
+
+  def __init__(self, url, auth=None, timeout=300):
+    self.url = url
+    self.timeout = timeout
+    self.session = opensearch_client.create_session(auth=auth)
+
+  def stream(self, prompt, parameters=None):
+    resp = self.session.post(self.url, json=stream_request(prompt, parameters),
+                             stream=True, timeout=self.timeout)
+    resp.raise_for_status()
+    try:
+      yield from parse_events(resp.iter_content(chunk_size=None))
+    finally:
+      resp.close()
+
+
+class TimedStream:
+  '''
+  Wraps a token stream, and records the time to the first token and the total
+  time, in seconds, from start (by default, when the stream is wrapped). Pass
+  the start time of the whole request to include retrieval in both.
+  '''
+
+  def __init__(self, tokens, start=None):
+    self.tokens = tokens
+    self.start = time.perf_counter() if start is None else start
+    self.first_token_s = None
+    self.total_s = None
+    self.parts = []
+
+  def __iter__(self):
+    for token in self.tokens:
+      if self.first_token_s is None:
+        self.first_token_s = time.perf_counter() - self.start
+      self.parts.append(token)
+      yield token
+    self.total_s = time.perf_counter() - self.start
+
+  @property
+  def text(self):
+    return ''.join(self.parts)
+
+  def timings(self):
+    def ms(value):
+      return None if value is None else round(value * 1000, 1)
+    return {"time_to_first_token_ms": ms(self.first_token_s),
+            "total_ms": ms(self.total_s),
+            "tokens": len(self.parts)}
@@ -0,0 +1,180 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Index profiles for the knn_vector mapping of the knowledge base. Each profile
+trades recall for latency and memory in a different way:
+
+- hnsw: faiss HNSW with full float32 vectors. This is the original mapping
+  from load_data.py, and the most accurate.
+- hnsw_fp16: faiss HNSW with the vectors scalar-quantized to 16-bit floats.
+  Half the vector memory, with recall close to hnsw.
+- hnsw_byte: Lucene HNSW with the built-in scalar quantizer, which stores each
+  dimension in a byte. A quarter of the vector memory.
+- ivf_pq: faiss IVF with product quantization. The smallest by far, but the
+  least accurate, and it needs a trained model (see train_model) before you
+  can create the index.
+
+build_mapping turns a profile into the index body, with ef_search and the
+shard count as settings. profile_report.py measures recall@k, latency, and
+memory for each profile, so you can pick one with data.
+
+See https://opensearch.org/docs/latest/search-plugins/knn/knn-vector-quantization/
+and https://opensearch.org/docs/latest/search-plugins/knn/knn-index/ for the
+details of each method.
+'''
+
+import math
+import time
+
+import chunking
+import metadata_filters
+
+
+DEFAULT_PROFILE = 'hnsw'
+DEFAULT_EF_SEARCH = 100
+# Amazon OpenSearch Service recommends shards of 10-30 GB for search workloads.
+TARGET_SHARD_BYTES = 30 * 1024 ** 3
+
+PROFILES = {
+  "hnsw": {
+    "method": {
+      "name": "hnsw",
+      "space_type": "l2",
+      "engine": "faiss",
+      "parameters": {"ef_construction": 128, "m": 24},
+    },
+    "bytes_per_dimension": 4,
+  },
+  "hnsw_fp16": {
+    "method": {
+      "name": "hnsw",
+      "space_type": "l2",
+      "engine": "faiss",
+      "parameters": {"ef_construction": 128, "m": 24,
+                     "encoder": {"name": "sq", "parameters": {"type": "fp16"}}},
+    },
+    "bytes_per_dimension": 2,
+  },
+  "hnsw_byte": {
+    "method": {
+      "name": "hnsw",
+      "space_type": "l2",
+      "engine": "lucene",
+      "parameters": {"ef_construction": 128, "m": 24,
+                     "encoder": {"name": "sq"}},
+    },
+    "bytes_per_dimension": 1,
+  },
+  "ivf_pq": {
+    # Trained with the _train API. code_size 8 with m=48 stores each 384
+    # dimension vector in 48 bytes. m must divide the dimension.
+    "method": {
+      "name": "ivf",
+      "space_type": "l2",
+      "engine": "faiss",
+      "parameters": {"nlist": 256, "nprobes": 16,
+                     "encoder": {"name": "pq", "parameters": {"code_size": 8, "m": 48}}},
+    },
+    "requires_training": True,
+  },
+}
+
+
+def get_profile(name):
+  if name not in PROFILES:
+    raise ValueError(f'Unknown index profile {name}. Choose one of {", ".join(PROFILES)}.')
+  return PROFILES[name]
+
+
+def shards_for_corpus(doc_count, avg_source_bytes=1024, dimension=384, profile_name=DEFAULT_PROFILE):
+  '''
+  Derives the primary shard count from the expected corpus size: the
+  estimated size on disk of the sources plus the vectors, divided by the
+  target shard size, rounded up.
+  '''
+  vector_bytes = estimate_memory_bytes(profile_name, doc_count, dimension)
+  total_bytes = doc_count * avg_source_bytes + vector_bytes
+  return max(1, math.ceil(total_bytes / TARGET_SHARD_BYTES))
+
+
+def estimate_memory_bytes(profile_name, num_vectors, dimension=384):
+  '''
+  Estimates the native memory the vector index needs, with the formulas from
+  the k-NN documentation.
+  '''
+  profile = get_profile(profile_name)
+  parameters = profile["method"]["parameters"]
+  if profile["method"]["name"] == 'hnsw':
+    return int(1.1 * (profile["bytes_per_dimension"] * dimension + 8 * parameters["m"]) * num_vectors)
+  pq = parameters["encoder"]["parameters"]
+  return int(1.1 * ((pq["code_size"] / 8) * pq["m"] + 24) * num_vectors +
+             (2 ** pq["code_size"]) * 4 * dimension + 4 * parameters["nlist"] * dimension)
+
+
+def vector_field(profile_name, dimension=384, model_id=None):
+  '''
+  The knn_vector field mapping for a profile. Profiles that need training take
+  the model id of the trained model in place of a method.
+  '''
+  profile = get_profile(profile_name)
+  if profile.get("requires_training"):
+    if model_id is None:
+      raise ValueError(f'Index profile {profile_name} needs a trained model. Call train_model first.')
+    return {"type": "knn_vector", "model_id": model_id}
+  return {"type": "knn_vector", "dimension": dimension, "method": profile["method"]}
+
+
+def build_mapping(profile_name=DEFAULT_PROFILE, ef_search=DEFAULT_EF_SEARCH,
+                  shards=1, replicas=2, dimension=384, model_id=None):
+  '''
+  The index body for the knowledge base. It sets kNN to true to enable vector
+  search for the index, and defines the text field as type text, a
+  text_embedding field as the profile's knn_vector, the fields that
+  chunking.py adds to each passage, and the fields that metadata_filters.py
+  extracts.
+  '''
+  return {
+    "settings": {
+      "index": {
+        "knn": True,
+        "knn.algo_param.ef_search": ef_search,
+        "number_of_shards": shards,
+        "number_of_replicas": replicas
+      }
+    },
+    "mappings": {
+      "properties": {
+        "text": {"type": "text"},
+        "text_embedding": vector_field(profile_name, dimension, model_id),
+        **chunking.CHUNK_PROPERTIES,
+        **metadata_filters.METADATA_PROPERTIES
+      }
+    }
+  }
+
+
+def train_model(client, model_id, training_index, profile_name='ivf_pq', dimension=384,
+                training_field='text_embedding', timeout_s=1800):
+  '''
+  Trains the quantizer for a profile that requires training, on the vectors in
+  training_field of training_index, and waits until the model is created.
+  The training index needs at least as many vectors as the profile's nlist,
+  and ideally many more.
+  '''
+  body = {"training_index": training_index,
+          "training_field": training_field,
+          "dimension": dimension,
+          "method": get_profile(profile_name)["method"]}
+  client.transport.perform_request('POST', f'/_plugins/_knn/models/{model_id}/_train', body=body)
+  deadline = time.monotonic() + timeout_s
+  delay = 1.0
+  while True:
+    state = client.transport.perform_request('GET', f'/_plugins/_knn/models/{model_id}')['state']
+    if state == 'created':
+      return model_id
+    if state == 'failed':
+      raise Exception(f'Training model {model_id} failed')
+    if time.monotonic() > deadline:
+      raise Exception(f'Training model {model_id} did not finish in {timeout_s}s')
+    time.sleep(delay)
+    delay = min(delay * 2, 30.0)
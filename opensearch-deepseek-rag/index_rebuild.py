@@ -0,0 +1,162 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Helpers for a blue/green rebuild of the knowledge base. run_rag.py queries an
+alias. A rebuild creates a new, versioned index behind it, fills it, and then
+moves the alias in a single _aliases call, so queries never see a half-built
+index, and never see an error.
+
+While the new index fills, it has no replicas and no periodic refresh, so
+every document is indexed once, on the primary. Once it's full, the index is
+force-merged to a few segments, the replicas are restored (they copy the
+merged segments), and sample queries warm it up before the swap.
+
+load_data.py uses these helpers when you set REBUILD_INDEX.
+'''
+
+import time
+
+import perf_stats
+import rag_query
+
+
+DEFAULT_SLICES = 'auto'
+DEFAULT_MAX_SEGMENTS = 1
+DEFAULT_TIMEOUT_S = 1800
+# The questions that warm the new index, when you don't provide your own.
+DEFAULT_WARMUP_QUESTIONS = [
+  "What's the population increase of New York City from 2021 to 2023? How is the trending comparing with Miami?",
+  "What is the current metro area population of Seattle?",
+  "Which metro area grew fastest from 2022 to 2023?",
+]
+
+
+def versioned_index_name(alias):
+  '''
+  Returns a new index name for alias, like population_data_v20250131120000.
+  The names sort by the time the rebuild started.
+  '''
+  return f'{alias}_v{time.strftime("%Y%m%d%H%M%S", time.gmtime())}'
+
+
+def alias_targets(client, alias):
+  '''
+  Returns the names of the indices behind alias. When alias is a concrete
+  index (a knowledge base from before the first rebuild), returns [alias].
+  Returns [] when neither exists.
+  '''
+  if client.indices.exists_alias(name=alias):
+    return sorted(client.indices.get_alias(name=alias).keys())
+  if client.indices.exists(index=alias):
+    return [alias]
+  return []
+
+
+def disable_replicas(client, index_name):
+  '''
+  Sets number_of_replicas to 0, and returns the previous count, so that you
+  can restore it with restore_replicas.
+  '''
+  settings = client.indices.get_settings(index=index_name,
+                                         name='index.number_of_replicas')
+  # The response is keyed by the index, which differs from index_name when
+  # that's an alias.
+  previous = next(iter(settings.values()), {}).get('settings', {}) \
+                 .get('index', {}).get('number_of_replicas')
+  client.indices.put_settings(index=index_name,
+                              body={"index": {"number_of_replicas": 0}})
+  return previous
+
+
+def restore_replicas(client, index_name, previous, timeout_s=DEFAULT_TIMEOUT_S):
+  '''
+  Restores the replica count saved by disable_replicas, and waits until every
+  replica is allocated and the index is green.
+  '''
+  client.indices.put_settings(index=index_name,
+                              body={"index": {"number_of_replicas": previous}})
+  health = client.cluster.health(index=index_name, wait_for_status='green',
+                                 timeout=f'{timeout_s}s', request_timeout=timeout_s + 30)
+  if health.get('timed_out') or health.get('status') != 'green':
+    raise Exception(f'Index {index_name} is {health.get("status")} after restoring '
+                    f'{previous} replicas. Not swapping the alias.')
+
+
+def sliced_reindex(client, source_index, dest_index, slices=DEFAULT_SLICES,
+                   batch_size=1000, pipeline=None, poll_seconds=5.0, log=print):
+  '''
+  Copies every document from source_index to dest_index with _reindex, split
+  into slices that run in parallel on the cluster ("auto" picks one slice per
+  shard). The copy keeps each document's _source, including text_embedding,
+  so the embedding model isn't called, unless you pass a pipeline. Runs as a
+  task, and polls it until it completes. Returns the task's response, with
+  the counts of created documents and failures.
+  '''
+  body = {"source": {"index": source_index, "size": batch_size},
+          "dest": {"index": dest_index}}
+  if pipeline:
+    body["dest"]["pipeline"] = pipeline
+  task_id = client.reindex(body=body, slices=slices,
+                           wait_for_completion=False)['task']
+  while True:
+    task = client.tasks.get(task_id=task_id)
+    status = task.get('task', {}).get('status', {})
+    if task.get('completed'):
+      if 'error' in task:
+        raise Exception(f'Reindex {source_index} to {dest_index} failed: {task["error"]}')
+      return task.get('response', status)
+    if log:
+      log(f'reindex: {status.get("created", 0) + status.get("updated", 0)} of '
+          f'{status.get("total", "?")} documents')
+    time.sleep(poll_seconds)
+
+
+def force_merge(client, index_name, max_segments=DEFAULT_MAX_SEGMENTS,
+                timeout_s=DEFAULT_TIMEOUT_S):
+  '''
+  Merges the index down to max_segments segments per shard. A kNN query
+  searches each segment's graph, so fewer segments means faster queries.
+  Merging a large index takes a while, so the request waits up to timeout_s.
+  '''
+  client.indices.forcemerge(index=index_name, max_num_segments=max_segments,
+                            request_timeout=timeout_s)
+
+
+def warm_up(client, index_name, questions, embedding_model_id, k=5, size=2):
+  '''
+  Loads the index's kNN graphs into memory with the k-NN warmup API, and then
+  sends a neural query for each question, so that the first queries after the
+  swap don't pay for cold caches. Returns the latency summary of the queries.
+  '''
+  client.transport.perform_request('GET', f'/_plugins/_knn/warmup/{index_name}')
+  latencies = []
+  start = time.perf_counter()
+  for question in questions:
+    query_start = time.perf_counter()
+    client.search(index=index_name,
+                  body={"query": rag_query.neural_clause(question, embedding_model_id, k=k),
+                        "size": size,
+                        "_source": False})
+    latencies.append(time.perf_counter() - query_start)
+  return perf_stats.summarize_latencies(latencies, time.perf_counter() - start)
+
+
+def swap_alias(client, alias, new_index, old_indices, delete_index=False):
+  '''
+  Points alias at new_index, and away from old_indices, in one atomic
+  _aliases call. The old indices stay, so you can move the alias back. When
+  alias is still a concrete index (from before the first rebuild), that index
+  has to go to free the name, and the same call deletes it, but only with
+  delete_index=True. Otherwise, that's a ValueError, and nothing changes.
+  '''
+  if alias in old_indices and not delete_index:
+    raise ValueError(f'{alias} is an index, not an alias. Pointing the alias at {new_index} '
+                     f'deletes it, and there is no rollback.')
+  actions = []
+  for old_index in old_indices:
+    if old_index == alias:
+      actions.append({"remove_index": {"index": old_index}})
+    else:
+      actions.append({"remove": {"index": old_index, "alias": alias}})
+  actions.append({"add": {"index": new_index, "alias": alias, "is_write_index": True}})
+  client.indices.update_aliases(body={"actions": actions})
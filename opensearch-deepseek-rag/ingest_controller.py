@@ -0,0 +1,346 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Loads documents with the _bulk API, and adapts to what the domain can take.
+Under load, Amazon OpenSearch Service rejects work it has no room for. A
+whole _bulk request can fail with 429, which the client retries (see
+opensearch_client.py), but more often the request succeeds, and some of its
+items fail with status 429 and es_rejected_execution_exception, because a
+shard's write queue was full. bulk_loader.bulk_load counts those items as
+errors, and moves on, so the documents are lost.
+
+adaptive_bulk_load reads the result of every item:
+
+- It retries only the items that were rejected, after a backoff with jitter
+  (opensearch_client.backoff_delay), in a later batch.
+- An item that is still rejected after max_attempts, or that failed for any
+  other reason (like a mapping error), counts as an error. With a
+  dead_letter_path, it also goes to the dead-letter file, a JSON line with
+  the document and its last error, so you can fix it and load it again.
+- A _bulk request that times out, or that can't connect, means the same as
+  a rejection: the domain is too busy. Its items are retried, and the
+  limits are cut. The domain may have written some of them before the
+  timeout, so a document without an id, which would be written twice, goes
+  to the dead-letter file instead.
+- AIMDLimits sets the size of each batch and the number of batches in
+  flight. After a batch that was fast and had no rejections, it grows the
+  batch size by a fixed step, and adds a worker once a window of batches has
+  succeeded. After a batch with more than a small share of its items
+  rejected, or that took longer than the target, it cuts both in half.
+  That's the additive increase, multiplicative decrease (AIMD) of TCP's
+  congestion control, and it settles just below the rate the domain can
+  take.
+
+load_data.py uses this when you set BULK_ADAPTIVE to true.
+'''
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from opensearchpy.exceptions import ConnectionError as TransportConnectionError
+from opensearchpy.exceptions import TransportError
+
+import bulk_loader
+import opensearch_client
+import tracing
+
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MIN_BATCH_DOCS = 10
+DEFAULT_MAX_BATCH_DOCS = 5000
+# A batch that takes longer than this counts as a sign of overload, like a
+# rejection. Bulk requests of a few seconds keep the domain busy without
+# queuing work behind them.
+DEFAULT_TARGET_BATCH_SECONDS = 5.0
+# The share of a batch's items that can be rejected before the limits are
+# cut. A few rejections are normal on a busy domain, and are retried.
+DEFAULT_REJECTION_THRESHOLD = 0.01
+DEFAULT_RETRY_BACKOFF = 1.0
+# The item errors that mean "slow down and try again": the item wasn't
+# written, and sending it again is safe.
+RETRY_ERROR_TYPES = ('es_rejected_execution_exception', 'circuit_breaking_exception',
+                     'request_timeout')
+
+
+class AIMDLimits:
+  '''
+  The batch size, in documents, and the number of batches in flight, adjusted
+  after each batch. Batches in flight when the limits were cut were sized for
+  the old limits, so their results don't cut the limits again.
+  '''
+
+  def __init__(self, batch_docs=bulk_loader.DEFAULT_BATCH_DOCS,
+               workers=bulk_loader.DEFAULT_WORKERS,
+               min_batch_docs=DEFAULT_MIN_BATCH_DOCS,
+               max_batch_docs=DEFAULT_MAX_BATCH_DOCS,
+               max_workers=DEFAULT_MAX_WORKERS,
+               target_batch_seconds=DEFAULT_TARGET_BATCH_SECONDS,
+               rejection_threshold=DEFAULT_REJECTION_THRESHOLD,
+               batch_step=None, decrease=0.5):
+    self.batch_docs = batch_docs
+    self.workers = workers
+    self.min_batch_docs = min_batch_docs
+    self.max_batch_docs = max_batch_docs
+    self.max_workers = max_workers
+    self.target_batch_seconds = target_batch_seconds
+    self.rejection_threshold = rejection_threshold
+    self.batch_step = batch_step or max(min_batch_docs, batch_docs // 10)
+    self.decrease = decrease
+    self.increases = 0
+    self.decreases = 0
+    # The number of times the limits were cut. A batch records the epoch it
+    # was sent in.
+    self.epoch = 0
+    self._successes = 0
+    self._lock = threading.Lock()
+
+  def update(self, epoch, elapsed, documents, rejected):
+    '''
+    Adjusts the limits after a batch of documents, sent in epoch, took
+    elapsed seconds, and had rejected items rejected.
+    '''
+    with self._lock:
+      if epoch != self.epoch:
+        return
+      if rejected > documents * self.rejection_threshold or elapsed > self.target_batch_seconds:
+        self.batch_docs = max(self.min_batch_docs, int(self.batch_docs * self.decrease))
+        self.workers = max(1, int(self.workers * self.decrease))
+        self.decreases += 1
+        self.epoch += 1
+        self._successes = 0
+        return
+      self.batch_docs = min(self.max_batch_docs, self.batch_docs + self.batch_step)
+      self._successes += 1
+      if self._successes >= self.workers:
+        self.workers = min(self.max_workers, self.workers + 1)
+        self._successes = 0
+      self.increases += 1
+
+  def snapshot(self):
+    return {"batch_docs": self.batch_docs, "workers": self.workers,
+            "increases": self.increases, "decreases": self.decreases}
+
+
+class _Item:
+  '''
+  One document's _bulk entry, and its attempts so far.
+  '''
+
+  __slots__ = ('entry', 'attempts', 'error')
+
+  def __init__(self, entry):
+    self.entry = entry
+    self.attempts = 0
+    self.error = None
+
+  @property
+  def has_id(self):
+    return '_id' in json.loads(self.entry.split('\n', 1)[0])["index"]
+
+
+def _error_type(result):
+  error = result.get('error')
+  return error.get('type') if isinstance(error, dict) else None
+
+
+def is_retryable(result):
+  '''
+  True when a _bulk item result is a rejection that's safe to retry.
+  '''
+  if not result.get('error'):
+    return False
+  return result.get('status') in opensearch_client.RETRY_STATUSES or _error_type(result) in RETRY_ERROR_TYPES
+
+
+class DeadLetterFile:
+  '''
+  Appends the documents that failed for good to a JSON lines file, each with
+  its index, id, document, attempts, and last error. The file is created
+  with the first failure. Without a path, it only counts them.
+  '''
+
+  def __init__(self, path=None):
+    self.path = os.path.abspath(path) if path else None
+    self.count = 0
+    self._file = None
+
+  def write(self, item):
+    self.count += 1
+    if self.path is None:
+      return
+    action, source = item.entry.splitlines()
+    meta = json.loads(action)["index"]
+    if self._file is None:
+      self._file = open(self.path, 'a', encoding='utf-8')
+    self._file.write(json.dumps({"_index": meta.get("_index"),
+                                 "_id": meta.get("_id"),
+                                 "document": json.loads(source),
+                                 "attempts": item.attempts,
+                                 "error": item.error}) + '\n')
+
+  def close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+
+def adaptive_bulk_load(client, index_name, documents, pipeline=None,
+                       limits=None,
+                       max_bytes=bulk_loader.DEFAULT_BATCH_BYTES,
+                       max_attempts=DEFAULT_MAX_ATTEMPTS,
+                       retry_backoff=DEFAULT_RETRY_BACKOFF,
+                       dead_letter_path=None,
+                       log=print):
+  '''
+  Sends documents to index_name with the _bulk API, with the batch size and
+  the concurrency that limits (an AIMDLimits) sets. Retries the rejected
+  items, and, with a dead_letter_path, writes the items that fail for good
+  there. Returns a dict with the totals for the load, like
+  bulk_loader.bulk_load, where errors are the documents that failed for
+  good, and with the rejections, the retries, and the final limits. When
+  any went to the dead-letter file, dead_letter_path is its absolute path.
+  '''
+  limits = limits or AIMDLimits()
+  dead_letters = DeadLetterFile(dead_letter_path)
+  totals = {"batches": 0, "documents": 0, "bytes": 0, "errors": 0,
+            "rejected": 0, "retried": 0}
+  entries = (bulk_loader.bulk_entry(document, index_name) for document in documents)
+  # Rejected items wait here until their backoff is over, ordered by the
+  # time they can go again. The counter breaks ties.
+  retries = []
+  order = itertools.count()
+  carry = None
+  start = time.perf_counter()
+  parent = tracing.tracer.current()
+
+  def take_batch():
+    '''
+    Builds the next batch, retries that are due first, then new documents, up
+    to the current batch size and max_bytes.
+    '''
+    nonlocal carry
+    items, batch_bytes = [], 0
+    now = time.monotonic()
+    while len(items) < limits.batch_docs:
+      if retries and retries[0][0] <= now:
+        item = heapq.heappop(retries)[2]
+      elif carry is not None:
+        item, carry = carry, None
+      else:
+        entry = next(entries, None)
+        if entry is None:
+          break
+        item = _Item(entry)
+      entry_bytes = len(item.entry.encode('utf-8'))
+      if items and batch_bytes + entry_bytes > max_bytes:
+        if item.attempts:
+          heapq.heappush(retries, (now, next(order), item))
+        else:
+          carry = item
+        break
+      items.append(item)
+      batch_bytes += entry_bytes
+    return items, batch_bytes
+
+  def send(batch_number, items, body_bytes):
+    span = tracing.tracer.start_span('bulk.batch', parent=parent, batch=batch_number,
+                                     documents=len(items), bytes=body_bytes, pipeline=pipeline,
+                                     retries=sum(1 for item in items if item.attempts))
+    batch_start = time.perf_counter()
+    try:
+      resp = client.bulk(body=''.join(item.entry for item in items), index=index_name,
+                         pipeline=pipeline)
+    except TransportConnectionError as e:
+      # A timeout (ConnectionTimeout is a ConnectionError), or no connection,
+      # under load. Sending an item again overwrites whatever the domain
+      # wrote, unless it has no id.
+      span.end(error=e)
+      error = {"type": "request_timeout", "reason": str(e)}
+      unsafe = {"type": "request_timeout_without_id", "reason": str(e)}
+      return ([{"status": e.status_code, "error": error if item.has_id else unsafe} for item in items],
+              time.perf_counter() - batch_start)
+    except TransportError as e:
+      # The client already retried the request. If the domain still turns
+      # it away, every item was rejected.
+      span.end(error=e)
+      if e.status_code not in opensearch_client.RETRY_STATUSES:
+        raise
+      error = {"type": "request_rejected", "reason": str(e)}
+      return [{"status": e.status_code, "error": error}] * len(items), time.perf_counter() - batch_start
+    elapsed = time.perf_counter() - batch_start
+    results = [next(iter(item.values())) for item in resp.get('items', [])]
+    span.set(errors=sum(1 for result in results if 'error' in result))
+    tracing.end_bulk_span(span, resp)
+    return results, elapsed
+
+  def report(batch_number, items, body_bytes, epoch, results, elapsed):
+    rejected = retrying = failed = 0
+    now = time.monotonic()
+    for item, result in zip(items, results):
+      if 'error' not in result:
+        continue
+      item.attempts += 1
+      item.error = result['error']
+      retryable = is_retryable(result)
+      # A timed-out item without an id fails for good, but it's still a sign
+      # of overload.
+      rejected += retryable or _error_type(result) == 'request_timeout_without_id'
+      if retryable and item.attempts < max_attempts:
+        retrying += 1
+        retry_at = now + opensearch_client.backoff_delay(item.attempts - 1, retry_backoff)
+        heapq.heappush(retries, (retry_at, next(order), item))
+      else:
+        failed += 1
+        dead_letters.write(item)
+    limits.update(epoch, elapsed, len(items), rejected)
+    written = len(items) - retrying - failed
+    totals["batches"] += 1
+    totals["documents"] += written
+    totals["bytes"] += body_bytes
+    totals["errors"] += failed
+    totals["rejected"] += rejected
+    totals["retried"] += retrying
+    if log:
+      log(f'batch {batch_number}: {len(items)} docs, {body_bytes / 1024:.0f} KB '
+          f'in {elapsed:.2f}s ({written / elapsed:.0f} docs/s), {rejected} rejected, {failed} failed, '
+          f'next batch {limits.batch_docs} docs x {limits.workers} workers')
+
+  try:
+    with ThreadPoolExecutor(max_workers=limits.max_workers) as executor:
+      in_flight = {}
+      batch_numbers = itertools.count(1)
+      while True:
+        while len(in_flight) < limits.workers:
+          items, body_bytes = take_batch()
+          if not items:
+            break
+          batch_number = next(batch_numbers)
+          future = executor.submit(send, batch_number, items, body_bytes)
+          in_flight[future] = (batch_number, items, body_bytes, limits.epoch)
+        if not in_flight:
+          if not retries:
+            break
+          # Nothing to send until the next retry is due.
+          time.sleep(max(0.0, retries[0][0] - time.monotonic()))
+          continue
+        # With room for another batch, wake up when the next retry is due.
+        timeout = None
+        if retries and len(in_flight) < limits.workers:
+          timeout = max(0.0, retries[0][0] - time.monotonic())
+        done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+          report(*in_flight.pop(future), *future.result())
+  finally:
+    dead_letters.close()
+
+  totals["seconds"] = time.perf_counter() - start
+  totals["limits"] = limits.snapshot()
+  if dead_letters.count and dead_letters.path:
+    totals["dead_letter_path"] = dead_letters.path
+  return totals
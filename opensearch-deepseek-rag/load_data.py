@@ -7,55 +7,123 @@ opensearch-py, to call OpenSearch's _bulk API with the data.
 
 It creates embeddings for the documents to support semantic search for
 the retrieval via an ingest pipeline. 
+
+By default, it loads the small, built-in population_data set. Environment
+variables turn on the other modes: loading larger corpora, embedding in this
+script, chunking, index profiles, in-place syncs, rebuilds without downtime,
+adaptive backpressure, and vector snapshots. The "Load the knowledge base"
+section of README.md describes each one.
 '''
 
-from opensearchpy import OpenSearch
+import itertools
 import os
 
+import answer_cache
+import bulk_loader
+import chunking
+import embedders
+import embedding_cache
+import facts
+import index_profiles
+import index_rebuild
+import ingest_controller
+import metadata_filters
+import opensearch_client
+import sync_manifest
+import tracing
+import vector_snapshot
+
 
-opensearch_port = 443
 opensearch_service_api_endpoint = os.environ['OPENSEARCH_SERVICE_DOMAIN_ENDPOINT']
 opensearch_user_name = os.environ['OPENSEARCH_SERVICE_ADMIN_USER']
 opensearch_user_password = os.environ['OPENSEARCH_SERVICE_ADMIN_PASSWORD']
 embedding_model_id = os.environ['EMBEDDING_MODEL_ID']
 index_name = "population_data"
 
+# Optional settings for the streaming load. Each file must contain a "text"
+# field per document, and may contain an "id" field.
+load_data_files = [f for f in os.environ.get('LOAD_DATA_FILES', '').split(',') if f]
+bulk_batch_docs = int(os.environ.get('BULK_BATCH_DOCS', bulk_loader.DEFAULT_BATCH_DOCS))
+bulk_batch_bytes = int(os.environ.get('BULK_BATCH_BYTES', bulk_loader.DEFAULT_BATCH_BYTES))
+bulk_workers = int(os.environ.get('BULK_WORKERS', bulk_loader.DEFAULT_WORKERS))
+# With BULK_ADAPTIVE, BULK_BATCH_DOCS and BULK_WORKERS are where
+# the batch size and the concurrency start. They grow up to BULK_MAX_WORKERS,
+# while batches finish within BULK_TARGET_SECONDS without rejections. A
+# rejected document is sent up to BULK_MAX_ATTEMPTS times, and one that
+# still fails goes to the file in BULK_DEAD_LETTER_PATH, when it's set.
+bulk_adaptive = os.environ.get('BULK_ADAPTIVE', 'false').lower() in ('1', 'true', 'yes')
+bulk_max_workers = int(os.environ.get('BULK_MAX_WORKERS', ingest_controller.DEFAULT_MAX_WORKERS))
+bulk_target_seconds = float(os.environ.get('BULK_TARGET_SECONDS', ingest_controller.DEFAULT_TARGET_BATCH_SECONDS))
+bulk_max_attempts = int(os.environ.get('BULK_MAX_ATTEMPTS', ingest_controller.DEFAULT_MAX_ATTEMPTS))
+bulk_dead_letter_path = os.environ.get('BULK_DEAD_LETTER_PATH')
 
-# Ensure the endpoint matches the contract for the opensearch-py client. Endpoints
-# are specified without the leading URL scheme or trailing slashes.
-if opensearch_service_api_endpoint.startswith('https://'):
-  opensearch_service_api_endpoint = opensearch_service_api_endpoint[len('https://'):]
-if opensearch_service_api_endpoint.endswith('/'):
-  opensearch_service_api_endpoint = opensearch_service_api_endpoint[:-1]
+# EMBEDDING_MODE is either pipeline (OpenSearch calls the model for each
+# document), or client (this script calls the embedder in batches). In client
+# mode, CLIENT_EMBEDDER selects the model behind EMBEDDING_MODEL_ID ("model"),
+# or the local, deterministic stand-in ("hashing") for offline testing.
+embedding_mode = os.environ.get('EMBEDDING_MODE', 'pipeline')
+client_embedder = os.environ.get('CLIENT_EMBEDDER', 'model')
+embedding_batch_size = int(os.environ.get('EMBEDDING_BATCH_SIZE', embedders.DEFAULT_BATCH_SIZE))
+# In client mode, set EMBEDDING_CACHE_DIR to reuse embeddings from earlier
+# loads for documents whose text hasn't changed (see embedding_cache.py).
+embedding_cache_dir = os.environ.get('EMBEDDING_CACHE_DIR')
+embedding_cache_max_bytes = int(os.environ.get('EMBEDDING_CACHE_MAX_BYTES', embedding_cache.DEFAULT_MAX_BYTES))
+# Set CHUNK_MAX_TOKENS to split documents into passages of at most that many
+# tokens, with CHUNK_OVERLAP_TOKENS tokens shared between neighbors. 0, the
+# default, indexes each document whole.
+chunk_max_tokens = int(os.environ.get('CHUNK_MAX_TOKENS', 0))
+chunk_overlap_tokens = int(os.environ.get('CHUNK_OVERLAP_TOKENS', chunking.DEFAULT_OVERLAP_TOKENS))
+# run_rag.py's semantic answer cache (see answer_cache.py). Answers whose
+# context includes a document that this script rewrites are removed from it.
+answer_cache_path = os.environ.get('ANSWER_CACHE_PATH')
+# Set SYNC_MANIFEST_PATH to a file where the script records the hash of each
+# document it writes. Later runs skip the documents whose hash hasn't changed.
+sync_manifest_path = os.environ.get('SYNC_MANIFEST_PATH')
+# Set REBUILD_INDEX to true for a blue/green rebuild. REBUILD_SOURCE is load
+# (load the documents, exactly as without REBUILD_INDEX), or reindex (copy the
+# documents, with their embeddings, from the index behind the alias, with
+# REINDEX_SLICES parallel slices). The old index stays, for a rollback,
+# unless you set REBUILD_DELETE_OLD to true.
+rebuild_index = os.environ.get('REBUILD_INDEX', 'false').lower() in ('1', 'true', 'yes')
+rebuild_source = os.environ.get('REBUILD_SOURCE', 'load')
+reindex_slices = os.environ.get('REINDEX_SLICES', index_rebuild.DEFAULT_SLICES)
+if reindex_slices != 'auto':
+  if not reindex_slices.isdigit() or int(reindex_slices) < 1:
+    raise ValueError(f'REINDEX_SLICES is {reindex_slices}. Set it to auto, or to a number of slices.')
+  reindex_slices = int(reindex_slices)
+force_merge_segments = int(os.environ.get('FORCE_MERGE_SEGMENTS', index_rebuild.DEFAULT_MAX_SEGMENTS))
+# A file with one question per line to warm the new index before the swap.
+warmup_questions_file = os.environ.get('REBUILD_WARMUP_QUESTIONS')
+rebuild_delete_old = os.environ.get('REBUILD_DELETE_OLD', 'false').lower() in ('1', 'true', 'yes')
+# Set VECTOR_SNAPSHOT_PATH to the path prefix of a snapshot (see
+# vector_snapshot.py) to load its documents and vectors, in place of
+# LOAD_DATA_FILES or the built-in data set.
+vector_snapshot_path = os.environ.get('VECTOR_SNAPSHOT_PATH')
+# The facts index for run_rag.py's fact router (see facts.py). Note: if you
+# change FACTS_INDEX here, set the same FACTS_INDEX for run_rag.py.
+load_facts = os.environ.get('LOAD_FACTS', os.environ.get('RAG_FACTS_ROUTER', 'false')).lower() in ('1', 'true', 'yes')
+facts_index = os.environ.get('FACTS_INDEX', facts.DEFAULT_INDEX)
 
 
 # The mapping sets kNN to true to enable vector search for the index. It defines
-# the text field as type text, and a text_embedding field that uses the FAISS engine
-# for storage and retrieval, using the HNSW algorithm.
-mapping = {
-    "settings": {
-        "index": {
-            "knn": True,
-            "number_of_shards": 1,
-            "number_of_replicas": 2
-        }
-    },
-    "mappings": {
-        "properties": {
-            "text": {"type": "text"},
-            "text_embedding": {
-              "type": "knn_vector",
-              "dimension": 384,
-              "method": {
-                  "name": "hnsw",
-                  "space_type": "l2",
-                  "engine": "faiss",
-                  "parameters": {"ef_construction": 128, "m": 24},
-              }
-            }
-        }
-    }
-}
+# the text field as type text, and a text_embedding field that, with the default
+# hnsw profile, uses the FAISS engine for storage and retrieval, using the HNSW
+# algorithm. See index_profiles.py for the other profiles, which quantize the
+# vectors to trade recall for memory and latency. With CORPUS_SIZE_DOCS set, the
+# shard count follows from the expected corpus size, instead of being 1.
+index_profile = os.environ.get('INDEX_PROFILE', index_profiles.DEFAULT_PROFILE)
+knn_ef_search = int(os.environ.get('KNN_EF_SEARCH', index_profiles.DEFAULT_EF_SEARCH))
+corpus_size_docs = os.environ.get('CORPUS_SIZE_DOCS')
+knn_training_docs = int(os.environ.get('KNN_TRAINING_DOCS', 10000))
+number_of_shards = 1
+if corpus_size_docs:
+  number_of_shards = index_profiles.shards_for_corpus(int(corpus_size_docs), profile_name=index_profile)
+requires_training = index_profiles.get_profile(index_profile).get('requires_training', False)
+if not requires_training:
+  mapping = index_profiles.build_mapping(index_profile,
+                                         ef_search=knn_ef_search,
+                                         shards=number_of_shards,
+                                         replicas=2)
 
 
 # The data for the knowledge base.
@@ -94,31 +162,251 @@ ingest_pipeline_definition = {
 
 
 # Set up for the client to call OpenSearch Service
-hosts = [{"host": opensearch_service_api_endpoint, "port": opensearch_port}]
-client = OpenSearch(
-    hosts=hosts,
-    http_auth=(opensearch_user_name, opensearch_user_password),
-    use_ssl=True,
-    verify_certs=False,
-    ssl_assert_hostname=False,
-    ssl_show_warn=False,
-)
+# Allow one pooled connection per bulk worker. See opensearch_client.py for
+# the connection settings.
+client = opensearch_client.create_client(opensearch_service_api_endpoint,
+                                         (opensearch_user_name, opensearch_user_password),
+                                         pool_size=max(bulk_workers, bulk_max_workers) if bulk_adaptive else bulk_workers)
 
 
 # Check whether an index already exists with the chosen name. If you receive an 
 # exception, change the index name in the global variable above, and be sure 
-# also to change the index_name global variable in run_rag.py
-if client.indices.exists(index=index_name) == 200:
-  raise Exception(f'Index {index_name} already exists. Please choose a different name in load_data.py. Be sure to change the index_name in run_rag.py as well.')
+# also to change the index_name global variable in run_rag.py. With
+# SYNC_MANIFEST_PATH set, the script updates the existing index instead.
+# With REBUILD_INDEX set, index_name is an alias, and the script writes to a
+# new index, target_index, that doesn't exist yet.
+target_index = index_name
+if rebuild_index:
+  previous_indices = index_rebuild.alias_targets(client, index_name)
+  if rebuild_source == 'reindex' and not previous_indices:
+    raise Exception(f'There is no index {index_name} to reindex from. Set REBUILD_SOURCE to load.')
+  # The first rebuild turns the index_name index into an alias, which
+  # deletes the index. Check that up front, rather than after the load.
+  if index_name in previous_indices and not rebuild_delete_old:
+    raise Exception(f'{index_name} is an index, not an alias, and the first rebuild deletes it to '
+                    f'make way for the alias, with no rollback. Set REBUILD_DELETE_OLD to true to go '
+                    f'ahead. To keep a copy, save it with vector_snapshot.py first.')
+  target_index = index_rebuild.versioned_index_name(index_name)
+  print(f'Rebuilding {index_name} ({", ".join(previous_indices) or "new"}) into {target_index}')
+index_exists = client.indices.exists(index=target_index)
+if index_exists and not sync_manifest_path:
+  raise Exception(f'Index {target_index} already exists. Please choose a different name in load_data.py. Be sure to change the index_name in run_rag.py as well. To update the index in place, set SYNC_MANIFEST_PATH. To rebuild it, set REBUILD_INDEX.')
+if vector_snapshot_path:
+  if sync_manifest_path:
+    raise Exception('A snapshot loads whole. Unset SYNC_MANIFEST_PATH to load VECTOR_SNAPSHOT_PATH.')
+  # The vectors are only meaningful for the model that produced them. On a new
+  # domain, the model id differs even for the same model, so this only warns.
+  snapshot_model_id = vector_snapshot.read_manifest(vector_snapshot_path).get('embedding_model_id')
+  if snapshot_model_id and snapshot_model_id != embedding_model_id:
+    print(f'The snapshot was embedded with model {snapshot_model_id}, and EMBEDDING_MODEL_ID is '
+          f'{embedding_model_id}. Make sure that both are the same embedding model.')
+
+def source_documents(chunked=True):
+  '''
+  Returns a fresh stream of the documents to load, from VECTOR_SNAPSHOT_PATH,
+  LOAD_DATA_FILES, or the built-in data set, with their metadata fields, and
+  split into passages when chunking is on (and chunked is True).
+  '''
+  if vector_snapshot_path:
+    # The snapshot holds the passages as they were indexed, so they aren't
+    # split again. Passages from an index without the metadata fields get
+    # them from their own text.
+    return metadata_filters.with_metadata(vector_snapshot.read_snapshot(vector_snapshot_path))
+  if load_data_files:
+    documents = bulk_loader.read_documents(load_data_files)
+  else:
+    # Convert the action/source pairs of the built-in data set to documents.
+    documents = ({"_id": action["index"]["_id"], **source}
+                 for action, source in zip(population_data[0::2], population_data[1::2]))
+  # Extract from the whole document, since only its first sentences may name
+  # the metro area. The passages copy the fields.
+  documents = metadata_filters.with_metadata(documents)
+  if chunk_max_tokens and chunked:
+    documents = chunking.chunk_documents(documents, chunk_max_tokens, chunk_overlap_tokens)
+  return documents
+
+
+def split_document(document):
+  return list(chunking.chunk_documents([document], chunk_max_tokens, chunk_overlap_tokens))
+
 
 # This code does not validate the response. In actual use, you should wrap this
 # block in try/except and validate the response. 
-client.indices.create(index=index_name, body=mapping)
 r = client.ingest.put_pipeline(id="embedding_pipeline", 
                                body=ingest_pipeline_definition)
-client.bulk(index=index_name, 
-            body=population_data,
-            pipeline="embedding_pipeline", 
-            refresh=True)
 
-print(f'Loaded data into {index_name}')
\ No newline at end of file
+# Profiles with product quantization need a model trained on a sample of the
+# vectors before the index can exist. Load the sample into a temporary, exact
+# index, train on it, and then drop it.
+if requires_training and not index_exists:
+  training_index = f'{target_index}_training'
+  client.indices.create(index=training_index,
+                        body=index_profiles.build_mapping(index_profiles.DEFAULT_PROFILE, replicas=0))
+  bulk_loader.bulk_load(client, training_index,
+                        itertools.islice(source_documents(), knn_training_docs),
+                        pipeline=None if vector_snapshot_path else "embedding_pipeline",
+                        workers=bulk_workers)
+  client.indices.refresh(index=training_index)
+  knn_model_id = index_profiles.train_model(client, f'{target_index}_{index_profile}',
+                                            training_index, index_profile)
+  client.indices.delete(index=training_index)
+  mapping = index_profiles.build_mapping(index_profile,
+                                         ef_search=knn_ef_search,
+                                         shards=number_of_shards,
+                                         replicas=2,
+                                         model_id=knn_model_id)
+if not index_exists:
+  client.indices.create(index=target_index, body=mapping)
+if rebuild_index:
+  # Without replicas, each document is indexed once, on the primary. The
+  # replicas copy the finished, force-merged segments at the end.
+  previous_replicas = index_rebuild.disable_replicas(client, target_index)
+
+written_ids = []
+load_errors = 0
+load_span = tracing.tracer.start_span('load_data', index=target_index,
+                                      embedding_mode='snapshot' if vector_snapshot_path else embedding_mode)
+if rebuild_index and rebuild_source == 'reindex':
+  # _reindex copies each document's _source, text_embedding included, so the
+  # embedding model isn't called. The documents keep the passages and the
+  # embeddings they have now. To change the chunk sizes or the embedding
+  # model, rebuild with REBUILD_SOURCE=load.
+  previous_refresh = bulk_loader.disable_refresh(client, target_index)
+  try:
+    reindexed = index_rebuild.sliced_reindex(client, index_name, target_index,
+                                             slices=reindex_slices,
+                                             batch_size=bulk_batch_docs)
+  finally:
+    bulk_loader.restore_refresh(client, target_index, previous_refresh)
+  load_errors = len(reindexed.get('failures', []))
+  print(f'Reindexed {reindexed.get("created", 0)} documents from {index_name} '
+        f'in {reindexed.get("took", 0) / 1000:.1f}s, {load_errors} failures')
+else:
+  if sync_manifest_path:
+    # The manifest filters whole documents, and splits the changed ones into
+    # passages itself, so that it knows how many passages each one has.
+    manifest = sync_manifest.SyncManifest(sync_manifest_path, {
+      "index": index_name,
+      "embedding_model_id": embedding_model_id,
+      "embedder": client_embedder if embedding_mode == 'client' else 'pipeline',
+      "chunk_max_tokens": chunk_max_tokens,
+      "chunk_overlap_tokens": chunk_overlap_tokens if chunk_max_tokens else None})
+    if not index_exists:
+      manifest.clear()
+    documents = manifest.changed(source_documents(chunked=False),
+                                 split_document if chunk_max_tokens else None)
+  else:
+    documents = source_documents()
+  if answer_cache_path:
+    documents = bulk_loader.record_ids(documents, written_ids)
+  pipeline = "embedding_pipeline"
+  if vector_snapshot_path:
+    # The documents carry their vectors, so they bypass the ingest pipeline.
+    pipeline = None
+  elif embedding_mode == 'client':
+    # The documents arrive at OpenSearch with text_embedding already set, so
+    # they bypass the ingest pipeline.
+    embedder = embedders.create_embedder(client_embedder, client=client,
+                                         model_id=embedding_model_id,
+                                         batch_size=embedding_batch_size)
+    if embedding_cache_dir:
+      cache = embedding_cache.EmbeddingCache(embedding_cache_dir,
+                                             max_bytes=embedding_cache_max_bytes)
+      embedder = embedding_cache.CachedEmbedder(embedder, cache)
+    documents = embedders.embed_documents(documents, embedder,
+                                          batch_size=embedding_batch_size)
+    pipeline = None
+  # Refreshing makes new segments searchable, and it's wasted work while the
+  # load is in progress. Turn it off, and turn it back on at the end.
+  previous_refresh = bulk_loader.disable_refresh(client, target_index)
+  try:
+    if bulk_adaptive:
+      limits = ingest_controller.AIMDLimits(batch_docs=bulk_batch_docs,
+                                            workers=bulk_workers,
+                                            max_workers=max(bulk_workers, bulk_max_workers),
+                                            target_batch_seconds=bulk_target_seconds)
+      totals = ingest_controller.adaptive_bulk_load(client, target_index,
+                                                    documents,
+                                                    pipeline=pipeline,
+                                                    limits=limits,
+                                                    max_bytes=bulk_batch_bytes,
+                                                    max_attempts=bulk_max_attempts,
+                                                    dead_letter_path=bulk_dead_letter_path)
+    else:
+      totals = bulk_loader.bulk_load(client, target_index,
+                                     documents,
+                                     pipeline=pipeline,
+                                     workers=bulk_workers,
+                                     max_docs=bulk_batch_docs,
+                                     max_bytes=bulk_batch_bytes)
+    if sync_manifest_path:
+      stale_ids = manifest.stale_ids()
+      deleted = bulk_loader.bulk_delete(client, target_index, stale_ids, max_docs=bulk_batch_docs)
+      written_ids.extend(stale_ids)
+  finally:
+    bulk_loader.restore_refresh(client, target_index, previous_refresh)
+  load_errors = totals["errors"]
+  if embedding_mode == 'client' and embedding_cache_dir:
+    cache.save()
+    print(f'Embedding cache: {cache.stats()}')
+  print(f'Loaded {totals["documents"]} documents in {totals["batches"]} batches, '
+        f'{totals["seconds"]:.1f}s ({totals["documents"] / max(totals["seconds"], 1e-9):.0f} docs/s), '
+        f'{totals["errors"]} errors')
+  if bulk_adaptive:
+    print(f'Backpressure: {totals["rejected"]} rejections, {totals["retried"]} retries, '
+          f'final limits {totals["limits"]}')
+    if totals.get("dead_letter_path"):
+      print(f'{totals["errors"]} documents failed, and are in {totals["dead_letter_path"]}')
+  if sync_manifest_path:
+    print(f'Sync: {manifest.written()} new or changed documents, {manifest.unchanged} unchanged, '
+          f'{deleted["deleted"]} deleted')
+    # Record the load only when every write and delete succeeded. Otherwise,
+    # the next run sends the same changes again, which is safe, because the
+    # ids are the same.
+    if totals["errors"] or deleted["errors"]:
+      print(f'Not updating {sync_manifest_path}, because of errors')
+    else:
+      manifest.commit()
+load_span.end()
+
+# Finish the new index before any query sees it: merge it down, give it its
+# replicas back, and warm it. The swap is a single _aliases call, so a query
+# goes either to the old index or to the new one, never to neither.
+if rebuild_index:
+  if load_errors:
+    raise Exception(f'{load_errors} documents failed to load into {target_index}. '
+                    f'Not swapping {index_name}, which still points to {", ".join(previous_indices) or "nothing"}.')
+  index_rebuild.force_merge(client, target_index, max_segments=force_merge_segments)
+  index_rebuild.restore_replicas(client, target_index, previous_replicas)
+  warmup_questions = index_rebuild.DEFAULT_WARMUP_QUESTIONS
+  if warmup_questions_file:
+    with open(warmup_questions_file, encoding='utf-8') as f:
+      warmup_questions = [line.strip() for line in f if line.strip()]
+  warmup = index_rebuild.warm_up(client, target_index, warmup_questions, embedding_model_id)
+  print(f'Warm-up queries on {target_index}: {warmup}')
+  index_rebuild.swap_alias(client, index_name, target_index, previous_indices,
+                           delete_index=rebuild_delete_old)
+  print(f'Alias {index_name} now points to {target_index}')
+  if rebuild_delete_old:
+    for old_index in previous_indices:
+      # The swap already deleted an old index with the alias's name.
+      if old_index != index_name:
+        client.indices.delete(index=old_index)
+        print(f'Deleted {old_index}')
+
+# The facts come from the whole source, not only the documents that this load
+# wrote, so they are complete after a sync too. After a rebuild with
+# REBUILD_SOURCE=reindex, they come from the built-in data set or
+# LOAD_DATA_FILES, so set those as for the original load.
+if load_facts:
+  built = facts.build_facts_index(client, facts_index, source_documents(chunked=False), log=None)
+  print(f'Indexed {built["facts"]} facts for {built["metros"]} metro areas into {facts_index}')
+
+if answer_cache_path:
+  answers = answer_cache.SemanticAnswerCache(answer_cache_path)
+  removed = answers.invalidate_documents(index_name, written_ids)
+  answers.save()
+  print(f'Removed {removed} cached answers for rewritten documents')
+
+print(f'Loaded data into {target_index}')
+print(f'Connections: {opensearch_client.metrics.snapshot()}')
\ No newline at end of file
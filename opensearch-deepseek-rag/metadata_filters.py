@@ -0,0 +1,172 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Extracts structured fields from the population documents at ingest, and turns
+the entities in a question into a filter for the kNN query. The documents
+name their metro area and their years only in the free text, so, without a
+filter, every question searches every vector, and only k and size decide
+whether the right city makes it into the context.
+
+At ingest, with_metadata adds to each document:
+
+- metro: the metro area's name, as a keyword, from "for the <name> metro
+  area", or, failing that, "population of <name> in <year>".
+- year_from and year_to: the first and the last year the text mentions, as
+  integers. The built-in documents cover 1950 to 2035.
+
+A document that already has one of these fields keeps its value.
+
+At query time, QuestionParser finds the metro areas in a question, from the
+names in the index (known_metros reads them with a terms aggregation), and
+the years. filter_clause turns them into a filter that keeps the documents
+of those metro areas whose years cover the question's. rag_query.py puts
+the filter inside the knn or neural clause, where the k-NN plugin applies it
+during the search (efficient filtering), so the search only considers the
+matching documents, and still returns k of them. The number of candidates
+depends on the metro areas in the question, not on the size of the corpus.
+
+load_data.py extracts the fields for every load. run_rag.py and async_rag.py
+filter when you set RAG_METADATA_FILTER to true.
+'''
+
+import re
+
+
+METRO_FIELD = 'metro'
+YEAR_FROM_FIELD = 'year_from'
+YEAR_TO_FIELD = 'year_to'
+# The mapping of the fields, for index_profiles.build_mapping.
+METADATA_PROPERTIES = {
+  METRO_FIELD: {"type": "keyword"},
+  YEAR_FROM_FIELD: {"type": "integer"},
+  YEAR_TO_FIELD: {"type": "integer"},
+}
+# The number of metro areas that known_metros reads.
+DEFAULT_MAX_METROS = 10000
+
+_metro_patterns = [re.compile(r'for the (.+?) metro area'),
+                   re.compile(r'population of (.+?) in (?:19|20)\d{2}\b')]
+_year_pattern = re.compile(r'\b(?:19|20)\d{2}\b')
+_token_pattern = re.compile(r'[a-z0-9]+')
+
+
+def _tokens(text):
+  return tuple(_token_pattern.findall(text.lower()))
+
+
+def extract_metadata(text):
+  '''
+  Returns the metro, year_from, and year_to fields that text supports, as a
+  dict without the ones it doesn't.
+  '''
+  fields = {}
+  for pattern in _metro_patterns:
+    match = pattern.search(text)
+    if match:
+      fields[METRO_FIELD] = match.group(1).strip()
+      break
+  years = [int(year) for year in _year_pattern.findall(text)]
+  if years:
+    fields[YEAR_FROM_FIELD] = min(years)
+    fields[YEAR_TO_FIELD] = max(years)
+  return fields
+
+
+def with_metadata(documents, text_field='text'):
+  '''
+  Adds the extracted fields to each document, lazily. Extract before
+  chunking, so that every passage has its document's metro area, even the
+  passages whose text doesn't name it.
+  '''
+  for document in documents:
+    extracted = extract_metadata(document.get(text_field, ''))
+    yield dict(document, **{name: value for name, value in extracted.items() if name not in document})
+
+
+def metros_query(size=DEFAULT_MAX_METROS):
+  '''
+  The search body for the metro areas in an index: a terms aggregation on
+  the metro field, without hits.
+  '''
+  return {"size": 0, "aggs": {"metros": {"terms": {"field": METRO_FIELD, "size": size}}}}
+
+
+def metros_from_response(resp):
+  return [bucket["key"] for bucket in resp["aggregations"]["metros"]["buckets"]]
+
+
+def known_metros(client, index_name, size=DEFAULT_MAX_METROS):
+  '''
+  Returns the metro areas in index_name. With the async client, send
+  metros_query yourself, and read the response with metros_from_response.
+  '''
+  return metros_from_response(client.search(index=index_name, body=metros_query(size)))
+
+
+def filter_clause(metros=(), years=()):
+  '''
+  The filter for documents of any of metros that cover all of years, or
+  None for a question with neither.
+  '''
+  clauses = []
+  if metros:
+    clauses.append({"terms": {METRO_FIELD: list(metros)}})
+  if years:
+    clauses.append({"range": {YEAR_FROM_FIELD: {"lte": min(years)}}})
+    clauses.append({"range": {YEAR_TO_FIELD: {"gte": max(years)}}})
+  if not clauses:
+    return None
+  return {"bool": {"filter": clauses}}
+
+
+class QuestionParser:
+  '''
+  Finds the metro areas, out of metros, and the years in a question. Names
+  match on their words, without case or punctuation, so "ogden layton"
+  finds Ogden-Layton. Where names overlap, the longest wins.
+  '''
+
+  def __init__(self, metros):
+    self.names = {}
+    for metro in metros:
+      tokens = _tokens(metro)
+      if tokens:
+        self.names.setdefault(tokens, metro)
+    self.max_tokens = max((len(tokens) for tokens in self.names), default=0)
+
+  def parse(self, question):
+    '''
+    Returns a dict with the metro areas, in the order the question names
+    them, and the years. A number in a metro area's name isn't a year.
+    '''
+    metros, years, _ = self.split(question)
+    return {"metros": metros, "years": years}
+
+  def split(self, question):
+    '''
+    Returns the metro areas, the years, and the rest of the question's
+    words, lowercased, in order.
+    '''
+    tokens = _tokens(question)
+    metros, rest = [], []
+    i = 0
+    while i < len(tokens):
+      for length in range(min(self.max_tokens, len(tokens) - i), 0, -1):
+        metro = self.names.get(tokens[i:i + length])
+        if metro is not None:
+          if metro not in metros:
+            metros.append(metro)
+          i += length
+          break
+      else:
+        rest.append(tokens[i])
+        i += 1
+    years = sorted({int(token) for token in rest if _year_pattern.fullmatch(token)})
+    return metros, years, [token for token in rest if not _year_pattern.fullmatch(token)]
+
+  def filter(self, question):
+    '''
+    The filter for question, or None when it names no metro area and no
+    year.
+    '''
+    return filter_clause(**self.parse(question))
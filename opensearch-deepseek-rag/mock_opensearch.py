@@ -0,0 +1,1311 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+A local stand-in for Amazon OpenSearch Service, ML Commons, and the SageMaker
+DeepSeek endpoint, for benchmarks, offline testing, and performance work. It
+implements the endpoints that the scripts in this folder call:
+
+- index create, exists, delete, settings, refresh, count, and force merge
+- aliases, and _reindex as a task
+- _bulk, with text_embedding ingest pipelines
+- search, with match, bool/term/range filters, knn, neural, and hybrid
+  queries, filtered kNN, terms aggregations on keyword fields, the profile
+  API, sliced scrolls, and search pipelines with the
+  normalization and retrieval_augmented_generation processors
+- ML Commons connector create and search, model register, search, and
+  deploy, and _predict
+- k-NN model training, model get, and stats
+- security role mappings
+- the SageMaker invocations endpoint that the DeepSeek connector calls
+
+kNN queries run against an exact, brute-force NumPy index, scored the way the
+faiss engine scores each space type. The mock's embedding "model" is the
+deterministic HashingEmbedder from embedders.py, so neural queries, the
+ingest pipeline, and client-side embedding through _predict all agree.
+
+Every call sleeps for a configurable latency, so you can model a remote
+embedding model or a slow generation endpoint, and measure how the client
+side behaves. The server keeps everything in memory and is not durable. It
+ignores authentication.
+
+Start it in-process with start_mock_server, or from the command line:
+
+  python mock_opensearch.py          # listens on http://127.0.0.1:9200
+
+Set MOCK_TLS_CERT and MOCK_TLS_KEY to serve HTTPS with your own (for example,
+self-signed) certificate.
+'''
+
+from collections import Counter, defaultdict
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import inspect
+import json
+import math
+import os
+import random
+import re
+import ssl
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+import urllib.request
+import uuid
+import zlib
+
+import numpy as np
+
+from embedders import HashingEmbedder
+
+
+_token_pattern = re.compile(r'\w+')
+
+
+class MockLatency:
+  '''
+  Latencies, in milliseconds, that the mock adds to each operation, and the
+  limits on the work it takes at once.
+
+  - bulk_ms: each _bulk request, before any embedding work.
+  - bulk_slots: the _bulk requests the write queue holds at once. The items
+    of requests beyond that are rejected with status 429 and
+    es_rejected_execution_exception, as a busy domain does. 0 (the default)
+    means no limit.
+  - bulk_reject_rate: the share of _bulk items rejected at random, the same
+    way, however busy the mock is.
+  - embed_ms: each call to the embedding model. The ingest pipeline calls it
+    once per document, as OpenSearch does.
+  - search_ms: each search, before embedding the query or generating.
+  - generate_ms: each SageMaker invocation.
+  - token_ms: each generated token, on top of generate_ms.
+  - batch_item_ms: each prompt after the first in a SageMaker invocation with
+    a list of prompts. The prompts are generated together, so a batch costs
+    only a little more than one prompt.
+  - generate_slots: the SageMaker invocations the endpoint works on at a
+    time, like the GPUs behind it. Others wait for a free slot. 0 (the
+    default) means no limit.
+  - generate_tail_rate and generate_tail_ms: the share of SageMaker
+    invocations, at random, that take generate_tail_ms longer, like the
+    occasional slow request behind a real endpoint's tail latency.
+  - generate_error_rate: the share of SageMaker invocations, at random, that
+    fail with status 500, as an unhealthy endpoint's do. 1 fails them all.
+  - deploy_ms: the time a model takes to go from DEPLOYING to DEPLOYED.
+  - sts_ms: each STS assume_role call, for the aws_credentials.LocalSTS that
+    the benchmark uses.
+  '''
+
+  def __init__(self, bulk_ms=5.0, bulk_slots=0.0, bulk_reject_rate=0.0,
+               embed_ms=10.0, search_ms=5.0,
+               generate_ms=500.0, token_ms=0.0, batch_item_ms=0.0, generate_slots=0.0,
+               generate_tail_rate=0.0, generate_tail_ms=0.0, generate_error_rate=0.0,
+               deploy_ms=0.0, sts_ms=50.0):
+    self.bulk_ms = bulk_ms
+    self.bulk_slots = bulk_slots
+    self.bulk_reject_rate = bulk_reject_rate
+    self.embed_ms = embed_ms
+    self.search_ms = search_ms
+    self.generate_ms = generate_ms
+    self.token_ms = token_ms
+    self.batch_item_ms = batch_item_ms
+    self.generate_slots = generate_slots
+    self.generate_tail_rate = generate_tail_rate
+    self.generate_tail_ms = generate_tail_ms
+    self.generate_error_rate = generate_error_rate
+    self.deploy_ms = deploy_ms
+    self.sts_ms = sts_ms
+
+  def as_dict(self):
+    return dict(vars(self))
+
+  @classmethod
+  def from_env(cls):
+    '''
+    Reads each latency from a MOCK_<NAME> environment variable, for example
+    MOCK_EMBED_MS, and uses the default for the rest.
+    '''
+    return cls(**{name: float(os.environ.get(f'MOCK_{name.upper()}', value))
+                  for name, value in cls().as_dict().items()})
+
+
+def _sleep_ms(ms):
+  if ms > 0:
+    time.sleep(ms / 1000.0)
+
+
+def _new_id():
+  return uuid.uuid4().hex[:20]
+
+
+def _tokens(text):
+  return _token_pattern.findall(str(text).lower())
+
+
+def _keyword_values(source, field):
+  values = source.get(field)
+  return values if isinstance(values, list) else [] if values is None else [values]
+
+
+class VectorField:
+  '''
+  An exact kNN index for one knn_vector field. Vectors live in one float32
+  matrix that doubles in size as it fills. Deleted and replaced rows are
+  masked out, not compacted.
+  '''
+
+  def __init__(self, dimension, space_type):
+    self.dimension = dimension
+    self.space_type = space_type
+    self.matrix = np.zeros((16, dimension), dtype=np.float32)
+    self.alive = np.zeros(16, dtype=bool)
+    self.row_ids = []
+    self.rows = {}
+
+  def put(self, doc_id, vector):
+    self.remove(doc_id)
+    row = len(self.row_ids)
+    if row == len(self.matrix):
+      self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+      self.alive = np.concatenate([self.alive, np.zeros_like(self.alive)])
+    self.matrix[row] = vector
+    self.alive[row] = True
+    self.row_ids.append(doc_id)
+    self.rows[doc_id] = row
+
+  def remove(self, doc_id):
+    row = self.rows.pop(doc_id, None)
+    if row is not None:
+      self.alive[row] = False
+
+  def search(self, vector, k, allowed_ids=None):
+    '''
+    Returns up to k (doc_id, score) pairs, best first. When allowed_ids is set,
+    only those documents are candidates, like an efficient kNN filter.
+    '''
+    count = len(self.row_ids)
+    if allowed_ids is None:
+      candidates = np.flatnonzero(self.alive[:count])
+    else:
+      candidates = np.array(sorted(self.rows[d] for d in allowed_ids if d in self.rows), dtype=np.intp)
+    if len(candidates) == 0:
+      return []
+    query = np.asarray(vector, dtype=np.float32)
+    vectors = self.matrix[candidates]
+    if self.space_type == 'innerproduct':
+      dot = vectors @ query
+      scores = np.where(dot >= 0, dot + 1, 1 / (1 - dot))
+    elif self.space_type == 'cosinesimil':
+      norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+      cosine = np.divide(vectors @ query, norms, out=np.zeros(len(vectors), dtype=np.float32),
+                         where=norms > 0)
+      scores = (1 + cosine) / 2
+    else:
+      distances = np.sum((vectors - query) ** 2, axis=1)
+      scores = 1 / (1 + distances)
+    k = min(k, len(candidates))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(self.row_ids[candidates[i]], float(scores[i])) for i in top]
+
+
+class MockIndex:
+
+  def __init__(self, body, knn_models=None):
+    self.body = body or {}
+    self.settings = dict(self.body.get('settings', {}).get('index', {}))
+    self.properties = self.body.get('mappings', {}).get('properties', {})
+    self.docs = {}
+    self.doc_tokens = {}
+    self.vector_fields = {}
+    # The ids of the documents with each value of each keyword field, for
+    # filters and aggregations.
+    self.postings = {field: defaultdict(set) for field, mapping in self.properties.items()
+                     if mapping.get('type') == 'keyword'}
+    for field, mapping in self.properties.items():
+      if mapping.get('type') == 'knn_vector':
+        # Fields backed by a trained model take the dimension and method from
+        # the model.
+        if 'model_id' in mapping:
+          mapping = (knn_models or {})[mapping['model_id']]
+        self.vector_fields[field] = VectorField(
+          mapping['dimension'], mapping.get('method', {}).get('space_type', 'l2'))
+    self._next_id = 0
+
+  def new_id(self):
+    self._next_id += 1
+    return f'auto-{self._next_id}'
+
+  def _unpost(self, doc_id):
+    source = self.docs.get(doc_id)
+    if source is None:
+      return
+    for field, postings in self.postings.items():
+      for value in _keyword_values(source, field):
+        postings[value].discard(doc_id)
+        if not postings[value]:
+          del postings[value]
+
+  def put(self, doc_id, source):
+    self._unpost(doc_id)
+    self.docs[doc_id] = source
+    for field, postings in self.postings.items():
+      for value in _keyword_values(source, field):
+        postings[value].add(doc_id)
+    self.doc_tokens[doc_id] = Counter(_tokens(source.get('text', '')))
+    for field, vectors in self.vector_fields.items():
+      if source.get(field) is not None:
+        vectors.put(doc_id, source[field])
+      else:
+        vectors.remove(doc_id)
+
+  def delete(self, doc_id):
+    self._unpost(doc_id)
+    if self.docs.pop(doc_id, None) is None:
+      return False
+    self.doc_tokens.pop(doc_id, None)
+    for vectors in self.vector_fields.values():
+      vectors.remove(doc_id)
+    return True
+
+
+class MockState:
+  '''
+  The in-memory contents of the mock cluster.
+  '''
+
+  def __init__(self, latency):
+    self.latency = latency
+    self.lock = threading.RLock()
+    self.indices = {}
+    self.ingest_pipelines = {}
+    self.search_pipelines = {}
+    self.role_mappings = {}
+    self.connectors = {}
+    self.models = {}
+    self.tasks = {}
+    self.knn_models = {}
+    # alias -> {index name: {"is_write_index": bool}}
+    self.aliases = {}
+    self.cluster_tasks = {}
+    self.scrolls = {}
+    self.bulk_in_flight = 0
+    self.embedder = HashingEmbedder()
+    # Generation models that aren't registered (for example, the benchmark's
+    # "mock-deepseek") call this URL, the server's own SageMaker route.
+    self.sagemaker_url = None
+    # With latency.generate_slots, the invocations that can generate at once.
+    self.generate_slots = (threading.Semaphore(int(latency.generate_slots))
+                           if latency.generate_slots else contextlib.nullcontext())
+
+  def resolve(self, name):
+    '''
+    Returns the index that name refers to: the write index (or only index) of
+    an alias, or name itself.
+    '''
+    indices = self.aliases.get(name)
+    if not indices:
+      return name
+    for index, options in indices.items():
+      if options.get('is_write_index') or len(indices) == 1:
+        return index
+    raise KeyError(f'alias [{name}] has more than one index and no write index')
+
+  def embed(self, texts, dimension=None):
+    if dimension and dimension != self.embedder.dimension:
+      self.embedder = HashingEmbedder(dimension)
+    return self.embedder.embed(texts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  # Headers and body go out in separate writes. Without this, Nagle's algorithm
+  # and delayed ACKs add about 40 ms to every response.
+  disable_nagle_algorithm = True
+
+  # Each route is (method, path pattern, handler method name). The first match
+  # wins, so specific routes come before the /{index} catch-alls.
+  index = r'/(?P<index>[^/_][^/]*)'
+  routes = [
+    ('POST', r'/endpoints/(?P<endpoint>[^/]+)/invocations', 'sagemaker_invoke'),
+    ('POST', r'/_plugins/_ml/connectors/_create', 'ml_create_connector'),
+    ('POST', r'/_plugins/_ml/connectors/_search', 'ml_search_connectors'),
+    ('GET', r'/_plugins/_ml/connectors/(?P<connector_id>[^/]+)', 'ml_get_connector'),
+    ('POST', r'/_plugins/_ml/models/_register', 'ml_register_model'),
+    ('POST', r'/_plugins/_ml/models/_search', 'ml_search_models'),
+    ('POST', r'/_plugins/_ml/models/(?P<model_id>[^/]+)/_deploy', 'ml_deploy_model'),
+    ('POST', r'/_plugins/_ml/models/(?P<model_id>[^/]+)/_predict', 'ml_predict'),
+    ('GET', r'/_plugins/_ml/models/(?P<model_id>[^/]+)', 'ml_get_model'),
+    ('GET', r'/_plugins/_ml/tasks/(?P<task_id>[^/]+)', 'ml_get_task'),
+    ('POST', r'/_plugins/_ml/_predict/text_embedding/(?P<model_id>[^/]+)', 'ml_predict_embedding'),
+    ('POST', r'/_plugins/_knn/models/(?P<model_id>[^/]+)/_train', 'knn_train_model'),
+    ('GET', r'/_plugins/_knn/models/(?P<model_id>[^/]+)', 'knn_get_model'),
+    ('DELETE', r'/_plugins/_knn/models/(?P<model_id>[^/]+)', 'knn_delete_model'),
+    ('GET', r'/_plugins/_knn/stats(?:/.*)?', 'knn_stats'),
+    ('PUT', r'/_plugins/_security/api/rolesmapping/(?P<role>[^/]+)', 'put_role_mapping'),
+    ('GET', r'/_plugins/_security/api/rolesmapping/(?P<role>[^/]+)', 'get_role_mapping'),
+    ('PUT', r'/_ingest/pipeline/(?P<id>[^/]+)', 'put_ingest_pipeline'),
+    ('GET', r'/_ingest/pipeline/(?P<id>[^/]+)', 'get_ingest_pipeline'),
+    ('PUT', r'/_search/pipeline/(?P<id>[^/]+)', 'put_search_pipeline'),
+    ('GET', r'/_search/pipeline/(?P<id>[^/]+)', 'get_search_pipeline'),
+    ('GET', r'/_cluster/health(?:/.*)?', 'cluster_health'),
+    ('POST', r'/_aliases', 'update_aliases'),
+    ('GET', r'/_alias/(?P<name>[^/]+)', 'get_alias'),
+    ('HEAD', r'/_alias/(?P<name>[^/]+)', 'alias_exists'),
+    ('POST', r'/_reindex', 'reindex'),
+    ('GET', r'/_tasks/(?P<task_id>[^/]+)', 'get_task'),
+    ('GET', r'/_plugins/_knn/warmup/(?P<index>[^/]+)', 'knn_warmup'),
+    ('POST', r'/_search/scroll', 'scroll'),
+    ('GET', r'/_search/scroll', 'scroll'),
+    ('DELETE', r'/_search/scroll', 'clear_scroll'),
+    ('POST', r'/_bulk', 'bulk'),
+    ('PUT', r'/_bulk', 'bulk'),
+    ('POST', index + r'/_bulk', 'bulk'),
+    ('PUT', index + r'/_bulk', 'bulk'),
+    ('GET', index + r'/_settings(?:/.*)?', 'get_settings'),
+    ('PUT', index + r'/_settings', 'put_settings'),
+    ('POST', index + r'/_refresh', 'refresh'),
+    ('POST', index + r'/_forcemerge', 'force_merge'),
+    ('GET', index + r'/_count', 'count'),
+    ('POST', index + r'/_count', 'count'),
+    ('GET', index + r'/_search', 'search'),
+    ('POST', index + r'/_search', 'search'),
+    ('GET', index + r'/_doc/(?P<doc_id>[^/]+)', 'get_doc'),
+    ('PUT', index, 'create_index'),
+    ('HEAD', index, 'index_exists'),
+    ('GET', index, 'get_index'),
+    ('DELETE', index, 'delete_index'),
+    ('GET', r'/', 'info'),
+    ('HEAD', r'/', 'info'),
+  ]
+
+  def log_message(self, format, *args):
+    pass
+
+  @property
+  def state(self):
+    return self.server.state
+
+  def _dispatch(self):
+    parsed = urlparse(self.path)
+    self.query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+    length = int(self.headers.get('Content-Length') or 0)
+    raw = self.rfile.read(length) if length else b''
+    if self.headers.get('Content-Encoding') == 'gzip':
+      raw = gzip.decompress(raw)
+    self.raw_body = raw
+    for method, pattern, name in self.routes:
+      if method != self.command:
+        continue
+      match = re.fullmatch(pattern, parsed.path)
+      if match:
+        try:
+          status, body = getattr(self, name)(**{k: unquote(v) for k, v in match.groupdict().items()})
+        except KeyError as e:
+          status, body = 404, {"error": {"type": "resource_not_found_exception", "reason": str(e)}}
+        except Exception as e:
+          status, body = 500, {"error": {"type": "mock_exception", "reason": str(e)}}
+        return self._respond(status, body)
+    self._respond(404, {"error": {"type": "mock_unsupported", "reason": f'{self.command} {parsed.path}'}})
+
+  do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _dispatch
+
+  def _respond(self, status, body):
+    if inspect.isgenerator(body):
+      return self._respond_stream(status, body)
+    payload = b'' if body is None else json.dumps(body).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(payload)))
+    self.end_headers()
+    if self.command != 'HEAD':
+      self.wfile.write(payload)
+
+  def _respond_stream(self, status, chunks):
+    '''
+    Sends each chunk from a generator as it's produced, with chunked transfer
+    encoding.
+    '''
+    self.send_response(status)
+    self.send_header('Content-Type', 'text/event-stream')
+    self.send_header('Transfer-Encoding', 'chunked')
+    self.end_headers()
+    for chunk in chunks:
+      self.wfile.write(f'{len(chunk):x}\r\n'.encode('ascii') + chunk + b'\r\n')
+      self.wfile.flush()
+    self.wfile.write(b'0\r\n\r\n')
+
+  def json_body(self):
+    return json.loads(self.raw_body) if self.raw_body else {}
+
+  def _index(self, index):
+    found = self.state.indices.get(self.state.resolve(index))
+    if found is None:
+      raise KeyError(f'no such index [{index}]')
+    return found
+
+  # Cluster and index APIs ##############################################
+
+  def info(self):
+    return 200, {"name": "mock", "version": {"distribution": "opensearch", "number": "2.17.0"}}
+
+  def cluster_health(self):
+    return 200, {"cluster_name": "mock", "status": "green", "number_of_nodes": 1}
+
+  def create_index(self, index):
+    with self.state.lock:
+      if index in self.state.indices or index in self.state.aliases:
+        return 400, {"error": {"type": "resource_already_exists_exception",
+                               "reason": f'index [{index}] already exists'}}
+      self.state.indices[index] = MockIndex(self.json_body(), self.state.knn_models)
+    return 200, {"acknowledged": True, "shards_acknowledged": True, "index": index}
+
+  def index_exists(self, index):
+    found = index in self.state.indices or index in self.state.aliases
+    return (200 if found else 404), None
+
+  def get_index(self, index):
+    target = self._index(index)
+    return 200, {index: {"settings": {"index": dict(target.settings)},
+                         "mappings": {"properties": target.properties}}}
+
+  def delete_index(self, index):
+    with self.state.lock:
+      self._delete_index(index)
+    return 200, {"acknowledged": True}
+
+  def _delete_index(self, index):
+    if self.state.indices.pop(index, None) is None:
+      raise KeyError(f'no such index [{index}]')
+    for alias in list(self.state.aliases):
+      self.state.aliases[alias].pop(index, None)
+      if not self.state.aliases[alias]:
+        del self.state.aliases[alias]
+
+  def get_settings(self, index):
+    return 200, {self.state.resolve(index): {"settings": {"index": dict(self._index(index).settings)}}}
+
+  def put_settings(self, index):
+    settings = self.json_body()
+    settings = settings.get('index', settings)
+    target = self._index(index).settings
+    for key, value in settings.items():
+      key = key[len('index.'):] if key.startswith('index.') else key
+      if value is None:
+        target.pop(key, None)
+      else:
+        target[key] = value
+    return 200, {"acknowledged": True}
+
+  def refresh(self, index):
+    self._index(index)
+    return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+  def force_merge(self, index):
+    '''
+    The mock has no segments to merge, so this only checks the index.
+    '''
+    self._index(index)
+    return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+  def update_aliases(self):
+    '''
+    Applies add, remove, and remove_index actions all together, or not at
+    all, as OpenSearch does.
+    '''
+    actions = self.json_body().get('actions', [])
+    with self.state.lock:
+      for action in actions:
+        op, params = next(iter(action.items()))
+        if op not in ('add', 'remove', 'remove_index'):
+          return 400, {"error": {"type": "illegal_argument_exception",
+                                 "reason": f'unsupported alias action [{op}]'}}
+        if params['index'] not in self.state.indices:
+          raise KeyError(f'no such index [{params["index"]}]')
+      aliases = {alias: dict(indices) for alias, indices in self.state.aliases.items()}
+      removed = set()
+      for action in actions:
+        op, params = next(iter(action.items()))
+        if op == 'add':
+          aliases.setdefault(params['alias'], {})[params['index']] = \
+            {"is_write_index": bool(params.get('is_write_index'))}
+        elif op == 'remove':
+          aliases.get(params['alias'], {}).pop(params['index'], None)
+        else:
+          removed.add(params['index'])
+      if any(alias in self.state.indices and alias not in removed for alias in aliases):
+        return 400, {"error": {"type": "invalid_alias_name_exception",
+                               "reason": 'an index exists with the same name as the alias'}}
+      for name in removed:
+        self._delete_index(name)
+      for indices in aliases.values():
+        for name in removed:
+          indices.pop(name, None)
+      self.state.aliases = {alias: indices for alias, indices in aliases.items() if indices}
+    return 200, {"acknowledged": True}
+
+  def get_alias(self, name):
+    indices = self.state.aliases.get(name)
+    if not indices:
+      return 404, {"error": f'alias [{name}] missing', "status": 404}
+    return 200, {index: {"aliases": {name: options}} for index, options in indices.items()}
+
+  def alias_exists(self, name):
+    return (200 if self.state.aliases.get(name) else 404), None
+
+  def count(self, index):
+    target = self._index(index)
+    query = self.json_body().get('query', {"match_all": {}})
+    with self.state.lock:
+      found = sum(1 for doc_id, source in target.docs.items() if self._matches(doc_id, source, query))
+    return 200, {"count": found}
+
+  def get_doc(self, index, doc_id):
+    source = self._index(index).docs.get(doc_id)
+    if source is None:
+      return 404, {"_index": index, "_id": doc_id, "found": False}
+    return 200, {"_index": index, "_id": doc_id, "found": True, "_source": source}
+
+  def put_ingest_pipeline(self, id):
+    self.state.ingest_pipelines[id] = self.json_body()
+    return 200, {"acknowledged": True}
+
+  def get_ingest_pipeline(self, id):
+    return 200, {id: self.state.ingest_pipelines[id]}
+
+  def put_search_pipeline(self, id):
+    self.state.search_pipelines[id] = self.json_body()
+    return 200, {"acknowledged": True}
+
+  def get_search_pipeline(self, id):
+    return 200, {id: self.state.search_pipelines[id]}
+
+  def put_role_mapping(self, role):
+    created = role not in self.state.role_mappings
+    self.state.role_mappings[role] = self.json_body()
+    return (201 if created else 200), {"status": "CREATED" if created else "OK",
+                                       "message": f"'{role}' {'created' if created else 'updated'}."}
+
+  def get_role_mapping(self, role):
+    return 200, {role: self.state.role_mappings[role]}
+
+  # Ingest ##############################################################
+
+  def bulk(self, index=None):
+    start = time.perf_counter()
+    latency = self.state.latency
+    with self.state.lock:
+      self.state.bulk_in_flight += 1
+      overloaded = latency.bulk_slots and self.state.bulk_in_flight > latency.bulk_slots
+    try:
+      _sleep_ms(latency.bulk_ms)
+      lines = [line for line in self.raw_body.decode('utf-8').split('\n') if line.strip()]
+      pipeline = self.query.get('pipeline')
+      items = []
+      ingest_ms = 0.0
+      position = 0
+      while position < len(lines):
+        action = json.loads(lines[position])
+        op, meta = next(iter(action.items()))
+        target = meta.get('_index', index)
+        position += 1
+        source = None
+        if op != 'delete':
+          source = json.loads(lines[position])
+          position += 1
+        if overloaded or random.random() < latency.bulk_reject_rate:
+          items.append({op: {"_index": target, "_id": meta.get('_id'), "status": 429,
+                             "error": {"type": "es_rejected_execution_exception",
+                                       "reason": "rejected execution of primary operation "
+                                                 f"[write queue capacity = {int(latency.bulk_slots)}]"}}})
+          continue
+        if source is not None and pipeline:
+          ingest_start = time.perf_counter()
+          self._run_ingest_pipeline(pipeline, target, source)
+          ingest_ms += (time.perf_counter() - ingest_start) * 1000
+        items.append({op: self._apply(op, target, meta.get('_id'), source)})
+    finally:
+      with self.state.lock:
+        self.state.bulk_in_flight -= 1
+    resp = {"took": int((time.perf_counter() - start) * 1000),
+            "errors": any('error' in next(iter(item.values())) for item in items),
+            "items": items}
+    if pipeline:
+      resp["ingest_took"] = int(ingest_ms)
+    return 200, resp
+
+  def reindex(self):
+    '''
+    Copies every document from source.index to dest.index, through
+    dest.pipeline when there is one. The copy runs in the request, in one
+    slice, and with wait_for_completion=false, the response is a task that
+    has already completed.
+    '''
+    start = time.perf_counter()
+    body = self.json_body()
+    source_index = self._index(body['source']['index'])
+    dest = body['dest']['index']
+    pipeline = body['dest'].get('pipeline')
+    with self.state.lock:
+      documents = [(doc_id, dict(source)) for doc_id, source in source_index.docs.items()]
+    created = updated = 0
+    for doc_id, source in documents:
+      if pipeline:
+        self._run_ingest_pipeline(pipeline, dest, source)
+      if self._apply('index', dest, doc_id, source)['result'] == 'created':
+        created += 1
+      else:
+        updated += 1
+    resp = {"took": int((time.perf_counter() - start) * 1000), "timed_out": False,
+            "total": len(documents), "created": created, "updated": updated,
+            "deleted": 0, "batches": 1, "failures": []}
+    if self.query.get('wait_for_completion', 'true') == 'false':
+      task_id = f'mock-node:{len(self.state.cluster_tasks) + 1}'
+      self.state.cluster_tasks[task_id] = {
+        "completed": True,
+        "task": {"node": "mock-node", "action": "indices:data/write/reindex", "status": dict(resp)},
+        "response": resp}
+      return 200, {"task": task_id}
+    return 200, resp
+
+  def get_task(self, task_id):
+    return 200, self.state.cluster_tasks[task_id]
+
+  def _run_ingest_pipeline(self, pipeline, index, source):
+    '''
+    Runs the text_embedding processors of an ingest pipeline on one document,
+    calling the embedding model once per field, as OpenSearch does.
+    '''
+    for processor in self.state.ingest_pipelines.get(pipeline, {}).get('processors', []):
+      for source_field, target_field in processor.get('text_embedding', {}).get('field_map', {}).items():
+        if source_field in source:
+          _sleep_ms(self.state.latency.embed_ms)
+          dimension = self._dimension(index, target_field)
+          source[target_field] = self.state.embed([source[source_field]], dimension)[0].tolist()
+
+  def _dimension(self, index, field):
+    target = self.state.indices.get(self.state.resolve(index))
+    if target is not None and field in target.vector_fields:
+      return target.vector_fields[field].dimension
+    return None
+
+  def _apply(self, op, index, doc_id, source):
+    with self.state.lock:
+      index = self.state.resolve(index)
+      target = self.state.indices.get(index)
+      if target is None:
+        target = self.state.indices[index] = MockIndex({})
+      if op == 'delete':
+        found = target.delete(doc_id)
+        return {"_index": index, "_id": doc_id, "result": "deleted" if found else "not_found",
+                "status": 200 if found else 404}
+      doc_id = doc_id or target.new_id()
+      created = doc_id not in target.docs
+      if op == 'create' and not created:
+        return {"_index": index, "_id": doc_id, "status": 409,
+                "error": {"type": "version_conflict_engine_exception",
+                          "reason": f'[{doc_id}]: document already exists'}}
+      if op == 'update':
+        source = dict(target.docs.get(doc_id, {}), **source.get('doc', {}))
+      target.put(doc_id, source)
+    return {"_index": index, "_id": doc_id, "result": "created" if created else "updated",
+            "status": 201 if created else 200}
+
+  # Search ##############################################################
+
+  def search(self, index):
+    start = time.perf_counter()
+    _sleep_ms(self.state.latency.search_ms)
+    body = self.json_body()
+    target = self._index(index)
+    index = self.state.resolve(index)
+    size = int(self.query.get('size', body.get('size', 10)))
+    offset = int(body.get('from', 0))
+    # OpenSearch embeds the query text of each neural clause before the kNN
+    # search. Pay that latency before taking the lock, so that concurrent
+    # searches overlap.
+    _sleep_ms(self.state.latency.embed_ms * self.raw_body.count(b'"neural"'))
+    query = body.get('query', {"match_all": {}})
+    pipeline = self.state.search_pipelines.get(self.query.get('search_pipeline'))
+    query_start = time.perf_counter_ns()
+    with self.state.lock:
+      if 'hybrid' in query:
+        scores = self._hybrid(target, query['hybrid'], pipeline, offset + size)
+      else:
+        scores = self._score(target, query)
+    collect_start = time.perf_counter_ns()
+    ranked = sorted(scores.items(), key=lambda item: -item[1])
+    if body.get('slice'):
+      # Each slice of a sliced scroll gets the documents whose id hashes to it.
+      slice_id, slice_max = body['slice']['id'], body['slice']['max']
+      ranked = [(doc_id, score) for doc_id, score in ranked
+                if zlib.crc32(doc_id.encode('utf-8')) % slice_max == slice_id]
+    with self.state.lock:
+      ranked = [(doc_id, score, target.docs[doc_id]) for doc_id, score in ranked]
+    hits = self._hits(index, ranked[offset:offset + size], body.get('_source', True))
+    resp = {"took": int((time.perf_counter() - start) * 1000),
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": len(ranked), "relation": "eq"},
+                     "max_score": hits[0]["_score"] if hits else None,
+                     "hits": hits}}
+    aggs = body.get('aggs') or body.get('aggregations')
+    if aggs:
+      with self.state.lock:
+        resp["aggregations"] = self._aggregations(target, aggs, [doc_id for doc_id, _, _ in ranked])
+    if body.get('profile'):
+      # One shard, with the measured scoring and ranking times. The neural
+      # query's embedding happens before this, on the coordinator, as in
+      # OpenSearch, so it's in took but not in the shard's times.
+      resp["profile"] = {"shards": [{
+        "id": f"[mock][{index}][0]",
+        "searches": [{"query": [{"type": next(iter(query)), "description": json.dumps(query),
+                                 "time_in_nanos": collect_start - query_start}],
+                      "rewrite_time": 0,
+                      "collector": [{"name": "SimpleTopScoreDocCollector", "reason": "search_top_hits",
+                                     "time_in_nanos": time.perf_counter_ns() - collect_start}]}]}]}
+    if self.query.get('scroll'):
+      # The scroll keeps the rest of the hits, with their sources as they are
+      # now, like the point-in-time view of a scroll context.
+      scroll_id = _new_id()
+      self.state.scrolls[scroll_id] = {"index": index, "hits": ranked[offset + size:], "size": size,
+                                       "total": len(ranked), "source": body.get('_source', True)}
+      resp["_scroll_id"] = scroll_id
+    if pipeline:
+      self._apply_response_processors(pipeline, body, resp)
+    return 200, resp
+
+  def _hits(self, index, ranked, source_filter):
+    hits = [{"_index": index, "_id": doc_id, "_score": score,
+             "_source": self._filter_source(source, source_filter)}
+            for doc_id, score, source in ranked]
+    for hit in hits:
+      if hit["_source"] is None:
+        del hit["_source"]
+    return hits
+
+  def scroll(self):
+    _sleep_ms(self.state.latency.search_ms)
+    body = self.json_body()
+    scroll_id = body.get('scroll_id') or self.query['scroll_id']
+    context = self.state.scrolls[scroll_id]
+    with self.state.lock:
+      page, context["hits"] = context["hits"][:context["size"]], context["hits"][context["size"]:]
+    return 200, {"_scroll_id": scroll_id, "took": 0, "timed_out": False,
+                 "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                 "hits": {"total": {"value": context["total"], "relation": "eq"},
+                          "hits": self._hits(context["index"], page, context["source"])}}
+
+  def clear_scroll(self):
+    scroll_ids = self.json_body().get('scroll_id', [])
+    if isinstance(scroll_ids, str):
+      scroll_ids = [scroll_ids]
+    freed = sum(1 for scroll_id in scroll_ids if self.state.scrolls.pop(scroll_id, None) is not None)
+    return 200, {"succeeded": True, "num_freed": freed}
+
+  @staticmethod
+  def _filter_source(source, source_filter):
+    if source_filter is False:
+      return None
+    if isinstance(source_filter, str):
+      source_filter = [source_filter]
+    if isinstance(source_filter, list):
+      return {k: v for k, v in source.items() if k in source_filter}
+    if isinstance(source_filter, dict):
+      includes = source_filter.get('includes')
+      excludes = set(source_filter.get('excludes', []))
+      return {k: v for k, v in source.items()
+              if (includes is None or k in includes) and k not in excludes}
+    return dict(source)
+
+  def _score(self, target, query):
+    '''
+    Returns {doc_id: score} for the documents that match the query.
+    '''
+    kind, clause = next(iter(query.items()))
+    if kind in ('knn', 'neural'):
+      field, params = next(iter(clause.items()))
+      if kind == 'neural':
+        vector = self.state.embed([params['query_text']], target.vector_fields[field].dimension)[0]
+      else:
+        vector = params['vector']
+      allowed = None
+      if params.get('filter'):
+        allowed = self._filter_ids(target, params['filter'])
+      return dict(target.vector_fields[field].search(vector, params.get('k', 10), allowed))
+    if kind == 'match':
+      field, params = next(iter(clause.items()))
+      text = params.get('query', '') if isinstance(params, dict) else params
+      return self._bm25(target, field, text)
+    if kind == 'bool' and (clause.get('must') or clause.get('should')):
+      # Score with the must clauses (or, without them, the should clauses),
+      # and apply the rest of the bool query as a filter.
+      scoring = 'must' if clause.get('must') else 'should'
+      scorers = clause[scoring] if isinstance(clause[scoring], list) else [clause[scoring]]
+      rest = {"bool": {k: v for k, v in clause.items() if k != scoring}}
+      scores = {}
+      for i, scorer in enumerate(scorers):
+        part = self._score(target, scorer)
+        if scoring == 'must':
+          scores = part if i == 0 else {d: s + part[d] for d, s in scores.items() if d in part}
+        else:
+          for doc_id, score in part.items():
+            scores[doc_id] = scores.get(doc_id, 0.0) + score
+      return {doc_id: score for doc_id, score in scores.items()
+              if self._matches(doc_id, target.docs[doc_id], rest)}
+    return {doc_id: 1.0 for doc_id, source in target.docs.items()
+            if self._matches(doc_id, source, query)}
+
+  def _hybrid(self, target, clause, pipeline, depth):
+    '''
+    Runs each subquery of a hybrid query for its top depth documents, and
+    normalizes and combines their scores with the pipeline's normalization
+    processor. A document that a subquery didn't return scores 0 for it.
+    '''
+    processors = [p['normalization-processor'] for p in (pipeline or {}).get('phase_results_processors', [])
+                  if 'normalization-processor' in p]
+    if not processors:
+      raise ValueError('hybrid queries need a search pipeline with a normalization-processor')
+    normalization = processors[0].get('normalization', {}).get('technique', 'min_max')
+    combination = processors[0].get('combination', {})
+    technique = combination.get('technique', 'arithmetic_mean')
+    subqueries = clause.get('queries', [])
+    weights = combination.get('parameters', {}).get('weights') or [1.0] * len(subqueries)
+
+    normalized = []
+    for subquery in subqueries:
+      top = dict(sorted(self._score(target, subquery).items(), key=lambda item: -item[1])[:depth])
+      if top and normalization == 'l2':
+        norm = math.sqrt(sum(score ** 2 for score in top.values())) or 1.0
+        top = {doc_id: score / norm for doc_id, score in top.items()}
+      elif top:
+        low, high = min(top.values()), max(top.values())
+        # Like OpenSearch, the lowest returned score normalizes to 0.001, not 0.
+        top = {doc_id: max((score - low) / (high - low), 0.001) if high > low else 1.0
+               for doc_id, score in top.items()}
+      normalized.append(top)
+
+    combined = {}
+    for doc_id in set().union(*normalized):
+      scores = [(weight, part.get(doc_id, 0.0)) for weight, part in zip(weights, normalized)]
+      if technique == 'harmonic_mean':
+        positive = [(w, s) for w, s in scores if s > 0]
+        combined[doc_id] = sum(w for w, _ in positive) / sum(w / s for w, s in positive)
+      elif technique == 'geometric_mean':
+        positive = [(w, s) for w, s in scores if s > 0]
+        combined[doc_id] = math.exp(sum(w * math.log(s) for w, s in positive) / sum(w for w, _ in positive))
+      else:
+        combined[doc_id] = sum(w * s for w, s in scores) / sum(weights)
+    return combined
+
+  def _bm25(self, target, field, text, k1=1.2, b=0.75):
+    '''
+    BM25 over the text field, which is the only analyzed field the mock keeps
+    term statistics for.
+    '''
+    terms = set(_tokens(text))
+    if field != 'text' or not terms or not target.docs:
+      return {}
+    lengths = {doc_id: sum(tokens.values()) for doc_id, tokens in target.doc_tokens.items()}
+    average = sum(lengths.values()) / len(lengths) or 1
+    scores = {}
+    for term in terms:
+      postings = [(doc_id, tokens[term]) for doc_id, tokens in target.doc_tokens.items() if term in tokens]
+      if not postings:
+        continue
+      idf = math.log(1 + (len(target.docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+      for doc_id, tf in postings:
+        norm = tf + k1 * (1 - b + b * lengths[doc_id] / average)
+        scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / norm
+    return scores
+
+  def _filter_ids(self, target, query):
+    '''
+    The ids of the documents that match a filter. A term or terms clause on a
+    keyword field, alone or in a bool filter or must, narrows the candidates
+    to its postings first, so that a selective filter doesn't evaluate every
+    document.
+    '''
+    clauses = [query]
+    if 'bool' in query:
+      clauses = []
+      for name in ('filter', 'must'):
+        found = query['bool'].get(name, [])
+        clauses.extend(found if isinstance(found, list) else [found])
+    candidates = None
+    for clause in clauses:
+      kind, params = next(iter(clause.items()))
+      if kind not in ('term', 'terms'):
+        continue
+      field, wanted = next(iter(params.items()))
+      if field not in target.postings:
+        continue
+      if kind == 'term':
+        wanted = [wanted['value'] if isinstance(wanted, dict) else wanted]
+      ids = set().union(*(target.postings[field].get(value, ()) for value in wanted))
+      candidates = ids if candidates is None else candidates & ids
+    if candidates is None:
+      candidates = target.docs
+    return [doc_id for doc_id in candidates if self._matches(doc_id, target.docs[doc_id], query)]
+
+  def _aggregations(self, target, aggs, doc_ids):
+    '''
+    Runs terms aggregations on keyword fields over the matching documents.
+    '''
+    results = {}
+    for name, agg in aggs.items():
+      if 'terms' not in agg:
+        raise ValueError(f'The mock only supports terms aggregations, not {next(iter(agg))}')
+      field, size = agg['terms']['field'], agg['terms'].get('size', 10)
+      counts = Counter()
+      for doc_id in doc_ids:
+        counts.update(_keyword_values(target.docs[doc_id], field))
+      buckets = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+      results[name] = {"doc_count_error_upper_bound": 0,
+                       "sum_other_doc_count": sum(count for _, count in buckets[size:]),
+                       "buckets": [{"key": key, "doc_count": count} for key, count in buckets[:size]]}
+    return results
+
+  def _matches(self, doc_id, source, query):
+    '''
+    Evaluates a filter clause against one document.
+    '''
+    kind, clause = next(iter(query.items()))
+    if kind == 'match_all':
+      return True
+    if kind == 'ids':
+      return doc_id in clause.get('values', [])
+    if kind == 'exists':
+      return source.get(clause['field']) is not None
+    if kind in ('term', 'terms'):
+      field, wanted = next(iter(clause.items()))
+      if kind == 'term':
+        wanted = [wanted['value'] if isinstance(wanted, dict) else wanted]
+      values = source.get(field)
+      values = values if isinstance(values, list) else [values]
+      return any(value in wanted for value in values)
+    if kind == 'range':
+      field, bounds = next(iter(clause.items()))
+      value = source.get(field)
+      if value is None:
+        return False
+      return (('gte' not in bounds or value >= bounds['gte']) and
+              ('gt' not in bounds or value > bounds['gt']) and
+              ('lte' not in bounds or value <= bounds['lte']) and
+              ('lt' not in bounds or value < bounds['lt']))
+    if kind == 'match':
+      field, params = next(iter(clause.items()))
+      text = params.get('query', '') if isinstance(params, dict) else params
+      return bool(set(_tokens(text)) & set(_tokens(source.get(field, ''))))
+    if kind == 'bool':
+      def clauses(name):
+        found = clause.get(name, [])
+        return found if isinstance(found, list) else [found]
+      if not all(self._matches(doc_id, source, c) for c in clauses('must') + clauses('filter')):
+        return False
+      if any(self._matches(doc_id, source, c) for c in clauses('must_not')):
+        return False
+      should = clauses('should')
+      return not should or any(self._matches(doc_id, source, c) for c in should)
+    raise ValueError(f'The mock does not support [{kind}] queries here')
+
+  def _apply_response_processors(self, pipeline, body, resp):
+    for processor in pipeline.get('response_processors', []):
+      rag = processor.get('retrieval_augmented_generation')
+      if rag is None:
+        continue
+      params = body.get('ext', {}).get('generative_qa_parameters', {})
+      context = [hit.get('_source', {}).get(field, '')
+                 for hit in resp['hits']['hits'][:params.get('context_size', 5)]
+                 for field in rag.get('context_field_list', [])]
+      prompt = rag.get('system_prompt', '') + '\n' + rag.get('user_instructions', '') + '\n' + \
+               ''.join(f'SEARCH RESULT {i + 1}: {text}\n' for i, text in enumerate(context)) + \
+               f'QUESTION: {params.get("llm_question", "")}\n'
+      completion = self._generate(rag.get('model_id'), {"inputs": prompt})
+      resp['ext'] = {"retrieval_augmented_generation": {"answer": completion}}
+
+  # k-NN plugin #########################################################
+
+  def knn_train_model(self, model_id):
+    '''
+    "Trains" a model. The mock's kNN is exact, so there's nothing to learn,
+    but it checks the training index like the plugin, and the model is
+    training for deploy_ms, and then created.
+    '''
+    body = self.json_body()
+    training = self._index(body['training_index'])
+    if body.get('training_field') not in training.vector_fields:
+      return 400, {"error": {"type": "illegal_argument_exception",
+                             "reason": f'{body.get("training_field")} is not a knn_vector field'}}
+    model = {"model_id": model_id, "state": "training", "dimension": body['dimension'],
+             "method": body.get('method', {}), "engine": body.get('method', {}).get('engine', 'faiss')}
+    with self.state.lock:
+      self.state.knn_models[model_id] = model
+
+    def finish():
+      model['state'] = 'created'
+    threading.Timer(self.state.latency.deploy_ms / 1000.0, finish).start()
+    return 200, {"model_id": model_id}
+
+  def knn_get_model(self, model_id):
+    return 200, self.state.knn_models[model_id]
+
+  def knn_delete_model(self, model_id):
+    with self.state.lock:
+      if self.state.knn_models.pop(model_id, None) is None:
+        raise KeyError(f'no such model [{model_id}]')
+    return 200, {"model_id": model_id, "result": "deleted"}
+
+  def knn_warmup(self, index):
+    '''
+    The mock's vectors are always in memory, so this only checks the index.
+    '''
+    self._index(index)
+    return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+  def knn_stats(self):
+    '''
+    Reports the float32 vector memory of every index as graph memory, in KB,
+    for a single node.
+    '''
+    with self.state.lock:
+      vector_bytes = sum(len(field.rows) * field.dimension * 4
+                         for target in self.state.indices.values()
+                         for field in target.vector_fields.values())
+    return 200, {"_nodes": {"total": 1, "successful": 1, "failed": 0},
+                 "cluster_name": "mock",
+                 "nodes": {"mock-node": {"graph_memory_usage": vector_bytes // 1024,
+                                         "graph_memory_usage_percentage": 0.0}}}
+
+  # ML Commons and SageMaker ############################################
+
+  def ml_create_connector(self):
+    connector_id = _new_id()
+    self.state.connectors[connector_id] = self.json_body()
+    return 200, {"connector_id": connector_id}
+
+  def ml_get_connector(self, connector_id):
+    return 200, dict(self.state.connectors[connector_id], connector_id=connector_id)
+
+  def ml_search_connectors(self):
+    return 200, self._ml_search(self.state.connectors)
+
+  def ml_search_models(self):
+    return 200, self._ml_search(self.state.models)
+
+  def _ml_search(self, records):
+    '''
+    Searches connectors or models with a term query, alone or in a bool
+    filter or must, or returns them all. A .keyword suffix on a field is
+    ignored.
+    '''
+    body = self.json_body()
+    query = body.get('query', {})
+    clauses = [query] if 'term' in query else query.get('bool', {}).get('filter', []) + \
+                                                query.get('bool', {}).get('must', [])
+    terms = {}
+    for clause in clauses:
+      for field, value in clause.get('term', {}).items():
+        terms[field.removesuffix('.keyword')] = value.get('value') if isinstance(value, dict) else value
+    hits = [{"_id": record_id, "_score": 1.0, "_source": record}
+            for record_id, record in list(records.items())
+            if all(record.get(field) == value for field, value in terms.items())]
+    return {"took": 0, "timed_out": False,
+            "hits": {"total": {"value": len(hits), "relation": "eq"},
+                     "hits": hits[:body.get('size', 10)]}}
+
+  def ml_register_model(self):
+    body = self.json_body()
+    if body.get('connector_id') and body['connector_id'] not in self.state.connectors:
+      raise KeyError(f'Failed to find connector {body["connector_id"]}')
+    model_id, task_id = _new_id(), _new_id()
+    self.state.models[model_id] = dict(body, model_state='REGISTERED')
+    self.state.tasks[task_id] = {"model_id": model_id, "task_type": "REGISTER_MODEL", "state": "COMPLETED"}
+    if self.query.get('deploy') == 'true':
+      self._deploy(model_id)
+    return 200, {"task_id": task_id, "status": "CREATED", "model_id": model_id}
+
+  def ml_deploy_model(self, model_id):
+    if model_id not in self.state.models:
+      raise KeyError(f'Failed to find model {model_id}')
+    return 200, {"task_id": self._deploy(model_id), "task_type": "DEPLOY_MODEL", "status": "CREATED"}
+
+  def _deploy(self, model_id):
+    '''
+    Deploys asynchronously, like ML Commons. The model is DEPLOYING for
+    deploy_ms, and then DEPLOYED.
+    '''
+    task_id = _new_id()
+    model = self.state.models[model_id]
+    task = {"model_id": model_id, "task_type": "DEPLOY_MODEL", "state": "RUNNING"}
+    model['model_state'] = 'DEPLOYING'
+    self.state.tasks[task_id] = task
+
+    def finish():
+      model['model_state'] = 'DEPLOYED'
+      task['state'] = 'COMPLETED'
+    threading.Timer(self.state.latency.deploy_ms / 1000.0, finish).start()
+    return task_id
+
+  def ml_get_model(self, model_id):
+    return 200, dict(self.state.models[model_id], model_id=model_id)
+
+  def ml_get_task(self, task_id):
+    return 200, self.state.tasks[task_id]
+
+  def _generate(self, model_id, parameters):
+    '''
+    Generates through a model's connector. The connector's request_body
+    template is filled in from its parameters and the request's parameters,
+    and sent over HTTP, so the mock pays a real connector round trip, as
+    OpenSearch does. Models that aren't registered call the server's own
+    SageMaker route.
+    '''
+    model = self.state.models.get(model_id)
+    if model is None:
+      url = self.state.sagemaker_url
+      payload = {"inputs": parameters.get('inputs', ''),
+                 "parameters": {k: v for k, v in parameters.items() if k != 'inputs'}}
+    else:
+      if model['model_state'] != 'DEPLOYED':
+        raise ValueError(f'Model {model_id} is not deployed')
+      connector = self.state.connectors[model['connector_id']]
+      action = next(a for a in connector['actions'] if a['action_type'] == 'PREDICT')
+      values = dict(connector.get('parameters', {}), **parameters)
+      url, payload = action['url'], json.loads(_fill_template(action['request_body'], values))
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                     headers={"Content-Type": "application/json"}, method='POST')
+    with urllib.request.urlopen(request) as f:
+      result = json.loads(f.read())
+    # A list of prompts (through the batch connector in generation_batch.py)
+    # gets a list of completions back, in the same order.
+    if isinstance(parameters.get('inputs'), list):
+      return [item['generated_text'] for item in result]
+    return result[0]['generated_text']
+
+  def ml_predict(self, model_id):
+    parameters = self.json_body().get('parameters', {})
+    completion = self._generate(model_id, parameters)
+    # The two connectors' post_process_functions: the batch connector returns
+    # all of the completions, and the other the first.
+    data = {"completions": completion} if isinstance(completion, list) else {"completion": completion}
+    return 200, {"inference_results": [{"output": [{"name": "response", "dataAsMap": data}],
+                                        "status_code": 200}]}
+
+  def ml_predict_embedding(self, model_id):
+    texts = self.json_body().get('text_docs', [])
+    _sleep_ms(self.state.latency.embed_ms)
+    vectors = self.state.embed(texts)
+    return 200, {"inference_results": [{"output": [{"name": "sentence_embedding",
+                                                    "data_type": "FLOAT32",
+                                                    "shape": [len(vector)],
+                                                    "data": vector.tolist()}]}
+                                       for vector in vectors]}
+
+  def sagemaker_invoke(self, endpoint):
+    '''
+    Generates like the TGI container. With "stream": true, the answer comes
+    back as server-sent events, one per token: the first after generate_ms
+    (the prefill), and the rest spread over the token_ms * max_new_tokens
+    that a whole generation takes. inputs can be a list of prompts, which
+    are generated together, for batch_item_ms more for each prompt after the
+    first, with one result for each. Each invocation holds one of the
+    generate_slots while it generates. generate_tail_rate of the invocations
+    take generate_tail_ms longer, and generate_error_rate of them fail.
+    '''
+    body = self.json_body()
+    max_new_tokens = int(body.get('parameters', {}).get('max_new_tokens', 64))
+    inputs = body.get('inputs', '')
+    prompts = inputs if isinstance(inputs, list) else [inputs]
+    answer = f'Mock answer from {endpoint}.'
+    if body.get('stream'):
+      return 200, self._stream_tokens(answer, max_new_tokens)
+    latency = self.state.latency
+    if random.random() < latency.generate_error_rate:
+      return 500, {"ErrorCode": "ModelError", "Message": f'Endpoint {endpoint} failed to generate'}
+    tail_ms = latency.generate_tail_ms if random.random() < latency.generate_tail_rate else 0.0
+    with self.state.generate_slots:
+      _sleep_ms(latency.generate_ms + tail_ms + latency.token_ms * max_new_tokens +
+                latency.batch_item_ms * (len(prompts) - 1))
+    return 200, [{"generated_text": f'{prompt}{answer}'} for prompt in prompts]
+
+  def _stream_tokens(self, answer, max_new_tokens):
+    tokens = re.findall(r'\s*\S+', answer)
+    # The first token comes after the prefill, and the rest after token_ms
+    # each, on average.
+    token_ms = self.state.latency.token_ms * max_new_tokens / max(len(tokens) - 1, 1)
+    with self.state.generate_slots:
+      _sleep_ms(self.state.latency.generate_ms)
+      for i, text in enumerate(tokens):
+        if i:
+          _sleep_ms(token_ms)
+        event = {"index": i + 1, "token": {"id": i, "text": text, "special": False},
+                 "generated_text": answer if i == len(tokens) - 1 else None}
+        yield b'data:' + json.dumps(event).encode('utf-8') + b'\n\n'
+
+
+def _fill_template(template, values):
+  '''
+  Substitutes ${parameters.name} placeholders the way ML Commons does: strings
+  are inserted JSON-escaped, without quotes, and everything else as JSON.
+  '''
+  def replace(match):
+    value = values[match.group(1)]
+    return json.dumps(value)[1:-1] if isinstance(value, str) else json.dumps(value)
+  return re.sub(r'\$\{parameters\.(\w+)\}', replace, template)
+
+
+class _Server(ThreadingHTTPServer):
+  # The connector calls open a new connection each, so a burst of concurrent
+  # _predict calls overflows the default backlog of 5, and the connections
+  # beyond it wait a second for the SYN to be sent again.
+  request_queue_size = 128
+  daemon_threads = True
+
+  def handle_error(self, request, client_address):
+    # A client that gives up on a request, like a hedged request that lost
+    # (see generation_pool.py), closes its connection. That's not an error.
+    if isinstance(sys.exc_info()[1], ConnectionError):
+      return
+    super().handle_error(request, client_address)
+
+
+def start_mock_server(latency=None, host='127.0.0.1', port=0, certfile=None, keyfile=None):
+  '''
+  Starts the mock in a daemon thread, and returns (server, url). Port 0 picks
+  a free port. With certfile and keyfile, the server speaks HTTPS. Call
+  server.shutdown() to stop it.
+  '''
+  server = _Server((host, port), _Handler)
+  scheme = 'http'
+  if certfile:
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    scheme = 'https'
+  server.state = MockState(latency or MockLatency())
+  url = f'{scheme}://{host}:{server.server_address[1]}'
+  # With TLS, the SageMaker route that unregistered models call runs on a
+  # second, plain HTTP server, so the connector calls don't need to trust the
+  # certificate.
+  sagemaker_url = url
+  if certfile:
+    server.sagemaker, sagemaker_url = start_mock_server(server.state.latency, host)
+  server.state.sagemaker_url = f'{sagemaker_url}/endpoints/mock-deepseek/invocations'
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server, url
+
+
+if __name__ == '__main__':
+  latency = MockLatency.from_env()
+  server, url = start_mock_server(latency,
+                                  host=os.environ.get('MOCK_HOST', '127.0.0.1'),
+                                  port=int(os.environ.get('MOCK_PORT', 9200)),
+                                  certfile=os.environ.get('MOCK_TLS_CERT'),
+                                  keyfile=os.environ.get('MOCK_TLS_KEY'))
+  print(f'Mock OpenSearch listening on {url}, latency {latency.as_dict()}')
+  print(f'Mock SageMaker endpoint: {server.state.sagemaker_url}')
+  try:
+    threading.Event().wait()
+  except KeyboardInterrupt:
+    server.shutdown()
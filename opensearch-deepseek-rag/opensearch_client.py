@@ -0,0 +1,309 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Builds the connections to your OpenSearch Service domain, so that every
+script in this folder connects the same way:
+
+- create_client returns a synchronous opensearch-py client, and
+  create_async_client an async one, for the domain endpoint. The endpoint can
+  be a bare host name, or a URL with a scheme and a port.
+- create_session returns a requests Session, for the scripts that call the
+  REST API directly (create_connector.py and create_deepseek_model.py).
+
+Each one keeps a pool of connections open (keep-alive), so requests after the
+first reuse a connection and its TLS session instead of paying a new
+handshake. Each one retries requests that the domain rejects with 429 (too
+many requests) or 503 (unavailable), waiting longer after each attempt, with
+jitter. The opensearch-py clients also gzip their request bodies, which
+shrinks _bulk requests several times over.
+
+You can tune the defaults with environment variables:
+
+- OPENSEARCH_PORT: the port, when the endpoint doesn't include one (443).
+- OPENSEARCH_POOL_MAXSIZE: connections kept open per client (10).
+- OPENSEARCH_HTTP_COMPRESS: gzip request bodies, true or false (true).
+- OPENSEARCH_MAX_RETRIES: retries after a 429 or 503 (3).
+- OPENSEARCH_RETRY_BACKOFF: the first wait before a retry, in seconds (0.5).
+
+All clients count their requests, retries, and new connections in metrics.
+Call metrics.snapshot() to see how well connections are reused.
+'''
+
+import asyncio
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from opensearchpy import AIOHttpConnection, AsyncOpenSearch, OpenSearch, Urllib3HttpConnection
+from opensearchpy.exceptions import TransportError
+
+
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+MAX_RETRY_BACKOFF = 20.0
+# The statuses that mean "slow down and try again". The request wasn't
+# processed, so it's safe to send it again.
+RETRY_STATUSES = (429, 503)
+
+
+def _env_bool(name, default):
+  return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+pool_maxsize = int(os.environ.get('OPENSEARCH_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE))
+http_compress = _env_bool('OPENSEARCH_HTTP_COMPRESS', True)
+max_retries = int(os.environ.get('OPENSEARCH_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+retry_backoff = float(os.environ.get('OPENSEARCH_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF))
+
+
+class ClientMetrics:
+  '''
+  Counts, across all the clients that this module creates:
+
+  - requests: HTTP requests sent, including retries.
+  - retries: requests sent again after a 429 or 503.
+  - throttled: responses with status 429.
+  - connections_opened: new connections (and, with TLS, new handshakes).
+
+  connection_reuse in the snapshot is the share of requests that went out on
+  a connection that was already open.
+  '''
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    with self._lock:
+      self.counts = {"requests": 0, "retries": 0, "throttled": 0, "connections_opened": 0}
+
+  def count(self, name, amount=1):
+    if amount:
+      with self._lock:
+        self.counts[name] += amount
+
+  def snapshot(self):
+    with self._lock:
+      snapshot = dict(self.counts)
+    requests_sent = snapshot["requests"]
+    snapshot["connection_reuse"] = (round(1 - snapshot["connections_opened"] / requests_sent, 4)
+                                    if requests_sent else None)
+    return snapshot
+
+
+metrics = ClientMetrics()
+
+
+def parse_endpoint(endpoint, port=None):
+  '''
+  Splits a domain endpoint into (scheme, host, port). The endpoint can be a
+  bare host name, or a URL like https://host:9200/. Without a port in the
+  endpoint, the port is the port argument, OPENSEARCH_PORT, or 443 (80 for
+  http).
+  '''
+  if '://' not in endpoint:
+    endpoint = 'https://' + endpoint
+  parsed = urlparse(endpoint)
+  default_port = 80 if parsed.scheme == 'http' else 443
+  port = parsed.port or port or int(os.environ.get('OPENSEARCH_PORT', default_port))
+  return parsed.scheme, parsed.hostname, port
+
+
+def endpoint_url(endpoint, port=None):
+  '''
+  The base URL for the domain, with scheme and port, and no trailing slash.
+  '''
+  scheme, host, port = parse_endpoint(endpoint, port)
+  return f'{scheme}://{host}:{port}'
+
+
+def backoff_delay(attempt, base=DEFAULT_RETRY_BACKOFF):
+  '''
+  The wait before retry number attempt (from 0): exponential, capped, with
+  full jitter, so that many clients that were throttled together don't
+  retry together.
+  '''
+  return random.uniform(0, min(MAX_RETRY_BACKOFF, base * 2 ** attempt))
+
+
+class RetryingConnection(Urllib3HttpConnection):
+  '''
+  An opensearch-py connection that retries 429 and 503 responses with
+  backoff, and counts its requests and new connections in metrics.
+  '''
+
+  def __init__(self, *args, throttle_retries=DEFAULT_MAX_RETRIES,
+               throttle_backoff=DEFAULT_RETRY_BACKOFF, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.throttle_retries = throttle_retries
+    self.throttle_backoff = throttle_backoff
+    self._seen_lock = threading.Lock()
+    self._seen_connections = 0
+
+  def _count_new_connections(self):
+    # urllib3 counts the connections each pool opens. Report the increase
+    # since the last request.
+    with self._seen_lock:
+      opened = self.pool.num_connections if self.pool is not None else 0
+      new, self._seen_connections = opened - self._seen_connections, opened
+    metrics.count("connections_opened", max(new, 0))
+
+  def perform_request(self, *args, **kwargs):
+    attempt = 0
+    while True:
+      metrics.count("requests")
+      try:
+        return super().perform_request(*args, **kwargs)
+      except TransportError as e:
+        if e.status_code == 429:
+          metrics.count("throttled")
+        if e.status_code not in RETRY_STATUSES or attempt >= self.throttle_retries:
+          raise
+      finally:
+        self._count_new_connections()
+      metrics.count("retries")
+      time.sleep(backoff_delay(attempt, self.throttle_backoff))
+      attempt += 1
+
+
+class RetryingAsyncConnection(AIOHttpConnection):
+  '''
+  The async counterpart of RetryingConnection.
+  '''
+
+  def __init__(self, *args, throttle_retries=DEFAULT_MAX_RETRIES,
+               throttle_backoff=DEFAULT_RETRY_BACKOFF, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.throttle_retries = throttle_retries
+    self.throttle_backoff = throttle_backoff
+
+  async def perform_request(self, *args, **kwargs):
+    attempt = 0
+    while True:
+      metrics.count("requests")
+      try:
+        return await super().perform_request(*args, **kwargs)
+      except TransportError as e:
+        if e.status_code == 429:
+          metrics.count("throttled")
+        if e.status_code not in RETRY_STATUSES or attempt >= self.throttle_retries:
+          raise
+      metrics.count("retries")
+      await asyncio.sleep(backoff_delay(attempt, self.throttle_backoff))
+      attempt += 1
+
+  async def _create_aiohttp_session(self):
+    # AIOHttpConnection's own session, plus a trace that counts the
+    # connections its connector opens.
+    await super()._create_aiohttp_session()
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_end.append(_count_connection)
+    trace.freeze()
+    self.session.trace_configs.append(trace)
+
+
+async def _count_connection(session, context, params):
+  metrics.count("connections_opened")
+
+
+def _client_options(endpoint, http_auth, port):
+  scheme, host, port = parse_endpoint(endpoint, port)
+  return {
+    "hosts": [{"host": host, "port": port}],
+    "http_auth": http_auth,
+    "use_ssl": scheme == 'https',
+    "verify_certs": False,
+    "ssl_assert_hostname": False,
+    "ssl_show_warn": False,
+    "http_compress": http_compress,
+    # The connection retries 429 and 503 with backoff. The transport retries
+    # 502, on a fresh connection. Not 504: behind a gateway timeout, the
+    # request can still be running, and sending a _predict or a RAG search
+    # again would run it twice.
+    "retry_on_status": (502,),
+    "throttle_retries": max_retries,
+    "throttle_backoff": retry_backoff,
+  }
+
+
+def create_client(endpoint, http_auth=None, pool_size=None, port=None, throttle_retries=None,
+                  **kwargs):
+  '''
+  Returns a synchronous client for the domain. Size the pool to the number of
+  threads that share the client. Pass throttle_retries=0 when the caller
+  handles 429 and 503 itself, like the adaptive _bulk load in
+  ingest_controller.py, so that it sees them. Other keyword arguments go to
+  OpenSearch().
+  '''
+  options = _client_options(endpoint, http_auth, port)
+  if throttle_retries is not None:
+    options["throttle_retries"] = throttle_retries
+  options.update(connection_class=RetryingConnection,
+                 pool_maxsize=pool_size or pool_maxsize,
+                 **kwargs)
+  return OpenSearch(**options)
+
+
+def create_async_client(endpoint, http_auth=None, pool_size=None, port=None, throttle_retries=None,
+                        **kwargs):
+  '''
+  Returns an AsyncOpenSearch client for the domain. Size the pool to the
+  number of requests in flight. throttle_retries is as for create_client.
+  '''
+  options = _client_options(endpoint, http_auth, port)
+  if throttle_retries is not None:
+    options["throttle_retries"] = throttle_retries
+  options.update(connection_class=RetryingAsyncConnection,
+                 maxsize=pool_size or pool_maxsize,
+                 **kwargs)
+  return AsyncOpenSearch(**options)
+
+
+def create_session(auth=None, pool_size=None):
+  '''
+  Returns a requests Session with a pool of kept-alive connections that
+  retries 429 and 503 responses with backoff (honoring Retry-After), for
+  every method, since the domain didn't process the request. It doesn't
+  retry a request that failed while reading the response: the domain may
+  have processed it, and a POST sent again could create a second connector
+  or model. auth is anything requests accepts, like a (user, password)
+  tuple, or AWS4Auth.
+  '''
+  session = requests.Session()
+  session.auth = auth
+  adapter = HTTPAdapter(pool_connections=1,
+                        pool_maxsize=pool_size or pool_maxsize,
+                        max_retries=Retry(total=max_retries,
+                                          read=0,
+                                          backoff_factor=retry_backoff,
+                                          status_forcelist=RETRY_STATUSES,
+                                          allowed_methods=None,
+                                          raise_on_status=False))
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  seen = {"connections": 0}
+  seen_lock = threading.Lock()
+
+  def record(response, *args, **kwargs):
+    retries = response.raw.retries
+    history = retries.history if retries is not None else ()
+    metrics.count("requests", 1 + len(history))
+    metrics.count("retries", len(history))
+    metrics.count("throttled", sum(1 for attempt in history if attempt.status == 429) +
+                  (1 if response.status_code == 429 else 0))
+    with seen_lock:
+      pools = adapter.poolmanager.pools
+      opened = sum(pools[key].num_connections for key in pools.keys())
+      new, seen["connections"] = opened - seen["connections"], opened
+    metrics.count("connections_opened", max(new, 0))
+
+  session.hooks['response'].append(record)
+  return session
@@ -0,0 +1,40 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Latency and throughput summaries for the query runners and benchmarks.
+'''
+
+
+def percentile(values, p):
+  '''
+  Returns the p-th percentile (0-100) of values, interpolating linearly
+  between the closest ranks. Returns None for an empty list.
+  '''
+  if not values:
+    return None
+  ordered = sorted(values)
+  rank = (len(ordered) - 1) * p / 100.0
+  lower = int(rank)
+  upper = min(lower + 1, len(ordered) - 1)
+  return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize_latencies(latencies, elapsed_seconds, errors=0):
+  '''
+  Summarizes a list of request latencies, in seconds, collected over
+  elapsed_seconds of wall clock time. Latencies in the result are in
+  milliseconds.
+  '''
+  def ms(value):
+    return None if value is None else round(value * 1000, 2)
+
+  return {
+    "requests": len(latencies),
+    "errors": errors,
+    "elapsed_s": round(elapsed_seconds, 3),
+    "qps": round(len(latencies) / elapsed_seconds, 2) if elapsed_seconds > 0 else None,
+    "p50_ms": ms(percentile(latencies, 50)),
+    "p95_ms": ms(percentile(latencies, 95)),
+    "p99_ms": ms(percentile(latencies, 99)),
+    "max_ms": ms(max(latencies) if latencies else None),
+  }
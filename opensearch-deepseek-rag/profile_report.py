@@ -0,0 +1,195 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Compares the index profiles in index_profiles.py on recall@k, query latency,
+and memory, so you can pick one for load_data.py with data.
+
+For each profile (and each ef_search in PROFILE_REPORT_EF_SEARCH), the script
+creates a scratch index, writes the same synthetic, client-embedded corpus to
+it, and runs the same kNN queries. The exact answer for each query comes from
+a brute-force NumPy search over the corpus in this script, so recall@k is the
+share of the true k nearest neighbors that the index returns.
+
+Memory is reported two ways: the estimate from the k-NN documentation's
+formulas, and the change in graph_memory_usage from the _plugins/_knn/stats
+API, when the cluster reports it.
+
+By default the script runs against the local mock in mock_opensearch.py. The
+mock's kNN is exact, so its recall is always 1.0, and you should use it only
+to check the report itself. Set OPENSEARCH_SERVICE_DOMAIN_ENDPOINT (with
+OPENSEARCH_SERVICE_ADMIN_USER and OPENSEARCH_SERVICE_ADMIN_PASSWORD) to
+measure a real domain. The scratch indices are deleted when each profile
+finishes.
+'''
+
+import datetime
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import bulk_loader
+import embedders
+import index_profiles
+import mock_opensearch
+import opensearch_client
+import perf_stats
+import rag_query
+
+
+def _list(name, default):
+  return [x for x in os.environ.get(name, default).split(',') if x]
+
+
+profiles = _list('PROFILE_REPORT_PROFILES', ','.join(index_profiles.PROFILES))
+ef_search_values = [int(x) for x in _list('PROFILE_REPORT_EF_SEARCH', str(index_profiles.DEFAULT_EF_SEARCH))]
+doc_count = int(os.environ.get('PROFILE_REPORT_DOCS', 5000))
+query_count = int(os.environ.get('PROFILE_REPORT_QUERIES', 100))
+k = int(os.environ.get('PROFILE_REPORT_K', 10))
+output_path = os.environ.get('PROFILE_REPORT_OUTPUT')
+opensearch_service_api_endpoint = os.environ.get('OPENSEARCH_SERVICE_DOMAIN_ENDPOINT')
+index_prefix = 'profile_report'
+
+
+def corpus_texts(count):
+  for i in range(count):
+    yield (f'The metro area population of Metro {i} in 2023 is {500_000 + 7_919 * i:,}, '
+           f'a {i % 300 / 100:.2f}% increase from 2022, in region {i % 50}.')
+
+
+def query_texts(count):
+  return [f'population growth of Metro {(j * 37) % max(doc_count, 1)} in region {j % 50}'
+          for j in range(count)]
+
+
+def exact_distances(corpus, queries):
+  '''
+  The squared l2 distance from each query to each document, by brute force.
+  This is the baseline that recall is measured against.
+  '''
+  return (np.sum(queries ** 2, axis=1)[:, None] - 2 * queries @ corpus.T +
+          np.sum(corpus ** 2, axis=1)[None, :])
+
+
+def recall_at_k(distances, returned_rows, k):
+  '''
+  The share of the true top k among the returned rows. Documents tied with
+  the k-th nearest neighbor all count as true neighbors, because any of them
+  is a correct answer.
+  '''
+  kth = np.partition(distances, k - 1)[k - 1]
+  correct = sum(1 for row in returned_rows[:k] if distances[row] <= kth + 1e-6)
+  return correct / k
+
+
+def graph_memory_kb(client):
+  try:
+    stats = client.transport.perform_request('GET', '/_plugins/_knn/stats')
+  except Exception:
+    return None
+  return sum(node.get('graph_memory_usage', 0) for node in stats.get('nodes', {}).values())
+
+
+def load_vectors(client, index, vectors):
+  documents = ({"id": str(i), "text_embedding": vector.tolist()} for i, vector in enumerate(vectors))
+  bulk_loader.bulk_load(client, index, documents, log=None)
+  client.indices.refresh(index=index)
+
+
+def create_profile_index(client, index, profile_name, ef_search, vectors):
+  '''
+  Creates the index for a profile and loads the vectors. Profiles that need
+  training are trained on the corpus first, through a scratch hnsw index.
+  Returns the trained model id, or None.
+  '''
+  model_id = None
+  if index_profiles.get_profile(profile_name).get('requires_training'):
+    training_index = f'{index}_training'
+    client.indices.create(index=training_index,
+                          body=index_profiles.build_mapping(index_profiles.DEFAULT_PROFILE, replicas=0,
+                                                            dimension=vectors.shape[1]))
+    load_vectors(client, training_index, vectors)
+    model_id = index_profiles.train_model(client, f'{index}_model', training_index, profile_name,
+                                          dimension=vectors.shape[1])
+    client.indices.delete(index=training_index)
+  client.indices.create(index=index,
+                        body=index_profiles.build_mapping(profile_name, ef_search=ef_search, replicas=0,
+                                                          dimension=vectors.shape[1], model_id=model_id))
+  load_vectors(client, index, vectors)
+  return model_id
+
+
+def measure(client, profile_name, ef_search, vectors, query_vectors, distances):
+  index = f'{index_prefix}_{profile_name}_{ef_search}'
+  memory_before = graph_memory_kb(client)
+  model_id = create_profile_index(client, index, profile_name, ef_search, vectors)
+  try:
+    latencies, recalls = [], []
+    start = time.perf_counter()
+    for query_vector, query_distances in zip(query_vectors, distances):
+      query = {"size": k, "_source": False, "query": rag_query.knn_clause(query_vector.tolist(), k=k)}
+      query_start = time.perf_counter()
+      resp = client.search(body=query, index=index)
+      latencies.append(time.perf_counter() - query_start)
+      returned = [int(doc_id) for doc_id in rag_query.hit_ids(resp)]
+      recalls.append(recall_at_k(query_distances, returned, k))
+    metrics = perf_stats.summarize_latencies(latencies, time.perf_counter() - start)
+    memory_after = graph_memory_kb(client)
+  finally:
+    client.indices.delete(index=index)
+    if model_id:
+      client.transport.perform_request('DELETE', f'/_plugins/_knn/models/{model_id}')
+  return {"profile": profile_name,
+          "ef_search": ef_search,
+          f'recall_at_{k}': round(float(np.mean(recalls)), 4),
+          "p50_ms": metrics["p50_ms"],
+          "p95_ms": metrics["p95_ms"],
+          "qps": metrics["qps"],
+          "estimated_memory_mb": round(index_profiles.estimate_memory_bytes(
+            profile_name, len(vectors), vectors.shape[1]) / 1024 ** 2, 2),
+          "graph_memory_mb": None if memory_before is None or memory_after is None
+                             else round((memory_after - memory_before) / 1024, 2)}
+
+
+def main():
+  server = None
+  if opensearch_service_api_endpoint:
+    client = opensearch_client.create_client(opensearch_service_api_endpoint,
+                                             (os.environ['OPENSEARCH_SERVICE_ADMIN_USER'],
+                                              os.environ['OPENSEARCH_SERVICE_ADMIN_PASSWORD']))
+  else:
+    server, url = mock_opensearch.start_mock_server(mock_opensearch.MockLatency(0, 0, 0, 0, 0, 0))
+    client = opensearch_client.create_client(url)
+    print(f'Using the local mock at {url}. Its kNN is exact, so recall is always 1.0.', file=sys.stderr)
+
+  embedder = embedders.HashingEmbedder()
+  vectors = embedder.embed(list(corpus_texts(doc_count)))
+  query_vectors = embedder.embed(query_texts(query_count))
+  distances = exact_distances(vectors, query_vectors)
+
+  report = {"started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "documents": doc_count,
+            "queries": query_count,
+            "k": k,
+            "results": []}
+  try:
+    for profile_name in profiles:
+      for ef_search in ef_search_values:
+        print(f'Measuring {profile_name} with ef_search {ef_search}', file=sys.stderr)
+        report["results"].append(measure(client, profile_name, ef_search, vectors, query_vectors, distances))
+  finally:
+    if server:
+      server.shutdown()
+
+  if output_path:
+    with open(output_path, 'w', encoding='utf-8') as f:
+      json.dump(report, f, indent=2)
+    print(f'Wrote {output_path}', file=sys.stderr)
+  else:
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,463 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Runs the whole setup in one go: the work of create_invoke_role.py,
+create_connector_role.py, setup_opensearch_security.py, create_connector.py,
+and create_deepseek_model.py, without copying export lines between them.
+
+The steps form a dependency graph. run_steps starts each step as soon as the
+steps it requires have finished, so independent steps run concurrently (the
+two IAM roles, for example, and the batch connector alongside the main one).
+Each step returns the values it produced, under the names of the environment
+variables the scripts read, like INVOKE_DEEPSEEK_ROLE, and later steps read
+them from the shared context.
+
+Every step checks for its resources first, and reuses them, so you can run
+the script again after a failure, or after a partial setup with the
+individual scripts:
+
+- The IAM policies and roles are looked up by name, and created only when
+  they're missing. Attaching a policy to a role is idempotent, so that runs
+  every time.
+- The ml_full_access role mapping keeps the backend roles it has, and gains
+  the ones it's missing.
+- The connector is looked up by name and SageMaker URL, the model by
+  connector id.
+- A model that isn't deployed is deployed, and the script polls its state,
+  with backoff, until it's DEPLOYED, rather than firing the deploy and hoping.
+
+A new IAM role can take several seconds to be usable everywhere, so the
+connector step retries, with backoff, as well.
+
+Set PROVISION_BATCH_CONNECTOR to true to create the batch connector and its
+model too (see generation_batch.py). Set PROVISION_ENV_FILE to a path to write
+the export lines there, so that you can source it.
+
+  python provision.py
+'''
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import json
+import os
+import time
+
+import boto3
+from opensearchpy.exceptions import NotFoundError
+
+import aws_credentials
+import deepseek_connector
+import generation_batch
+import opensearch_client
+import tracing
+
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_RETRY_BACKOFF = 2.0
+DEFAULT_DEPLOY_TIMEOUT_S = 600
+DEFAULT_DEPLOY_BACKOFF = 1.0
+# The names the tutorial scripts use.
+INVOKE_POLICY_NAME = 'invoke_deepseek_policy'
+INVOKE_ROLE_NAME = 'invoke_deepseek_role'
+CONNECTOR_POLICY_NAME = 'create_deepseek_connector_policy'
+CONNECTOR_ROLE_NAME = 'create_deepseek_connector_role'
+LAMBDA_INVOKE_ML_COMMONS_ROLE_NAME = 'LambdaInvokeOpenSearchMLCommonsRole'
+ML_ROLE = 'ml_full_access'
+CONNECTOR_NAME = 'DeepSeek R1 model connector v2'
+BATCH_CONNECTOR_NAME = 'DeepSeek R1 model batch connector'
+MODEL_NAME = 'Sagemaker DeepSeek R1 model'
+BATCH_MODEL_NAME = 'Sagemaker DeepSeek R1 batch model'
+# A model in this state won't deploy by waiting.
+DEPLOY_FAILED_STATE = 'DEPLOY_FAILED'
+
+CREATED = 'created'
+EXISTS = 'exists'
+UPDATED = 'updated'
+
+
+class Step:
+  '''
+  One step of the setup. run takes the context, a dict of the values so far,
+  and returns (outputs, status): a dict of the values it produced, and
+  whether it created its resources, found them, or updated them. A step runs
+  after every step named in requires has finished. A step that raises is
+  tried again, with backoff, up to attempts times in all.
+  '''
+
+  def __init__(self, name, run, requires=(), attempts=1):
+    self.name = name
+    self.run = run
+    self.requires = tuple(requires)
+    self.attempts = attempts
+
+
+def _run_step(step, context, retry_backoff, parent, log):
+  span = tracing.tracer.start_span(f'provision.{step.name}', parent=parent)
+  start = time.perf_counter()
+  for attempt in range(step.attempts):
+    try:
+      outputs, status = step.run(context)
+      break
+    except Exception as e:
+      if attempt + 1 >= step.attempts:
+        span.end(error=e)
+        raise
+      delay = opensearch_client.backoff_delay(attempt, retry_backoff)
+      if log:
+        log(f'{step.name}: {e}. Trying again in {delay:.1f}s')
+      time.sleep(delay)
+  span.set(status=status, attempts=attempt + 1)
+  span.end()
+  return outputs, status, time.perf_counter() - start
+
+
+def run_steps(steps, context, max_workers=DEFAULT_MAX_WORKERS,
+              retry_backoff=DEFAULT_RETRY_BACKOFF, log=print):
+  '''
+  Runs steps, each one as soon as the steps it requires have finished, up to
+  max_workers at once. Adds each step's outputs to context. Returns a dict
+  from step name to its status and seconds. When a step fails for good, the
+  steps already running finish, no new ones start, and its error is raised.
+  '''
+  pending = {step.name: step for step in steps}
+  for step in steps:
+    missing = [name for name in step.requires if name not in pending]
+    if missing:
+      raise ValueError(f'Step {step.name} requires unknown steps {missing}')
+  results = {}
+  parent = tracing.tracer.current()
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    running = {}
+    while pending or running:
+      for name, step in list(pending.items()):
+        if all(required in results for required in step.requires):
+          del pending[name]
+          # Each step sees the context as it was when it started.
+          running[executor.submit(_run_step, step, dict(context), retry_backoff, parent, log)] = step
+      if not running:
+        raise ValueError(f'Steps {sorted(pending)} require each other')
+      done, _ = wait(running, return_when=FIRST_COMPLETED)
+      for future in done:
+        step = running.pop(future)
+        try:
+          outputs, status, elapsed = future.result()
+        except Exception as e:
+          pending.clear()
+          raise Exception(f'Step {step.name} failed: {e}') from e
+        context.update(outputs)
+        results[step.name] = {"status": status, "seconds": round(elapsed, 2)}
+        if log:
+          log(f'{step.name}: {status} in {elapsed:.1f}s {outputs}')
+  return results
+
+
+# IAM ##################################################################
+
+def ensure_role(iam, account_id, role_name, policy_name, policy, trust_relationship):
+  '''
+  Finds or creates the IAM policy and role, and attaches the policy to the
+  role. Returns the role's ARN, and the status.
+  '''
+  status = EXISTS
+  policy_arn = f'arn:aws:iam::{account_id}:policy/{policy_name}'
+  try:
+    iam.get_policy(PolicyArn=policy_arn)
+  except iam.exceptions.NoSuchEntityException:
+    try:
+      policy_arn = iam.create_policy(PolicyName=policy_name,
+                                     PolicyDocument=json.dumps(policy))['Policy']['Arn']
+      status = CREATED
+    except iam.exceptions.EntityAlreadyExistsException:
+      # Another run created it in the meantime.
+      pass
+  try:
+    role_arn = iam.get_role(RoleName=role_name)['Role']['Arn']
+  except iam.exceptions.NoSuchEntityException:
+    try:
+      role_arn = iam.create_role(RoleName=role_name,
+                                 AssumeRolePolicyDocument=json.dumps(trust_relationship))['Role']['Arn']
+      status = CREATED
+    except iam.exceptions.EntityAlreadyExistsException:
+      role_arn = iam.get_role(RoleName=role_name)['Role']['Arn']
+  iam.attach_role_policy(RoleName=role_name, PolicyArn=policy_arn)
+  return role_arn, status
+
+
+def ensure_invoke_role(context):
+  '''
+  The role that OpenSearch Service assumes to invoke the SageMaker endpoint,
+  as in create_invoke_role.py.
+  '''
+  policy = {
+    "Version": "2012-10-17",
+    "Statement": [{"Effect": "Allow",
+                   "Action": ["sagemaker:InvokeEndpoint"],
+                   "Resource": [context['SAGEMAKER_MODEL_INFERENCE_ARN']]}]
+  }
+  trust_relationship = {
+    "Version": "2012-10-17",
+    "Statement": [{"Effect": "Allow",
+                   "Principal": {"Service": "es.amazonaws.com"},
+                   "Action": "sts:AssumeRole"}]
+  }
+  role_arn, status = ensure_role(boto3.client('iam'), context['AWS_ACCOUNT_ID'],
+                                 INVOKE_ROLE_NAME, INVOKE_POLICY_NAME, policy, trust_relationship)
+  return {"INVOKE_DEEPSEEK_ROLE": role_arn}, status
+
+
+def ensure_connector_role(context):
+  '''
+  The role that you assume to create the connector, as in
+  create_connector_role.py. Its policy names the invoke role by its ARN,
+  which follows from the role's name, so this step doesn't wait for
+  ensure_invoke_role.
+  '''
+  invoke_role_arn = f'arn:aws:iam::{context["AWS_ACCOUNT_ID"]}:role/{INVOKE_ROLE_NAME}'
+  policy = {
+    "Version": "2012-10-17",
+    "Statement": [{"Effect": "Allow",
+                   "Action": "iam:PassRole",
+                   "Resource": invoke_role_arn},
+                  {"Effect": "Allow",
+                   "Action": "es:ESHttpPost",
+                   "Resource": context['OPENSEARCH_SERVICE_DOMAIN_ARN']}]
+  }
+  trust_relationship = {
+    "Version": "2012-10-17",
+    "Statement": [{"Effect": "Allow",
+                   "Principal": {"AWS": boto3.resource('iam').CurrentUser().arn},
+                   "Action": "sts:AssumeRole"}]
+  }
+  role_arn, status = ensure_role(boto3.client('iam'), context['AWS_ACCOUNT_ID'],
+                                 CONNECTOR_ROLE_NAME, CONNECTOR_POLICY_NAME, policy, trust_relationship)
+  return {"CREATE_DEEPSEEK_CONNECTOR_ROLE": role_arn}, status
+
+
+# OpenSearch ###########################################################
+
+def admin_client(context):
+  return opensearch_client.create_client(context['OPENSEARCH_SERVICE_DOMAIN_ENDPOINT'],
+                                         (context['OPENSEARCH_SERVICE_ADMIN_USER'],
+                                          context['OPENSEARCH_SERVICE_ADMIN_PASSWORD']))
+
+
+def ensure_role_mapping(context):
+  '''
+  Maps the connector role, and the embedding integration's Lambda role, onto
+  ml_full_access, as in setup_opensearch_security.py. Keeps the users,
+  hosts, and backend roles that the mapping already has.
+  '''
+  lambda_role_arn = f'arn:aws:iam::{context["AWS_ACCOUNT_ID"]}:role/{LAMBDA_INVOKE_ML_COMMONS_ROLE_NAME}'
+  required = [context['CREATE_DEEPSEEK_CONNECTOR_ROLE'], lambda_role_arn]
+  client = admin_client(context)
+  try:
+    mapping = client.security.get_role_mapping(ML_ROLE)[ML_ROLE]
+    status = UPDATED
+  except NotFoundError:
+    mapping = {}
+    status = CREATED
+  backend_roles = list(mapping.get('backend_roles', []))
+  missing = [role for role in required if role not in backend_roles]
+  if not missing:
+    return {}, EXISTS
+  body = {key: mapping[key] for key in ('users', 'hosts') if mapping.get(key)}
+  body["backend_roles"] = backend_roles + missing
+  client.security.create_role_mapping(ML_ROLE, body=body)
+  return {}, status
+
+
+def connector_payload(context, batch=False):
+  '''
+  The connector to the SageMaker endpoint, as in create_connector.py.
+  '''
+  url = context['SAGEMAKER_MODEL_INFERENCE_ENDPOINT']
+  payload = {
+    "name": CONNECTOR_NAME,
+    "description": "Connector for my Sagemaker DeepSeek model",
+    "version": "1.0",
+    "protocol": "aws_sigv4",
+    "credential": {"roleArn": context['INVOKE_DEEPSEEK_ROLE']},
+    "parameters": {"service_name": "sagemaker",
+                   "region": context['DEEPSEEK_AWS_REGION'],
+                   "do_sample": True,
+                   "top_p": 0.9,
+                   "temperature": 0.7,
+                   "max_new_tokens": 512},
+    "actions": [deepseek_connector.connector_action(url)]
+  }
+  if batch:
+    payload["name"] = BATCH_CONNECTOR_NAME
+    payload["description"] = "Connector for my Sagemaker DeepSeek model, with batches of prompts"
+    payload["actions"] = [generation_batch.connector_action(url)]
+  return payload
+
+
+def find_connector(client, name, url):
+  '''
+  Returns the id of the connector called name whose PREDICT action calls
+  url, or None.
+  '''
+  resp = client.transport.perform_request('POST', '/_plugins/_ml/connectors/_search',
+                                          body={"query": {"term": {"name.keyword": name}},
+                                                "size": 100})
+  for hit in resp['hits']['hits']:
+    if any(action.get('url') == url for action in hit['_source'].get('actions', [])):
+      return hit['_id']
+  return None
+
+
+def connector_step(batch=False):
+  '''
+  Returns the run function of the step that finds or creates the connector
+  (or, with batch, the batch connector).
+  '''
+  output = 'DEEPSEEK_BATCH_CONNECTOR_ID' if batch else 'DEEPSEEK_CONNECTOR_ID'
+
+  def ensure_connector(context):
+    payload = connector_payload(context, batch)
+    connector_id = find_connector(admin_client(context), payload["name"],
+                                  context['SAGEMAKER_MODEL_INFERENCE_ENDPOINT'])
+    if connector_id:
+      return {output: connector_id}, EXISTS
+    # Creating the connector passes the invoke role, so the request is signed
+    # with the connector role's credentials. The step signs one request, so
+    # the credentials don't need a background refresh, which would leave a
+    # timer running for each attempt. With AWS_CREDENTIALS_CACHE, attempts
+    # after the first reuse the cached credentials.
+    credentials = aws_credentials.AssumedRoleCredentials(context['CREATE_DEEPSEEK_CONNECTOR_ROLE'],
+                                                         'create_connector_session',
+                                                         cache_path=context.get('AWS_CREDENTIALS_CACHE'),
+                                                         background_refresh=False)
+    awsauth = aws_credentials.SigV4Auth(credentials, context['DEEPSEEK_AWS_REGION'], 'es')
+    url = opensearch_client.endpoint_url(context['OPENSEARCH_SERVICE_DOMAIN_ENDPOINT'])
+    with opensearch_client.create_session(auth=awsauth) as session:
+      r = session.post(url + '/_plugins/_ml/connectors/_create', json=payload,
+                       headers={"Content-Type": "application/json"})
+    if not r.ok:
+      raise Exception(f'Creating connector {payload["name"]} failed with {r.status_code}: {r.text}')
+    return {output: r.json()['connector_id']}, CREATED
+  return ensure_connector
+
+
+def find_model(client, connector_id):
+  '''
+  Returns the id and state of a model on connector_id, preferring a deployed
+  one, or (None, None).
+  '''
+  resp = client.transport.perform_request('POST', '/_plugins/_ml/models/_search',
+                                          body={"query": {"term": {"connector_id": connector_id}},
+                                                "size": 100})
+  models = [(hit['_id'], hit['_source'].get('model_state')) for hit in resp['hits']['hits']]
+  for model_id, state in models:
+    if state == 'DEPLOYED':
+      return model_id, state
+  return models[0] if models else (None, None)
+
+
+def wait_for_deployment(client, model_id, timeout_s=DEFAULT_DEPLOY_TIMEOUT_S,
+                        backoff=DEFAULT_DEPLOY_BACKOFF, log=print):
+  '''
+  Polls the model's state, waiting longer after each poll, until it's
+  DEPLOYED. Raises when the deploy fails, or takes more than timeout_s.
+  '''
+  deadline = time.monotonic() + timeout_s
+  attempt = 0
+  while True:
+    state = client.transport.perform_request('GET', f'/_plugins/_ml/models/{model_id}').get('model_state')
+    if state == 'DEPLOYED':
+      return
+    if state == DEPLOY_FAILED_STATE:
+      raise Exception(f'Model {model_id} is {state}')
+    if time.monotonic() > deadline:
+      raise Exception(f'Model {model_id} is {state} after {timeout_s}s')
+    if log:
+      log(f'Model {model_id} is {state}')
+    time.sleep(opensearch_client.backoff_delay(attempt, backoff))
+    attempt += 1
+
+
+def model_step(batch=False, deploy_timeout_s=DEFAULT_DEPLOY_TIMEOUT_S):
+  '''
+  Returns the run function of the step that finds or registers the model on
+  the connector (or, with batch, the batch connector), deploys it if it
+  isn't deployed, and waits for it.
+  '''
+  connector_output = 'DEEPSEEK_BATCH_CONNECTOR_ID' if batch else 'DEEPSEEK_CONNECTOR_ID'
+  output = 'RAG_BATCH_MODEL_ID' if batch else 'DEEPSEEK_MODEL_ID'
+
+  def ensure_model(context):
+    client = admin_client(context)
+    connector_id = context[connector_output]
+    model_id, state = find_model(client, connector_id)
+    if state == 'DEPLOYED':
+      return {output: model_id}, EXISTS
+    status = UPDATED
+    if model_id is None:
+      resp = client.transport.perform_request('POST', '/_plugins/_ml/models/_register',
+                                              body={"name": BATCH_MODEL_NAME if batch else MODEL_NAME,
+                                                    "function_name": "remote",
+                                                    "description": "DeepSeek R1 model on Sagemaker",
+                                                    "connector_id": connector_id})
+      model_id = resp['model_id']
+      status = CREATED
+    if state != 'DEPLOYING':
+      client.transport.perform_request('POST', f'/_plugins/_ml/models/{model_id}/_deploy')
+    wait_for_deployment(client, model_id, timeout_s=deploy_timeout_s)
+    return {output: model_id}, status
+  return ensure_model
+
+
+def setup_steps(batch_connector=False, deploy_timeout_s=DEFAULT_DEPLOY_TIMEOUT_S):
+  '''
+  The graph of the setup steps.
+  '''
+  connector_requires = ('invoke_role', 'connector_role', 'role_mapping')
+  steps = [
+    Step('invoke_role', ensure_invoke_role),
+    Step('connector_role', ensure_connector_role),
+    Step('role_mapping', ensure_role_mapping, requires=('connector_role',)),
+    Step('connector', connector_step(), requires=connector_requires, attempts=6),
+    Step('model', model_step(deploy_timeout_s=deploy_timeout_s), requires=('connector',)),
+  ]
+  if batch_connector:
+    steps += [
+      Step('batch_connector', connector_step(batch=True), requires=connector_requires, attempts=6),
+      Step('batch_model', model_step(batch=True, deploy_timeout_s=deploy_timeout_s),
+           requires=('batch_connector',)),
+    ]
+  return steps
+
+
+def export_lines(context, names):
+  return [f'export {name}="{context[name]}"' for name in names if context.get(name)]
+
+
+if __name__ == '__main__':
+  context = {name: os.environ[name] for name in ('DEEPSEEK_AWS_REGION',
+                                                 'SAGEMAKER_MODEL_INFERENCE_ARN',
+                                                 'SAGEMAKER_MODEL_INFERENCE_ENDPOINT',
+                                                 'OPENSEARCH_SERVICE_DOMAIN_ARN',
+                                                 'OPENSEARCH_SERVICE_DOMAIN_ENDPOINT',
+                                                 'OPENSEARCH_SERVICE_ADMIN_USER',
+                                                 'OPENSEARCH_SERVICE_ADMIN_PASSWORD')}
+  context['AWS_CREDENTIALS_CACHE'] = os.environ.get('AWS_CREDENTIALS_CACHE')
+  context['AWS_ACCOUNT_ID'] = boto3.client('sts').get_caller_identity()['Account']
+  batch_connector = os.environ.get('PROVISION_BATCH_CONNECTOR', 'false').lower() in ('1', 'true', 'yes')
+  deploy_timeout_s = float(os.environ.get('PROVISION_DEPLOY_TIMEOUT', DEFAULT_DEPLOY_TIMEOUT_S))
+  env_file = os.environ.get('PROVISION_ENV_FILE')
+
+  start = time.perf_counter()
+  results = run_steps(setup_steps(batch_connector, deploy_timeout_s), context)
+  print(f'\nProvisioned in {time.perf_counter() - start:.1f}s:')
+  for name, result in results.items():
+    print(f'  {name}: {result["status"]} ({result["seconds"]}s)')
+
+  lines = export_lines(context, ['INVOKE_DEEPSEEK_ROLE', 'CREATE_DEEPSEEK_CONNECTOR_ROLE',
+                                 'DEEPSEEK_CONNECTOR_ID', 'DEEPSEEK_MODEL_ID',
+                                 'DEEPSEEK_BATCH_CONNECTOR_ID', 'RAG_BATCH_MODEL_ID'])
+  if env_file:
+    with open(env_file, 'w', encoding='utf-8') as f:
+      f.write('\n'.join(lines) + '\n')
+    print(f'\nWrote {env_file}. Please execute the following command\nsource {env_file}\n')
+  else:
+    print('\nPlease execute the following commands')
+    print('\n'.join(lines) + '\n')
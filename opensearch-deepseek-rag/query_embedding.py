@@ -0,0 +1,107 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Embeds questions on the client side, so that retrieval sends a plain knn
+query with the vector, rather than a neural query. For a neural query,
+OpenSearch calls the embedding model before every kNN search, one question
+at a time, so every query pays a model round trip on the search path.
+
+QueryEmbedder embeds the questions of concurrent callers together: it
+gathers them for up to max_wait_ms, or until it has max_batch_size, and
+embeds them in one call (with generation_batch.GenerationBatcher, which
+batches any coroutine function over a list). With a cache (see
+embedding_cache.py), a question that was asked before doesn't go to the
+model at all.
+
+With the same model, the vector is the one the neural query would compute,
+so the knn query finds the same passages, with the same scores, and the
+answer is the same. The embedder must be the model that embedded the index:
+the model behind EMBEDDING_MODEL_ID, through ML Commons' _predict API, or, for
+an index loaded with CLIENT_EMBEDDER=hashing, the local HashingEmbedder.
+
+async_rag.py uses this when you set RAG_QUERY_EMBEDDING to client.
+'''
+
+import embedders
+import generation_batch
+
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5
+
+
+def model_embedder(client, model_id):
+  '''
+  Returns a coroutine function that embeds a list of texts with one _predict
+  call to model_id, through the async client.
+  '''
+  async def embed_batch(texts):
+    resp = await client.transport.perform_request('POST', embedders.predict_path(model_id),
+                                                  body=embedders.predict_request(texts))
+    return embedders.vectors_from_prediction(resp, len(texts))
+  return embed_batch
+
+
+def local_embedder(embedder):
+  '''
+  Returns a coroutine function that embeds a list of texts with an embedder
+  from embedders.py, in this process.
+  '''
+  async def embed_batch(texts):
+    return [vector.tolist() for vector in embedder.embed(texts)]
+  return embed_batch
+
+
+def create_query_embedder(name, client, model_id, cache=None,
+                          max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                          max_wait_ms=DEFAULT_MAX_WAIT_MS):
+  '''
+  Builds a QueryEmbedder from the name of the embedder, as for
+  embedders.create_embedder: "model" for the model behind model_id, or
+  "hashing" for HashingEmbedder.
+  '''
+  if name == 'hashing':
+    embedder = embedders.HashingEmbedder()
+    return QueryEmbedder(local_embedder(embedder), embedder.model_id, cache,
+                         max_batch_size, max_wait_ms)
+  if name == 'model':
+    return QueryEmbedder(model_embedder(client, model_id), model_id, cache,
+                         max_batch_size, max_wait_ms)
+  raise ValueError(f'Unknown embedder {name}. Use "model" or "hashing".')
+
+
+class QueryEmbedder:
+  '''
+  Embeds questions through embed_batch, a coroutine function that takes a
+  list of texts and returns their vectors in the same order. Concurrent
+  questions share a call. With cache, an EmbeddingCache, questions are
+  looked up first, and the new vectors are added to it, under model_id.
+  '''
+
+  def __init__(self, embed_batch, model_id, cache=None,
+               max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+    self.model_id = model_id
+    self.cache = cache
+    self._batcher = generation_batch.GenerationBatcher(embed_batch, max_batch_size=max_batch_size,
+                                                       max_wait_ms=max_wait_ms)
+
+  async def embed(self, question):
+    '''
+    Returns the vector for question, as a list.
+    '''
+    if self.cache is not None:
+      vector = self.cache.get(self.model_id, question)
+      if vector is not None:
+        return vector.tolist()
+    vector = await self._batcher.generate(question)
+    if self.cache is not None:
+      self.cache.put(self.model_id, question, vector)
+    return vector
+
+  def stats(self):
+    stats = {"calls": self._batcher.batches,
+             "questions": self._batcher.prompts,
+             "mean_batch_size": self._batcher.stats()["mean_batch_size"]}
+    if self.cache is not None:
+      stats["cache"] = self.cache.stats()
+    return stats
@@ -0,0 +1,236 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Builds the search pipeline and the queries for retrieval augmented generation,
+so that run_rag.py and async_rag.py send exactly the same requests.
+'''
+
+
+import chunking
+
+
+SEARCH_PIPELINE_ID = 'deepseek_rag_pipeline'
+# Hybrid retrieval needs a normalization processor in the search pipeline. The
+# first pipeline only normalizes and combines the scores, for retrieval on its
+# own. The second also generates the answer.
+HYBRID_PIPELINE_ID = 'deepseek_hybrid_pipeline'
+HYBRID_RAG_PIPELINE_ID = 'deepseek_hybrid_rag_pipeline'
+# The weights of the match and the vector query in the combined score.
+DEFAULT_HYBRID_WEIGHTS = (0.3, 0.7)
+# The fields each hit returns. The chunk fields are missing from documents
+# that load_data.py didn't split into passages.
+SOURCE_FIELDS = ["text", chunking.PARENT_ID_FIELD, chunking.CHUNK_INDEX_FIELD]
+# The prompt that the retrieval_augmented_generation processor sends, ahead
+# of the search results and the question.
+SYSTEM_PROMPT = "You are a helpful assistant."
+USER_INSTRUCTIONS = "Generate a concise and informative answer in less than 100 words for the given question"
+
+
+def normalization_processor(weights=DEFAULT_HYBRID_WEIGHTS):
+  '''
+  The match query's BM25 scores and the vector query's similarity scores are
+  on different scales. The normalization processor rescales each to [0, 1]
+  with min_max, and then combines them as a weighted arithmetic mean.
+  '''
+  return {
+    "normalization-processor": {
+      "normalization": {"technique": "min_max"},
+      "combination": {
+        "technique": "arithmetic_mean",
+        "parameters": {"weights": [float(w) for w in weights]}
+      }
+    }
+  }
+
+
+def hybrid_pipeline_definition(weights=DEFAULT_HYBRID_WEIGHTS):
+  return {"phase_results_processors": [normalization_processor(weights)]}
+
+
+def search_pipeline_definition(generation_model_id, hybrid_weights=None):
+  '''
+  The search pipeline uses a retrieval_augmented_generation processor to
+  send the question and search results for a generated response. With
+  hybrid_weights, the pipeline first combines the scores of a hybrid query
+  with a normalization processor, so the answer is generated from the
+  combined ranking.
+  '''
+  pipeline = {
+    "response_processors": [
+      {
+        "retrieval_augmented_generation": {
+          "tag": "Demo pipeline",
+          "description": "Demo pipeline Using DeepSeek R1",
+          "model_id": generation_model_id,
+          "context_field_list": [
+            "text"
+          ],
+          "system_prompt": SYSTEM_PROMPT,
+          "user_instructions": USER_INSTRUCTIONS
+        }
+      }
+    ]
+  }
+  if hybrid_weights is not None:
+    pipeline["phase_results_processors"] = [normalization_processor(hybrid_weights)]
+  return pipeline
+
+
+def neural_clause(question, embedding_model_id, k=5, filter=None):
+  '''
+  The neural query uses the embedding model to generate an embedding for the
+  question and performs a kNN query to get nearest-neighbor matches. With
+  filter (see metadata_filters.py), the k matches come from the documents
+  that match it.
+  '''
+  params = {
+    "query_text": question,
+    "model_id": embedding_model_id,
+    "k": k
+  }
+  if filter is not None:
+    params["filter"] = filter
+  return {"neural": {"text_embedding": params}}
+
+
+def knn_clause(vector, k=5, filter=None):
+  '''
+  A kNN query with a vector that you computed already. OpenSearch doesn't call
+  the embedding model for this query. filter works as for neural_clause.
+  '''
+  params = {
+    "vector": [float(x) for x in vector],
+    "k": k
+  }
+  if filter is not None:
+    params["filter"] = filter
+  return {"knn": {"text_embedding": params}}
+
+
+def hybrid_clause(question, vector_clause, filter=None):
+  '''
+  A hybrid query runs a match query on the text field, which finds exact
+  terms like city names and years, alongside a neural or knn clause, which
+  finds passages with the same meaning. Send it through a pipeline with a
+  normalization processor. Pass the vector clause's filter as filter, so
+  that the match query keeps to the same documents.
+  '''
+  match = {"match": {"text": {"query": question}}}
+  if filter is not None:
+    match = {"bool": {"must": match, "filter": filter}}
+  return {
+    "hybrid": {
+      "queries": [
+        match,
+        vector_clause
+      ]
+    }
+  }
+
+
+def build_rag_query(question, retrieval_clause, size=2, context_size=5, llm_timeout=15):
+  '''
+  Wraps a retrieval clause with the generative_qa_parameters that the
+  retrieval_augmented_generation processor reads. Note the default size of 2,
+  with k=5 in the retrieval clause. These are very tight constraints that work
+  for this example. In actual use, you would set both k and size higher.
+  '''
+  return {
+    "query": retrieval_clause,
+    "size": size,
+    "_source": SOURCE_FIELDS,
+    # In this case, you use the "bedrock/claude" parameterization of the connector
+    # template. The connector itself sends the request to the SageMaker endpoint,
+    # hosting DeepSeek in the example. Stay tuned for a DeepSeek connector blueprint
+    # in the blueprints repository.
+    "ext": {
+      "generative_qa_parameters": {
+        "llm_model": "bedrock/claude",
+        "llm_question": question,
+        "context_size": context_size,
+        "timeout": llm_timeout
+      }
+    }
+  }
+
+
+def build_prompt(question, contexts):
+  '''
+  Builds the prompt the way the retrieval_augmented_generation processor does
+  for the bedrock/claude parameterization, so that a streamed answer sees the
+  same prompt as the search pipeline.
+  '''
+  return f'{SYSTEM_PROMPT}\n{USER_INSTRUCTIONS}\n' + \
+         ''.join(f'SEARCH RESULT {i + 1}: {text}\n' for i, text in enumerate(contexts)) + \
+         f'QUESTION: {question}\n'
+
+
+def hit_texts(resp, context_size=5):
+  '''
+  Returns the text of the first context_size hits, the context that the
+  retrieval_augmented_generation processor puts in the prompt.
+  '''
+  return [hit.get('_source', {}).get('text', '')
+          for hit in resp.get('hits', {}).get('hits', [])[:context_size]]
+
+
+def predict_path(generation_model_id):
+  return f'/_plugins/_ml/models/{generation_model_id}/_predict'
+
+
+def predict_request(prompt):
+  '''
+  The ML Commons _predict body that sends prompt through the generation
+  model's connector, as the search pipeline does.
+  '''
+  return {"parameters": {"inputs": prompt}}
+
+
+def answer_from_prediction(resp):
+  '''
+  Returns the completion from a _predict response, in the form the connector's
+  post_process_function produces.
+  '''
+  return resp['inference_results'][0]['output'][0]['dataAsMap']['completion']
+
+
+def batch_predict_request(prompts):
+  '''
+  The _predict body for a model on the batch connector (see
+  generation_batch.py). inputs is a list, which the connector sends to the
+  SageMaker endpoint as a JSON list.
+  '''
+  return {"parameters": {"inputs": list(prompts)}}
+
+
+def answers_from_batch_prediction(resp):
+  '''
+  Returns the completions from a batch _predict response, in the order of the
+  prompts.
+  '''
+  return resp['inference_results'][0]['output'][0]['dataAsMap']['completions']
+
+
+def answer_from_response(resp):
+  '''
+  Returns the generated answer from a search response, or None when the
+  response has no answer.
+  '''
+  return resp.get('ext', {}).get('retrieval_augmented_generation', {}).get('answer')
+
+
+def hit_ids(resp):
+  return [hit['_id'] for hit in resp.get('hits', {}).get('hits', [])]
+
+
+def hit_parent_ids(resp):
+  '''
+  Returns the ids of the documents the hits came from, in rank order, without
+  duplicates. A hit that isn't a passage is its own parent.
+  '''
+  parents = []
+  for hit in resp.get('hits', {}).get('hits', []):
+    parent = hit.get('_source', {}).get(chunking.PARENT_ID_FIELD, hit['_id'])
+    if parent not in parents:
+      parents.append(parent)
+  return parents
@@ -5,100 +5,329 @@ Uses an OpenSearch search processor to perform retrieval augmented generation. F
 define the processor, and send to OpenSearch with the opensearch-py client. Then send 
 a query through the pipeline, encapsulating a user question and engaging an langauge
 generation model to respond.
+
+Set EMBEDDING_CACHE_DIR to embed the question through the on-disk embedding
+cache (see embedding_cache.py). The script then sends a knn query with the
+cached vector instead of a neural query, so a repeated question never calls
+the embedding model.
+
+Set RAG_QUERY_EMBEDDING to client to embed the question in this script, and
+send a knn query with the vector, so that OpenSearch doesn't call the
+embedding model on the search path (see query_embedding.py). CLIENT_EMBEDDER
+must be the model that embedded the index, as in load_data.py.
+
+Set RAG_RETRIEVAL to hybrid to retrieve with a match query on the text
+alongside the neural query, combined by a normalization processor in the
+search pipeline. This finds exact terms, like city names and years, that the
+embedding alone can miss.
+
+Set RAG_METADATA_FILTER to true to filter the kNN query to the metro areas
+and the years that the question names, with the fields that load_data.py
+extracted (see metadata_filters.py). The search then only considers the
+documents of those metro areas.
+
+Set RAG_FACTS_ROUTER to true to answer numeric questions, like the sample
+question, from the facts index that load_data.py builds, without retrieval
+or the LLM (see facts.py). The script prints the path the question took.
+Other questions go through the search pipeline, as before.
+
+Set ANSWER_CACHE_PATH to put a semantic answer cache (see answer_cache.py) in
+front of the search pipeline. The script first retrieves the context documents
+with a plain kNN query. If a near-duplicate of the question was answered
+before with the same documents, it prints the cached answer without calling
+DeepSeek.
+
+Set RAG_STREAM to true to print the retrieved passages as soon as the search
+returns, and then stream DeepSeek's answer token by token, instead of waiting
+for the search pipeline to return the whole answer (see generation_stream.py).
+The script reports the time to the first token separately from the total.
+
+Set RAG_CONTEXT_TOKENS to fit the retrieved passages into that many tokens
+before they go into the prompt (see context_budget.py). The script then
+builds the prompt itself, and sends it to DeepSeek through the model's
+_predict API (or streams it, with RAG_STREAM), and reports the tokens saved.
+
+Set RAG_GENERATION_MODEL_IDS to the models on a pool of SageMaker endpoints
+(see create_deepseek_model.py), separated by commas, to build the prompt
+here, and generate the answer through the endpoint that is expected to
+answer first (see generation_pool.py). Each request waits at most
+RAG_ENDPOINT_TIMEOUT seconds, rather than 300, and with RAG_HEDGE_MS, a
+request that takes longer is sent to a second endpoint too. The script prints
+the endpoint that answered.
+
+Set TRACE_FILE to write the time spent in each stage, as JSON-line spans (see
+tracing.py): embedding the question, the kNN search on the shards (from the
+search profile API), and the DeepSeek call. The script prints the stage
+times, too.
 '''
 
-from opensearchpy import OpenSearch
+import answer_cache
+import asyncio
+import context_budget
+import embedders
+import embedding_cache
+import facts
+import generation_pool
+import generation_stream
+import metadata_filters
+import opensearch_client
 import os
+import rag_query
+import time
+import tracing
 
 
-opensearch_port = 443
 opensearch_service_api_endpoint = os.environ['OPENSEARCH_SERVICE_DOMAIN_ENDPOINT']
 opensearch_user_name = os.environ['OPENSEARCH_SERVICE_ADMIN_USER']
 opensearch_user_password = os.environ['OPENSEARCH_SERVICE_ADMIN_PASSWORD']
 embedding_model_id = os.environ['EMBEDDING_MODEL_ID']
 generation_model_id = os.environ['DEEPSEEK_MODEL_ID']
 # Note: if you changed the index name in load_data.py, be sure to change it here.
+# After a rebuild (REBUILD_INDEX in load_data.py), this is an alias for the
+# current version of the index, so it stays the same.
 index_name = "population_data"
+embedding_cache_dir = os.environ.get('EMBEDDING_CACHE_DIR')
+# neural, or client. CLIENT_EMBEDDER is "model" (EMBEDDING_MODEL_ID, through
+# the _predict API) or "hashing", for an index loaded with the hashing embedder.
+query_embedding_mode = os.environ.get('RAG_QUERY_EMBEDDING', 'neural')
+client_embedder = os.environ.get('CLIENT_EMBEDDER', 'model')
+answer_cache_path = os.environ.get('ANSWER_CACHE_PATH')
+answer_cache_threshold = float(os.environ.get('ANSWER_CACHE_SIMILARITY', answer_cache.DEFAULT_SIMILARITY_THRESHOLD))
+answer_cache_ttl = float(os.environ.get('ANSWER_CACHE_TTL_SECONDS', answer_cache.DEFAULT_TTL_SECONDS))
+# neural, or hybrid. RAG_HYBRID_WEIGHTS are the weights of the match and the
+# neural query in the combined score.
+retrieval_mode = os.environ.get('RAG_RETRIEVAL', 'neural')
+hybrid_weights = [float(w) for w in os.environ.get('RAG_HYBRID_WEIGHTS', ','.join(map(str, rag_query.DEFAULT_HYBRID_WEIGHTS))).split(',')]
+# Set RAG_METADATA_FILTER to true to filter the retrieval to the metro areas
+# and years in the question.
+metadata_filter = os.environ.get('RAG_METADATA_FILTER', 'false').lower() in ('1', 'true', 'yes')
+# Set RAG_FACTS_ROUTER to true to answer numeric questions from FACTS_INDEX.
+facts_router = os.environ.get('RAG_FACTS_ROUTER', 'false').lower() in ('1', 'true', 'yes')
+facts_index = os.environ.get('FACTS_INDEX', facts.DEFAULT_INDEX)
+# Set RAG_STREAM to true to stream the answer. The tokens come from the
+# SageMaker endpoint in SAGEMAKER_MODEL_INFERENCE_ENDPOINT, or from
+# RAG_STREAM_URL, a URL that speaks TGI's streaming protocol (like the mock's).
+stream_answers = os.environ.get('RAG_STREAM', 'false').lower() in ('1', 'true', 'yes')
+stream_url = os.environ.get('RAG_STREAM_URL')
+# Set RAG_CONTEXT_TOKENS to the token budget for the passages in the prompt.
+# 0, the default, sends whole passages through the search pipeline.
+context_tokens = int(os.environ.get('RAG_CONTEXT_TOKENS', 0))
+# Set RAG_GENERATION_MODEL_IDS to generate through a pool of endpoints. A
+# single question has no latencies to go by yet, so it hedges after
+# RAG_HEDGE_MS, or not at all, without it.
+generation_model_ids = [model_id for model_id in os.environ.get('RAG_GENERATION_MODEL_IDS', '').split(',') if model_id]
+hedge_ms = float(os.environ.get('RAG_HEDGE_MS', 0))
+endpoint_timeout = int(os.environ.get('RAG_ENDPOINT_TIMEOUT', generation_pool.DEFAULT_REQUEST_TIMEOUT))
+question = "What's the population increase of New York City from 2021 to 2023? How is the trending comparing with Miami?"
 
 
-# Ensure the endpoint matches the contract for the opensearch-py client. Endpoints
-# are specified without the leading URL scheme or trailing slashes.
-if opensearch_service_api_endpoint.startswith('https://'):
-  opensearch_service_api_endpoint = opensearch_service_api_endpoint[len('https://'):]
-if opensearch_service_api_endpoint.endswith('/'):
-  opensearch_service_api_endpoint = opensearch_service_api_endpoint[:-1]
+# Prepare the client with username/password authetication
+client = opensearch_client.create_client(opensearch_service_api_endpoint,
+                                         (opensearch_user_name, opensearch_user_password))
+# The root span for this question. Every stage below is a child of it.
+request_span = tracing.tracer.start_span('rag.request', question=question, retrieval=retrieval_mode)
 
 
-# Prepare the client with username/password authetication
-hosts = [{"host": opensearch_service_api_endpoint, "port": opensearch_port}]
-client = OpenSearch(
-    hosts=hosts,
-    http_auth=(opensearch_user_name, opensearch_user_password),
-    use_ssl=True,
-    verify_certs=False,
-    ssl_assert_hostname=False,
-    ssl_show_warn=False,
-)
+async def generate_with_pool(prompt):
+  '''
+  Generates the answer to prompt through a pool of the models in
+  RAG_GENERATION_MODEL_IDS, with an async client of its own. Returns the
+  answer, and the pool's stats.
+  '''
+  async_client = opensearch_client.create_async_client(opensearch_service_api_endpoint,
+                                                       (opensearch_user_name, opensearch_user_password),
+                                                       pool_size=2)
+  try:
+    pool = generation_pool.GenerationPool(
+      generation_pool.model_generators(async_client, generation_model_ids, endpoint_timeout),
+      hedge_after_ms=hedge_ms)
+    return await pool.generate(prompt), pool.stats()
+  finally:
+    await async_client.close()
 
 
 # The search pipeline uses a retrieval_augmented_generation processor to
-# send the question and search results for a generated response.
-search_pipeline_definition = {
-  "response_processors": [
-    {
-      "retrieval_augmented_generation": {
-        "tag": "Demo pipeline",
-        "description": "Demo pipeline Using DeepSeek R1",
-        "model_id": generation_model_id,
-        "context_field_list": [
-          "text"
-        ],
-        "system_prompt": "You are a helpful assistant.",
-        "user_instructions": "Generate a concise and informative answer in less than 100 words for the given question"
-      }
-    }
-  ]
-}
-
-
-# The neural query uses the embedding model to generate an embedding for the query_text
+# send the question and search results for a generated response. See
+# rag_query.py for the pipeline definition and the query. For hybrid retrieval,
+# the pipeline normalizes and combines the scores first.
+search_pipeline_id = rag_query.SEARCH_PIPELINE_ID
+search_pipeline_definition = rag_query.search_pipeline_definition(generation_model_id)
+if retrieval_mode == 'hybrid':
+  search_pipeline_id = rag_query.HYBRID_RAG_PIPELINE_ID
+  search_pipeline_definition = rag_query.search_pipeline_definition(generation_model_id,
+                                                                    hybrid_weights=hybrid_weights)
+
+
+# With RAG_FACTS_ROUTER, try the facts index first. A numeric question is
+# answered from it with one small search, and skips the embedding, the
+# retrieval, and the LLM below.
+fact_answer = None
+if facts_router:
+  router = facts.FactRouter(metadata_filters.known_metros(client, facts_index), index_name=facts_index)
+  start = time.perf_counter()
+  with tracing.tracer.start_span('facts.route', index=facts_index) as route_span:
+    fact_answer = router.route(client, question)
+    route_span.set(route=facts.ROUTE_LLM if fact_answer is None else facts.ROUTE_FACTS)
+  print(f'Route: {facts.ROUTE_LLM if fact_answer is None else facts.ROUTE_FACTS} '
+        f'({(time.perf_counter() - start) * 1000:.1f} ms)')
+use_llm = fact_answer is None
+
+
+# With RAG_METADATA_FILTER, find the metro areas and the years in the question.
+# The sample question names New York City and Miami, and 2021 to 2023, so the
+# kNN search only considers those two metro areas' documents.
+retrieval_filter = None
+if use_llm and metadata_filter:
+  parser = metadata_filters.QuestionParser(metadata_filters.known_metros(client, index_name))
+  retrieval_filter = parser.filter(question)
+  print(f'Metadata filter: {parser.parse(question)}')
+
+
+# The neural query uses the embedding model to generate an embedding for the question
 # and performs a kNN query to get nearest-neighbor matches. Note we set the size query
 # parameter to 2, with k=5. These are very tight constraints that work for this example.
-# In actual use, you would set both k and size higher.
-query = {
-  "query": {
-    "neural": {
-      "text_embedding": {
-        "query_text": "What's the population increase of New York City from 2021 to 2023? How is the trending comparing with Miami?",
-        "model_id": embedding_model_id,
-        "k": 5
-      }
-    }
-  },
-  "size": 2,
-  "_source": [
-    "text"
-  ],
-  # In this case, you use the "bedrock/claude" parameterization of the connector
-  # template. The connector itself sends the request to the SageMaker endpoint,
-  # hosting DeepSeek in the example. Stay tuned for a DeepSeek connector blueprint
-  # in the blueprints repository.
-  "ext": {
-    "generative_qa_parameters": {
-      "llm_model": "bedrock/claude",
-      "llm_question": "What's the population increase of New York City from 2021 to 2023? How is the trending comparing with Miami?",
-      "context_size": 5,
-      "timeout": 15
-    }
-  }
-}
-
-
-# Put the search pipeline, and send the query to it. 
-client.search_pipeline.put(id='deepseek_rag_pipeline',
-                           body=search_pipeline_definition)
-resp = client.search(body=query,
-                     index=index_name, 
-                     search_pipeline="deepseek_rag_pipeline",
-                     timeout=300)
-print(resp)
\ No newline at end of file
+# In actual use, you would set both k and size higher. If load_data.py split the
+# documents into passages (CHUNK_MAX_TOKENS), each hit is one short passage, so
+# the generation model gets tighter context, and far fewer prompt tokens.
+query = rag_query.build_rag_query(question,
+                                  rag_query.neural_clause(question, embedding_model_id, k=5,
+                                                          filter=retrieval_filter),
+                                  size=2,
+                                  context_size=5)
+
+
+# Both caches need the question's embedding, so embed the question here, as
+# does client-side query embedding. With the embedding cache, a question that
+# was asked before (with the same model) is served from disk. Either way, the
+# knn query carries the vector, so OpenSearch doesn't call the model.
+if use_llm and (query_embedding_mode == 'client' or embedding_cache_dir or answer_cache_path):
+  embedder = embedders.create_embedder(client_embedder, client=client, model_id=embedding_model_id)
+  if embedding_cache_dir:
+    cache = embedding_cache.EmbeddingCache(embedding_cache_dir)
+    embedder = embedding_cache.CachedEmbedder(embedder, cache)
+  with tracing.tracer.start_span('embedding', model_id=embedder.model_id):
+    query_vector = embedder.embed([question])[0]
+  query["query"] = rag_query.knn_clause(query_vector, k=5, filter=retrieval_filter)
+  if embedding_cache_dir:
+    cache.save()
+    print(f'Embedding cache: {cache.stats()}')
+
+
+# The hybrid query wraps the vector query (neural, or knn with the cached
+# embedding) with a match query on the text. Retrieval on its own, for the
+# answer cache, goes through a pipeline that only combines the scores.
+retrieval_pipeline_id = None
+if retrieval_mode == 'hybrid':
+  query["query"] = rag_query.hybrid_clause(question, query["query"], filter=retrieval_filter)
+  retrieval_pipeline_id = rag_query.HYBRID_PIPELINE_ID
+  client.search_pipeline.put(id=retrieval_pipeline_id,
+                             body=rag_query.hybrid_pipeline_definition(hybrid_weights))
+
+
+# With the answer cache, when streaming, or with a context budget, retrieve
+# the context documents first. This is the same kNN query, without the search
+# pipeline, so it costs milliseconds. The cache key is the question's
+# embedding plus the retrieved document ids.
+cached_answer = None
+start = time.perf_counter()
+build_prompt = stream_answers or context_tokens > 0 or bool(generation_model_ids)
+if use_llm and (answer_cache_path or build_prompt):
+  retrieval_span = tracing.tracer.start_span('retrieval', index=index_name)
+  retrieval = client.search(body={"query": query["query"],
+                                  "size": query["size"],
+                                  "_source": rag_query.SOURCE_FIELDS if build_prompt else False,
+                                  "profile": tracing.tracer.enabled},
+                            index=index_name,
+                            search_pipeline=retrieval_pipeline_id)
+  retrieval_ms = (time.perf_counter() - start) * 1000
+  print(f'Retrieval stages (ms): {tracing.end_search_span(retrieval_span, retrieval)}')
+if use_llm and answer_cache_path:
+  answers = answer_cache.SemanticAnswerCache(answer_cache_path,
+                                             similarity_threshold=answer_cache_threshold,
+                                             ttl_seconds=answer_cache_ttl)
+  context_ids = rag_query.hit_ids(retrieval)
+  cached_answer = answers.lookup(generation_model_id, index_name, query_vector, context_ids)
+
+
+# Put the search pipeline, and send the query to it. When streaming, or with
+# a context budget, print the passages the search found right away, build the
+# same prompt as the retrieval_augmented_generation processor, from the
+# passages that fit the budget, and send it to the model.
+if not use_llm:
+  print(f'Answer (from facts): {fact_answer}')
+elif cached_answer is not None:
+  print(f'Answer (from cache): {cached_answer}')
+elif build_prompt:
+  print(f'Retrieved in {retrieval_ms:.0f} ms. Sources: {rag_query.hit_parent_ids(retrieval)}')
+  context_size = query["ext"]["generative_qa_parameters"]["context_size"]
+  contexts = rag_query.hit_texts(retrieval, context_size=context_size)
+  if context_tokens:
+    contexts, compaction = context_budget.assemble_context(question, contexts, context_tokens)
+    print(f'Context: {compaction}')
+  for i, text in enumerate(contexts):
+    print(f'SEARCH RESULT {i + 1}: {text}')
+  prompt = rag_query.build_prompt(question, contexts)
+  if stream_answers:
+    if stream_url:
+      streamer = generation_stream.HttpStreamer(stream_url)
+    else:
+      streamer = generation_stream.SageMakerStreamer(os.environ['SAGEMAKER_MODEL_INFERENCE_ENDPOINT'],
+                                                     os.environ['DEEPSEEK_AWS_REGION'])
+    # Both timings count from the start of the retrieval, so they are what a
+    # user waits for.
+    with tracing.tracer.start_span('generation.stream') as generation_span:
+      tokens = generation_stream.TimedStream(streamer.stream(prompt), start=start)
+      print('Answer: ', end='', flush=True)
+      for token in tokens:
+        print(token, end='', flush=True)
+      print()
+      answer = tokens.text
+      timings = tokens.timings()
+      generation_span.set(**timings)
+  elif generation_model_ids:
+    with tracing.tracer.start_span('generation.pool', models=len(generation_model_ids)) as generation_span:
+      answer, pool_stats = asyncio.run(generate_with_pool(prompt))
+      winners = [name for name, endpoint in pool_stats["endpoints"].items() if endpoint["wins"]]
+      generation_span.set(model_id=winners[0], hedges=pool_stats["hedges"])
+    print(f'Answer: {answer}')
+    print(f'Generated by {winners[0]} (hedges: {pool_stats["hedges"]}, failovers: {pool_stats["failovers"]})')
+    timings = {"total_ms": round((time.perf_counter() - start) * 1000, 1)}
+  else:
+    with tracing.tracer.start_span('generation.predict', model_id=generation_model_id):
+      resp = client.transport.perform_request('POST', rag_query.predict_path(generation_model_id),
+                                              body=rag_query.predict_request(prompt),
+                                              params={"request_timeout": 300})
+    answer = rag_query.answer_from_prediction(resp)
+    print(f'Answer: {answer}')
+    timings = {"total_ms": round((time.perf_counter() - start) * 1000, 1)}
+  timings["retrieval_ms"] = round(retrieval_ms, 1)
+  print(f'Timings: {timings}')
+  if answer_cache_path and answer:
+    answers.store(generation_model_id, index_name, query_vector, context_ids, answer)
+else:
+  client.search_pipeline.put(id=search_pipeline_id,
+                             body=search_pipeline_definition)
+  # With tracing, the profile API times the query on each shard.
+  if tracing.tracer.enabled:
+    query["profile"] = True
+  search_span = tracing.tracer.start_span('rag.search', index=index_name, pipeline=search_pipeline_id)
+  resp = client.search(body=query,
+                       index=index_name, 
+                       search_pipeline=search_pipeline_id,
+                       timeout=300)
+  stages = tracing.end_search_span(search_span, resp, generation=True)
+  resp.pop('profile', None)
+  print(resp)
+  # The search pipeline returns the answer all at once, so the first token
+  # arrives with the last.
+  print(f'Timings: {{"total_ms": {(time.perf_counter() - start) * 1000:.1f}}}')
+  print(f'Search stages (ms): {stages}')
+  print(f'Sources: {rag_query.hit_parent_ids(resp)}')
+  answer = rag_query.answer_from_response(resp)
+  if answer_cache_path and answer is not None:
+    answers.store(generation_model_id, index_name, query_vector,
+                  rag_query.hit_ids(resp), answer)
+if use_llm and answer_cache_path:
+  answers.save()
+  print(f'Answer cache: {answers.stats()}')
+request_span.end()
@@ -9,7 +9,7 @@ to create a connector.
 
 
 import boto3
-from opensearchpy import OpenSearch
+import opensearch_client
 import os
 
 
@@ -19,15 +19,6 @@ opensearch_user_name = os.environ['OPENSEARCH_SERVICE_ADMIN_USER']
 opensearch_user_password = os.environ['OPENSEARCH_SERVICE_ADMIN_PASSWORD']
 create_deepseek_connector_role = os.environ['CREATE_DEEPSEEK_CONNECTOR_ROLE']
 lambda_invoke_ml_commons_role_name = 'LambdaInvokeOpenSearchMLCommonsRole'
-opensearch_port = 443
-
-
-# Ensure the endpoint matches the contract for the opensearch-py client. Endpoints
-# are specified without the leading URL scheme or trailing slashes.
-if opensearch_service_api_endpoint.startswith('https://'):
-  opensearch_service_api_endpoint = opensearch_service_api_endpoint[len('https://'):]
-if opensearch_service_api_endpoint.endswith('/'):
-  opensearch_service_api_endpoint = opensearch_service_api_endpoint[:-1]
 
 
 # Construct the backend roles. OpenSearch's fine-grained access control will detect
@@ -40,15 +31,8 @@ role_mapping = {
                     lambda_invoke_ml_commons_role_arn]
 }
 
-hosts = [{"host": opensearch_service_api_endpoint, "port": opensearch_port}]
-client = OpenSearch(
-    hosts=hosts,
-    http_auth=(opensearch_user_name, opensearch_user_password),
-    use_ssl=True,
-    verify_certs=False,
-    ssl_assert_hostname=False,
-    ssl_show_warn=False,
-)
+client = opensearch_client.create_client(opensearch_service_api_endpoint,
+                                         (opensearch_user_name, opensearch_user_password))
 client.security.create_role_mapping('ml_full_access', body=role_mapping)
 
 print(f'ml_full_access role mapping is now {client.security.get_role_mapping("ml_full_access")}')
@@ -0,0 +1,136 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Keeps a local manifest of what load_data.py has written to the knowledge
+base, so that loading the corpus again sends only what changed.
+
+The manifest maps each source document's id to a SHA-256 hash of its
+content, and to the number of passages it was split into (None when it was
+indexed whole). On the next load, SyncManifest.changed passes on only the
+documents that are new or whose hash differs, so unchanged documents make no
+embedding calls and no _bulk requests. stale_ids then lists what to delete:
+every passage of a document that's gone from the corpus, and the extra
+passages of a document that now splits into fewer.
+
+Documents without an id get one from a hash of their text (see
+chunking.parent_id), so that they can be tracked too. Editing such a
+document gives it a new id, and the old one is deleted.
+
+The manifest also records a fingerprint of the settings that change what's
+indexed for the same text: the index, the embedding model, and the chunk
+sizes. When the fingerprint differs, every document counts as changed.
+'''
+
+import hashlib
+import json
+import os
+
+import chunking
+
+
+def content_hash(document):
+  '''
+  A SHA-256 hash of all of a document's fields except its id, so that a
+  change to any field, not only the text, causes a rewrite.
+  '''
+  fields = {name: value for name, value in document.items() if name not in ('_id', 'id')}
+  return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False)
+                        .encode('utf-8')).hexdigest()
+
+
+def written_ids(doc_id, passage_count):
+  '''
+  The ids in the index for a source document: its own id when it was indexed
+  whole, or the ids of its passages.
+  '''
+  if passage_count is None:
+    return [doc_id]
+  return [f'{doc_id}{chunking.CHUNK_ID_SEPARATOR}{i}' for i in range(passage_count)]
+
+
+class SyncManifest:
+  '''
+  The manifest at path, for an index loaded with the settings in fingerprint
+  (a JSON-serializable dict). Call changed, then stale_ids, then, once the
+  writes and deletes have succeeded, commit.
+  '''
+
+  def __init__(self, path, fingerprint):
+    self.path = path
+    self.fingerprint = fingerprint
+    self._documents = {}
+    self._stale_fingerprint = False
+    self._pending = {}
+    self._seen = set()
+    self.unchanged = 0
+    try:
+      with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+      self._documents = {doc_id: tuple(entry) for doc_id, entry in manifest["documents"].items()}
+      self._stale_fingerprint = manifest.get("fingerprint") != fingerprint
+    except FileNotFoundError:
+      pass
+
+  def __len__(self):
+    return len(self._documents)
+
+  def clear(self):
+    '''
+    Forgets every document, for when the index has been created from scratch.
+    '''
+    self._documents = {}
+
+  def changed(self, documents, split=None):
+    '''
+    Yields the documents that are new or changed since the last commit,
+    lazily. split, when given, turns a document into its passages (a list of
+    documents), and the passages are yielded in its place.
+    '''
+    for document in documents:
+      doc_id = chunking.parent_id(document)
+      digest = content_hash(document)
+      self._seen.add(doc_id)
+      previous = self._documents.get(doc_id)
+      if previous is not None and previous[0] == digest and not self._stale_fingerprint:
+        self.unchanged += 1
+        continue
+      document = dict(document, _id=doc_id)
+      document.pop('id', None)
+      passages = split(document) if split else None
+      self._pending[doc_id] = (digest, None if passages is None else len(passages))
+      yield from passages if passages is not None else (document,)
+
+  def stale_ids(self):
+    '''
+    The ids to delete from the index, once changed has been consumed: the
+    passages (or documents) that the current corpus no longer produces.
+    '''
+    stale = []
+    for doc_id, (_, passage_count) in self._documents.items():
+      old = written_ids(doc_id, passage_count)
+      if doc_id not in self._seen:
+        stale.extend(old)
+      elif doc_id in self._pending:
+        new = set(written_ids(doc_id, self._pending[doc_id][1]))
+        stale.extend(old_id for old_id in old if old_id not in new)
+    return stale
+
+  def written(self):
+    '''
+    The number of source documents that changed passes on.
+    '''
+    return len(self._pending)
+
+  def commit(self):
+    '''
+    Records the pending changes and the deletions, and atomically rewrites the
+    manifest.
+    '''
+    self._documents = {doc_id: entry for doc_id, entry in self._documents.items()
+                       if doc_id in self._seen}
+    self._documents.update(self._pending)
+    self._pending, self._seen = {}, set()
+    self._stale_fingerprint = False
+    with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+      json.dump({"fingerprint": self.fingerprint, "documents": self._documents}, f)
+    os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,34 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+The scripts are top-level modules in the folder above, so the tests import
+them from there. Run the tests from that folder:
+
+  python -m pytest -q
+'''
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_opensearch
+import opensearch_client
+
+
+@pytest.fixture
+def mock_url():
+  '''
+  The URL of a mock OpenSearch domain of its own, with no latency.
+  '''
+  latency = mock_opensearch.MockLatency(bulk_ms=0, embed_ms=0, search_ms=0, generate_ms=0, sts_ms=0)
+  server, url = mock_opensearch.start_mock_server(latency)
+  yield url
+  server.shutdown()
+
+
+@pytest.fixture
+def mock_client(mock_url):
+  return opensearch_client.create_client(mock_url)
@@ -0,0 +1,62 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+
+import answer_cache
+
+
+QUESTION = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+SIMILAR = np.array([0.99, 0.1, 0.0], dtype=np.float32)
+DIFFERENT = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+
+
+def cache(tmp_path, **kwargs):
+  return answer_cache.SemanticAnswerCache(str(tmp_path / 'answers.json'), **kwargs)
+
+
+def test_a_similar_question_with_the_same_documents_hits(tmp_path):
+  answers = cache(tmp_path)
+  answers.store('deepseek', 'population', QUESTION, ['1', '2'], 'It grew.')
+  assert answers.lookup('deepseek', 'population', SIMILAR, ['2', '1']) == 'It grew.'
+  assert answers.lookup('deepseek', 'population', DIFFERENT, ['1', '2']) is None
+  assert answers.stats()["hits"] == 1
+  assert answers.stats()["misses"] == 1
+
+
+def test_other_documents_or_another_model_miss(tmp_path):
+  answers = cache(tmp_path)
+  answers.store('deepseek', 'population', QUESTION, ['1', '2'], 'It grew.')
+  assert answers.lookup('deepseek', 'population', QUESTION, ['1', '3']) is None
+  assert answers.lookup('other-model', 'population', QUESTION, ['1', '2']) is None
+
+
+def test_changed_documents_invalidate_their_answers(tmp_path):
+  answers = cache(tmp_path)
+  answers.store('deepseek', 'population', QUESTION, ['1', '2'], 'It grew.')
+  answers.store('deepseek', 'population', QUESTION, ['3'], 'It shrank.')
+  assert answers.invalidate_documents('population', ['2']) == 1
+  assert answers.lookup('deepseek', 'population', QUESTION, ['1', '2']) is None
+  assert answers.lookup('deepseek', 'population', QUESTION, ['3']) == 'It shrank.'
+
+
+def test_expired_answers_miss(tmp_path):
+  answers = cache(tmp_path, ttl_seconds=-1)
+  answers.store('deepseek', 'population', QUESTION, ['1'], 'It grew.')
+  assert answers.lookup('deepseek', 'population', QUESTION, ['1']) is None
+  assert answers.stats()["entries"] == 0
+
+
+def test_the_oldest_answer_goes_first_when_full(tmp_path):
+  answers = cache(tmp_path, max_entries=2)
+  for doc_id in ('1', '2', '3'):
+    answers.store('deepseek', 'population', QUESTION, [doc_id], f'Answer {doc_id}')
+  assert answers.lookup('deepseek', 'population', QUESTION, ['1']) is None
+  assert answers.lookup('deepseek', 'population', QUESTION, ['3']) == 'Answer 3'
+
+
+def test_answers_persist_across_instances(tmp_path):
+  answers = cache(tmp_path)
+  answers.store('deepseek', 'population', QUESTION, ['1'], 'It grew.')
+  answers.save()
+  assert cache(tmp_path).lookup('deepseek', 'population', SIMILAR, ['1']) == 'It grew.'
@@ -0,0 +1,88 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bulk_loader
+import index_profiles
+
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'async_rag.py')
+QUESTIONS = ['What was the population of Metro 3 in 2023?',
+             'How fast did Metro 7 grow?',
+             'Which metro area had 510,000 people?']
+
+
+@pytest.fixture
+def rag_url(mock_url, mock_client):
+  '''
+  The mock, with a population_data index of synthetic metro areas, embedded
+  through embedding_pipeline.
+  '''
+  mock_client.ingest.put_pipeline(id='embedding_pipeline', body={
+    "processors": [{"text_embedding": {"model_id": 'mock-embedding',
+                                       "field_map": {"text": "text_embedding"}}}]})
+  mock_client.indices.create(index='population_data', body=index_profiles.build_mapping())
+  documents = ({"id": str(i),
+                "text": f'The metro area population of Metro {i} in 2023 is {500_000 + 1_000 * i:,}, '
+                        f'a {i / 10:.2f}% increase from 2022.'} for i in range(20))
+  bulk_loader.bulk_load(mock_client, 'population_data', documents, pipeline='embedding_pipeline', log=None)
+  mock_client.indices.refresh(index='population_data')
+  return mock_url
+
+
+def run_async_rag(url, tmp_path, **env):
+  questions_file = tmp_path / 'questions.txt'
+  questions_file.write_text('\n'.join(QUESTIONS) + '\n\n', encoding='utf-8')
+  env = dict(os.environ,
+             OPENSEARCH_SERVICE_DOMAIN_ENDPOINT=url,
+             OPENSEARCH_SERVICE_ADMIN_USER='admin',
+             OPENSEARCH_SERVICE_ADMIN_PASSWORD='admin',
+             EMBEDDING_MODEL_ID='mock-embedding',
+             DEEPSEEK_MODEL_ID='mock-deepseek',
+             RAG_QUESTIONS_FILE=str(questions_file),
+             RAG_CONCURRENCY='2',
+             **env)
+  result = subprocess.run([sys.executable, SCRIPT], env=env, capture_output=True, text=True,
+                          timeout=60, check=True)
+  answers = {answer["question"]: answer for answer in map(json.loads, result.stdout.splitlines())}
+  return answers, json.loads(result.stderr.splitlines()[-1])
+
+
+def test_answers_every_question_and_summarizes(rag_url, tmp_path):
+  answers, summary = run_async_rag(rag_url, tmp_path)
+  assert sorted(answers) == sorted(QUESTIONS)
+  for answer in answers.values():
+    assert answer["answer"]
+    assert answer["route"] == 'llm'
+    assert len(answer["hits"]) == 2
+  assert summary["requests"] == 3
+  assert summary["errors"] == 0
+
+
+def test_client_embedding_retrieves_the_same_hits(rag_url, tmp_path):
+  neural, _ = run_async_rag(rag_url, tmp_path)
+  client, summary = run_async_rag(rag_url, tmp_path, RAG_QUERY_EMBEDDING='client')
+  assert {q: a["hits"] for q, a in client.items()} == {q: a["hits"] for q, a in neural.items()}
+  assert summary["query_embedding"]["questions"] == 3
+
+
+def test_a_cached_question_is_not_embedded_again(rag_url, tmp_path):
+  env = {"RAG_QUERY_EMBEDDING": 'client', "CLIENT_EMBEDDER": 'hashing',
+         "EMBEDDING_CACHE_DIR": str(tmp_path / 'cache')}
+  _, summary = run_async_rag(rag_url, tmp_path, **env)
+  assert summary["query_embedding"]["questions"] == 3
+  _, summary = run_async_rag(rag_url, tmp_path, **env)
+  assert summary["query_embedding"]["questions"] == 0
+  assert summary["query_embedding"]["cache"]["hits"] == 3
+
+
+def test_context_budget_reports_the_tokens_saved(rag_url, tmp_path):
+  answers, summary = run_async_rag(rag_url, tmp_path, RAG_CONTEXT_TOKENS='40', RAG_RETRIEVAL='hybrid')
+  assert all(answer["answer"] and "context" in answer for answer in answers.values())
+  assert summary["context_tokens_saved"] == sum(answer["context"]["tokens_saved"] for answer in answers.values())
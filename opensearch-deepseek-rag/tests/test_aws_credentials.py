@@ -0,0 +1,84 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import stat
+
+import requests
+
+import aws_credentials
+
+
+ROLE_ARN = 'arn:aws:iam::123456789012:role/connector_role'
+
+
+class FailingSTS(aws_credentials.LocalSTS):
+  def assume_role(self, **kwargs):
+    raise RuntimeError('STS is down')
+
+
+def provider(sts, **kwargs):
+  return aws_credentials.AssumedRoleCredentials(ROLE_ARN, 'test', sts_client=sts,
+                                                background_refresh=False, **kwargs)
+
+
+def signed(auth):
+  request = requests.Request('POST', 'https://localhost:9200/_plugins/_ml/connectors/_create',
+                             json={}).prepare()
+  return auth(request)
+
+
+def test_credentials_are_cached_until_they_near_expiry():
+  sts = aws_credentials.LocalSTS()
+  credentials = provider(sts)
+  first = credentials.get()
+  assert credentials.get() is first
+  assert sts.calls == 1
+  # Credentials that expire within the margin are refreshed.
+  expiring = provider(sts, duration_seconds=900, refresh_margin_seconds=1200)
+  assert expiring.get() is not expiring.get()
+  assert sts.calls == 3
+
+
+def test_sigv4_auth_derives_one_signing_key_per_credentials():
+  sts = aws_credentials.LocalSTS()
+  credentials = provider(sts)
+  auth = aws_credentials.SigV4Auth(credentials, 'us-west-2')
+  requests_signed = [signed(auth) for _ in range(3)]
+  assert auth.signing_keys == 1
+  for request in requests_signed:
+    assert request.headers['Authorization'].startswith(
+      f'AWS4-HMAC-SHA256 Credential={credentials.get()["access_key"]}/')
+    assert request.headers['X-Amz-Security-Token'] == credentials.get()["token"]
+  credentials._credentials = None
+  signed(auth)
+  assert auth.signing_keys == 2
+
+
+def test_cached_credentials_are_private_and_reused(tmp_path):
+  path = str(tmp_path / 'credentials.json')
+  sts = aws_credentials.LocalSTS()
+  first = provider(sts, cache_path=path).get()
+  assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+  assert provider(sts, cache_path=path).get() == first
+  assert sts.calls == 1
+  other = aws_credentials.AssumedRoleCredentials('arn:aws:iam::123456789012:role/other', 'test',
+                                                 sts_client=sts, cache_path=path, background_refresh=False)
+  assert other.get() != first
+  assert sts.calls == 2
+
+
+def test_background_refresh_keeps_the_credentials_when_sts_fails():
+  sts = aws_credentials.LocalSTS()
+  credentials = aws_credentials.AssumedRoleCredentials(ROLE_ARN, 'test', sts_client=sts)
+  try:
+    first = credentials.get()
+    assert credentials._timer.is_alive()
+    credentials.sts_client = FailingSTS()
+    credentials._refresh_in_background()
+    assert credentials.refresh_failures == 1
+    assert credentials.get() is first
+  finally:
+    credentials.close()
+  credentials._timer.join(1)
+  assert not credentials._timer.is_alive()
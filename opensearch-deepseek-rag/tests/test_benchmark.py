@@ -0,0 +1,61 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks import common
+
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark.py')
+
+
+def run_benchmark(**env):
+  env = dict(os.environ, BENCH_DOCS='20', BENCH_QUERIES='4', BENCH_CONCURRENCY='2', BENCH_K='5',
+             BENCH_SIZES='2', MOCK_BULK_MS='0', MOCK_EMBED_MS='0', MOCK_SEARCH_MS='0',
+             MOCK_GENERATE_MS='0', **env)
+  return subprocess.run([sys.executable, SCRIPT], env=env, capture_output=True, text=True, timeout=120)
+
+
+def test_the_report_has_a_result_for_each_run_of_a_suite():
+  result = run_benchmark(BENCH_SUITES='query,retrieval')
+  assert result.returncode == 0, result.stderr
+  report = json.loads(result.stdout)
+  assert report["mock_latency_ms"]["generate_ms"] == 0
+  suites = [run["suite"] for run in report["results"]]
+  assert set(suites) == {'query', 'retrieval'}
+  for run in report["results"]:
+    assert run["metrics"].get("errors", 0) == 0
+
+
+def test_an_unknown_suite_stops_before_the_run():
+  result = run_benchmark(BENCH_SUITES='query,quary')
+  assert result.returncode != 0
+  assert "Unknown suites ['quary']" in result.stderr
+
+
+def test_run_concurrently_counts_the_calls_that_fail():
+  calls = iter(range(10))
+
+  def call():
+    if next(calls) % 5 == 0:
+      raise RuntimeError('rejected')
+  summary = common.run_concurrently(call, 10, 2)
+  assert (summary["requests"], summary["errors"]) == (8, 2)
+
+
+def test_cycling_search_sends_each_body_in_turn():
+  class RecordingClient:
+    def __init__(self):
+      self.bodies = []
+
+    def search(self, body, **params):
+      self.bodies.append((body, params))
+
+  client = RecordingClient()
+  call = common.cycling_search(client, ['a', 'b'], index='i')
+  for _ in range(3):
+    call()
+  assert client.bodies == [('a', {"index": 'i'}), ('b', {"index": 'i'}), ('a', {"index": 'i'})]
@@ -0,0 +1,56 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import bulk_loader
+
+
+def documents(count, text='Population of Metro'):
+  return [{"id": str(i), "text": f'{text} {i}'} for i in range(count)]
+
+
+def test_bulk_entry_moves_the_id_to_the_action():
+  action, source = bulk_loader.bulk_entry({"id": 7, "text": 'Miami'}, 'population').splitlines()
+  assert json.loads(action) == {"index": {"_index": "population", "_id": "7"}}
+  assert json.loads(source) == {"text": "Miami"}
+
+
+def test_bulk_entry_keeps_neither_id_in_the_source():
+  action, source = bulk_loader.bulk_entry({"_id": 'a', "id": 'b', "text": 'Miami'}, 'population').splitlines()
+  assert json.loads(action)["index"]["_id"] == 'a'
+  assert json.loads(source) == {"text": "Miami"}
+  action, _ = bulk_loader.bulk_entry({"id": 0, "text": 'Miami'}, 'population').splitlines()
+  assert json.loads(action)["index"]["_id"] == '0'
+
+
+def test_iter_bulk_batches_closes_a_batch_at_max_docs():
+  batches = list(bulk_loader.iter_bulk_batches(documents(7), 'population', max_docs=3))
+  assert [doc_count for _, doc_count in batches] == [3, 3, 1]
+  assert all(body.count('\n') == 2 * doc_count for body, doc_count in batches)
+
+
+def test_iter_bulk_batches_closes_a_batch_before_max_bytes():
+  entry_bytes = len(bulk_loader.bulk_entry(documents(1)[0], 'population').encode('utf-8'))
+  batches = list(bulk_loader.iter_bulk_batches(documents(5), 'population', max_docs=100,
+                                               max_bytes=2 * entry_bytes + 1))
+  assert [doc_count for _, doc_count in batches] == [2, 2, 1]
+  # A document bigger than max_bytes still goes, in a batch of its own.
+  batches = list(bulk_loader.iter_bulk_batches(documents(2), 'population', max_bytes=1))
+  assert [doc_count for _, doc_count in batches] == [1, 1]
+
+
+def test_bulk_load_indexes_every_document(mock_client):
+  mock_client.indices.create(index='population')
+  totals = bulk_loader.bulk_load(mock_client, 'population', iter(documents(25)),
+                                 workers=2, max_docs=4, log=None)
+  assert (totals["batches"], totals["documents"], totals["errors"]) == (7, 25, 0)
+  mock_client.indices.refresh(index='population')
+  assert mock_client.count(index='population')["count"] == 25
+
+
+def test_record_ids_passes_documents_through():
+  ids = []
+  passed = list(bulk_loader.record_ids(iter([{"id": 1}, {"text": 'no id'}, {"_id": 'b'}]), ids))
+  assert len(passed) == 3
+  assert ids == ['1', 'b']
@@ -0,0 +1,58 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+import chunking
+
+
+def sentences(count):
+  return ' '.join(f'In {1950 + i} the population of Chicago was {1000 + i} thousand.' for i in range(count))
+
+
+def test_text_that_fits_is_one_chunk():
+  assert chunking.chunk_text('  Chicago grew.  ', max_tokens=10, overlap_tokens=2) == ['Chicago grew.']
+  assert chunking.chunk_text('', max_tokens=10, overlap_tokens=2) == []
+
+
+def test_long_text_splits_into_overlapping_windows_on_sentence_boundaries():
+  text = sentences(20)
+  chunks = chunking.chunk_text(text, max_tokens=40, overlap_tokens=10)
+  assert len(chunks) > 1
+  assert all(chunking.count_tokens(chunk) <= 40 for chunk in chunks)
+  # Every chunk starts and ends on a sentence boundary, and consecutive
+  # chunks share a sentence.
+  assert all(chunk.startswith('In ') and chunk.endswith('.') for chunk in chunks)
+  for previous, chunk in zip(chunks, chunks[1:]):
+    assert chunk.split('. ')[0] in previous
+  # Every sentence is in some chunk.
+  for i in range(20):
+    assert any(f'In {1950 + i} ' in chunk for chunk in chunks)
+
+
+def test_text_without_sentence_breaks_still_splits():
+  text = ' '.join(f'w{i}' for i in range(100))
+  chunks = chunking.chunk_text(text, max_tokens=30, overlap_tokens=5)
+  assert all(chunking.count_tokens(chunk) <= 30 for chunk in chunks)
+  assert chunks[0].startswith('w0 ') and chunks[-1].endswith(' w99')
+
+
+def test_overlap_must_be_less_than_the_window():
+  with pytest.raises(ValueError):
+    chunking.chunk_text('Chicago', max_tokens=10, overlap_tokens=10)
+
+
+def test_chunk_documents_gives_passages_stable_ids_and_their_parents_fields():
+  document = {"id": 'chi', "text": sentences(20), "metro": 'Chicago'}
+  passages = list(chunking.chunk_documents([document], max_tokens=40, overlap_tokens=10))
+  assert [passage["_id"] for passage in passages] == [f'chi#{i}' for i in range(len(passages))]
+  assert all(passage["metro"] == 'Chicago' and passage["parent_id"] == 'chi' and
+             passage["chunk_count"] == len(passages) and 'id' not in passage
+             for passage in passages)
+  assert [passage["chunk_index"] for passage in passages] == list(range(len(passages)))
+
+
+def test_a_document_without_an_id_gets_one_from_its_text():
+  document = {"text": 'Miami grew.'}
+  assert chunking.parent_id(document) == chunking.parent_id(dict(document))
+  assert chunking.parent_id(document) != chunking.parent_id({"text": 'Miami shrank.'})
@@ -0,0 +1,47 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import chunking
+import context_budget
+
+
+QUESTION = 'What was the population of New York City and Miami in 2021?'
+PASSAGES = [
+  'The population of New York City in 2021 was 19,000,000. '
+  'The population of New York City in 2020 was 18,900,000. '
+  'New York City is on the Atlantic coast.',
+  'The population of New York City in 2021 was 19,000,000. '
+  'The population of Miami in 2021 was 6,100,000. '
+  'The population of Miami in 2019 was 6,000,000.',
+]
+
+
+def test_split_sentences_reads_literal_newlines_as_breaks():
+  assert context_budget.split_sentences('One. Two!\\nThree') == ['One.', 'Two!', 'Three']
+
+
+def test_duplicate_sentences_are_dropped():
+  contexts, report = context_budget.assemble_context(QUESTION, PASSAGES, max_tokens=1000)
+  assert report["duplicate_sentences"] == 1
+  assert sum(context.count('New York City in 2021') for context in contexts) == 1
+
+
+def test_the_context_fits_the_budget_and_covers_the_question():
+  contexts, report = context_budget.assemble_context(QUESTION, PASSAGES, max_tokens=30)
+  assert report["tokens_after"] <= 30
+  assert sum(chunking.count_tokens(context) for context in contexts) == report["tokens_after"]
+  assert report["tokens_saved"] == report["tokens_before"] - report["tokens_after"]
+  assert contexts == ['The population of New York City in 2021 was 19,000,000.',
+                      'The population of Miami in 2021 was 6,100,000.']
+
+
+def test_sentences_keep_their_order_within_a_passage():
+  passage = 'Miami grew in 2021. It is warm. Miami shrank in 2019.'
+  contexts, _ = context_budget.assemble_context('How did Miami change in 2021 and 2019?', [passage],
+                                                max_tokens=100)
+  assert contexts == ['Miami grew in 2021. Miami shrank in 2019.']
+
+
+def test_one_sentence_is_kept_when_none_match():
+  contexts, _ = context_budget.assemble_context('Why?', ['Chicago is big. Miami is warm.'], max_tokens=100)
+  assert contexts == ['Chicago is big.']
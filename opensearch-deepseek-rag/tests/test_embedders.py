@@ -0,0 +1,65 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+import pytest
+
+import embedders
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+  embedder = embedders.HashingEmbedder()
+  vectors = embedder.embed(['Chicago population', 'chicago  POPULATION', ''])
+  assert vectors.shape == (3, embedders.EMBEDDING_DIMENSION)
+  np.testing.assert_array_equal(vectors[0], vectors[1])
+  np.testing.assert_allclose(np.linalg.norm(vectors[0]), 1.0, rtol=1e-6)
+  assert not vectors[2].any()
+  np.testing.assert_array_equal(vectors, embedders.HashingEmbedder().embed(['Chicago population',
+                                                                            'chicago  POPULATION', '']))
+
+
+def test_vectors_from_prediction_flattens_both_response_shapes():
+  local = {"inference_results": [{"output": [{"name": "sentence_embedding", "data": [1.0]}]},
+                                 {"output": [{"name": "sentence_embedding", "data": [2.0]}]}]}
+  remote = {"inference_results": [{"output": [{"name": "sentence_embedding", "data": [1.0]},
+                                              {"name": "sentence_embedding", "data": [2.0]}]}]}
+  assert embedders.vectors_from_prediction(local) == [[1.0], [2.0]]
+  assert embedders.vectors_from_prediction(remote, 2) == [[1.0], [2.0]]
+
+
+def test_an_output_without_data_is_an_error():
+  resp = {"inference_results": [{"output": [{"name": "sentence_embedding", "data": [1.0]}]},
+                                {"output": [{"name": "sentence_embedding"}]}]}
+  with pytest.raises(ValueError, match='no data'):
+    embedders.vectors_from_prediction(resp)
+
+
+def test_a_missing_vector_is_an_error():
+  resp = {"inference_results": [{"output": [{"name": "sentence_embedding", "data": [1.0]}]}]}
+  with pytest.raises(ValueError, match='Sent 2 texts'):
+    embedders.vectors_from_prediction(resp, 2)
+
+
+def test_model_embedder_batches_requests_and_keeps_the_order(mock_client):
+  texts = [f'Metro {i} population' for i in range(5)]
+  vectors = embedders.OpenSearchModelEmbedder(mock_client, 'mock-embedding', batch_size=2).embed(texts)
+  np.testing.assert_allclose(vectors, embedders.HashingEmbedder().embed(texts), rtol=1e-6)
+
+
+def test_embed_documents_sets_the_vector_field_in_order():
+  documents = [{"id": str(i), "text": f'Metro {i}'} for i in range(5)]
+  embedded = list(embedders.embed_documents(iter(documents), embedders.HashingEmbedder(), batch_size=2))
+  assert [document["id"] for document in embedded] == ['0', '1', '2', '3', '4']
+  assert embedded[3]["text_embedding"] == embedders.HashingEmbedder().embed(['Metro 3'])[0].tolist()
+  assert 'text_embedding' not in documents[0]
+
+
+def test_check_dimension_rejects_the_wrong_dimension():
+  with pytest.raises(ValueError, match='384 dimensions'):
+    embedders.check_dimension(np.zeros((2, 3), dtype=np.float32))
+
+
+def test_create_embedder_rejects_an_unknown_name():
+  assert isinstance(embedders.create_embedder('hashing'), embedders.HashingEmbedder)
+  with pytest.raises(ValueError, match='Unknown embedder'):
+    embedders.create_embedder('bert')
@@ -0,0 +1,112 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+import pytest
+
+import embedders
+import embedding_cache
+
+
+class CountingEmbedder(embedders.HashingEmbedder):
+  '''
+  A hashing embedder that records the texts it's asked to embed.
+  '''
+
+  def __init__(self):
+    super().__init__()
+    self.calls = []
+
+  def embed(self, texts):
+    self.calls.append(list(texts))
+    return super().embed(texts)
+
+
+def test_cached_embedder_embeds_texts_with_the_same_key_once(tmp_path):
+  embedder = CountingEmbedder()
+  cached = embedding_cache.CachedEmbedder(embedder, embedding_cache.EmbeddingCache(str(tmp_path), max_bytes=1 << 20))
+  vectors = cached.embed(['Chicago  population', 'Chicago population ', 'Miami'])
+  assert embedder.calls == [['Chicago  population', 'Miami']]
+  np.testing.assert_array_equal(vectors[0], vectors[1])
+  cached.embed(['  Chicago population', 'Miami'])
+  assert len(embedder.calls) == 1
+
+
+def test_cache_keys_ignore_whitespace_but_not_case():
+  assert embedding_cache.cache_key('m', ' Chicago\n population ') == embedding_cache.cache_key('m', 'Chicago population')
+  assert embedding_cache.cache_key('m', 'Chicago') != embedding_cache.cache_key('m', 'chicago')
+  assert embedding_cache.cache_key('m', 'Chicago') != embedding_cache.cache_key('other', 'Chicago')
+
+
+def test_cache_evicts_the_least_recently_used_entry(tmp_path):
+  cache = embedding_cache.EmbeddingCache(str(tmp_path), dimension=4, max_bytes=2 * 4 * 4)
+  assert cache.capacity == 2
+  cache.put('m', 'a', np.ones(4))
+  cache.put('m', 'b', np.full(4, 2.0))
+  cache.get('m', 'a')
+  cache.put('m', 'c', np.full(4, 3.0))
+  assert cache.get('m', 'b') is None
+  np.testing.assert_array_equal(cache.get('m', 'a'), np.ones(4))
+  np.testing.assert_array_equal(cache.get('m', 'c'), np.full(4, 3.0))
+  assert cache.stats()["evictions"] == 1
+
+
+def test_cache_persists_across_instances(tmp_path):
+  cache = embedding_cache.EmbeddingCache(str(tmp_path), dimension=4, max_bytes=1 << 10)
+  cache.put('m', 'Chicago', np.arange(4, dtype=np.float32))
+  cache.save()
+  reopened = embedding_cache.EmbeddingCache(str(tmp_path), dimension=4, max_bytes=1 << 10)
+  assert len(reopened) == 1
+  np.testing.assert_array_equal(reopened.get('m', 'Chicago'), np.arange(4))
+
+
+class FailingEmbedder(CountingEmbedder):
+  '''
+  A counting embedder that raises on its call number fail_on, as a load that
+  dies partway does.
+  '''
+
+  def __init__(self, fail_on):
+    super().__init__()
+    self.fail_on = fail_on
+
+  def embed(self, texts):
+    if len(self.calls) + 1 == self.fail_on:
+      raise RuntimeError('The load stopped')
+    return super().embed(texts)
+
+
+def test_an_interrupted_load_never_maps_a_key_to_another_texts_vector(tmp_path):
+  texts = [f'Metro {i} population' for i in range(12)]
+  cache = embedding_cache.EmbeddingCache(str(tmp_path), dimension=embedders.EMBEDDING_DIMENSION,
+                                         max_bytes=4 * embedders.EMBEDDING_DIMENSION * 4)
+  cached = embedding_cache.CachedEmbedder(FailingEmbedder(fail_on=4), cache)
+  cached.embed(texts[:4])
+  cache.save()
+  # These evict the saved entries and reuse their slots, with no save after.
+  cached.embed(texts[4:7])
+  cached.embed(texts[7:10])
+  try:
+    cached.embed(texts[10:])
+  except RuntimeError:
+    pass
+  reopened = embedding_cache.EmbeddingCache(str(tmp_path))
+  expected = embedders.HashingEmbedder().embed(texts)
+  found = 0
+  for text, vector in zip(texts, expected):
+    cached_vector = reopened.get(embedders.HashingEmbedder.model_id, text)
+    if cached_vector is not None:
+      found += 1
+      np.testing.assert_array_equal(cached_vector, vector)
+  assert found > 0
+
+
+def test_reopening_with_another_dimension_or_capacity_is_an_error(tmp_path):
+  embedding_cache.EmbeddingCache(str(tmp_path), dimension=4, max_bytes=1 << 10).save()
+  assert embedding_cache.EmbeddingCache(str(tmp_path)).capacity == 64
+  with pytest.raises(ValueError, match='4-dimensional'):
+    embedding_cache.EmbeddingCache(str(tmp_path), dimension=8)
+  with pytest.raises(ValueError, match='holds 64 vectors'):
+    embedding_cache.EmbeddingCache(str(tmp_path), dimension=4, max_bytes=1 << 11)
+  with pytest.raises(ValueError, match='4-dimensional'):
+    embedding_cache.CachedEmbedder(embedders.HashingEmbedder(), embedding_cache.EmbeddingCache(str(tmp_path)))
@@ -0,0 +1,87 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+import facts
+
+
+METROS = ['Chicago', 'New York City', 'Miami', 'Ogden-Layton']
+
+
+def document(metro, year, population, rate, direction='increase', doc_id='1'):
+  return {"id": doc_id,
+          "text": f'Chart and table of population level and growth rate for the {metro} metro area. '
+                  f'The metro area population of {metro} in {year} was {population:,}, '
+                  f'a {rate}% {direction} from {year - 1}.'}
+
+
+def facts_response(rows):
+  return {"hits": {"hits": [{"_source": {"metro": metro, "year": year, "population": population,
+                                         "growth_rate": rate}}
+                            for metro, year, population, rate in rows]}}
+
+
+def test_extract_facts_reads_population_and_signed_growth_rate():
+  [fact] = facts.extract_facts(document('Chicago', 2022, 8901000, '0.27'))
+  assert fact == {"metro": "Chicago", "year": 2022, "population": 8901000,
+                  "growth_rate": 0.27, "source_id": "1"}
+  [fact] = facts.extract_facts(document('Chicago', 2022, 8901000, '1.5', direction='decline'))
+  assert fact["growth_rate"] == -1.5
+
+
+def test_extract_facts_ignores_text_without_facts():
+  assert facts.extract_facts({"id": "1", "text": 'Chicago is a city on Lake Michigan.'}) == []
+
+
+@pytest.mark.parametrize('question, kind, metros, years', [
+  ("What's the population increase of New York City from 2021 to 2023? "
+   "How is the trending comparing with Miami?", 'change', ['New York City', 'Miami'], [2021, 2023]),
+  ('What was the population of Chicago in 2022?', 'population', ['Chicago'], [2022]),
+  ('How many people lived in Chicago in 2022?', 'population', ['Chicago'], [2022]),
+  ('What is the population of ogden layton?', 'population', ['Ogden-Layton'], []),
+  ('What was the growth rate of Miami in 2023?', 'growth_rate', ['Miami'], [2023]),
+])
+def test_plan_routes_template_questions_to_the_facts(question, kind, metros, years):
+  assert facts.FactRouter(METROS).plan(question) == {"kind": kind, "metros": metros, "years": years}
+
+
+@pytest.mark.parametrize('question', [
+  'How many people moved to Chicago in 2022?',
+  'How many people left Chicago in 2022?',
+  'What was the population density of Chicago in 2022?',
+  'How many residents of Chicago were born abroad in 2022?',
+  'How many people in Chicago were over 65 in 2022?',
+  'Why did the population of Chicago grow in 2022?',
+  'What will the population of Miami be in 2030? Predict it.',
+  'What was the population of Springfield in 2022?',
+  'Tell me about Chicago.',
+])
+def test_plan_sends_other_questions_to_the_llm(question):
+  assert facts.FactRouter(METROS).plan(question) is None
+
+
+def test_answer_computes_the_change_and_compares():
+  router = facts.FactRouter(METROS)
+  plan = router.plan('What was the population increase of Chicago and Miami from 2021 to 2023?')
+  answer = router.answer(plan, facts_response([('Chicago', 2021, 1000, 0.0), ('Chicago', 2023, 1100, 0.0),
+                                               ('Miami', 2021, 1000, 0.0), ('Miami', 2023, 1050, 0.0)]))
+  assert 'grew by 100 (10%), from 1,000 to 1,100' in answer
+  assert 'Chicago grew the fastest' in answer
+
+
+def test_answer_is_none_when_a_fact_is_missing():
+  router = facts.FactRouter(METROS)
+  plan = router.plan('What was the population of Chicago in 2022?')
+  assert router.answer(plan, facts_response([('Chicago', 2021, 1000, 0.0)])) is None
+  assert router.answer(plan, facts_response([])) is None
+
+
+def test_route_answers_from_the_facts_index(mock_client):
+  documents = [document('Chicago', 2022, 8901000, '0.27', doc_id='1'),
+               document('Miami', 2022, 6200000, '1.10', doc_id='2')]
+  assert facts.build_facts_index(mock_client, 'facts', documents, log=None) == {"facts": 2, "metros": 2}
+  router = facts.FactRouter(['Chicago', 'Miami'], index_name='facts')
+  assert router.route(mock_client, 'What was the population of Chicago in 2022?') == \
+    'The population of the Chicago metro area in 2022 was 8,901,000.'
+  assert router.route(mock_client, 'How many people moved to Chicago in 2022?') is None
@@ -0,0 +1,103 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import time
+
+import pytest
+
+import generation_batch
+import opensearch_client
+
+
+class FakeBatchModel:
+  '''
+  Completes each prompt with its upper-case, and records the batches.
+  '''
+
+  def __init__(self, fail=False, drop_one=False):
+    self.batches = []
+    self.fail = fail
+    self.drop_one = drop_one
+
+  async def __call__(self, prompts):
+    self.batches.append(list(prompts))
+    await asyncio.sleep(0)
+    if self.fail:
+      raise RuntimeError('The endpoint failed')
+    completions = [prompt.upper() for prompt in prompts]
+    return completions[1:] if self.drop_one else completions
+
+
+def generate_all(batcher, prompts):
+  async def run():
+    return await asyncio.gather(*[batcher.generate(prompt) for prompt in prompts],
+                                return_exceptions=True)
+  return asyncio.run(run())
+
+
+def test_full_batches_go_out_at_once_and_answers_keep_their_order():
+  model = FakeBatchModel()
+  batcher = generation_batch.GenerationBatcher(model, max_batch_size=3, max_wait_ms=10_000)
+  prompts = [f'prompt {i}' for i in range(6)]
+  assert generate_all(batcher, prompts) == [prompt.upper() for prompt in prompts]
+  assert model.batches == [prompts[:3], prompts[3:]]
+  assert batcher.stats() == {"batches": 2, "prompts": 6, "mean_batch_size": 3.0}
+
+
+def test_a_partial_batch_goes_out_after_max_wait_ms():
+  model = FakeBatchModel()
+  batcher = generation_batch.GenerationBatcher(model, max_batch_size=8, max_wait_ms=5)
+  assert generate_all(batcher, ['a', 'b']) == ['A', 'B']
+  assert model.batches == [['a', 'b']]
+
+
+def test_every_caller_in_a_failed_batch_gets_the_error():
+  batcher = generation_batch.GenerationBatcher(FakeBatchModel(fail=True), max_batch_size=2)
+  results = generate_all(batcher, ['a', 'b'])
+  assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_a_batch_with_missing_completions_fails():
+  batcher = generation_batch.GenerationBatcher(FakeBatchModel(drop_one=True), max_batch_size=2)
+  results = generate_all(batcher, ['a', 'b'])
+  assert all(isinstance(result, ValueError) for result in results)
+
+
+def register_batch_model(client, url):
+  action = generation_batch.connector_action(f'{url}/endpoints/mock-deepseek/invocations')
+  connector = client.transport.perform_request('POST', '/_plugins/_ml/connectors/_create', body={
+    "name": 'batch connector', "protocol": "aws_sigv4",
+    "parameters": {"do_sample": True, "top_p": 0.9, "temperature": 0.7, "max_new_tokens": 16},
+    "actions": [action]})
+  model_id = client.transport.perform_request(
+    'POST', '/_plugins/_ml/models/_register', params={"deploy": "true"},
+    body={"name": 'batch model', "function_name": "remote",
+          "connector_id": connector["connector_id"]})["model_id"]
+  while client.transport.perform_request('GET', f'/_plugins/_ml/models/{model_id}')["model_state"] != 'DEPLOYED':
+    time.sleep(0.01)
+  return model_id
+
+
+def test_model_generator_batches_through_the_connector(mock_client, mock_url):
+  model_id = register_batch_model(mock_client, mock_url)
+
+  async def run():
+    client = opensearch_client.create_async_client(mock_url)
+    try:
+      batcher = generation_batch.GenerationBatcher(generation_batch.model_generator(client, model_id),
+                                                   max_batch_size=3)
+      return await asyncio.gather(*[batcher.generate(f'prompt {i}') for i in range(3)]), batcher.stats()
+    finally:
+      await client.close()
+  completions, stats = asyncio.run(run())
+  assert [completion.startswith(f'prompt {i}') for i, completion in enumerate(completions)] == [True] * 3
+  assert stats["batches"] == 1
+
+
+@pytest.mark.parametrize('size', [0, 1])
+def test_no_prompts_no_batches(size):
+  model = FakeBatchModel()
+  batcher = generation_batch.GenerationBatcher(model, max_batch_size=2, max_wait_ms=1)
+  generate_all(batcher, ['a'] * size)
+  assert len(model.batches) == size
@@ -0,0 +1,195 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import time
+
+import pytest
+
+import generation_pool
+
+
+class FakeClock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class FakeEndpoint:
+  '''
+  Answers after delay seconds with its name and the prompt, or fails while
+  failing is set.
+  '''
+
+  def __init__(self, name, delay=0.0, failing=False):
+    self.name = name
+    self.delay = delay
+    self.failing = failing
+    self.calls = 0
+    self.cancelled = 0
+
+  async def __call__(self, prompt):
+    self.calls += 1
+    try:
+      await asyncio.sleep(self.delay)
+    except asyncio.CancelledError:
+      self.cancelled += 1
+      raise
+    if self.failing:
+      raise RuntimeError(f'{self.name} failed')
+    return f'{self.name}: {prompt}'
+
+
+def pool_of(*endpoints, **kwargs):
+  return generation_pool.GenerationPool({endpoint.name: endpoint for endpoint in endpoints}, **kwargs)
+
+
+def generate(pool, *prompts):
+  async def run():
+    return await asyncio.gather(*[pool.generate(prompt) for prompt in prompts])
+  return asyncio.run(run())
+
+
+def test_the_pool_needs_a_generator():
+  with pytest.raises(ValueError):
+    generation_pool.GenerationPool({})
+
+
+def test_choose_picks_the_shortest_expected_wait():
+  pool = pool_of(FakeEndpoint('slow'), FakeEndpoint('fast'))
+  slow, fast = pool.endpoints
+  slow.observe(1.0)
+  fast.observe(0.1)
+  assert pool.choose() is fast
+  # Ten requests in flight at 0.1s each are a longer wait than one at 1s.
+  fast.outstanding = 10
+  assert pool.choose() is slow
+  assert pool.choose(exclude=[slow]) is fast
+
+
+def test_concurrent_requests_spread_over_the_endpoints():
+  endpoints = [FakeEndpoint(name, delay=0.01) for name in 'abcd']
+  pool = pool_of(*endpoints, hedge_percentile=0)
+  generate(pool, *[f'q{i}' for i in range(4)])
+  assert [endpoint.calls for endpoint in endpoints] == [1, 1, 1, 1]
+
+
+def test_a_slow_request_is_hedged_and_the_hedge_wins():
+  slow, fast = FakeEndpoint('slow', delay=5.0), FakeEndpoint('fast', delay=0.01)
+  pool = pool_of(slow, fast, hedge_after_ms=20)
+  start = time.perf_counter()
+  assert generate(pool, 'q') == ['fast: q']
+  assert time.perf_counter() - start < 1.0
+  assert slow.cancelled == 1
+  stats = pool.stats()
+  assert (stats["hedges"], stats["hedge_wins"], stats["failovers"]) == (1, 1, 0)
+  assert stats["endpoints"]["fast"]["hedges"] == 1
+  assert pool.endpoints[0].outstanding == 0
+
+
+def test_a_hedge_that_loses_is_cancelled():
+  first, second = FakeEndpoint('first', delay=0.05), FakeEndpoint('second', delay=5.0)
+  pool = pool_of(first, second, hedge_after_ms=10)
+  assert generate(pool, 'q') == ['first: q']
+  assert second.cancelled == 1
+  assert (pool.hedges, pool.hedge_wins) == (1, 0)
+
+
+def test_no_hedge_without_a_delay_until_min_samples():
+  slow, fast = FakeEndpoint('slow', delay=0.05), FakeEndpoint('fast', delay=0.01)
+  pool = pool_of(slow, fast)
+  assert pool.hedge_delay() is None
+  assert generate(pool, 'q') == ['slow: q']
+  assert pool.hedges == 0
+
+
+def test_hedge_delay_is_the_percentile_after_min_samples():
+  pool = pool_of(FakeEndpoint('a'), FakeEndpoint('b'), hedge_after_ms=500, min_samples=10)
+  pool.latencies.extend([0.1] * 9)
+  assert pool.hedge_delay() == 0.5
+  # One slow request in a hundred is above the 95th percentile.
+  pool.latencies.extend([0.1] * 90 + [2.0])
+  assert pool.hedge_delay() == pytest.approx(0.1)
+  assert pool_of(FakeEndpoint('a'), hedge_after_ms=500).hedge_delay() is None
+  assert pool_of(FakeEndpoint('a'), FakeEndpoint('b'), hedge_percentile=0).hedge_delay() is None
+
+
+def test_a_failed_request_fails_over():
+  down, up = FakeEndpoint('down', failing=True), FakeEndpoint('up')
+  pool = pool_of(down, up)
+  assert generate(pool, 'q') == ['up: q']
+  assert (pool.failovers, pool.hedges) == (1, 0)
+  assert pool.stats()["endpoints"]["down"]["errors"] == 1
+
+
+def test_the_last_error_is_raised_when_every_request_fails():
+  pool = pool_of(FakeEndpoint('a', failing=True), FakeEndpoint('b', failing=True))
+  with pytest.raises(RuntimeError):
+    generate(pool, 'q')
+
+
+def test_a_second_request_prefers_an_endpoint_that_answered():
+  untried, proven = FakeEndpoint('untried'), FakeEndpoint('proven')
+  pool = pool_of(untried, proven)
+  first, second = pool.endpoints
+  second.observe(0.5)
+  second.answers = 1
+  assert pool.choose(exclude=[]) is first
+  assert pool.choose(exclude=[object()]) is second
+
+
+def test_failing_endpoints_are_ejected_and_tried_again_later():
+  clock = FakeClock()
+  down, up = FakeEndpoint('down', failing=True), FakeEndpoint('up')
+  pool = pool_of(down, up, max_failures=2, eject_s=10, max_eject_s=15, clock=clock)
+  generate(pool, 'q1')
+  generate(pool, 'q2')
+  assert down.calls == 2
+  assert pool.stats()["endpoints"]["down"]["ejected"]
+  generate(pool, 'q3', 'q4')
+  assert down.calls == 2
+
+  # After eject_s, it's tried again, and another failure ejects it for twice
+  # as long, up to max_eject_s.
+  clock.now = 10.0
+  generate(pool, 'q5')
+  assert down.calls == 3
+  assert pool.endpoints[0].ejected_until == 25.0
+  assert pool.endpoints[0].ejections == 2
+
+  # A success restores it.
+  clock.now = 25.0
+  down.failing = False
+  assert generate(pool, 'q6') == ['down: q6']
+  assert not pool.stats()["endpoints"]["down"]["ejected"]
+  assert (pool.endpoints[0].failures, pool.endpoints[0].eject_s) == (0, None)
+
+
+def test_a_first_request_goes_out_even_when_every_endpoint_is_ejected():
+  clock = FakeClock()
+  a, b = FakeEndpoint('a', failing=True), FakeEndpoint('b', failing=True)
+  pool = pool_of(a, b, max_failures=1, eject_s=10, clock=clock)
+  with pytest.raises(RuntimeError):
+    generate(pool, 'q1')
+  assert all(endpoint.ejected_until == 10.0 for endpoint in pool.endpoints)
+  a.failing = False
+  assert generate(pool, 'q2') == ['a: q2']
+  assert pool.failovers == 1
+
+
+def test_a_cancelled_request_only_raises_the_latency_estimate():
+  first, second = FakeEndpoint('first', delay=0.05), FakeEndpoint('second', delay=5.0)
+  pool = pool_of(first, second, hedge_after_ms=10)
+  pool.endpoints[1].latency_s = 1.0
+  generate(pool, 'q')
+  # Cancelled after about 40 ms, which says nothing against 1 second.
+  assert pool.endpoints[1].latency_s == 1.0
+  endpoint = generation_pool.Endpoint('e', None)
+  endpoint.observe_at_least(0.2)
+  assert endpoint.latency_s == 0.2
+  endpoint.observe_at_least(0.1)
+  assert endpoint.latency_s == 0.2
+  endpoint.observe_at_least(1.2)
+  assert endpoint.latency_s == pytest.approx(0.2 + generation_pool.LATENCY_SMOOTHING)
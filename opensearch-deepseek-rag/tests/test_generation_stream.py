@@ -0,0 +1,65 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import generation_stream
+
+
+def event(text, special=False):
+  return b'data:' + json.dumps({"token": {"text": text, "special": special}}).encode('utf-8') + b'\n\n'
+
+
+def test_parse_events_reassembles_events_split_across_chunks():
+  data = b': keep-alive\n' + event(' The') + event(' answer') + event('</s>', special=True)
+  chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+  assert list(generation_stream.parse_events(chunks)) == [' The', ' answer']
+
+
+def test_parse_events_reads_a_last_event_without_a_newline():
+  assert list(generation_stream.parse_events([event(' The').strip()])) == [' The']
+
+
+def test_stream_request_overrides_the_default_parameters():
+  request = generation_stream.stream_request('Q', {"max_new_tokens": 8})
+  assert request["stream"] is True
+  assert request["parameters"] == dict(generation_stream.DEFAULT_PARAMETERS, max_new_tokens=8)
+
+
+class FakeRuntime:
+  '''
+  Stands in for boto3's sagemaker-runtime client, and records the request.
+  '''
+
+  def __init__(self, payloads):
+    self.payloads = payloads
+    self.requests = []
+
+  def invoke_endpoint_with_response_stream(self, **request):
+    self.requests.append(request)
+    return {"Body": [{"PayloadPart": {"Bytes": payload}} for payload in self.payloads]}
+
+
+def test_sagemaker_streamer_takes_the_endpoint_name_from_the_url():
+  runtime = FakeRuntime([event(' The')[:9], event(' The')[9:] + event(' answer')])
+  url = 'https://runtime.sagemaker.us-west-2.amazonaws.com/endpoints/deepseek-r1/invocations'
+  streamer = generation_stream.SageMakerStreamer(url, 'us-west-2', sagemaker_runtime=runtime)
+  assert list(streamer.stream('Q')) == [' The', ' answer']
+  assert runtime.requests[0]["EndpointName"] == 'deepseek-r1'
+  assert json.loads(runtime.requests[0]["Body"])["inputs"] == 'Q'
+
+
+def test_http_streamer_streams_the_mock_answer(mock_url):
+  streamer = generation_stream.HttpStreamer(f'{mock_url}/endpoints/deepseek/invocations')
+  tokens = generation_stream.TimedStream(streamer.stream('Q', {"max_new_tokens": 4}))
+  assert ''.join(tokens) == 'Mock answer from deepseek.'
+  timings = tokens.timings()
+  assert timings["tokens"] == 4
+  assert 0 <= timings["time_to_first_token_ms"] <= timings["total_ms"]
+
+
+def test_timed_stream_has_no_timings_before_the_first_token():
+  tokens = generation_stream.TimedStream(iter([]))
+  assert tokens.timings() == {"time_to_first_token_ms": None, "total_ms": None, "tokens": 0}
+  assert list(tokens) == []
+  assert tokens.timings()["total_ms"] is not None
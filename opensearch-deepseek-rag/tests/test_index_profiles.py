@@ -0,0 +1,57 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+import bulk_loader
+import chunking
+import embedders
+import index_profiles
+import metadata_filters
+
+
+def test_get_profile_rejects_an_unknown_name():
+  with pytest.raises(ValueError, match='Unknown index profile hnsw_fp8'):
+    index_profiles.get_profile('hnsw_fp8')
+
+
+def test_build_mapping_uses_the_profile_and_settings():
+  mapping = index_profiles.build_mapping('hnsw_fp16', ef_search=50, shards=3, replicas=0, dimension=8)
+  assert mapping["settings"]["index"] == {"knn": True, "knn.algo_param.ef_search": 50,
+                                          "number_of_shards": 3, "number_of_replicas": 0}
+  properties = mapping["mappings"]["properties"]
+  assert properties["text_embedding"] == {"type": "knn_vector", "dimension": 8,
+                                          "method": index_profiles.PROFILES["hnsw_fp16"]["method"]}
+  assert set(chunking.CHUNK_PROPERTIES) | set(metadata_filters.METADATA_PROPERTIES) <= set(properties)
+
+
+def test_a_trained_profile_needs_its_model():
+  with pytest.raises(ValueError, match='needs a trained model'):
+    index_profiles.vector_field('ivf_pq')
+  assert index_profiles.vector_field('ivf_pq', model_id='pq') == {"type": "knn_vector", "model_id": 'pq'}
+
+
+def test_quantized_profiles_need_less_memory():
+  estimates = [index_profiles.estimate_memory_bytes(name, 1_000_000)
+               for name in ('hnsw', 'hnsw_fp16', 'hnsw_byte', 'ivf_pq')]
+  assert estimates == sorted(estimates, reverse=True)
+  assert estimates[0] == int(1.1 * (4 * 384 + 8 * 24) * 1_000_000)
+
+
+def test_shards_for_corpus_rounds_up_to_the_target_shard_size():
+  assert index_profiles.shards_for_corpus(1000) == 1
+  doc_count = 20_000_000
+  total_bytes = doc_count * 1024 + index_profiles.estimate_memory_bytes('hnsw', doc_count)
+  assert total_bytes > index_profiles.TARGET_SHARD_BYTES
+  assert index_profiles.shards_for_corpus(doc_count) == -(-total_bytes // index_profiles.TARGET_SHARD_BYTES)
+
+
+def test_train_model_waits_for_the_model(mock_client):
+  mock_client.indices.create(index='training', body=index_profiles.build_mapping())
+  documents = embedders.embed_documents(({"id": str(i), "text": f'Metro {i}'} for i in range(300)),
+                                        embedders.HashingEmbedder())
+  bulk_loader.bulk_load(mock_client, 'training', documents, log=None)
+  mock_client.indices.refresh(index='training')
+  assert index_profiles.train_model(mock_client, 'pq', 'training') == 'pq'
+  mock_client.indices.create(index='population', body=index_profiles.build_mapping('ivf_pq', model_id='pq'))
+  assert mock_client.indices.exists(index='population')
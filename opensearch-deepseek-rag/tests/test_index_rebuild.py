@@ -0,0 +1,74 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+import bulk_loader
+import index_rebuild
+
+
+def create_index(client, name, documents=0):
+  client.indices.create(index=name, body={"settings": {"index": {"refresh_interval": "30s"}}})
+  if documents:
+    client.bulk(body=''.join(bulk_loader.bulk_entry({"id": i, "text": f'Metro {i} population'}, name)
+                             for i in range(documents)))
+  client.indices.refresh(index=name)
+
+
+def test_alias_targets_tells_an_alias_from_an_index(mock_client):
+  assert index_rebuild.alias_targets(mock_client, 'population_data') == []
+  create_index(mock_client, 'population_data')
+  assert index_rebuild.alias_targets(mock_client, 'population_data') == ['population_data']
+  create_index(mock_client, 'kb_v1')
+  index_rebuild.swap_alias(mock_client, 'kb', 'kb_v1', [])
+  assert index_rebuild.alias_targets(mock_client, 'kb') == ['kb_v1']
+
+
+def test_disabling_refresh_through_an_alias_restores_the_index_setting(mock_client):
+  create_index(mock_client, 'kb_v1')
+  index_rebuild.swap_alias(mock_client, 'kb', 'kb_v1', [])
+  previous = bulk_loader.disable_refresh(mock_client, 'kb')
+  assert previous == '30s'
+  settings = mock_client.indices.get_settings(index='kb_v1', name='index.refresh_interval')
+  assert settings['kb_v1']['settings']['index']['refresh_interval'] == '-1'
+  bulk_loader.restore_refresh(mock_client, 'kb', previous)
+  settings = mock_client.indices.get_settings(index='kb_v1', name='index.refresh_interval')
+  assert settings['kb_v1']['settings']['index']['refresh_interval'] == '30s'
+
+
+def test_the_first_swap_keeps_the_concrete_index_without_an_opt_in(mock_client):
+  create_index(mock_client, 'population_data', documents=3)
+  create_index(mock_client, 'population_data_v1')
+  with pytest.raises(ValueError, match='is an index, not an alias'):
+    index_rebuild.swap_alias(mock_client, 'population_data', 'population_data_v1', ['population_data'])
+  assert mock_client.count(index='population_data')['count'] == 3
+  assert not mock_client.indices.exists_alias(name='population_data')
+
+
+def test_the_first_swap_replaces_the_concrete_index_when_asked(mock_client):
+  create_index(mock_client, 'population_data', documents=3)
+  create_index(mock_client, 'population_data_v1')
+  index_rebuild.swap_alias(mock_client, 'population_data', 'population_data_v1', ['population_data'],
+                           delete_index=True)
+  assert index_rebuild.alias_targets(mock_client, 'population_data') == ['population_data_v1']
+
+
+def test_a_swap_between_versions_keeps_the_old_index_for_a_rollback(mock_client):
+  create_index(mock_client, 'kb_v1', documents=2)
+  create_index(mock_client, 'kb_v2')
+  index_rebuild.swap_alias(mock_client, 'kb', 'kb_v1', [])
+  index_rebuild.swap_alias(mock_client, 'kb', 'kb_v2', ['kb_v1'])
+  assert index_rebuild.alias_targets(mock_client, 'kb') == ['kb_v2']
+  assert mock_client.count(index='kb_v1')['count'] == 2
+  index_rebuild.swap_alias(mock_client, 'kb', 'kb_v1', ['kb_v2'])
+  assert mock_client.count(index='kb')['count'] == 2
+
+
+def test_sliced_reindex_copies_every_document(mock_client):
+  create_index(mock_client, 'kb_v1', documents=7)
+  create_index(mock_client, 'kb_v2')
+  response = index_rebuild.sliced_reindex(mock_client, 'kb_v1', 'kb_v2', slices=2, batch_size=3,
+                                          poll_seconds=0.01, log=lambda message: None)
+  assert response['created'] == 7
+  mock_client.indices.refresh(index='kb_v2')
+  assert mock_client.count(index='kb_v2')['count'] == 7
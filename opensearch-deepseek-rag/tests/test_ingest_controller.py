@@ -0,0 +1,179 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+
+from opensearchpy.exceptions import ConnectionError, ConnectionTimeout, TransportError
+import pytest
+
+import ingest_controller
+
+
+REJECTED = {"type": "es_rejected_execution_exception", "reason": 'rejected execution'}
+MAPPING_ERROR = {"type": "mapper_parsing_exception", "reason": 'failed to parse'}
+
+
+class FakeBulkClient:
+  '''
+  Answers _bulk requests item by item. rejections maps a document id to the
+  times it's rejected before it's written, and broken ids always fail with
+  a mapping error. The first failed_requests requests raise, after writing
+  their documents, like a request that times out after the domain did the
+  work.
+  '''
+
+  def __init__(self, rejections=None, broken=(), throttled_requests=0, failed_requests=()):
+    self.rejections = dict(rejections or {})
+    self.broken = set(broken)
+    self.throttled_requests = throttled_requests
+    self.failed_requests = list(failed_requests)
+    self.requests = []
+    self.written = set()
+    self.writes = 0
+
+  def bulk(self, body, index, pipeline=None):
+    if self.throttled_requests:
+      self.throttled_requests -= 1
+      raise TransportError(429, 'Too Many Requests', {})
+    lines = body.splitlines()
+    ids = [json.loads(action)["index"].get("_id") for action in lines[::2]]
+    if self.failed_requests:
+      self.writes += len(ids)
+      raise self.failed_requests.pop(0)
+    self.requests.append(ids)
+    items = []
+    for doc_id in ids:
+      if doc_id in self.broken:
+        items.append({"index": {"_id": doc_id, "status": 400, "error": MAPPING_ERROR}})
+      elif self.rejections.get(doc_id):
+        self.rejections[doc_id] -= 1
+        items.append({"index": {"_id": doc_id, "status": 429, "error": REJECTED}})
+      else:
+        self.written.add(doc_id)
+        self.writes += 1
+        items.append({"index": {"_id": doc_id, "status": 201}})
+    return {"errors": any('error' in item["index"] for item in items), "items": items}
+
+
+def documents(count):
+  return ({"id": str(i), "text": f'Metro {i}'} for i in range(count))
+
+
+def load(client, count, **kwargs):
+  kwargs.setdefault('limits', ingest_controller.AIMDLimits(batch_docs=10, workers=2, min_batch_docs=1))
+  return ingest_controller.adaptive_bulk_load(client, 'population', documents(count),
+                                              retry_backoff=0.001, log=None, **kwargs)
+
+
+def test_limits_grow_additively_after_good_batches():
+  limits = ingest_controller.AIMDLimits(batch_docs=100, workers=2, batch_step=10, max_workers=3)
+  for _ in range(4):
+    limits.update(limits.epoch, 0.1, 100, 0)
+  assert limits.batch_docs == 140
+  assert limits.workers == 3
+  assert limits.snapshot()["increases"] == 4
+
+
+def test_limits_halve_after_rejections_or_a_slow_batch():
+  limits = ingest_controller.AIMDLimits(batch_docs=100, workers=8, target_batch_seconds=1.0)
+  limits.update(limits.epoch, 0.1, 100, 5)
+  assert (limits.batch_docs, limits.workers) == (50, 4)
+  limits.update(limits.epoch, 2.0, 50, 0)
+  assert (limits.batch_docs, limits.workers) == (25, 2)
+  assert limits.decreases == 2
+
+
+def test_limits_ignore_batches_sent_before_a_cut():
+  limits = ingest_controller.AIMDLimits(batch_docs=100, workers=8)
+  epoch = limits.epoch
+  limits.update(epoch, 0.1, 100, 50)
+  limits.update(epoch, 0.1, 100, 50)
+  assert (limits.batch_docs, limits.workers, limits.decreases) == (50, 4, 1)
+
+
+def test_rejections_below_the_threshold_dont_cut_the_limits():
+  limits = ingest_controller.AIMDLimits(batch_docs=1000, workers=4, rejection_threshold=0.01)
+  limits.update(limits.epoch, 0.1, 1000, 10)
+  assert limits.decreases == 0
+
+
+def test_rejected_items_are_retried_until_written():
+  client = FakeBulkClient(rejections={"3": 2, "7": 1})
+  totals = load(client, 20)
+  assert client.written == {str(i) for i in range(20)}
+  assert (totals["documents"], totals["errors"], totals["rejected"], totals["retried"]) == (20, 0, 3, 3)
+  assert "dead_letter_path" not in totals
+  # Only the rejected items are sent again.
+  assert sum(len(ids) for ids in client.requests) == 23
+
+
+def test_rejections_cut_the_batch_size():
+  client = FakeBulkClient(rejections={str(i): 1 for i in range(10)})
+  limits = ingest_controller.AIMDLimits(batch_docs=10, workers=1, min_batch_docs=1)
+  load(client, 30, limits=limits)
+  assert limits.decreases >= 1
+  assert len(client.requests[1]) == 5
+
+
+def test_a_throttled_request_rejects_all_of_its_items():
+  client = FakeBulkClient(throttled_requests=1)
+  totals = load(client, 10, limits=ingest_controller.AIMDLimits(batch_docs=10, workers=1, min_batch_docs=1))
+  assert client.written == {str(i) for i in range(10)}
+  assert (totals["rejected"], totals["retried"], totals["errors"]) == (10, 10, 0)
+
+
+def test_failed_items_are_counted_without_a_dead_letter_file(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  client = FakeBulkClient(rejections={"1": 10}, broken={"2"})
+  totals = load(client, 5, max_attempts=3)
+  assert totals["errors"] == 2
+  assert "dead_letter_path" not in totals
+  assert os.listdir(tmp_path) == []
+
+
+def test_failed_items_go_to_the_dead_letter_file(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  client = FakeBulkClient(rejections={"1": 10}, broken={"2"})
+  totals = load(client, 5, max_attempts=3, dead_letter_path='dead.jsonl')
+  assert totals["dead_letter_path"] == str(tmp_path / 'dead.jsonl')
+  with open(totals["dead_letter_path"], encoding='utf-8') as f:
+    letters = {letter["_id"]: letter for letter in map(json.loads, f)}
+  assert letters["1"]["attempts"] == 3
+  assert letters["1"]["error"] == REJECTED
+  assert letters["2"]["attempts"] == 1
+  assert letters["2"]["document"] == {"text": "Metro 2"}
+
+
+def test_other_request_errors_are_raised():
+  class BrokenClient:
+    def bulk(self, body, index, pipeline=None):
+      raise TransportError(400, 'illegal_argument_exception', {})
+  with pytest.raises(TransportError):
+    load(BrokenClient(), 5)
+
+
+@pytest.mark.parametrize('error', [ConnectionTimeout('TIMEOUT', 'Read timed out', None),
+                                   ConnectionError('N/A', 'Connection refused', None)])
+def test_a_request_that_times_out_is_retried_and_cuts_the_limits(error):
+  client = FakeBulkClient(failed_requests=[error])
+  limits = ingest_controller.AIMDLimits(batch_docs=10, workers=1, min_batch_docs=1)
+  totals = load(client, 20, limits=limits)
+  assert client.written == {str(i) for i in range(20)}
+  assert (totals["rejected"], totals["retried"], totals["errors"]) == (10, 10, 0)
+  assert limits.decreases == 1
+
+
+def test_a_document_without_an_id_isnt_sent_again_after_a_timeout(tmp_path):
+  client = FakeBulkClient(failed_requests=[ConnectionTimeout('TIMEOUT', 'Read timed out', None)])
+  documents = [{"text": f'Metro {i}'} for i in range(3)] + [{"id": '3', "text": 'Metro 3'}]
+  totals = ingest_controller.adaptive_bulk_load(
+    client, 'population', documents, retry_backoff=0.001, log=None,
+    dead_letter_path=str(tmp_path / 'dead.jsonl'),
+    limits=ingest_controller.AIMDLimits(batch_docs=10, workers=1, min_batch_docs=1))
+  assert (totals["rejected"], totals["retried"], totals["errors"]) == (4, 1, 3)
+  # The timed-out request wrote all four, and only the one with an id again.
+  assert client.writes == 5
+  with open(totals["dead_letter_path"], encoding='utf-8') as f:
+    letters = [json.loads(line) for line in f]
+  assert [letter["error"]["type"] for letter in letters] == ['request_timeout_without_id'] * 3
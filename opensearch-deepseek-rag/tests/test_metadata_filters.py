@@ -0,0 +1,58 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import metadata_filters
+
+
+METROS = ['Chicago', 'New York City', 'York', 'Ogden-Layton', 'Area 51']
+
+
+def test_extract_metadata_reads_the_metro_and_the_years():
+  text = ('Chart and table of population level and growth rate for the Ogden-Layton metro area '
+          'from 1950 to 2023. The metro area population of Ogden-Layton in 2023 was 700,000.')
+  assert metadata_filters.extract_metadata(text) == {"metro": 'Ogden-Layton', "year_from": 1950,
+                                                     "year_to": 2023}
+  assert metadata_filters.extract_metadata('The population of Miami in 2021 was 6,100,000.') == \
+    {"metro": 'Miami', "year_from": 2021, "year_to": 2021}
+  assert metadata_filters.extract_metadata('No numbers here.') == {}
+
+
+def test_with_metadata_keeps_the_documents_own_fields():
+  [document] = metadata_filters.with_metadata([{"text": 'The population of Miami in 2021.', "metro": 'MIA'}])
+  assert document == {"text": 'The population of Miami in 2021.', "metro": 'MIA',
+                      "year_from": 2021, "year_to": 2021}
+
+
+def test_filter_clause():
+  assert metadata_filters.filter_clause() is None
+  assert metadata_filters.filter_clause(metros=['Miami'], years=[2023, 2021]) == {"bool": {"filter": [
+    {"terms": {"metro": ['Miami']}},
+    {"range": {"year_from": {"lte": 2021}}},
+    {"range": {"year_to": {"gte": 2023}}}]}}
+
+
+def test_parser_finds_metros_in_order_and_the_longest_name_wins():
+  parser = metadata_filters.QuestionParser(METROS)
+  assert parser.parse('How does New York City compare with chicago, and with York, from 2021 to 2023?') == \
+    {"metros": ['New York City', 'Chicago', 'York'], "years": [2021, 2023]}
+
+
+def test_parser_matches_names_without_case_or_punctuation():
+  parser = metadata_filters.QuestionParser(METROS)
+  assert parser.parse('What about ogden layton in 2020?')["metros"] == ['Ogden-Layton']
+
+
+def test_a_number_in_a_metro_name_is_not_a_year():
+  parser = metadata_filters.QuestionParser(METROS)
+  assert parser.parse('How big was Area 51 in 2020?') == {"metros": ['Area 51'], "years": [2020]}
+
+
+def test_split_returns_the_remaining_words():
+  parser = metadata_filters.QuestionParser(METROS)
+  assert parser.split('Population of Chicago in 2022?') == (['Chicago'], [2022], ['population', 'of', 'in'])
+
+
+def test_filter_is_none_for_a_question_without_metros_or_years():
+  parser = metadata_filters.QuestionParser(METROS)
+  assert parser.filter('Which city grew fastest?') is None
+  assert parser.filter('Chicago in 2022') == metadata_filters.filter_clause(['Chicago'], [2022])
@@ -0,0 +1,92 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+from opensearchpy.exceptions import NotFoundError, RequestError
+import pytest
+
+import bulk_loader
+import embedders
+import index_profiles
+import mock_opensearch
+import opensearch_client
+import rag_query
+
+
+def load(client, index_name, documents, pipeline=None):
+  client.bulk(body=''.join(bulk_loader.bulk_entry(document, index_name) for document in documents),
+              pipeline=pipeline)
+  client.indices.refresh(index=index_name)
+
+
+def vector_index(client, space_type):
+  client.indices.create(index='points', body={
+    "settings": {"index": {"knn": True}},
+    "mappings": {"properties": {"v": {"type": "knn_vector", "dimension": 2,
+                                      "method": {"name": "hnsw", "engine": "faiss",
+                                                 "space_type": space_type}},
+                                "side": {"type": "keyword"}}}})
+  load(client, 'points', [{"id": 'near', "v": [1.0, 0.0], "side": 'right'},
+                          {"id": 'far', "v": [3.0, 0.0], "side": 'right'},
+                          {"id": 'left', "v": [-2.0, 0.0], "side": 'left'}])
+
+
+def test_knn_ranks_exactly_and_scores_like_faiss(mock_client):
+  vector_index(mock_client, 'l2')
+  resp = mock_client.search(index='points', body={"query": {"knn": {"v": {"vector": [0.0, 0.0], "k": 3}}}})
+  # l2 scores are 1 / (1 + squared distance), in float32.
+  assert [hit['_id'] for hit in resp['hits']['hits']] == ['near', 'left', 'far']
+  assert [hit['_score'] for hit in resp['hits']['hits']] == pytest.approx([0.5, 0.2, 0.1], rel=1e-6)
+
+
+def test_a_knn_filter_limits_the_candidates(mock_client):
+  vector_index(mock_client, 'l2')
+  resp = mock_client.search(index='points', body={"query": {"knn": {"v": {
+    "vector": [-1.0, 0.0], "k": 2, "filter": {"term": {"side": 'right'}}}}}})
+  assert [hit['_id'] for hit in resp['hits']['hits']] == ['near', 'far']
+
+
+def test_the_ingest_pipeline_and_the_neural_query_embed_alike(mock_client):
+  mock_client.ingest.put_pipeline(id='embedding_pipeline', body={
+    "processors": [{"text_embedding": {"model_id": 'mock-embedding',
+                                       "field_map": {"text": "text_embedding"}}}]})
+  mock_client.indices.create(index='population_data', body=index_profiles.build_mapping())
+  texts = [f'Metro {i} population grew' for i in range(5)]
+  load(mock_client, 'population_data', [{"id": str(i), "text": text} for i, text in enumerate(texts)],
+       pipeline='embedding_pipeline')
+  stored = mock_client.get(index='population_data', id='2')['_source']['text_embedding']
+  assert stored == pytest.approx(embedders.HashingEmbedder().embed([texts[2]])[0].tolist(), rel=1e-6)
+  neural = mock_client.search(index='population_data', body={
+    "query": rag_query.neural_clause(texts[2], 'mock-embedding', k=3)})
+  vector = embedders.HashingEmbedder().embed([texts[2]])[0].tolist()
+  knn = mock_client.search(index='population_data', body={"query": rag_query.knn_clause(vector, k=3)})
+  assert neural['hits']['hits'][0]['_id'] == '2'
+  assert [(hit['_id'], hit['_score']) for hit in neural['hits']['hits']] == \
+    [(hit['_id'], hit['_score']) for hit in knn['hits']['hits']]
+
+
+def test_a_busy_mock_rejects_bulk_items_like_a_full_write_queue():
+  server, url = mock_opensearch.start_mock_server(mock_opensearch.MockLatency(bulk_ms=0, bulk_reject_rate=1.0))
+  try:
+    client = opensearch_client.create_client(url)
+    client.indices.create(index='population')
+    resp = client.bulk(body=bulk_loader.bulk_entry({"id": 1, "text": 'Miami'}, 'population'))
+    item = resp['items'][0]['index']
+    assert resp['errors']
+    assert (item['status'], item['error']['type']) == (429, 'es_rejected_execution_exception')
+  finally:
+    server.shutdown()
+
+
+def test_an_alias_cant_take_the_name_of_an_index(mock_client):
+  mock_client.indices.create(index='population_data')
+  mock_client.indices.create(index='population_data_v1')
+  with pytest.raises(RequestError, match='invalid_alias_name_exception'):
+    mock_client.indices.update_aliases(body={"actions": [
+      {"add": {"index": 'population_data_v1', "alias": 'population_data'}}]})
+  assert not mock_client.indices.exists_alias(name='population_data')
+
+
+def test_an_unsupported_call_is_a_404(mock_client):
+  with pytest.raises(NotFoundError) as error:
+    mock_client.transport.perform_request('POST', '/_plugins/_unknown')
+  assert error.value.info['error']['type'] == 'mock_unsupported'
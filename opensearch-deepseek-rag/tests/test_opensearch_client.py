@@ -0,0 +1,129 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import threading
+
+import pytest
+import requests
+
+from opensearchpy.exceptions import TransportError
+
+import opensearch_client
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+  '''
+  Answers each request with the next status in the server's script, and 200
+  once the script runs out. A status of None closes the connection without
+  a response.
+  '''
+
+  def _answer(self):
+    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    with self.server.lock:
+      self.server.requests.append((self.command, self.path, body))
+      status = self.server.script.pop(0) if self.server.script else 200
+    if status is None:
+      self.close_connection = True
+      return
+    payload = json.dumps({"status": status}).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(payload)))
+    self.end_headers()
+    self.wfile.write(payload)
+
+  do_GET = do_POST = do_PUT = _answer
+
+  def log_message(self, format, *args):
+    pass
+
+
+@pytest.fixture
+def scripted():
+  server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+  server.lock = threading.Lock()
+  server.requests, server.script = [], []
+  threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+  server.url = f'http://127.0.0.1:{server.server_address[1]}'
+  yield server
+  server.shutdown()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+  monkeypatch.setattr(opensearch_client, 'backoff_delay', lambda attempt, base=0: 0)
+  monkeypatch.setattr(opensearch_client, 'retry_backoff', 0)
+
+
+@pytest.mark.parametrize('endpoint, url', [
+  ('search-domain.us-west-2.es.amazonaws.com', 'https://search-domain.us-west-2.es.amazonaws.com:443'),
+  ('https://localhost:9200/', 'https://localhost:9200'),
+  ('http://localhost', 'http://localhost:80'),
+])
+def test_endpoint_url_adds_the_scheme_and_port(endpoint, url):
+  assert opensearch_client.endpoint_url(endpoint) == url
+
+
+def test_backoff_delay_is_capped():
+  for attempt in range(20):
+    assert 0 <= opensearch_client.backoff_delay(attempt) <= opensearch_client.MAX_RETRY_BACKOFF
+
+
+def test_client_retries_throttled_requests(scripted, no_backoff):
+  scripted.script = [429, 503]
+  opensearch_client.metrics.reset()
+  client = opensearch_client.create_client(scripted.url)
+  assert client.transport.perform_request('POST', '/_bulk', body={}) == {"status": 200}
+  assert len(scripted.requests) == 3
+  counts = opensearch_client.metrics.snapshot()
+  assert (counts["requests"], counts["retries"], counts["throttled"]) == (3, 2, 1)
+
+
+def test_client_without_throttle_retries_raises_the_429(scripted, no_backoff):
+  scripted.script = [429]
+  client = opensearch_client.create_client(scripted.url, throttle_retries=0)
+  with pytest.raises(TransportError) as raised:
+    client.transport.perform_request('POST', '/_bulk', body={})
+  assert raised.value.status_code == 429
+  assert len(scripted.requests) == 1
+
+
+def test_client_doesnt_send_a_request_again_after_a_gateway_timeout(scripted, no_backoff):
+  scripted.script = [504]
+  client = opensearch_client.create_client(scripted.url)
+  with pytest.raises(TransportError) as raised:
+    client.transport.perform_request('POST', '/_plugins/_ml/models/m/_predict', body={})
+  assert raised.value.status_code == 504
+  assert len(scripted.requests) == 1
+
+
+def test_async_client_retries_throttled_requests(scripted, no_backoff):
+  scripted.script = [429]
+
+  async def run():
+    client = opensearch_client.create_async_client(scripted.url)
+    try:
+      return await client.transport.perform_request('GET', '/')
+    finally:
+      await client.close()
+  assert asyncio.run(run()) == {"status": 200}
+  assert len(scripted.requests) == 2
+
+
+def test_session_retries_throttled_posts(scripted, no_backoff):
+  scripted.script = [429, 503]
+  session = opensearch_client.create_session()
+  assert session.post(f'{scripted.url}/_plugins/_ml/connectors/_create', json={}).status_code == 200
+  assert len(scripted.requests) == 3
+
+
+def test_session_doesnt_send_a_post_again_after_a_read_error(scripted, no_backoff):
+  scripted.script = [None]
+  session = opensearch_client.create_session()
+  with pytest.raises(requests.ConnectionError):
+    session.post(f'{scripted.url}/_plugins/_ml/connectors/_create', json={})
+  assert len(scripted.requests) == 1
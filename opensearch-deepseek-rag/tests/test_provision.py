@@ -0,0 +1,111 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+
+import pytest
+
+import aws_credentials
+import provision
+import rag_query
+
+
+def recording_step(name, order, requires=(), outputs=None, status=provision.CREATED):
+  def run(context):
+    order.append((name, dict(context)))
+    return dict(outputs or {}), status
+  return provision.Step(name, run, requires=requires)
+
+
+def test_steps_run_after_the_steps_they_require_and_see_their_outputs():
+  order = []
+  steps = [recording_step('model', order, requires=['connector'], outputs={"model_id": 'm'}),
+           recording_step('connector', order, requires=['role', 'mapping'], outputs={"connector_id": 'c'}),
+           recording_step('role', order, outputs={"role_arn": 'arn'}),
+           recording_step('mapping', order, status=provision.EXISTS)]
+  context = {"region": 'us-west-2'}
+  results = provision.run_steps(steps, context, log=None)
+  names = [name for name, _ in order]
+  assert set(names[:2]) == {'role', 'mapping'}
+  assert names[2:] == ['connector', 'model']
+  assert dict(order)['connector'] == {"region": 'us-west-2', "role_arn": 'arn'}
+  assert context == {"region": 'us-west-2', "role_arn": 'arn', "connector_id": 'c', "model_id": 'm'}
+  assert results['mapping']["status"] == provision.EXISTS
+  assert results['model']["status"] == provision.CREATED
+
+
+def test_independent_steps_run_at_the_same_time():
+  barrier = threading.Barrier(2, timeout=5)
+  def run(context):
+    barrier.wait()
+    return {}, provision.CREATED
+  provision.run_steps([provision.Step('a', run), provision.Step('b', run)], {}, max_workers=2, log=None)
+
+
+def test_an_unknown_requirement_is_an_error():
+  with pytest.raises(ValueError, match='unknown'):
+    provision.run_steps([recording_step('model', [], requires=['connector'])], {}, log=None)
+
+
+def test_a_cycle_is_an_error():
+  order = []
+  steps = [recording_step('role', order),
+           recording_step('connector', order, requires=['model']),
+           recording_step('model', order, requires=['connector'])]
+  with pytest.raises(ValueError, match='require each other'):
+    provision.run_steps(steps, {}, log=None)
+  assert [name for name, _ in order] == ['role']
+
+
+def test_a_failing_step_is_retried_up_to_its_attempts():
+  calls = []
+  def flaky(context):
+    calls.append(1)
+    if len(calls) < 3:
+      raise RuntimeError('throttled')
+    return {"done": True}, provision.CREATED
+  context = {}
+  provision.run_steps([provision.Step('flaky', flaky, attempts=3)], context, retry_backoff=0, log=None)
+  assert len(calls) == 3
+  assert context == {"done": True}
+
+
+def test_a_step_that_fails_for_good_stops_the_steps_after_it():
+  order = []
+  def broken(context):
+    raise RuntimeError('access denied')
+  steps = [provision.Step('role', broken, attempts=2),
+           recording_step('connector', order, requires=['role'])]
+  with pytest.raises(Exception, match='Step role failed: access denied'):
+    provision.run_steps(steps, {}, retry_backoff=0, log=None)
+  assert order == []
+
+
+@pytest.fixture
+def mock_context(mock_url, monkeypatch):
+  sts = aws_credentials.LocalSTS()
+  monkeypatch.setattr(aws_credentials.boto3, 'client', lambda service, **kwargs: sts)
+  return {"OPENSEARCH_SERVICE_DOMAIN_ENDPOINT": mock_url,
+          "OPENSEARCH_SERVICE_ADMIN_USER": 'admin',
+          "OPENSEARCH_SERVICE_ADMIN_PASSWORD": 'admin',
+          "DEEPSEEK_AWS_REGION": 'us-west-2',
+          "SAGEMAKER_MODEL_INFERENCE_ENDPOINT": f'{mock_url}/endpoints/mock-deepseek/invocations',
+          "INVOKE_DEEPSEEK_ROLE": 'arn:aws:iam::123456789012:role/invoke_deepseek_role',
+          "CREATE_DEEPSEEK_CONNECTOR_ROLE": 'arn:aws:iam::123456789012:role/create_deepseek_connector_role'}
+
+
+def test_the_connector_and_model_steps_create_a_working_model_once(mock_context):
+  timers = {thread for thread in threading.enumerate() if isinstance(thread, threading.Timer)}
+  steps = [provision.Step('connector', provision.connector_step()),
+           provision.Step('model', provision.model_step(), requires=('connector',))]
+  context = dict(mock_context)
+  results = provision.run_steps(steps, context, log=None)
+  assert [result["status"] for result in results.values()] == [provision.CREATED] * 2
+  # The credentials signed one request, and left no refresh timer behind.
+  assert {thread for thread in threading.enumerate() if isinstance(thread, threading.Timer)} == timers
+  client = provision.admin_client(context)
+  resp = client.transport.perform_request('POST', rag_query.predict_path(context['DEEPSEEK_MODEL_ID']),
+                                          body=rag_query.predict_request('Q'))
+  assert rag_query.answer_from_prediction(resp).endswith('Mock answer from mock-deepseek.')
+  again = provision.run_steps(steps, dict(mock_context), log=None)
+  assert [result["status"] for result in again.values()] == [provision.EXISTS] * 2
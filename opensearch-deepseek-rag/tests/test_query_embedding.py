@@ -0,0 +1,76 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+
+import numpy as np
+import pytest
+
+import embedders
+import embedding_cache
+import opensearch_client
+import query_embedding
+
+
+class RecordingEmbedder:
+  '''
+  A hashing embedder, as a coroutine function, that records each batch.
+  '''
+
+  def __init__(self):
+    self.batches = []
+    self._embed = query_embedding.local_embedder(embedders.HashingEmbedder())
+
+  async def __call__(self, texts):
+    self.batches.append(list(texts))
+    return await self._embed(texts)
+
+
+def test_concurrent_questions_share_one_call():
+  questions = [f'What is the population of metro {i}?' for i in range(5)]
+  embed_batch = RecordingEmbedder()
+
+  async def main():
+    embedder = query_embedding.QueryEmbedder(embed_batch, 'hashing', max_wait_ms=50)
+    return embedder, await asyncio.gather(*(embedder.embed(question) for question in questions))
+  embedder, vectors = asyncio.run(main())
+  assert embed_batch.batches == [questions]
+  np.testing.assert_allclose(vectors, embedders.HashingEmbedder().embed(questions), rtol=1e-6)
+  assert embedder.stats() == {"calls": 1, "questions": 5, "mean_batch_size": 5.0}
+
+
+def test_a_cached_question_skips_the_embedder(tmp_path):
+  embed_batch = RecordingEmbedder()
+  cache = embedding_cache.EmbeddingCache(str(tmp_path), max_bytes=1 << 20)
+
+  async def main():
+    embedder = query_embedding.QueryEmbedder(embed_batch, embedders.HashingEmbedder.model_id, cache,
+                                             max_wait_ms=0)
+    first = await embedder.embed('Chicago population')
+    second = await embedder.embed(' Chicago  population')
+    return embedder, first, second
+  embedder, first, second = asyncio.run(main())
+  assert len(embed_batch.batches) == 1
+  np.testing.assert_allclose(first, second, rtol=1e-6)
+  assert embedder.stats()["cache"]["hits"] == 1
+
+
+def test_the_model_embedder_gets_the_vectors_from_the_model(mock_url):
+  questions = ['Chicago population', 'Miami population']
+
+  async def main():
+    client = opensearch_client.create_async_client(mock_url)
+    try:
+      embedder = query_embedding.create_query_embedder('model', client, 'mock-embedding', max_wait_ms=20)
+      return await asyncio.gather(*(embedder.embed(question) for question in questions))
+    finally:
+      await client.close()
+  vectors = asyncio.run(main())
+  np.testing.assert_allclose(vectors, embedders.HashingEmbedder().embed(questions), rtol=1e-6)
+
+
+def test_an_unknown_embedder_is_an_error():
+  assert query_embedding.create_query_embedder('hashing', None, None).model_id == \
+    embedders.HashingEmbedder.model_id
+  with pytest.raises(ValueError, match='Unknown embedder'):
+    query_embedding.create_query_embedder('bert', None, None)
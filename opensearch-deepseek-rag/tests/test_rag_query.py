@@ -0,0 +1,67 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+import bulk_loader
+import embedders
+import index_profiles
+import rag_query
+
+
+@pytest.fixture
+def population_client(mock_client):
+  '''
+  The mock, with an index of synthetic metro areas, and the hybrid
+  pipelines.
+  '''
+  mock_client.indices.create(index='population', body=index_profiles.build_mapping())
+  documents = ({"id": str(i),
+                "text": f'The metro area population of Metro {i} in 2023 is {500_000 + 1_000 * i:,}.'}
+               for i in range(50))
+  bulk_loader.bulk_load(mock_client, 'population',
+                        embedders.embed_documents(documents, embedders.HashingEmbedder()), log=None)
+  mock_client.indices.refresh(index='population')
+  mock_client.search_pipeline.put(id=rag_query.HYBRID_PIPELINE_ID,
+                                  body=rag_query.hybrid_pipeline_definition())
+  mock_client.search_pipeline.put(id=rag_query.HYBRID_RAG_PIPELINE_ID,
+                                  body=rag_query.search_pipeline_definition('mock-deepseek',
+                                                                            hybrid_weights=(0.5, 0.5)))
+  return mock_client
+
+
+def test_hybrid_clause_filters_the_match_query_too():
+  vector_clause = rag_query.neural_clause('Chicago', 'm', filter={"term": {"metro": "Chicago"}})
+  clause = rag_query.hybrid_clause('Chicago', vector_clause, filter={"term": {"metro": "Chicago"}})
+  match, vector = clause["hybrid"]["queries"]
+  assert match == {"bool": {"must": {"match": {"text": {"query": 'Chicago'}}},
+                            "filter": {"term": {"metro": "Chicago"}}}}
+  assert vector is vector_clause
+  assert rag_query.hybrid_clause('Chicago', vector_clause)["hybrid"]["queries"][0] == \
+    {"match": {"text": {"query": 'Chicago'}}}
+
+
+def test_only_the_hybrid_pipeline_normalizes_scores():
+  assert 'phase_results_processors' not in rag_query.search_pipeline_definition('m')
+  pipeline = rag_query.search_pipeline_definition('m', hybrid_weights=['0.2', '0.8'])
+  [processor] = pipeline["phase_results_processors"]
+  assert processor["normalization-processor"]["combination"]["parameters"]["weights"] == [0.2, 0.8]
+  assert pipeline["response_processors"] == rag_query.search_pipeline_definition('m')["response_processors"]
+
+
+def test_hybrid_retrieval_ranks_the_exact_metro_first(population_client):
+  question = 'What is the population of Metro 17 in 2023?'
+  clause = rag_query.hybrid_clause(question, rag_query.neural_clause(question, 'mock-embedding', k=10))
+  resp = population_client.search(body={"query": clause, "size": 3}, index='population',
+                                  search_pipeline=rag_query.HYBRID_PIPELINE_ID)
+  assert rag_query.hit_ids(resp)[0] == '17'
+  assert all(0.0 <= hit["_score"] <= 1.0 for hit in resp["hits"]["hits"])
+
+
+def test_hybrid_rag_query_answers_from_the_combined_ranking(population_client):
+  question = 'What is the population of Metro 17 in 2023?'
+  clause = rag_query.hybrid_clause(question, rag_query.neural_clause(question, 'mock-embedding', k=10))
+  resp = population_client.search(body=rag_query.build_rag_query(question, clause), index='population',
+                                  search_pipeline=rag_query.HYBRID_RAG_PIPELINE_ID)
+  assert rag_query.answer_from_response(resp)
+  assert rag_query.hit_ids(resp)[0] == '17'
@@ -0,0 +1,73 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import chunking
+import sync_manifest
+
+
+FINGERPRINT = {"index": "population", "embedding_model_id": "m"}
+
+
+def documents(*texts):
+  return [{"id": str(i), "text": text} for i, text in enumerate(texts)]
+
+
+def load(path, docs, fingerprint=FINGERPRINT, split=None, commit=True):
+  '''
+  Runs a sync the way load_data.py does. Returns the ids written, the ids to
+  delete, and the manifest.
+  '''
+  manifest = sync_manifest.SyncManifest(path, fingerprint)
+  written = [document["_id"] for document in manifest.changed(iter(docs), split)]
+  stale = manifest.stale_ids()
+  if commit:
+    manifest.commit()
+  return written, stale, manifest
+
+
+def test_a_second_load_writes_only_what_changed(tmp_path):
+  path = str(tmp_path / 'manifest.json')
+  written, stale, _ = load(path, documents('Chicago', 'Miami', 'Austin'))
+  assert (written, stale) == (['0', '1', '2'], [])
+  written, stale, manifest = load(path, documents('Chicago', 'Miami, Florida'))
+  assert written == ['1']
+  assert stale == ['2']
+  assert manifest.unchanged == 1
+  assert len(manifest) == 2
+
+
+def test_an_uncommitted_load_is_sent_again(tmp_path):
+  path = str(tmp_path / 'manifest.json')
+  load(path, documents('Chicago'), commit=False)
+  written, _, _ = load(path, documents('Chicago'))
+  assert written == ['0']
+  assert load(path, documents('Chicago'))[0] == []
+
+
+def test_new_settings_rewrite_every_document(tmp_path):
+  path = str(tmp_path / 'manifest.json')
+  load(path, documents('Chicago', 'Miami'))
+  written, _, _ = load(path, documents('Chicago', 'Miami'), dict(FINGERPRINT, embedding_model_id='other'))
+  assert written == ['0', '1']
+
+
+def test_a_document_that_splits_into_fewer_passages_deletes_the_rest(tmp_path):
+  path = str(tmp_path / 'manifest.json')
+
+  def split(document):
+    return [dict(document, _id=f'{document["_id"]}{chunking.CHUNK_ID_SEPARATOR}{i}')
+            for i in range(len(document["text"].split()))]
+  written, _, _ = load(path, documents('one two three'), split=split)
+  assert written == sync_manifest.written_ids('0', 3)
+  written, stale, _ = load(path, documents('one'), split=split)
+  assert written == sync_manifest.written_ids('0', 1)
+  assert stale == sync_manifest.written_ids('0', 3)[1:]
+
+
+def test_documents_without_an_id_get_one_from_their_text(tmp_path):
+  path = str(tmp_path / 'manifest.json')
+  written, _, _ = load(path, [{"text": 'Chicago'}])
+  assert written == [chunking.parent_id({"text": 'Chicago'})]
+  written, stale, _ = load(path, [{"text": 'Chicago, Illinois'}])
+  assert stale == [chunking.parent_id({"text": 'Chicago'})]
+  assert written != stale
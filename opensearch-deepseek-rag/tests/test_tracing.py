@@ -0,0 +1,95 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+  return tmp_path / 'trace.jsonl'
+
+
+def read_spans(path):
+  with open(path, encoding='utf-8') as f:
+    return {span["name"]: span for span in map(json.loads, f)}
+
+
+def test_nested_spans_share_a_trace_and_link_their_parents(trace_file):
+  tracer = tracing.Tracer(str(trace_file))
+  with tracer.start_span('rag.query', question='Q') as root:
+    with tracer.start_span('retrieval') as child:
+      assert tracer.current() is child
+    assert tracer.current() is root
+  assert tracer.current() is None
+  spans = read_spans(trace_file)
+  assert spans["retrieval"]["trace_id"] == spans["rag.query"]["trace_id"]
+  assert spans["retrieval"]["parent_span_id"] == spans["rag.query"]["span_id"]
+  assert spans["rag.query"]["parent_span_id"] is None
+  assert spans["rag.query"]["attributes"] == {"question": 'Q'}
+  assert spans["rag.query"]["status"] == {"code": "OK"}
+
+
+def test_a_span_records_the_error_that_ended_it(trace_file):
+  tracer = tracing.Tracer(str(trace_file))
+  with pytest.raises(RuntimeError):
+    with tracer.start_span('generation'):
+      raise RuntimeError('The endpoint timed out')
+  assert read_spans(trace_file)["generation"]["status"] == {"code": "ERROR",
+                                                            "message": 'The endpoint timed out'}
+
+
+def test_a_disabled_tracer_writes_nothing():
+  tracer = tracing.Tracer()
+  with tracer.start_span('rag.query') as span:
+    span.set(hits=3)
+  assert not tracer.enabled
+  assert span.end_ns is not None
+
+
+def profiled_response(took_ms, shards):
+  return {"took": took_ms,
+          "profile": {"shards": [{"searches": [{"query": [{"type": 'KNNQuery', "time_in_nanos": query_ns}],
+                                                "rewrite_time": rewrite_ns,
+                                                "collector": [{"time_in_nanos": collector_ns}]}]}
+                                 for query_ns, rewrite_ns, collector_ns in shards]}}
+
+
+def test_end_search_span_derives_the_stages_from_the_slowest_shard(trace_file):
+  tracer = tracing.Tracer(str(trace_file))
+  span = tracer.start_span('search')
+  # The second shard is the slowest, at 40 ms of the 100 ms took.
+  resp = profiled_response(100, [(10_000_000, 0, 0), (30_000_000, 5_000_000, 5_000_000)])
+  stages = tracing.end_search_span(span, resp)
+  assert stages["took"] == 100.0
+  assert (stages["shard_query"], stages["shard_rewrite"], stages["shard_collect"]) == (30.0, 5.0, 5.0)
+  assert stages["coordinator"] == 60.0
+  spans = read_spans(trace_file)
+  assert spans["shard.query"]["attributes"]["query_types"] == ['KNNQuery']
+  assert spans["coordinator"]["parent_span_id"] == spans["opensearch.took"]["span_id"]
+  # The phases run end to end, and the collector ends with took.
+  assert spans["coordinator"]["end_time_unix_nano"] == spans["shard.rewrite"]["start_time_unix_nano"]
+  assert spans["shard.query"]["end_time_unix_nano"] == spans["shard.collect"]["start_time_unix_nano"]
+  assert spans["shard.collect"]["end_time_unix_nano"] == spans["opensearch.took"]["end_time_unix_nano"]
+  assert "generation" not in spans
+
+
+def test_end_search_span_gives_generation_the_time_after_took(trace_file):
+  tracer = tracing.Tracer(str(trace_file))
+  span = tracing.Span(tracer, 'search', start_ns=tracing._now_ns() - 500_000_000)
+  stages = tracing.end_search_span(span, {"took": 100}, generation=True)
+  assert 'coordinator' not in stages
+  assert stages["generation"] == pytest.approx(stages["wall"] - 100.0, abs=0.2)
+  assert read_spans(trace_file)["generation"]["attributes"]["derived"] == 'client wall clock minus took'
+
+
+def test_end_bulk_span_puts_the_ingest_pipeline_before_indexing(trace_file):
+  tracer = tracing.Tracer(str(trace_file))
+  tracing.end_bulk_span(tracer.start_span('bulk'), {"took": 30, "ingest_took": 200})
+  spans = read_spans(trace_file)
+  assert spans["bulk.ingest_pipeline"]["duration_ms"] == 200.0
+  assert spans["bulk.index"]["duration_ms"] == 30.0
+  assert spans["bulk.ingest_pipeline"]["end_time_unix_nano"] == spans["bulk.index"]["start_time_unix_nano"]
@@ -0,0 +1,91 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import numpy as np
+import pytest
+
+import bulk_loader
+import embedders
+import vector_snapshot
+
+
+def embedded_documents(count):
+  texts = [f'Metro {i} population' for i in range(count)]
+  vectors = embedders.HashingEmbedder().embed(texts)
+  return [{"id": str(i), "text": text, "text_embedding": vector.tolist()}
+          for i, (text, vector) in enumerate(zip(texts, vectors))]
+
+
+def test_a_snapshot_reads_back_every_document_and_vector(mock_client, tmp_path):
+  documents = embedded_documents(11)
+  mock_client.indices.create(index='population_data')
+  mock_client.bulk(body=''.join(bulk_loader.bulk_entry(document, 'population_data') for document in documents))
+  mock_client.bulk(body=bulk_loader.bulk_entry({"id": 'no-vector', "text": 'Miami'}, 'population_data'))
+  mock_client.indices.refresh(index='population_data')
+  prefix = str(tmp_path / 'population')
+  totals = vector_snapshot.export_snapshot(mock_client, 'population_data', prefix, slices=3, batch_size=2,
+                                           embedding_model_id='m', log=None)
+  assert totals["documents"] == 11
+  assert vector_snapshot.read_manifest(prefix)["embedding_model_id"] == 'm'
+  restored = {document["_id"]: document for document in vector_snapshot.read_snapshot(prefix)}
+  assert sorted(restored) == sorted(document["id"] for document in documents)
+  for document in documents:
+    assert restored[document["id"]]["text"] == document["text"]
+    np.testing.assert_array_equal(np.float32(restored[document["id"]]["text_embedding"]),
+                                  np.float32(document["text_embedding"]))
+
+
+class OneSliceClient:
+  '''
+  Answers the snapshot's scroll with hits, in pages of page_size, and reports
+  total documents, which can be less than there are, like a total that's
+  only a lower bound. Records the search bodies.
+  '''
+
+  def __init__(self, hits, total, page_size):
+    self.pages = [hits[i:i + page_size] for i in range(0, len(hits), page_size)] + [[]]
+    self.total = total
+    self.bodies = []
+
+  def search(self, index, body, scroll):
+    self.bodies.append(body)
+    return self._page()
+
+  def scroll(self, body):
+    return self._page()
+
+  def clear_scroll(self, body, ignore):
+    pass
+
+  def _page(self):
+    return {"_scroll_id": 's', "hits": {"total": {"value": self.total, "relation": "gte"},
+                                        "hits": self.pages.pop(0)}}
+
+
+def test_the_export_asks_for_the_exact_total_and_checks_it(tmp_path):
+  hits = [{"_id": document["id"], "_source": {"text": document["text"],
+                                              "text_embedding": document["text_embedding"]}}
+          for document in embedded_documents(5)]
+  client = OneSliceClient(hits, total=4, page_size=2)
+  with pytest.raises(Exception, match='more than the 4 documents'):
+    vector_snapshot.export_snapshot(client, 'population_data', str(tmp_path / 's'), slices=1, log=None)
+  assert client.bodies[0]["track_total_hits"] is True
+
+
+def test_reading_a_snapshot_checks_the_dimension_and_the_format(tmp_path):
+  prefix = str(tmp_path / 's')
+  vectors_path, sidecar_path, manifest_path = vector_snapshot.snapshot_paths(prefix)
+  np.save(vectors_path, np.zeros((0, 4), dtype=np.float32))
+  open(sidecar_path, 'w').close()
+  manifest = {"format": vector_snapshot.FORMAT_VERSION, "dimension": 4, "vector_field": 'text_embedding'}
+  with open(manifest_path, 'w') as f:
+    json.dump(manifest, f)
+  assert list(vector_snapshot.read_snapshot(prefix, dimension=4)) == []
+  with pytest.raises(ValueError, match='4-dimensional'):
+    list(vector_snapshot.read_snapshot(prefix))
+  with open(manifest_path, 'w') as f:
+    json.dump(dict(manifest, format=0), f)
+  with pytest.raises(ValueError, match='format 0'):
+    vector_snapshot.read_manifest(prefix)
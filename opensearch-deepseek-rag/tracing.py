@@ -0,0 +1,240 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Per-stage latency tracing for the RAG query and the ingest paths. When a
+query takes 20 seconds, the spans show how much of it went to embedding the
+question, to the kNN search on the shards, and to the DeepSeek call behind
+the connector.
+
+Spans are written as JSON lines, one per span, shaped like OpenTelemetry
+spans: trace_id, span_id, parent_span_id, name, start and end times in Unix
+nanoseconds, attributes, and status. Spans that share a trace_id belong to
+the same request. Set TRACE_FILE to a file path (or - for standard error) to
+turn tracing on. Without it, spans cost next to nothing, and nothing is
+written.
+
+Some stages happen inside OpenSearch, where the client can't time them. Those
+spans are derived from the responses, and their derived attribute says how:
+
+- end_search_span reads the search profile API (send the query with
+  "profile": true) and took. The shard spans are the slowest shard's query,
+  rewrite, and collector times. The coordinator span is took minus the
+  slowest shard, which, for a neural query, is mostly the embedding model
+  call that rewrites the query into a kNN query. With a RAG search pipeline,
+  the generation span is the client's wall clock minus took, since took
+  doesn't include the response processors.
+- end_bulk_span reads took and ingest_took from a _bulk response. ingest_took
+  is the time in the ingest pipeline, which, for embedding_pipeline, is the
+  embedding model calls.
+
+All scripts share the module's tracer, like opensearch_client.metrics.
+'''
+
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+
+SERVICE_NAME = 'opensearch-deepseek-rag'
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def _now_ns():
+  return time.time_ns()
+
+
+class Span:
+  '''
+  One timed stage. Use it as a context manager, or call end(). A span started
+  without a parent is the root of a new trace.
+  '''
+
+  def __init__(self, tracer, name, parent=None, attributes=None, start_ns=None):
+    self.tracer = tracer
+    self.name = name
+    self.parent = parent
+    self.trace_id = parent.trace_id if parent else f'{random.getrandbits(128):032x}'
+    self.span_id = f'{random.getrandbits(64):016x}'
+    self.attributes = dict(attributes or {})
+    self.start_ns = _now_ns() if start_ns is None else start_ns
+    self.end_ns = None
+    self._token = None
+
+  def set(self, **attributes):
+    self.attributes.update(attributes)
+    return self
+
+  def end(self, error=None, end_ns=None):
+    if self.end_ns is not None:
+      return
+    self.end_ns = _now_ns() if end_ns is None else end_ns
+    if self._token is not None:
+      try:
+        _current_span.reset(self._token)
+      except ValueError:
+        # Ended in another thread or task than the one that started it.
+        pass
+      self._token = None
+    self.tracer._emit(self, error)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.end(error=exc)
+    return False
+
+
+class Tracer:
+  '''
+  Creates spans, and writes each one as a JSON line when it ends. When
+  disabled, it still creates spans, so callers don't need to check, but it
+  writes nothing.
+  '''
+
+  def __init__(self, path=None):
+    self._lock = threading.Lock()
+    self.enabled = bool(path)
+    self._file = None
+    if path == '-':
+      self._file = sys.stderr
+    elif path:
+      self._file = open(path, 'a', encoding='utf-8')
+
+  @classmethod
+  def from_env(cls):
+    return cls(os.environ.get('TRACE_FILE'))
+
+  def current(self):
+    return _current_span.get()
+
+  def start_span(self, name, parent=None, **attributes):
+    '''
+    Starts a span, as a child of parent, or of the current span in this
+    thread or task, and makes it the current span until it ends. Threads in
+    a pool don't inherit the current span, so pass parent explicitly there.
+    '''
+    span = Span(self, name, parent or self.current(), attributes)
+    span._token = _current_span.set(span)
+    return span
+
+  def record(self, name, duration_s, parent, end_ns=None, **attributes):
+    '''
+    Writes a span for a stage that already happened, like a stage inside
+    OpenSearch, from its duration. It ends at end_ns, or at the parent's end.
+    '''
+    if duration_s is None:
+      return None
+    end_ns = end_ns or parent.end_ns or _now_ns()
+    span = Span(self, name, parent, attributes, start_ns=end_ns - int(duration_s * 1e9))
+    span.end(end_ns=end_ns)
+    return span
+
+  def _emit(self, span, error):
+    if not self.enabled:
+      return
+    record = {"trace_id": span.trace_id,
+              "span_id": span.span_id,
+              "parent_span_id": span.parent.span_id if span.parent else None,
+              "name": span.name,
+              "start_time_unix_nano": span.start_ns,
+              "end_time_unix_nano": span.end_ns,
+              "duration_ms": round((span.end_ns - span.start_ns) / 1e6, 3),
+              "attributes": span.attributes,
+              "status": {"code": "ERROR", "message": str(error)} if error else {"code": "OK"},
+              "resource": {"service.name": SERVICE_NAME}}
+    line = json.dumps(record, default=str)
+    with self._lock:
+      self._file.write(line + '\n')
+      self._file.flush()
+
+
+tracer = Tracer.from_env()
+
+
+def _profile_times(resp):
+  '''
+  Returns the slowest shard's (query, rewrite, collector) times, in seconds,
+  and the query types, from the profile section of a search response.
+  '''
+  slowest = (0, 0, 0)
+  query_types = set()
+  for shard in resp.get('profile', {}).get('shards', []):
+    query_ns = rewrite_ns = collector_ns = 0
+    for search in shard.get('searches', []):
+      for query in search.get('query', []):
+        query_ns += query.get('time_in_nanos', 0)
+        query_types.add(query.get('type'))
+      rewrite_ns += search.get('rewrite_time', 0)
+      for collector in search.get('collector', []):
+        collector_ns += collector.get('time_in_nanos', 0)
+    if query_ns + rewrite_ns + collector_ns > sum(slowest):
+      slowest = (query_ns, rewrite_ns, collector_ns)
+  return [t / 1e9 for t in slowest], sorted(t for t in query_types if t)
+
+
+def end_search_span(span, resp, generation=False):
+  '''
+  Ends span, which covers the client's whole search request, and adds the
+  server-side stages of the search under it. Pass generation=True when the
+  search went through a RAG search pipeline. Returns the stage times, in ms,
+  which are also the span's attributes.
+  '''
+  end_ns = _now_ns()
+  took_s = resp.get('took', 0) / 1000.0
+  wall_s = (end_ns - span.start_ns) / 1e9
+  (query_s, rewrite_s, collector_s), query_types = _profile_times(resp)
+  shard_s = query_s + rewrite_s + collector_s
+  stages = {"wall": wall_s, "took": took_s}
+  if 'profile' in resp:
+    stages.update(shard_query=query_s, shard_rewrite=rewrite_s, shard_collect=collector_s,
+                  coordinator=max(took_s - shard_s, 0))
+  if generation:
+    stages["generation"] = max(wall_s - took_s, 0)
+  stages_ms = {name: round(seconds * 1000, 1) for name, seconds in stages.items()}
+  span.set(**{f'{name}_ms': ms for name, ms in stages_ms.items()})
+  span.end(end_ns=end_ns)
+
+  # The server's stages end when took ends. Everything after that, on the
+  # client's clock, is the response processors and the network.
+  took_end = end_ns - int(max(wall_s - took_s, 0) * 1e9)
+  opensearch = span.tracer.record('opensearch.took', took_s, span, end_ns=took_end, derived='took')
+  if 'profile' in resp:
+    # Lay the shard's phases end to end, in the order they run, ending with
+    # took. The coordinator's share comes before them.
+    collect_end = took_end
+    query_end = collect_end - int(collector_s * 1e9)
+    rewrite_end = query_end - int(query_s * 1e9)
+    span.tracer.record('coordinator', stages["coordinator"], opensearch,
+                       end_ns=rewrite_end - int(rewrite_s * 1e9),
+                       derived='took minus slowest shard (includes neural query embedding)')
+    span.tracer.record('shard.rewrite', rewrite_s, opensearch, end_ns=rewrite_end, derived='profile')
+    span.tracer.record('shard.query', query_s, opensearch, end_ns=query_end, derived='profile',
+                       query_types=query_types)
+    span.tracer.record('shard.collect', collector_s, opensearch, end_ns=collect_end, derived='profile')
+  if generation:
+    span.tracer.record('generation', stages["generation"], span,
+                       derived='client wall clock minus took')
+  return stages_ms
+
+
+def end_bulk_span(span, resp):
+  '''
+  Ends span, which covers the client's whole _bulk request, and adds the
+  server-side stages under it: the ingest pipeline (ingest_took), and
+  indexing (took).
+  '''
+  ingest_s = resp.get('ingest_took')
+  ingest_s = None if ingest_s is None else ingest_s / 1000.0
+  took_s = resp.get('took', 0) / 1000.0
+  span.set(took_ms=resp.get('took'), ingest_took_ms=resp.get('ingest_took'))
+  span.end()
+  if ingest_s is not None:
+    span.tracer.record('bulk.ingest_pipeline', ingest_s, span,
+                       end_ns=span.end_ns - int(took_s * 1e9), derived='ingest_took')
+  span.tracer.record('bulk.index', took_s, span, derived='took')
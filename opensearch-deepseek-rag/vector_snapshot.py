@@ -0,0 +1,189 @@
+# Copyright opensearch-examples contributors
+# SPDX-License-Identifier: Apache-2.0
+'''
+Exports the documents of an index, with their embeddings, to files, and loads
+them back, so that you can fill a new index, or a new domain, without calling
+the embedding model. Running every document through embedding_pipeline is the
+slowest and most expensive part of load_data.py. A snapshot keeps the result.
+
+A snapshot is three files with a common path prefix:
+
+- prefix.npy: the vectors, a float32 NumPy array with one row per document.
+  It's written and read memory-mapped, so the vectors never sit in memory all
+  at once.
+- prefix.jsonl: one JSON line per document, with its row in prefix.npy, its
+  _id, and the rest of its _source (the text, and any passage fields).
+- prefix.json: the manifest, with the source index, the vector field, the
+  dimension, the number of documents, and the embedding model.
+
+export_snapshot reads the index with a sliced scroll. Each slice is its own
+scroll, and a scroll reports the exact number of documents it will return,
+so every slice gets a fixed range of rows up front, and the slices write to
+the vector file in place, concurrently. read_snapshot yields the documents
+back with text_embedding set, ready for _bulk without the ingest pipeline.
+
+To export population_data to the snapshot at VECTOR_SNAPSHOT_PATH:
+
+  python vector_snapshot.py
+
+To load a snapshot, run load_data.py with VECTOR_SNAPSHOT_PATH set.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import itertools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import embedders
+import opensearch_client
+import tracing
+
+
+DEFAULT_SLICES = 4
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_SCROLL = '5m'
+VECTOR_FIELD = 'text_embedding'
+FORMAT_VERSION = 1
+
+
+def snapshot_paths(prefix):
+  '''
+  The paths of the vector file, the sidecar, and the manifest of the snapshot
+  at prefix.
+  '''
+  return prefix + '.npy', prefix + '.jsonl', prefix + '.json'
+
+
+def export_snapshot(client, index_name, prefix, slices=DEFAULT_SLICES,
+                    batch_size=DEFAULT_BATCH_SIZE, scroll=DEFAULT_SCROLL,
+                    vector_field=VECTOR_FIELD,
+                    dimension=embedders.EMBEDDING_DIMENSION,
+                    embedding_model_id=None, log=print):
+  '''
+  Writes every document of index_name that has a vector to the snapshot at
+  prefix, reading slices scrolls in parallel, batch_size documents per page.
+  Returns a dict with the number of documents, the bytes written, and the
+  seconds it took.
+  '''
+  vectors_path, sidecar_path, manifest_path = snapshot_paths(prefix)
+  # Past 10,000 hits, the total is a lower bound unless the query asks for
+  # the exact count, and the rows depend on it.
+  body = {"query": {"exists": {"field": vector_field}},
+          "size": batch_size,
+          "sort": ["_doc"],
+          "track_total_hits": True}
+  start = time.perf_counter()
+  span = tracing.tracer.start_span('snapshot.export', index=index_name, slices=slices)
+  first_pages, scroll_ids = [], []
+  try:
+    # Open every slice first. Their totals set the rows each slice writes.
+    for slice_id in range(slices):
+      sliced = dict(body, slice={"id": slice_id, "max": slices}) if slices > 1 else body
+      resp = client.search(index=index_name, body=sliced, scroll=scroll)
+      first_pages.append(resp)
+      scroll_ids.append(resp['_scroll_id'])
+    counts = [resp['hits']['total']['value'] for resp in first_pages]
+    offsets = list(itertools.accumulate([0] + counts[:-1]))
+    total = sum(counts)
+    vectors = np.lib.format.open_memmap(vectors_path, mode='w+', dtype=np.float32,
+                                        shape=(total, dimension))
+    sidecar_lock = threading.Lock()
+
+    def export_slice(slice_id, sidecar):
+      resp = first_pages[slice_id]
+      row, end = offsets[slice_id], offsets[slice_id] + counts[slice_id]
+      while resp['hits']['hits']:
+        hits = resp['hits']['hits']
+        if row + len(hits) > end:
+          raise Exception(f'Slice {slice_id} returned more than the {counts[slice_id]} documents it reported')
+        sources = [dict(hit['_source']) for hit in hits]
+        block = embedders.check_dimension(
+          np.asarray([source.pop(vector_field) for source in sources], dtype=np.float32), dimension)
+        vectors[row:row + len(hits)] = block
+        lines = [json.dumps({"row": row + i, "_id": hit['_id'], "_source": source}) + '\n'
+                 for i, (hit, source) in enumerate(zip(hits, sources))]
+        with sidecar_lock:
+          sidecar.writelines(lines)
+        row += len(hits)
+        if log:
+          log(f'slice {slice_id}: {row - offsets[slice_id]} of {counts[slice_id]} documents')
+        resp = client.scroll(body={"scroll_id": resp['_scroll_id'], "scroll": scroll})
+        scroll_ids[slice_id] = resp['_scroll_id']
+      if row != end:
+        raise Exception(f'Slice {slice_id} returned {row - offsets[slice_id]} of the '
+                        f'{counts[slice_id]} documents it reported')
+
+    with open(sidecar_path, 'w', encoding='utf-8') as sidecar, \
+         ThreadPoolExecutor(max_workers=slices) as executor:
+      for future in [executor.submit(export_slice, slice_id, sidecar) for slice_id in range(slices)]:
+        future.result()
+    vectors.flush()
+  finally:
+    if scroll_ids:
+      client.clear_scroll(body={"scroll_id": scroll_ids}, ignore=404)
+  manifest = {"format": FORMAT_VERSION,
+              "index": index_name,
+              "vector_field": vector_field,
+              "dimension": dimension,
+              "documents": total,
+              "embedding_model_id": embedding_model_id,
+              "exported_at": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+  with open(manifest_path, 'w', encoding='utf-8') as f:
+    json.dump(manifest, f, indent=2)
+  totals = {"documents": total,
+            "bytes": sum(os.path.getsize(path) for path in snapshot_paths(prefix)),
+            "seconds": time.perf_counter() - start}
+  span.set(documents=total, bytes=totals["bytes"])
+  span.end()
+  return totals
+
+
+def read_manifest(prefix):
+  with open(snapshot_paths(prefix)[2], encoding='utf-8') as f:
+    manifest = json.load(f)
+  if manifest.get('format') != FORMAT_VERSION:
+    raise ValueError(f'{prefix} is a snapshot in format {manifest.get("format")}, '
+                     f'and this code reads format {FORMAT_VERSION}')
+  return manifest
+
+
+def read_snapshot(prefix, dimension=embedders.EMBEDDING_DIMENSION):
+  '''
+  Yields the documents of the snapshot at prefix, each with its _id, its
+  _source, and its vector, as a list. The vectors are read from the
+  memory-mapped file as the documents go, so memory stays flat. Raises
+  ValueError when the snapshot's vectors don't have dimension columns.
+  '''
+  manifest = read_manifest(prefix)
+  if manifest["dimension"] != dimension:
+    raise ValueError(f'The snapshot at {prefix} has {manifest["dimension"]}-dimensional vectors, '
+                     f'and the index expects {dimension}')
+  vectors_path, sidecar_path, _ = snapshot_paths(prefix)
+  vectors = np.load(vectors_path, mmap_mode='r')
+  with open(sidecar_path, encoding='utf-8') as f:
+    for line in f:
+      record = json.loads(line)
+      document = dict(record["_source"], _id=record["_id"])
+      # float32 values convert to floats that OpenSearch parses back to the
+      # same float32, so the imported vectors are identical.
+      document[manifest["vector_field"]] = vectors[record["row"]].tolist()
+      yield document
+
+
+if __name__ == '__main__':
+  client = opensearch_client.create_client(os.environ['OPENSEARCH_SERVICE_DOMAIN_ENDPOINT'],
+                                           (os.environ['OPENSEARCH_SERVICE_ADMIN_USER'],
+                                            os.environ['OPENSEARCH_SERVICE_ADMIN_PASSWORD']))
+  # Note: if you changed the index name in load_data.py, be sure to change it here.
+  index_name = os.environ.get('VECTOR_SNAPSHOT_INDEX', 'population_data')
+  prefix = os.environ['VECTOR_SNAPSHOT_PATH']
+  slices = int(os.environ.get('VECTOR_SNAPSHOT_SLICES', DEFAULT_SLICES))
+  totals = export_snapshot(client, index_name, prefix, slices=slices,
+                           embedding_model_id=os.environ.get('EMBEDDING_MODEL_ID'))
+  print(f'Exported {totals["documents"]} documents from {index_name} to {prefix}.* '
+        f'({totals["bytes"] / 1024 / 1024:.1f} MB) in {totals["seconds"]:.1f}s')